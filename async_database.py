@@ -0,0 +1,95 @@
+"""
+⚡ واجهة غير متزامنة لقاعدة البيانات
+
+كل دوال قاعدة البيانات تصبح قابلة للانتظار: await db.get_user(...).
+القراءات الخفيفة تُخدم من الذاكرة مباشرة داخل حلقة الأحداث، وكل ما قد
+يلمس الشبكة أو القرص (التعديلات، السجل، الحفظ، عمليات المسح الكاملة)
+يُنفذ في منفذ خيوط مخصص حتى لا يتوقف البوت بسبب طلب GitHub بطيء.
+"""
+
+import asyncio
+import logging
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+from metrics import registry, timed
+
+logger = logging.getLogger(__name__)
+
+# قراءات من الذاكرة بتعقيد ثابت: لا تستحق الانتقال إلى خيط آخر
+MEMORY_READS = frozenset({
+    "get_user",
+    "get_stars_balance",
+    "get_vip_status",
+    "get_conversation",
+    "get_write_stats",
+    "get_stats",
+})
+# منها ما يأخذ قفل قاعدة البيانات، وقد يبقى القفل محجوزاً طوال تحويل البيانات
+# للحفظ (_save_data)؛ هذه تُخدم في الحلقة فقط إذا كان القفل متاحاً الآن
+LOCKED_READS = frozenset({
+    "get_conversation",
+    "get_write_stats",
+    "get_stats",
+})
+
+class AsyncDatabase:
+    """غلاف غير متزامن فوق GitHubDatabase / DatabaseManager"""
+
+    def __init__(self, db, max_workers: int = 4):
+        self.db = db
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="db-io")
+        self.call_latency = registry.histogram("db_call_seconds")
+        self.inline_latency = registry.histogram("db_inline_read_seconds")
+        self._methods = {}
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self.db, name)
+        if not callable(attr):
+            return attr
+
+        method = self._methods.get(name)
+        if method is None:
+            method = self._wrap(name)
+            self._methods[name] = method
+        return method
+
+    def _wrap(self, name: str):
+        @functools.wraps(getattr(self.db, name))
+        async def method(*args, **kwargs):
+            func = getattr(self.db, name)
+            if name in MEMORY_READS and self._cache_fresh():
+                lock = getattr(self.db, "lock", None) if name in LOCKED_READS else None
+                # RLock: حجزه هنا دون انتظار يجعل أخذه داخل الدالة فورياً
+                if lock is None or lock.acquire(blocking=False):
+                    try:
+                        registry.inc("db_inline_reads")
+                        with timed(self.inline_latency):
+                            return func(*args, **kwargs)
+                    finally:
+                        if lock is not None:
+                            lock.release()
+                registry.inc("db_inline_reads_deferred")
+
+            registry.inc("db_executor_calls")
+            loop = asyncio.get_running_loop()
+            with timed(self.call_latency):
+                return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+        return method
+
+    def _cache_fresh(self) -> bool:
+        is_fresh = getattr(self.db, "is_cache_fresh", None)
+        return bool(is_fresh and is_fresh())
+
+    @property
+    def sync(self):
+        """قاعدة البيانات المتزامنة الأصلية (للأكواد التي تعمل خارج حلقة الأحداث)"""
+        return self.db
+
+    async def close(self):
+        """حفظ ما تبقى ثم إيقاف المنفذ"""
+        close = getattr(self.db, "close", None)
+        if close:
+            await asyncio.get_running_loop().run_in_executor(self.executor, close)
+        self.executor.shutdown(wait=False)
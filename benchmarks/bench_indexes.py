@@ -0,0 +1,91 @@
+"""
+⏱️ قياس فهارس قاعدة البيانات: DatabaseIndexes مقابل مسح القوائم القديم
+
+100 ألف محادثة (10% نشطة) ومليون رسالة و50 ألف تقرير. الطريقة القديمة:
+مسح data["conversations"] أو data["messages"] أو data["reports"] في كل
+استعلام كما كانت تفعل GitHubDatabase قبل الفهارس.
+
+    python benchmarks/bench_indexes.py [عدد المحادثات]
+"""
+
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from indexes import DatabaseIndexes
+
+def make_data(conversation_count: int, seed: int = 1):
+    rng = random.Random(seed)
+    user_count = conversation_count // 2
+    conversations = []
+    for conv_id in range(1, conversation_count + 1):
+        user_a, user_b = rng.sample(range(1, user_count + 1), 2)
+        conversations.append({"id": conv_id, "user_a": user_a, "user_b": user_b,
+                              "start_ts": 1_700_000_000 + conv_id, "active": 0})
+    # المحادثات النشطة لمستخدمين مختلفين كما يفرض البوت
+    busy = set()
+    for conv in rng.sample(conversations, conversation_count // 10):
+        if conv["user_a"] not in busy and conv["user_b"] not in busy:
+            conv["active"] = 1
+            busy.update((conv["user_a"], conv["user_b"]))
+    messages = [{"id": message_id, "conv_id": rng.randint(1, conversation_count), "text": "مرحبا"}
+                for message_id in range(1, conversation_count * 10 + 1)]
+    reports = [{"id": report_id, "target_id": rng.randint(1, user_count), "reason": "spam"}
+               for report_id in range(1, conversation_count // 2 + 1)]
+    return {"users": {}, "conversations": conversations, "messages": messages, "reports": reports}
+
+def per_call(func, args) -> float:
+    started = time.perf_counter()
+    for arg in args:
+        func(*arg)
+    return (time.perf_counter() - started) / len(args)
+
+def report(name: str, old: float, new: float):
+    print(f"{name:<22} {old * 1000:8.2f} ms -> {new * 1e6:6.1f} us ({old / new:,.0f}x)")
+
+def main(conversation_count: int = 100000):
+    data = make_data(conversation_count)
+    conversations, messages, reports = data["conversations"], data["messages"], data["reports"]
+    print(f"{len(conversations)} conversations, {len(messages)} messages, {len(reports)} reports")
+
+    started = time.perf_counter()
+    indexes = DatabaseIndexes()
+    indexes.rebuild(data)
+    print(f"index build {time.perf_counter() - started:.2f} s")
+
+    rng = random.Random(2)
+    conv_ids = [(rng.randint(1, conversation_count),) for _ in range(20)]
+    active = [conv for conv in conversations if conv["active"] == 1]
+    pairs = [(conv["user_a"], conv["user_b"]) for conv in rng.sample(active, 20)]
+    targets = [(rng.choice(reports)["target_id"],) for _ in range(20)]
+
+    def old_get_conversation(conv_id):
+        return next((conv for conv in conversations if conv["id"] == conv_id), None)
+
+    def new_get_conversation(conv_id):
+        index = indexes.conversation_index(conv_id)
+        return conversations[index] if index is not None else None
+
+    def old_pair_lookup(user_a, user_b):
+        return next((conv["id"] for conv in conversations if conv.get("active") == 1
+                     and {conv["user_a"], conv["user_b"]} == {user_a, user_b}), None)
+
+    for conv_id, in conv_ids:
+        assert old_get_conversation(conv_id) is new_get_conversation(conv_id)
+    for user_a, user_b in pairs:
+        assert old_pair_lookup(user_a, user_b) == indexes.active_conversation_id(user_a, user_b)
+
+    report("get_conversation", per_call(old_get_conversation, conv_ids), per_call(new_get_conversation, conv_ids))
+    report("get_messages",
+           per_call(lambda conv_id: [msg for msg in messages if msg["conv_id"] == conv_id], conv_ids),
+           per_call(indexes.messages_for, conv_ids))
+    report("active pair lookup", per_call(old_pair_lookup, pairs), per_call(indexes.active_conversation_id, pairs))
+    report("reports by target",
+           per_call(lambda target_id: [r for r in reports if r["target_id"] == target_id], targets),
+           per_call(indexes.reports_for, targets))
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
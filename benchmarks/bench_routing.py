@@ -0,0 +1,75 @@
+"""
+⏱️ قياس تكلفة توجيه الرسائل النصية: Router مقابل سلسلة if/elif القديمة
+
+تُنفذ _relay_message_internal من bot_main والسلسلة القديمة (tests/legacy_relay.py)
+في بيئة وهمية: كل المعالجات دوال فارغة، فالرقم المقاس هو تكلفة التوجيه وحده
+(نانوثانية لكل رسالة).
+
+    python benchmarks/bench_routing.py [عدد الرسائل لكل حالة]
+"""
+
+import os
+import sys
+import time
+import asyncio
+import builtins
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tests.fakes import load_routing, routing_sources
+
+CASES = [
+    ("chat message", "مرحبا كيف حالك", None, True),
+    ("first button", "🚀 بحث عشوائي", None, False),
+    ("last button", "🔄 تحديث النظام", None, False),
+    ("unknown text", "اي شي", None, False),
+    ("guess state", "42", "playing_guess_7", False),
+    ("admin state", "نص البث", "admin_broadcast", False),
+]
+
+async def noop(*args, **kwargs):
+    return None
+
+class Stubs(dict):
+    """أي اسم غير معرّف يصبح معالجاً فارغاً (يُنشأ مرة واحدة)"""
+
+    def __missing__(self, name):
+        if hasattr(builtins, name):
+            raise KeyError(name)
+        self[name] = noop
+        return noop
+
+def load(source):
+    return load_routing(source, Stubs(main_reply_keyboard=lambda *a: None))
+
+async def measure(namespace, text, state, in_chat, count):
+    namespace["USER_STATES"].clear()
+    namespace["active_chats"].clear()
+    user = SimpleNamespace(id=5, first_name="Bench")
+    if state is not None:
+        namespace["USER_STATES"][user.id] = state
+    if in_chat:
+        namespace["active_chats"][user.id] = 6
+    update = SimpleNamespace(effective_user=user, message=SimpleNamespace(reply_text=noop))
+    relay = namespace["_relay_message_internal"]
+    started = time.perf_counter()
+    for _ in range(count):
+        await relay(update, None, user, text)
+    return (time.perf_counter() - started) / count * 1e9
+
+async def main(count: int):
+    new_source, old_source = routing_sources()
+    new, old = load(new_source), load(old_source)
+
+    started = time.perf_counter()
+    for _ in range(count):
+        await noop(None, None)
+    print(f"handler call floor {(time.perf_counter() - started) / count * 1e9:.0f} ns")
+    for name, text, state, in_chat in CASES:
+        old_ns = await measure(old, text, state, in_chat, count)
+        new_ns = await measure(new, text, state, in_chat, count)
+        print(f"{name:14s} old {old_ns:6.0f} ns  new {new_ns:6.0f} ns")
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000))
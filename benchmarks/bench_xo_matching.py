@@ -0,0 +1,114 @@
+"""
+⏱️ قياس البحث عن خصم XO: Futures مقابل حلقة الاستطلاع القديمة
+
+10 آلاف باحث يصلون خلال ثانيتين (مهلة 5 ثوانٍ): كم منهم وجد خصماً وزمن
+الانتظار حتى المطابقة. ثم 10 آلاف منتظر لا خصم لهم لمدة 3 ثوانٍ: عدد مرات
+استيقاظ حلقة الأحداث ووقت المعالج الذي يستهلكونه وهم ينتظرون.
+الحلقة القديمة: كل منتظر يفحص قائمة الانتظار كل ثانية بـ asyncio.sleep(1).
+
+    python benchmarks/bench_xo_matching.py [عدد الباحثين]
+"""
+
+import os
+import sys
+import time
+import asyncio
+import selectors
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from games import GameManager
+
+class LegacyXOSearch:
+    """search_xo_opponent كما كانت: مجموعة انتظار واستطلاع كل ثانية"""
+
+    def __init__(self):
+        self.waiting_xo_players = set()
+        self.polls = 0
+
+    async def search_xo_opponent(self, player_id: int, context=None, max_wait: int = 60):
+        for waiting_player in list(self.waiting_xo_players):
+            if waiting_player != player_id:
+                self.waiting_xo_players.remove(waiting_player)
+                return waiting_player
+        self.waiting_xo_players.add(player_id)
+        started = time.time()
+        while time.time() - started < max_wait:
+            self.polls += 1
+            for waiting_player in list(self.waiting_xo_players):
+                if waiting_player != player_id:
+                    self.waiting_xo_players.remove(waiting_player)
+                    self.waiting_xo_players.discard(player_id)
+                    return waiting_player
+            await asyncio.sleep(1)
+        self.waiting_xo_players.discard(player_id)
+        return None
+
+class CountingSelector(selectors.DefaultSelector):
+    """كل استدعاء select هو دورة واحدة لحلقة الأحداث"""
+
+    def __init__(self):
+        super().__init__()
+        self.wakeups = 0
+
+    def select(self, timeout=None):
+        self.wakeups += 1
+        return super().select(timeout)
+
+def run(coroutine):
+    selector = CountingSelector()
+    loop = asyncio.SelectorEventLoop(selector)
+    try:
+        return loop.run_until_complete(coroutine), selector.wakeups
+    finally:
+        loop.close()
+
+def percentile(values, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else 0.0
+
+async def burst(manager, searchers: int, spread: float = 2.0, max_wait: int = 5):
+    """الباحثون يصلون بالتتابع خلال spread ثانية؛ زمن كل بحث حتى نتيجته"""
+    waits, matched = [], 0
+
+    async def search(player_id: int):
+        nonlocal matched
+        started = time.perf_counter()
+        result = await manager.search_xo_opponent(player_id, None, max_wait)
+        if result is not None:
+            matched += 1
+            waits.append(time.perf_counter() - started)
+
+    tasks = []
+    for player_id in range(1, searchers + 1):
+        tasks.append(asyncio.ensure_future(search(player_id)))
+        if player_id % 100 == 0:
+            await asyncio.sleep(spread * 100 / searchers)
+    await asyncio.gather(*tasks)
+    return matched, waits
+
+async def idle(managers, seconds: float = 3.0):
+    """منتظر واحد في كل مدير (لا خصم له): ما يكلفه الانتظار وحده"""
+    tasks = [asyncio.ensure_future(manager.search_xo_opponent(player_id, None, 60))
+             for player_id, manager in enumerate(managers, 1)]
+    await asyncio.sleep(0)
+    cpu = time.process_time()
+    await asyncio.sleep(seconds)
+    cpu = time.process_time() - cpu
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return cpu
+
+def main(searchers: int = 10000):
+    for name, factory in (("old", LegacyXOSearch), ("new", lambda: GameManager(None))):
+        (matched, waits), _ = run(burst(factory(), searchers))
+        print(f"{name}: {matched}/{searchers} matched, "
+              f"p50 {percentile(waits, 0.5) * 1000:.2f} ms, p99 {percentile(waits, 0.99) * 1000:.1f} ms")
+
+    for name, factory in (("old", LegacyXOSearch), ("new", lambda: GameManager(None))):
+        cpu, wakeups = run(idle([factory() for _ in range(searchers)]))
+        print(f"{name}: {searchers} idle waiters over 3 s: {wakeups} loop wakeups, {cpu * 1000:.0f} ms CPU")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
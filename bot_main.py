@@ -5,20 +5,28 @@ import asyncio
 import logging
 import sys
 from datetime import datetime, timedelta
-from typing import Optional, Dict, Any, List
-from github_database import get_database
-
-# ثم استخدام:
-db = get_database()
-
-# جميع الدوال ستعمل بنفس الطر
+from typing import Optional, Dict, Any, List, Tuple
 from telegram import Update, KeyboardButton, ReplyKeyboardMarkup, ReplyKeyboardRemove, InlineKeyboardMarkup, InlineKeyboardButton, BotCommand, LabeledPrice
 from telegram.ext import ApplicationBuilder, ContextTypes, CommandHandler, MessageHandler, filters, CallbackQueryHandler, PreCheckoutQueryHandler
 from telegram.error import TelegramError
 
 # --- استيراد الملفات المحدثة (تأكد من وجودها في المستودع) ---
-from database import Database
-from games import GameManager, create_xo_keyboard, calculate_game_rewards
+from database import get_database
+from async_database import AsyncDatabase
+from metrics import registry, LoopStallMonitor
+from matchmaking import MatchmakingEngine
+from webhook_front import get_webhook_stats, run_webhook
+from subscription_cache import SubscriptionCache
+from send_scheduler import SendScheduler, send_priority, PRIORITY_GAME
+from broadcast import BroadcastManager
+from timer_wheel import TimerWheel
+from session_store import SessionStore
+from content_filter import ContentFilter
+from moderation import ModerationPipeline
+from monitor_digest import MonitorDigest
+from update_locks import KeyedUpdateProcessor
+from routing import Router
+from games import GameManager, calculate_game_rewards
 from config import get_config
 from stars_payment import TelegramStarsPaymentSystem, StarsKeyboards
 
@@ -29,10 +37,10 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# --- تهيئة قاعدة البيانات السحابية (MongoDB) ---
+# --- تهيئة قاعدة البيانات السحابية (GitHub) ---
 try:
-    # سيقوم الكلاس في database.py بالتحقق من MONGO_URI
-    db = Database()
+    # المعالجات تستخدم الواجهة غير المتزامنة: await db.get_user(...)
+    db = AsyncDatabase(get_database())
     logger.info("✅ تم ربط عقل البوت بقاعدة البيانات السحابية بنجاح.")
 except Exception as e:
     logger.error(f"❌ فشل بدء تشغيل البوت: {e}")
@@ -47,6 +55,9 @@ OWNER_ID = config['owner_id']
 ADMIN_IDS = config['admin_ids']
 MANDATORY_CHANNEL = config['mandatory_channel']
 MONITOR_CHANNEL = config['monitor_channel']
+MONITOR_DIGEST_INTERVAL = config.get('monitor_digest_interval', 5)
+MONITOR_DIGEST_MAX_EVENTS = config.get('monitor_digest_max_events', 200)
+MONITOR_DIGEST_SAMPLES = config.get('monitor_digest_samples', 5)
 DATA_CHANNEL = config['data_channel']
 
 # إعدادات المكافآت والأسعار (تُجلب من السحاب أو Config)
@@ -55,23 +66,69 @@ REWARD_COOLDOWN = config.get('reward_cooldown', 86400)
 GENDER_SEARCH_COST = config.get('gender_search_cost', 5)
 GENDER_CHANGE_COST = config.get('gender_change_cost', 50)
 FILTERED_WORDS = config.get('filtered_words', [])
+FILTERED_WORDS_FILE = config.get('filtered_words_file', 'filtered_words.txt')
+FILTER_RELOAD_INTERVAL = config.get('filter_reload_interval', 30)
+MODERATION_PENALTY = config.get('moderation_penalty', 5)
+MODERATION_BAN_STRIKES = config.get('moderation_ban_strikes', 3)
+MODERATION_STRIKE_WINDOW = config.get('moderation_strike_window', 3600)
+MODERATION_BAN_DURATION = config.get('moderation_ban_duration', 86400)
+MODERATION_QUEUE_SIZE = config.get('moderation_queue_size', 10000)
+MAX_SEARCH_TIME = config.get('max_search_time', 300)
+XO_WIN_POINTS = config.get('xo_win_points', 5)
+XO_SEARCH_TIMEOUT = config.get('xo_search_timeout', 60)
+TIMER_RESOLUTION = config.get('timer_resolution', 1)
+USER_STATE_TIMEOUT = config.get('user_state_timeout', 600)
+GAME_TIMEOUT = config.get('game_timeout', 3600)
+SESSION_SNAPSHOT_FILE = config.get('session_snapshot_file', 'sessions.snapshot')
+SESSION_SNAPSHOT_INTERVAL = config.get('session_snapshot_interval', 5)
+SUBSCRIPTION_CACHE_TTL = config.get('subscription_cache_ttl', 600)
+SUBSCRIPTION_NEGATIVE_TTL = config.get('subscription_negative_ttl', 30)
+BROADCAST_CONCURRENCY = config.get('broadcast_concurrency', 30)
+BROADCAST_PAGE_SIZE = config.get('broadcast_page_size', 200)
+BROADCAST_PROGRESS_INTERVAL = config.get('broadcast_progress_interval', 5)
+BROADCAST_CHECKPOINT_FILE = config.get('broadcast_checkpoint_file', 'broadcast_checkpoint.json')
+BOT_MODE = os.getenv('BOT_MODE') or config.get('bot_mode', 'polling')
+CONCURRENT_UPDATES = config.get('concurrent_updates', 16)
 
 # --- تهيئة الأنظمة الفرعية ---
-game_manager = GameManager(db)
-payment_system = TelegramStarsPaymentSystem(db)
-
-# ----------------------------------------
-
-logging.basicConfig(
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", 
-    level=logging.INFO
+timers = TimerWheel(TIMER_RESOLUTION)  # مهل الألعاب والبحث وحالات الانتظار
+game_manager = GameManager(db.sync, timers, GAME_TIMEOUT)
+stars_system = None  # سيتم تهيئتها بعد بناء التطبيق
+bot_app = None  # التطبيق الجاري (لإرسال إشعارات انتهاء المهل من المؤقتات)
+loop_monitor = LoopStallMonitor()
+subscription_cache = SubscriptionCache(SUBSCRIPTION_CACHE_TTL, SUBSCRIPTION_NEGATIVE_TTL)
+send_scheduler = SendScheduler()  # كل الرسائل الصادرة تمر من هنا (حدود Telegram والأولويات)
+broadcaster = BroadcastManager(
+    db, BROADCAST_CHECKPOINT_FILE, BROADCAST_CONCURRENCY, BROADCAST_PAGE_SIZE, BROADCAST_PROGRESS_INTERVAL
+)
+session_store = SessionStore(SESSION_SNAPSHOT_FILE, SESSION_SNAPSHOT_INTERVAL)  # المحادثات والألعاب عبر إعادة التشغيل
+content_filter = ContentFilter(FILTERED_WORDS, FILTERED_WORDS_FILE, FILTER_RELOAD_INTERVAL)  # الكلمات المحظورة
+monitor_digest = MonitorDigest(  # أحداث قناة المراقبة كملخصات دورية
+    MONITOR_CHANNEL, MONITOR_DIGEST_INTERVAL, MONITOR_DIGEST_MAX_EVENTS, MONITOR_DIGEST_SAMPLES
+)
+moderation = ModerationPipeline(  # عقوبات الكلمات المحظورة في الخلفية (لا تؤخر إرسال الرسالة)
+    db, content_filter, monitor_digest, MODERATION_PENALTY, MODERATION_BAN_STRIKES,
+    MODERATION_STRIKE_WINDOW, MODERATION_BAN_DURATION, MODERATION_QUEUE_SIZE
 )
-logger = logging.getLogger(__name__)
 
-# تهيئة قواعد البيانات والنظم
-db = Database()
-game_manager = GameManager(db)
-stars_system = None  # سيتم تهيئتها بعد بناء التطبيق
+def update_lock_keys(update: object) -> List[str]:
+    """مفاتيح تسلسل التحديث: صاحبه، ولعبة XO التي يخصها الزر إن وُجدت"""
+    if not isinstance(update, Update):
+        return []
+    keys = []
+    if update.effective_user:
+        keys.append(f"user:{update.effective_user.id}")
+    elif update.effective_chat:
+        keys.append(f"chat:{update.effective_chat.id}")
+    query = update.callback_query
+    if query and query.data and query.data.startswith("xo_"):
+        parts = query.data.split("_")
+        if len(parts) > 2 and parts[2].isdigit():
+            keys.append(f"xo:{parts[2]}")
+    return keys
+
+router = Router()  # أزرار القوائم وحالات المستخدم -> المعالجات (register_routes)
+update_processor = KeyedUpdateProcessor(CONCURRENT_UPDATES, update_lock_keys)  # توازي مع ترتيب كل مستخدم ولعبة
 
 # Utilities
 def now_ts() -> int:
@@ -98,12 +155,15 @@ def format_time_left(seconds: int) -> str:
     
     return time_str.strip()
 
-def require_user_in_db(user_id:int, tg_user:dict):
-    u = db.get_user(user_id)
+async def require_user_in_db(user_id:int, tg_user:dict):
+    u = await db.get_user(user_id)
     if u:
+        if u.get("blocked_bot"):
+            # عاد لاستخدام البوت بعد حظره: يستقبل البث مجدداً
+            await db.set_bot_blocked(user_id, False)
         return u
     
-    db.create_user({
+    await db.create_user({
         "user_id": user_id,
         "username": tg_user.get("username") or "",
         "first_name": tg_user.get("first_name") or "",
@@ -111,20 +171,56 @@ def require_user_in_db(user_id:int, tg_user:dict):
         "join_ts": now_ts()
     })
     
-    return db.get_user(user_id)
+    return await db.get_user(user_id)
 
-def safe_get_user(user_id: int):
+async def safe_get_user(user_id: int):
     """الحصول على بيانات المستخدم بشكل آمن مع معالجة الأخطاء"""
     try:
-        return db.get_user(user_id) or {}
+        return await db.get_user(user_id) or {}
     except Exception as e:
         logger.error(f"خطأ في الحصول على بيانات المستخدم {user_id}: {e}")
         return {'user_id': user_id, 'first_name': 'مستخدم', 'points': 0}
 
-# نظام المطابقة المبسط في الذاكرة
-waiting_users = set()  # مستخدمين ينتظرون شريك
+# نظام المطابقة والمحادثات في الذاكرة
+def can_be_matched(user_id: int) -> bool:
+    """هل ما زال الباحث في الطابور يصلح شريكاً؟ (يُستدعى داخل حلقة الأحداث: لا تحميل من GitHub)"""
+    if user_id in active_chats:
+        return False
+    u = db.sync.peek_user(user_id)
+    return u is None or u.get('banned_until', 0) <= now_ts()
+
+matchmaker = MatchmakingEngine(MAX_SEARCH_TIME, config.get('matchmaking_strategy', 'fifo'), timers,
+                           is_available=can_be_matched)  # من يبحث عن شريك
 active_chats = {}      # محادثات نشطة {user_id: partner_id}
 
+def set_user_state(user_id: int, state: str, timeout: int = USER_STATE_TIMEOUT, notify: bool = True):
+    """حالة انتظار لإدخال المستخدم تنتهي تلقائياً إذا لم يرد خلال timeout"""
+    USER_STATES[user_id] = state
+    timers.schedule(("state", user_id), timeout, expire_user_state, user_id, state, notify)
+
+async def expire_user_state(user_id: int, state: str, notify: bool = True):
+    if USER_STATES.get(user_id) != state:
+        return  # تغيرت الحالة أو أُلغيت قبل انتهاء المهلة
+    if matchmaker.is_searching(user_id) or user_id in active_chats:
+        # المستخدم مشغول بالبحث أو بمحادثة: تأجيل الانتهاء
+        timers.schedule(("state", user_id), USER_STATE_TIMEOUT, expire_user_state, user_id, state, notify)
+        return
+    USER_STATES.pop(user_id, None)
+    GENDER_CONFIRM.pop(user_id, None)
+    if not notify:
+        return
+    try:
+        await bot_app.bot.send_message(
+            chat_id=user_id,
+            text="⌛ **انتهت مهلة الانتظار وتم إلغاء العملية.**",
+            reply_markup=main_reply_keyboard(user_id in ADMIN_IDS)
+        )
+    except Exception as e:
+        logger.debug(f"تعذر إبلاغ المستخدم {user_id} بانتهاء المهلة: {e}")
+
+def is_vip_user(user_data: Optional[Dict]) -> bool:
+    return bool(user_data) and user_data.get('vip_until', 0) > now_ts()
+
 # Keyboards
 def main_reply_keyboard(is_admin=False):
     kb = [
@@ -151,8 +247,8 @@ def profile_keyboard():
         ["⬅️ الرئيسية"]
     ], resize_keyboard=True)
 
-def settings_keyboard(user_id: int):
-    user = safe_get_user(user_id)
+async def settings_keyboard(user_id: int):
+    user = await safe_get_user(user_id)
     gender_changed = user.get('gender_changed', 0)
     
     kb = [
@@ -228,19 +324,21 @@ def search_cancel_keyboard():
         ["⏹️ إيقاف البحث", "⬅️ الرئيسية"]
     ], resize_keyboard=True)
 
+ADMIN_KEYBOARD_ROWS = [
+    ["📊 الإحصائيات الكاملة", "👥 المستخدمين المحظورين"],
+    ["💰 توزيع النقاط", "⭐ توزيع النجوم"],
+    ["📢 بث سريع", "🔄 تحديث النظام"],
+    ["⬅️ الرئيسية"]
+]
+ADMIN_BUTTONS = {button for row in ADMIN_KEYBOARD_ROWS for button in row}
+
 def admin_keyboard():
-    return ReplyKeyboardMarkup([
-        ["📊 الإحصائيات الكاملة", "👥 المستخدمين المحظورين"],
-        ["💰 توزيع النقاط", "⭐ توزيع النجوم"],
-        ["📢 بث سريع", "🔄 تحديث النظام"],
-        ["⬅️ الرئيسية"]
-    ], resize_keyboard=True)
+    return ReplyKeyboardMarkup(ADMIN_KEYBOARD_ROWS, resize_keyboard=True)
 
 # Global states
 MATCHING: Dict[int, Dict[str,Any]] = {}
 GENDER_CONFIRM: Dict[int,str] = {}
 USER_STATES: Dict[int, str] = {}
-ACTIVE_SEARCHES: Dict[int, asyncio.Task] = {}
 GAME_SEARCHES: Dict[int, asyncio.Task] = {}
 
 # VIP prices بالنقاط (أسعار مضاعفة)
@@ -276,11 +374,9 @@ def vip_purchase_keyboard():
     return InlineKeyboardMarkup(kb)
 
 # Monitoring helpers
-async def send_to_monitor(context: ContextTypes.DEFAULT_TYPE, text: str):
-    try:
-        await context.bot.send_message(chat_id=MONITOR_CHANNEL, text=text)
-    except Exception as e:
-        logger.debug("Monitor send failed: %s", e)
+async def send_to_monitor(context: ContextTypes.DEFAULT_TYPE, text: str, kind: str = "event", critical: bool = False):
+    """تسجيل حدث لقناة المراقبة: يُجمع في الملخص الدوري، والحرج يُرسل فوراً"""
+    monitor_digest.add(kind, text, critical)
 
 # --- فحص الاشتراك الإجباري ---
 async def check_channel_subscription(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
@@ -288,15 +384,14 @@ async def check_channel_subscription(update: Update, context: ContextTypes.DEFAU
         return True
         
     user = update.effective_user
-    try:
-        member = await context.bot.get_chat_member(MANDATORY_CHANNEL.replace("@", ""), user.id)
-        if member.status in ['left', 'kicked']:
-            return False
-    except Exception as e:
-        logger.error(f"Error checking channel subscription: {e}")
-        return True
-        
-    return True
+    return await subscription_cache.is_subscribed(
+        user.id, lambda: fetch_channel_subscription(context, user.id)
+    )
+
+async def fetch_channel_subscription(context: ContextTypes.DEFAULT_TYPE, user_id: int) -> bool:
+    """طلب حالة العضوية من Telegram (يُستدعى فقط عند عدم وجود نتيجة صالحة في الكاش)"""
+    member = await context.bot.get_chat_member(MANDATORY_CHANNEL.replace("@", ""), user_id)
+    return member.status not in ['left', 'kicked']
 
 async def must_subscribe(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(
@@ -322,13 +417,13 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         try:
             ref_id = int(args[0])
             if ref_id != user.id:
-                db.add_referral(referrer_id=ref_id, new_user_id=user.id)
-                db.add_points(ref_id, 20)
-                db.add_points(user.id, 10)  # مكافأة للمستخدم الجديد
+                await db.add_referral(referrer_id=ref_id, new_user_id=user.id)
+                await db.add_points(ref_id, 20)
+                await db.add_points(user.id, 10)  # مكافأة للمستخدم الجديد
         except Exception:
             pass
     
-    require_user_in_db(user.id, user.to_dict() if user else {})
+    await require_user_in_db(user.id, user.to_dict() if user else {})
     
     kb = main_reply_keyboard(is_admin=(user.id in ADMIN_IDS))
     
@@ -390,7 +485,7 @@ async def start_search(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await must_subscribe(update, context)
         return
     
-    u = require_user_in_db(user.id, user.to_dict() if user else {})
+    u = await require_user_in_db(user.id, user.to_dict() if user else {})
     
     if u.get('banned_until', 0) > now_ts():
         await update.message.reply_text("🚫 حسابك محظور مؤقتاً.")
@@ -400,102 +495,108 @@ async def start_search(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("❌ أنت في محادثة بالفعل! استخدم /stop لإنهائها أولاً.")
         return
     
-    # إذا كان هناك شخص في الانتظار
-    if waiting_users:
-        partner_id = waiting_users.pop(0)
-        uid = update.effective_user.id
-        
-        # 1. تحديث الحالة في قاعدة البيانات السحابية (مهم جداً للربط)
-        db.set_user_status(uid, "chatting", partner_id)
-        db.set_user_status(partner_id, "chatting", uid)
-        
-        # 2. إنشاء محادثة (إذا كانت الدالة موجودة في database.py)
-        try:
-            db.create_conversation(uid, partner_id)
-        except:
-            pass
-
-        # 3. دالة داخلية لتنسيق الرسالة بشكل جذاب (تمنع تكرار الكود)
-        def format_info_msg(user_data):
-            p_name = user_data.get('first_name', 'مجهول')
-            p_gender = user_data.get('gender', 'غير محدد')
-            p_age = user_data.get('age', 'غير محدد')
-            p_country = user_data.get('country', 'غير محدد')
-            p_points = user_data.get('points', 0)
-            
-            # معالجة VIP والتقييم
-            is_vip = "👑 ذهبي (VIP)" if user_data.get('vip_until', 0) > time.time() else "👤 عادي"
-            r_sum = user_data.get('rating_sum', 0)
-            r_total = user_data.get('total_ratings', 1)
-            p_rating = round(r_sum / max(r_total, 1), 1)
-            p_stars = "⭐" * int(p_rating) if p_rating > 0 else "جديد 🆕"
-
-            return (
-                f"🎉 **تم العثور على شريك جديد!**\n"
-                f"━━━━━━━━━━━━━━━━━━\n"
-                f"👤 **معلومات الشريك:**\n"
-                f"• **الاسم:** {p_name}\n"
-                f"• **الجنس:** {p_gender}\n"
-                f"• **العمر:** {p_age} سنة\n"
-                f"• **البلد:** {p_country} 🌍\n"
-                f"• **النقاط:** {p_points} 💰\n"
-                f"• **التقييم:** {p_stars} ({p_rating})\n"
-                f"• **العضوية:** {is_vip}\n"
-                f"━━━━━━━━━━━━━━━━━━\n\n"
-                f"💬 **يمكنك الآن البدء بالدردشة مباشرة...**\n"
-                f"⚠️ استخدم /stop للإنهاء."
-            )
-
-        # 4. جلب معلومات الطرفين
-        current_user_info = db.get_user(uid)
-        partner_info = db.get_user(partner_id)
-
-        # 5. إرسال الرسالة لك (تحتوي على معلومات الشريك)
+    if matchmaker.is_searching(uid):
         await update.message.reply_text(
-            text=format_info_msg(partner_info),
-            parse_mode='Markdown',
-            reply_markup=chat_control_keyboard()
+            "⏳ **البحث جارٍ بالفعل...**\nاستخدم /stop_search لإيقاف البحث",
+            reply_markup=search_cancel_keyboard()
         )
-        
-        # 6. إرسال الرسالة للشريك (تحتوي على معلوماتك أنت)
-        try:
-            await context.bot.send_message(
-                chat_id=partner_id,
-                text=format_info_msg(current_user_info),
-                parse_mode='Markdown',
-                reply_markup=chat_control_keyboard()
-            )
-        except Exception as e:
-            logger.error(f"Error sending message to partner: {e}")
-
-            # تنظيف المحادثة
-            if uid in active_chats:
-                del active_chats[uid]
-            if partner in active_chats:
-                del active_chats[partner]
-            db.set_user_status(uid, "idle")
-            await update.message.reply_text("❌ فشل في التواصل مع الشريك. حاول مرة أخرى.")
-            return
-            
-        await send_to_monitor(context, f"🟢 محادثة جديدة: {uid} ↔ {partner}")
-        
+        return
+    
+    partner_id = matchmaker.search(uid, gender=u.get('gender'), vip=is_vip_user(u))
+    if partner_id:
+        await connect_partners(update, context, uid, partner_id)
     else:
-        waiting_users.add(uid)
-        db.set_user_status(uid, "searching")
+        await db.set_user_status(uid, "searching")
         await update.message.reply_text(
             "🔍 **جاري البحث عن شريك...**\n\n"
-            "⏳ **سيبقى البحث نشطاً حتى تجد شريكاً**\n"
+            f"⏳ **سيبقى البحث نشطاً لمدة {MAX_SEARCH_TIME // 60} دقائق حتى تجد شريكاً**\n"
             "استخدم /stop_search لإيقاف البحث",
             reply_markup=search_cancel_keyboard()
         )
 
+def format_partner_info(user_data: Dict) -> str:
+    """تنسيق معلومات الشريك بشكل جذاب"""
+    p_name = user_data.get('first_name', 'مجهول')
+    p_gender = user_data.get('gender', 'غير محدد')
+    p_age = user_data.get('age', 'غير محدد')
+    p_country = user_data.get('country', 'غير محدد')
+    p_points = user_data.get('points', 0)
+    
+    # معالجة VIP والتقييم
+    is_vip = "👑 ذهبي (VIP)" if is_vip_user(user_data) else "👤 عادي"
+    r_sum = user_data.get('rating_sum', 0)
+    r_total = user_data.get('total_ratings', 1)
+    p_rating = round(r_sum / max(r_total, 1), 1)
+    p_stars = "⭐" * int(p_rating) if p_rating > 0 else "جديد 🆕"
+
+    return (
+        f"🎉 **تم العثور على شريك جديد!**\n"
+        f"━━━━━━━━━━━━━━━━━━\n"
+        f"👤 **معلومات الشريك:**\n"
+        f"• **الاسم:** {p_name}\n"
+        f"• **الجنس:** {p_gender}\n"
+        f"• **العمر:** {p_age} سنة\n"
+        f"• **البلد:** {p_country} 🌍\n"
+        f"• **النقاط:** {p_points} 💰\n"
+        f"• **التقييم:** {p_stars} ({p_rating})\n"
+        f"• **العضوية:** {is_vip}\n"
+        f"━━━━━━━━━━━━━━━━━━\n\n"
+        f"💬 **يمكنك الآن البدء بالدردشة مباشرة...**\n"
+        f"⚠️ استخدم /stop للإنهاء."
+    )
+
+async def connect_partners(update: Update, context: ContextTypes.DEFAULT_TYPE, uid: int, partner_id: int,
+                           source: str = "عشوائي"):
+    """ربط مستخدمين وجدهما محرك المطابقة وإبلاغ الطرفين"""
+    active_chats[uid] = partner_id
+    active_chats[partner_id] = uid
+    
+    await db.set_user_status(uid, "chatting")
+    await db.set_user_status(partner_id, "chatting")
+    await db.create_conversation(uid, partner_id)
+    
+    current_user_info = await db.get_user(uid) or {}
+    partner_info = await db.get_user(partner_id) or {}
+    
+    # إرسال الرسالة للشريك المنتظر أولاً (تحتوي على معلوماتك أنت)
+    try:
+        await context.bot.send_message(
+            chat_id=partner_id,
+            text=format_partner_info(current_user_info),
+            parse_mode='Markdown',
+            reply_markup=chat_control_keyboard()
+        )
+    except Exception as e:
+        logger.error(f"Error sending message to partner: {e}")
+        
+        # تنظيف المحادثة
+        active_chats.pop(uid, None)
+        active_chats.pop(partner_id, None)
+        conv = await db.find_active_conversation(uid, partner_id)
+        if conv:
+            await db.close_conversation(conv['id'])
+        await db.set_user_status(uid, "idle")
+        await db.set_user_status(partner_id, "idle")
+        await update.message.reply_text("❌ فشل في التواصل مع الشريك. حاول مرة أخرى.",
+                                        reply_markup=main_reply_keyboard(uid in ADMIN_IDS))
+        return False
+    
+    # إرسال الرسالة لك (تحتوي على معلومات الشريك)
+    await update.message.reply_text(
+        text=format_partner_info(partner_info),
+        parse_mode='Markdown',
+        reply_markup=chat_control_keyboard()
+    )
+    
+    await send_to_monitor(context, f"({source}) {uid} ↔ {partner_id}", "chat_start")
+    return True
+
 async def stop_search(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     uid = user.id
     
-    if uid in waiting_users:
-        waiting_users.remove(uid)
-        db.set_user_status(uid, "idle")
+    if matchmaker.cancel(uid):
+        await db.set_user_status(uid, "idle")
         await update.message.reply_text(
             "⏹️ **تم إيقاف البحث.**",
             reply_markup=main_reply_keyboard(uid in ADMIN_IDS)
@@ -528,16 +629,13 @@ async def stop_chat(update: Update, context: ContextTypes.DEFAULT_TYPE):
         del active_chats[partner]
     
     # تحديث الحالة في قاعدة البيانات
-    db.set_user_status(uid, "idle")
-    db.set_user_status(partner, "idle")
+    await db.set_user_status(uid, "idle")
+    await db.set_user_status(partner, "idle")
     
     # إغلاق المحادثة في قاعدة البيانات
-    convs = db.list_active_conversations()
-    for conv in convs:
-        if (conv['user_a'] == uid and conv['user_b'] == partner) or \
-           (conv['user_a'] == partner and conv['user_b'] == uid):
-            db.close_conversation(conv['id'])
-            break
+    conv = await db.find_active_conversation(uid, partner)
+    if conv:
+        await db.close_conversation(conv['id'])
     
     # إرسال إشعارات
     await update.message.reply_text(
@@ -554,7 +652,7 @@ async def stop_chat(update: Update, context: ContextTypes.DEFAULT_TYPE):
     except Exception:
         pass
     
-    await send_to_monitor(context, f"🔴 محادثة منتهية: {uid} ↔ {partner}")
+    await send_to_monitor(context, f"{uid} ↔ {partner}", "chat_end")
 
 # --- البحث حسب الجنس ---
 async def gender_search_entry(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -565,7 +663,7 @@ async def gender_search_entry(update: Update, context: ContextTypes.DEFAULT_TYPE
         await must_subscribe(update, context)
         return
     
-    u = db.get_user(user.id)
+    u = await db.get_user(user.id)
     
     if not u or u.get('points', 0) < GENDER_SEARCH_COST:
         await update.message.reply_text(
@@ -581,7 +679,7 @@ async def gender_search_entry(update: Update, context: ContextTypes.DEFAULT_TYPE
         f"✨ **اختر الجنس المطلوب:**",
         reply_markup=ReplyKeyboardMarkup([['👦 ذكر','👧 أنثى'],['إلغاء']], resize_keyboard=True)
     )
-    USER_STATES[user.id] = 'waiting_gender_choice'
+    set_user_state(user.id, 'waiting_gender_choice')
 
 # --- معالجة الرسائل في المحادثات ---
 async def handle_chat_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -596,16 +694,8 @@ async def handle_chat_message(update: Update, context: ContextTypes.DEFAULT_TYPE
     # تصفية الكلمات المحظورة
     text = update.message.text
     if text:
-        penalty = 0
-        lowered = text.lower()
-        for bad in FILTERED_WORDS:
-            if bad in lowered:
-                penalty += 5
-                
-        if penalty:
-            db.consume_points(uid, penalty)
-            await update.message.reply_text(f"⚠️ **تم خصم {penalty} نقاط لاستخدام كلمات محظورة.**")
-            await send_to_monitor(context, f"🚫 مستخدم {uid} استخدم كلمات محظورة: {text}")
+        # الحكم فوري والخصم والتنبيه والإشعار يتم في الخلفية
+        moderation.check(uid, partner, text, update.message.message_id)
     
     # إرسال الرسالة للشريك
     try:
@@ -624,16 +714,6 @@ async def handle_chat_message(update: Update, context: ContextTypes.DEFAULT_TYPE
         elif update.message.audio:
             await context.bot.send_audio(chat_id=partner, audio=update.message.audio.file_id)
         
-        # محاكاة مؤشر الكتابة
-        async def show_typing_to_partner():
-            try:
-                await context.bot.send_chat_action(chat_id=partner, action="typing")
-                await asyncio.sleep(1)
-            except:
-                pass
-                
-        asyncio.create_task(show_typing_to_partner())
-        
     except Exception as e:
         await update.message.reply_text("⚠️ **فشل في إرسال الرسالة.** قد يكون الشريك غادر المحادثة.")
         # تنظيف المحادثة
@@ -643,8 +723,8 @@ async def handle_chat_message(update: Update, context: ContextTypes.DEFAULT_TYPE
                 del active_chats[uid]
             if partner in active_chats:
                 del active_chats[partner]
-            db.set_user_status(uid, "idle")
-            db.set_user_status(partner, "idle")
+            await db.set_user_status(uid, "idle")
+            await db.set_user_status(partner, "idle")
 
 # --- نظام المكافآت المحسن ---
 async def reward_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -655,9 +735,9 @@ async def reward_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await must_subscribe(update, context)
         return
     
-    u = require_user_in_db(user.id, user.to_dict() if user else {})
+    u = await require_user_in_db(user.id, user.to_dict() if user else {})
     
-    last_reward = db.get_last_reward(user.id)
+    last_reward = await db.get_last_reward(user.id)
     now = now_ts()
     
     if now - last_reward < REWARD_COOLDOWN:
@@ -674,14 +754,14 @@ async def reward_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     # منح المكافأة
-    db.add_points(user.id, REWARD_POINTS)
-    db.set_last_reward(user.id, now)
+    await db.add_points(user.id, REWARD_POINTS)
+    await db.set_last_reward(user.id, now)
     
     # إذا كان مستخدم VIP، يعطي مكافأة مضاعفة
-    vip_status = db.get_vip_status(user.id)
+    vip_status = await db.get_vip_status(user.id)
     if vip_status['is_vip']:
         bonus = REWARD_POINTS * 2
-        db.add_points(user.id, bonus)
+        await db.add_points(user.id, bonus)
         reward_text = f"""
 🎉 **تم منحك مكافأة الساعة!** 👑
 
@@ -722,6 +802,7 @@ async def share_links(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     user = update.effective_user
     bot_username = (await context.bot.get_me()).username
+    u = await db.get_user(user.id) or {}
     
     links_text = f"""
 📤 **كسب النقاط عبر مشاركة الروابط**
@@ -731,11 +812,11 @@ async def share_links(update: Update, context: ContextTypes.DEFAULT_TYPE):
 🔗 **رابط الدعوة الخاص بك:**
 https://t.me/{bot_username}?start={user.id}
 
-💎 **كود الإحالة:** {db.get_user(user.id).get('referral_code', '')}
+💎 **كود الإحالة:** {u.get('referral_code', '')}
 
 📊 **إحصائياتك الحالية:**
-• عدد الإحالات: {db.get_user(user.id).get('referrals', 0)}
-• النقاط المحصلة: {db.get_user(user.id).get('referrals', 0) * 20} نقطة
+• عدد الإحالات: {u.get('referrals', 0)}
+• النقاط المحصلة: {u.get('referrals', 0) * 20} نقطة
 
 🔥 **ابدأ المشاركة الآن واكسب المزيد!**
 """
@@ -750,6 +831,7 @@ async def invite_friends(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     user = update.effective_user
     bot_username = (await context.bot.get_me()).username
+    u = await db.get_user(user.id) or {}
     
     invite_text = f"""
 👥 **دعوة الأصدقاء**
@@ -762,7 +844,7 @@ async def invite_friends(update: Update, context: ContextTypes.DEFAULT_TYPE):
 🔗 **رابط الدعوة الخاص بك:**
 https://t.me/{bot_username}?start={user.id}
 
-💎 **كود الإحالة:** {db.get_user(user.id).get('referral_code', '')}
+💎 **كود الإحالة:** {u.get('referral_code', '')}
 
 📋 **تعليمات الدعوة:**
 1. انسخ الرابط أعلاه
@@ -770,8 +852,8 @@ https://t.me/{bot_username}?start={user.id}
 3. احصل على 20 نقطة فور انضمام كل صديق
 
 📊 **إحصائيات دعوتك:**
-• عدد الأصدقاء المدعوين: {db.get_user(user.id).get('referrals', 0)}
-• النقاط المحصلة: {db.get_user(user.id).get('referrals', 0) * 20} نقطة
+• عدد الأصدقاء المدعوين: {u.get('referrals', 0)}
+• النقاط المحصلة: {u.get('referrals', 0) * 20} نقطة
 """
     
     await update.message.reply_text(invite_text, reply_markup=earn_points_keyboard())
@@ -801,7 +883,7 @@ async def show_profile(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     user = update.effective_user
-    u = safe_get_user(user.id)
+    u = await safe_get_user(user.id)
     
     # حساب المستوى
     level = u.get('level', 1)
@@ -810,16 +892,16 @@ async def show_profile(update: Update, context: ContextTypes.DEFAULT_TYPE):
     progress = min((points / next_level_points) * 100, 100) if next_level_points > 0 else 0
     
     # حساب متوسط التقييم
-    avg_rating = db.get_average_rating(user.id)
+    avg_rating = await db.get_average_rating(user.id)
     
     # حالة VIP
-    vip_status = db.get_vip_status(user.id)
+    vip_status = await db.get_vip_status(user.id)
     vip_info = f"❌ غير مشترك" 
     if vip_status['is_vip']:
         vip_info = f"✅ {vip_status['vip_title']} ({vip_status['days_left']} يوم متبقي)"
     
     # رصيد النجوم
-    stars_balance = db.get_stars_balance(user.id)
+    stars_balance = await db.get_stars_balance(user.id)
     
     profile_text = f"""
 📄 **الملف الشخصي لـ {user.first_name}**
@@ -853,7 +935,7 @@ async def settings_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     user = update.effective_user
-    await update.message.reply_text("⚙️ **إعدادات الملف الشخصي:**", reply_markup=settings_keyboard(user.id))
+    await update.message.reply_text("⚙️ **إعدادات الملف الشخصي:**", reply_markup=await settings_keyboard(user.id))
 
 async def update_gender(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # التحقق من الاشتراك الإجباري
@@ -862,17 +944,17 @@ async def update_gender(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     user = update.effective_user
-    u = db.get_user(user.id)
+    u = await db.get_user(user.id)
     
     if u and u.get('gender') and u.get('gender_changed', 0) == 1:
         if u.get('points', 0) < GENDER_CHANGE_COST:
             await update.message.reply_text(
                 f"❌ تحتاج {GENDER_CHANGE_COST} نقاط لتغيير الجنس.",
-                reply_markup=settings_keyboard(user.id)
+                reply_markup=await settings_keyboard(user.id)
             )
             return
         else:
-            db.consume_points(user.id, GENDER_CHANGE_COST)
+            await db.consume_points(user.id, GENDER_CHANGE_COST)
             await update.message.reply_text(
                 f"💰 تم خصم {GENDER_CHANGE_COST} نقاط لتغيير الجنس."
             )
@@ -882,7 +964,7 @@ async def update_gender(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "⚠️ **ملاحظة:** يمكن تغيير الجنس مرة واحدة فقط مجاناً!",
         reply_markup=gender_select_keyboard()
     )
-    USER_STATES[user.id] = 'waiting_gender_update'
+    set_user_state(user.id, 'waiting_gender_update')
 
 async def update_age(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # التحقق من الاشتراك الإجباري
@@ -891,7 +973,7 @@ async def update_age(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     user = update.effective_user
-    USER_STATES[user.id] = 'waiting_age_update'
+    set_user_state(user.id, 'waiting_age_update')
     await update.message.reply_text(
         "🎂 **أدخل عمرك:**\n\n"
         "⚠️ **الشرط:** يجب أن يكون العمر بين 15 و 60 سنة"
@@ -908,20 +990,20 @@ async def update_country(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "👇 **اختر بلدك من القائمة:**",
         reply_markup=country_select_keyboard()
     )
-    USER_STATES[update.effective_user.id] = 'waiting_country_update'
+    set_user_state(update.effective_user.id, 'waiting_country_update')
 
 # --- تحديث البيانات ---
 async def handle_gender_update(update: Update, context: ContextTypes.DEFAULT_TYPE, gender: str):
     user = update.effective_user
     try:
-        db.update_user_profile(user.id, {
+        await db.update_user_profile(user.id, {
             'gender': gender,
             'gender_changed': 1
         })
         await update.message.reply_text(
             f"✅ **تم تحديث الجنس إلى:** {gender}\n\n"
             f"⚠️ **ملاحظة:** يمكنك تغيير الجنس مرة أخرى مقابل {GENDER_CHANGE_COST} نقاط",
-            reply_markup=settings_keyboard(user.id)
+            reply_markup=await settings_keyboard(user.id)
         )
         USER_STATES.pop(user.id, None)
     except Exception as e:
@@ -939,10 +1021,10 @@ async def handle_age_update(update: Update, context: ContextTypes.DEFAULT_TYPE,
             await update.message.reply_text("⚠️ العمر يجب أن يكون بين 15 و 60 سنة.")
             return
         
-        db.update_user_profile(user.id, {'age': age_int})
+        await db.update_user_profile(user.id, {'age': age_int})
         await update.message.reply_text(
             f"✅ **تم تحديث العمر إلى:** {age} سنة",
-            reply_markup=settings_keyboard(user.id)
+            reply_markup=await settings_keyboard(user.id)
         )
         USER_STATES.pop(user.id, None)
     except ValueError:
@@ -959,13 +1041,13 @@ async def handle_country_update(update: Update, context: ContextTypes.DEFAULT_TY
     try:
         if country == "🌍 دولة أخرى":
             await update.message.reply_text("🌍 **أدخل اسم بلدك:**")
-            USER_STATES[user.id] = 'waiting_country_name'
+            set_user_state(user.id, 'waiting_country_name')
             return
             
-        db.update_user_profile(user.id, {'country': country})
+        await db.update_user_profile(user.id, {'country': country})
         await update.message.reply_text(
             f"✅ **تم تحديث البلد إلى:** {country}",
-            reply_markup=settings_keyboard(user.id)
+            reply_markup=await settings_keyboard(user.id)
         )
         USER_STATES.pop(user.id, None)
     except Exception as e:
@@ -996,12 +1078,21 @@ async def xo_game_random(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if user.id in USER_STATES and USER_STATES[user.id].startswith('playing_xo_'):
         USER_STATES.pop(user.id, None)
     
-    # البحث عن خصم
+    # البحث عن خصم (الانتظار في مهمة منفصلة حتى لا تتوقف معالجة التحديثات الأخرى)
     await update.message.reply_text("🔍 **جاري البحث عن خصم...**")
+    context.application.create_task(run_xo_search(update, context), update=update)
+
+async def run_xo_search(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """انتظار خصم XO ثم إنشاء اللعبة إذا كان هذا اللاعب هو من وجد الخصم"""
+    user = update.effective_user
+    match = await game_manager.search_xo_opponent(user.id, context, max_wait=XO_SEARCH_TIMEOUT)
     
-    opponent_id = await game_manager.search_xo_opponent(user.id, context, max_wait=60)
+    if match and not match.initiator:
+        # الخصم الذي وجدنا هو من ينشئ اللعبة ويرسل لنا اللوحة
+        return
     
-    if opponent_id:
+    if match:
+        opponent_id = match.opponent_id
         # إنشاء لعبة جديدة
         game = game_manager.create_xo_game(user.id, opponent_id, is_random=True)
         
@@ -1012,13 +1103,13 @@ async def xo_game_random(update: Update, context: ContextTypes.DEFAULT_TYPE):
             f"• الفائز: يحصل على 5 نقاط من الخاسر\n"
             f"• الخاسر: يخسر 5 نقاط للفائز\n\n"
             f"👇 **دورك الآن، اختر خانة:**",
-            reply_markup=create_xo_keyboard(game.board, game.game_id, can_play=(game.current_player == user.id))
+            reply_markup=game.keyboard(user.id)
         )
         game.message_ids[user.id] = msg1.message_id
         
         try:
             # إرسال رسالة للخصم
-            opponent_info = db.get_user(opponent_id)
+            opponent_info = await db.get_user(opponent_id)
             opponent_name = opponent_info.get('first_name', 'لاعب') if opponent_info else 'لاعب'
             
             msg2 = await context.bot.send_message(
@@ -1028,7 +1119,7 @@ async def xo_game_random(update: Update, context: ContextTypes.DEFAULT_TYPE):
                      f"• الفائز: يحصل على 5 نقاط من الخاسر\n"
                      f"• الخاسر: يخسر 5 نقاط للفائز\n\n"
                      f"👇 **دورك الآن، اختر خانة:**",
-                reply_markup=create_xo_keyboard(game.board, game.game_id, can_play=(game.current_player == opponent_id))
+                reply_markup=game.keyboard(opponent_id)
             )
             game.message_ids[opponent_id] = msg2.message_id
             
@@ -1064,7 +1155,40 @@ async def guess_number_game(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     USER_STATES[user.id] = f'playing_guess_{game.game_id}'
 
+async def edit_xo_message(context: ContextTypes.DEFAULT_TYPE, game, player_id: int, text: str, query=None):
+    """تعديل رسالة لوحة XO لدى لاعب، وتخطي التعديل إذا كانت الرسالة معروضة كما هي"""
+    if query is None and player_id not in game.message_ids:
+        return
+    markup = game.keyboard(player_id)
+    if not game.needs_edit(player_id, text, markup):
+        return
+    try:
+        if query is not None:
+            await query.edit_message_text(text, reply_markup=markup)
+        else:
+            await context.bot.edit_message_text(
+                chat_id=player_id,
+                message_id=game.message_ids[player_id],
+                text=text,
+                reply_markup=markup
+            )
+    except Exception:
+        # لا نعرف ما يعرضه اللاعب الآن: التعديل القادم يُرسل دائماً
+        game.rendered.pop(player_id, None)
+        if query is not None:
+            raise
+
+async def update_xo_messages(query, context: ContextTypes.DEFAULT_TYPE, game, player_id: int, opponent_id: int, text: str):
+    """تحديث رسالة اللاعب الذي ضغط الزر ورسالة خصمه"""
+    await edit_xo_message(context, game, player_id, text, query)
+    await edit_xo_message(context, game, opponent_id, text)
+
 async def handle_xo_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # تحديثات اللوحة تأتي بعد رسائل المحادثات في طابور الإرسال
+    with send_priority(PRIORITY_GAME):
+        await _handle_xo_callback(update, context)
+
+async def _handle_xo_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     user = query.from_user
@@ -1097,136 +1221,57 @@ async def handle_xo_callback(update: Update, context: ContextTypes.DEFAULT_TYPE)
             return
         
         # تحديث لوحة اللعبة
+        opponent_id = game.player2 if game.player1 == user.id else game.player1
         if result == "فوز":
             # حساب الفائز والخاسر
             loser = game.player2 if winner == game.player1 else game.player1
             
-            # توزيع النقاط: الفائز يكسب 5 نقاط من الخاسر
-            db.add_points(winner, 5)
-            db.consume_points(loser, 5)
+            # توزيع النقاط: الفائز يكسب من الخاسر بقدر ما يملك (تحويل واحد)
+            transfer = await db.transfer_points(loser, winner, XO_WIN_POINTS, f"xo_win:{game_id}", allow_partial=True)
+            won = transfer.amount if transfer.ok else 0
             
             winner_text = f"""
 🎉 **{game.symbols[winner]} فاز!**
 
 💰 **المكافآت:**
-• الفائز: +5 نقاط 🌶️
-• الخاسر: -5 نقاط 🌶️
+• الفائز: +{won} نقاط 🌶️
+• الخاسر: -{won} نقاط 🌶️
 
 👑 **مبروك للفائز!**
 """
             
-            await query.edit_message_text(
-                winner_text,
-                reply_markup=create_xo_keyboard(game.board, game_id, can_play=False)
-            )
-            
-            # تحديث رسالة الخصم
-            if user.id == game.player1 and game.player2 in game.message_ids:
-                try:
-                    await context.bot.edit_message_text(
-                        chat_id=game.player2,
-                        message_id=game.message_ids[game.player2],
-                        text=winner_text,
-                        reply_markup=create_xo_keyboard(game.board, game_id, can_play=False)
-                    )
-                except:
-                    pass
-            elif user.id == game.player2 and game.player1 in game.message_ids:
-                try:
-                    await context.bot.edit_message_text(
-                        chat_id=game.player1,
-                        message_id=game.message_ids[game.player1],
-                        text=winner_text,
-                        reply_markup=create_xo_keyboard(game.board, game_id, can_play=False)
-                    )
-                except:
-                    pass
+            await update_xo_messages(query, context, game, user.id, opponent_id, winner_text)
             
             # تسجيل اللعبة في قاعدة البيانات
-            db.create_game('xo', winner, loser)
-            db.update_game_result(game_id, 'win', 5, 0)
+            await db.record_game('xo', winner, loser, 'win', won, winner=winner)
             
-            # تنظيف اللعبة بعد فترة
-            await asyncio.sleep(10)
-            game_manager.delete_xo_game(game_id)
+            # تنظيف اللعبة بعد فترة (مؤقت، فلا يبقى التحديث ومفتاح اللعبة محجوزين)
+            game_manager.finish_xo_game(game_id)
             
         elif result == "تعادل":
             tie_text = "🤝 **تعادل!**\n\n💰 **لا توجد نقاط مكتسبة أو خاسرة.**"
-            await query.edit_message_text(
-                tie_text,
-                reply_markup=create_xo_keyboard(game.board, game_id, can_play=False)
-            )
-            
-            if user.id == game.player1 and game.player2 in game.message_ids:
-                try:
-                    await context.bot.edit_message_text(
-                        chat_id=game.player2,
-                        message_id=game.message_ids[game.player2],
-                        text=tie_text,
-                        reply_markup=create_xo_keyboard(game.board, game_id, can_play=False)
-                    )
-                except:
-                    pass
-            elif user.id == game.player2 and game.player1 in game.message_ids:
-                try:
-                    await context.bot.edit_message_text(
-                        chat_id=game.player1,
-                        message_id=game.message_ids[game.player1],
-                        text=tie_text,
-                        reply_markup=create_xo_keyboard(game.board, game_id, can_play=False)
-                    )
-                except:
-                    pass
+            await update_xo_messages(query, context, game, user.id, opponent_id, tie_text)
             
             # تسجيل اللعبة
-            db.create_game('xo', game.player1, game.player2)
-            db.update_game_result(game_id, 'draw', 0, 0)
+            await db.record_game('xo', game.player1, game.player2, 'draw')
             
-            await asyncio.sleep(10)
-            game_manager.delete_xo_game(game_id)
+            game_manager.finish_xo_game(game_id)
             
         else:  # استمرار
             current_symbol = game.symbols[game.current_player]
-            await query.edit_message_text(
-                f"🎮 **دور:** {current_symbol}\n👇 **اختر خانة:**",
-                reply_markup=create_xo_keyboard(game.board, game_id, can_play=(game.current_player == user.id))
-            )
-            
-            opponent_id = game.player2 if game.player1 == user.id else game.player1
-            if opponent_id in game.message_ids:
-                try:
-                    await context.bot.edit_message_text(
-                        chat_id=opponent_id,
-                        message_id=game.message_ids[opponent_id],
-                        text=f"🎮 **دور:** {current_symbol}\n👇 **اختر خانة:**",
-                        reply_markup=create_xo_keyboard(game.board, game_id, can_play=(game.current_player == opponent_id))
-                    )
-                except:
-                    pass
+            await update_xo_messages(query, context, game, user.id, opponent_id,
+                                     f"🎮 **دور:** {current_symbol}\n👇 **اختر خانة:**")
     
     elif data.startswith("xo_restart_"):
         game_id = int(data.split("_")[2])
         game = game_manager.get_xo_game(game_id)
         
         if game and user.id in [game.player1, game.player2]:
-            game.restart()
+            game_manager.restart_xo_game(game)
             current_symbol = game.symbols[game.current_player]
-            await query.edit_message_text(
-                f"🔄 **تم إعادة اللعبة**\n🎮 **دور:** {current_symbol}\n👇 **اختر خانة:**",
-                reply_markup=create_xo_keyboard(game.board, game_id, can_play=(game.current_player == user.id))
-            )
-            
             opponent_id = game.player2 if game.player1 == user.id else game.player1
-            if opponent_id in game.message_ids:
-                try:
-                    await context.bot.edit_message_text(
-                        chat_id=opponent_id,
-                        message_id=game.message_ids[opponent_id],
-                        text=f"🔄 **تم إعادة اللعبة**\n🎮 **دور:** {current_symbol}\n👇 **اختر خانة:**",
-                        reply_markup=create_xo_keyboard(game.board, game_id, can_play=(game.current_player == opponent_id))
-                    )
-                except:
-                    pass
+            await update_xo_messages(query, context, game, user.id, opponent_id,
+                                     f"🔄 **تم إعادة اللعبة**\n🎮 **دور:** {current_symbol}\n👇 **اختر خانة:**")
     
     elif data.startswith("xo_exit_"):
         game_id = int(data.split("_")[2])
@@ -1252,10 +1297,7 @@ async def handle_xo_callback(update: Update, context: ContextTypes.DEFAULT_TYPE)
         
         if game and user.id in [game.player1, game.player2]:
             current_symbol = game.symbols[game.current_player]
-            await query.edit_message_text(
-                f"🎮 **دور:** {current_symbol}\n👇 **اختر خانة:**",
-                reply_markup=create_xo_keyboard(game.board, game_id, can_play=(game.current_player == user.id))
-            )
+            await edit_xo_message(context, game, user.id, f"🎮 **دور:** {current_symbol}\n👇 **اختر خانة:**", query)
 
 # --- نظام النجوم في البوت الرئيسي ---
 async def stars_menu_main(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -1277,8 +1319,8 @@ async def show_stars_balance_main(update: Update, context: ContextTypes.DEFAULT_
     """عرض رصيد النجوم من الزر الرئيسي"""
     user = update.effective_user
     
-    stars_balance = db.get_stars_balance(user.id)
-    vip_status = db.get_vip_status(user.id)
+    stars_balance = await db.get_stars_balance(user.id)
+    vip_status = await db.get_vip_status(user.id)
     
     balance_text = f"""
 💰 **رصيد النجوم:** {stars_balance} ⭐
@@ -1317,8 +1359,8 @@ async def vip_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     user = update.effective_user
-    u = db.get_user(user.id)
-    vip_status = db.get_vip_status(user.id)
+    u = await db.get_user(user.id)
+    vip_status = await db.get_vip_status(user.id)
     
     vip_text = f"""
 👑 **نظام VIP**
@@ -1337,7 +1379,7 @@ async def vip_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 📊 **حالتك الحالية:**
 • **النقاط:** {u.get('points', 0)} 🌶️
-• **النجوم:** {db.get_stars_balance(user.id)} ⭐
+• **النجوم:** {await db.get_stars_balance(user.id)} ⭐
 • **حالة VIP:** {'✅ نشط' if vip_status['is_vip'] else '❌ غير نشط'}
 • **الأيام المتبقية:** {vip_status['days_left'] if vip_status['is_vip'] else 0}
 
@@ -1353,7 +1395,7 @@ async def vip_purchase_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     user = update.effective_user
-    u = db.get_user(user.id)
+    u = await db.get_user(user.id)
     
     vip_text = f"""
 🛒 **شراء اشتراك VIP بالنقاط**
@@ -1395,17 +1437,17 @@ async def handle_vip_purchase(update: Update, context: ContextTypes.DEFAULT_TYPE
         await query.edit_message_text("❌ **الباقة غير متوفرة.**")
         return
     
-    u = db.get_user(user.id)
+    u = await db.get_user(user.id)
     if not u or u.get('points', 0) < price:
         await query.edit_message_text(f"❌ **نقاطك غير كافية.** تحتاج {price} نقطة.")
         return
     
     # شراء VIP
-    if db.purchase_vip(user.id, days, price):
-        vip_status = db.get_vip_status(user.id)
+    if await db.purchase_vip(user.id, days, price):
+        vip_status = await db.get_vip_status(user.id)
         
         # تحديث معلومات VIP في قاعدة البيانات
-        db.set_vip(user.id, days)
+        await db.set_vip(user.id, days)
         
         await query.edit_message_text(
             f"✅ **تم شراء اشتراك VIP بنجاح!**\n\n"
@@ -1439,7 +1481,7 @@ async def vip_contact_admin(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     user = update.effective_user
-    vip_status = db.get_vip_status(user.id)
+    vip_status = await db.get_vip_status(user.id)
     
     if not vip_status['is_vip']:
         await update.message.reply_text(
@@ -1458,7 +1500,7 @@ async def vip_contact_admin(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "👉 @ssvv119\n\n"
         "📞 **أو أرسل رسالتك هنا وسيتم إرسالها للمشرف:**"
     )
-    USER_STATES[user.id] = 'waiting_admin_message'
+    set_user_state(user.id, 'waiting_admin_message')
 
 # --- الإحصائيات والوظائف الإضافية ---
 async def stats_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -1472,7 +1514,7 @@ async def stats_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def show_users_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """عرض إحصائيات المستخدمين"""
-    stats = db.get_stats()
+    stats = await db.get_stats()
     
     stats_text = f"""
 👥 **إحصائيات المستخدمين:**
@@ -1497,7 +1539,7 @@ async def show_users_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def show_activity_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """عرض إحصائيات النشاط"""
-    stats = db.get_stats()
+    stats = await db.get_stats()
     
     activity_text = f"""
 🎯 **إحصائيات النشاط:**
@@ -1519,7 +1561,7 @@ async def show_activity_stats(update: Update, context: ContextTypes.DEFAULT_TYPE
 
 async def show_points_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """عرض إحصائيات النقاط"""
-    stats = db.get_stats()
+    stats = await db.get_stats()
     
     points_text = f"""
 💰 **إحصائيات النقاط:**
@@ -1540,7 +1582,7 @@ async def show_points_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def show_stars_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """عرض إحصائيات النجوم"""
-    stats = db.get_stats()
+    stats = await db.get_stats()
     
     stars_text = f"""
 ⭐ **إحصائيات النجوم:**
@@ -1569,7 +1611,7 @@ async def leaderboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     try:
         # الحصول على أفضل 10 مستخدمين حسب النقاط
-        top_users = db.get_leaderboard(limit=10)
+        top_users = await db.get_leaderboard(limit=10)
         
         if not top_users:
             await update.message.reply_text(
@@ -1588,8 +1630,8 @@ async def leaderboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
             leaderboard_text += f"{medal} **{name}** - {points} نقطة 🌶️\n"
         
         # ترتيب المستخدم الحالي
-        user_rank = db.get_user_rank(user.id)
-        user_info = db.get_user(user.id)
+        user_rank = await db.get_user_rank(user.id)
+        user_info = await db.get_user(user.id)
         user_points = user_info.get('points', 0) if user_info else 0
         
         leaderboard_text += f"\n📊 **ترتيبك الحالي:** #{user_rank}\n"
@@ -1619,7 +1661,7 @@ async def admin_opener_handler(update: Update, context: ContextTypes.DEFAULT_TYP
     
     try:
         # جلب الإحصائيات من قاعدة البيانات
-        stats = db.get_stats()
+        stats = await db.get_stats()
         
         admin_text = f"""
 🛠️ **لوحة المشرف**
@@ -1662,8 +1704,8 @@ async def admin_stats_full(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     try:
-        stats = db.get_stats()
-        vip_stats = db.get_vip_stats()
+        stats = await db.get_stats()
+        vip_stats = await db.get_vip_stats()
         
         stats_text = f"""
 📊 **الإحصائيات الكاملة:**
@@ -1714,7 +1756,7 @@ async def admin_banned_users(update: Update, context: ContextTypes.DEFAULT_TYPE)
     
     try:
         # الحصول على جميع المستخدمين
-        all_users = db.list_all_users(limit=1000)
+        all_users = await db.list_all_users(limit=1000)
         banned_users = []
         
         now = now_ts()
@@ -1791,232 +1833,143 @@ async def relay_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
 
 async def _relay_message_internal(update: Update, context: ContextTypes.DEFAULT_TYPE, user, text: str):
-    # معالجة التقييمات
-    if user.id in USER_STATES and USER_STATES[user.id] == 'waiting_for_rating':
-        if '⭐ 1' in text:
-            rating = 1
-            USER_STATES.pop(user.id, None)
-            await update.message.reply_text(
-                f"⭐ **شكراً لتقييمك!** تم تسجيل {rating} نجوم.", 
-                reply_markup=main_reply_keyboard(user.id in ADMIN_IDS)
-            )
-        elif '⭐⭐ 2' in text:
-            rating = 2
-            USER_STATES.pop(user.id, None)
-            await update.message.reply_text(
-                f"⭐⭐ **شكراً لتقييمك!** تم تسجيل {rating} نجوم.", 
-                reply_markup=main_reply_keyboard(user.id in ADMIN_IDS)
-            )
-        elif '⭐⭐⭐ 3' in text:
-            rating = 3
-            USER_STATES.pop(user.id, None)
-            await update.message.reply_text(
-                f"⭐⭐⭐ **شكراً لتقييمك!** تم تسجيل {rating} نجوم.", 
-                reply_markup=main_reply_keyboard(user.id in ADMIN_IDS)
-            )
-        elif '⭐⭐⭐⭐ 4' in text:
-            rating = 4
-            USER_STATES.pop(user.id, None)
-            await update.message.reply_text(
-                f"⭐⭐⭐⭐ **شكراً لتقييمك!** تم تسجيل {rating} نجوم.", 
-                reply_markup=main_reply_keyboard(user.id in ADMIN_IDS)
-            )
-        elif '⭐⭐⭐⭐⭐ 5' in text:
-            rating = 5
-            USER_STATES.pop(user.id, None)
-            await update.message.reply_text(
-                f"⭐⭐⭐⭐⭐ **شكراً لتقييمك!** تم تسجيل {rating} نجوم.", 
-                reply_markup=main_reply_keyboard(user.id in ADMIN_IDS)
-            )
-        elif 'تخطي' in text:
+    state = USER_STATES.get(user.id)
+    
+    # المسار السريع: رسائل المحادثة النشطة تُرسل للشريك دون المرور بالقوائم
+    if state is None:
+        button = router.button(text)
+        if button is None:
+            if user.id in active_chats:
+                await handle_chat_message(update, context)
+            else:
+                await reply_not_understood(update, context)
+            return
+        await button(update, context)
+        return
+    
+    # حالات انتظار إدخال من المستخدم (False: الرسالة ليست للحالة فتكمل إلى الأزرار)
+    handler = router.state(state)
+    if handler is not None and await handler(update, context, text) is not False:
+        return
+    
+    button = router.button(text)
+    if button is not None:
+        await button(update, context)
+    elif user.id in active_chats:
+        await handle_chat_message(update, context)
+    else:
+        await reply_not_understood(update, context)
+
+async def reply_not_understood(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.message.reply_text(
+        "🤔 **لم أفهم طلبك.**\n"
+        "استخدم الأزرار للتفاعل مع البوت 🎮", 
+        reply_markup=main_reply_keyboard(update.effective_user.id in ADMIN_IDS)
+    )
+
+# --- معالجات الحالات ---
+async def handle_rating_state(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str):
+    user = update.effective_user
+    for rating in range(1, 6):
+        stars = '⭐' * rating
+        if f"{stars} {rating}" in text:
             USER_STATES.pop(user.id, None)
             await update.message.reply_text(
-                "✅ **تم تخطي التقييم.**", 
+                f"{stars} **شكراً لتقييمك!** تم تسجيل {rating} نجوم.", 
                 reply_markup=main_reply_keyboard(user.id in ADMIN_IDS)
             )
-        return
-    
-    # معالجة رسائل المشرف من VIP
-    if user.id in USER_STATES and USER_STATES[user.id] == 'waiting_admin_message':
-        message = text
+            return
+    if 'تخطي' in text:
         USER_STATES.pop(user.id, None)
-        
-        # إرسال الرسالة للمشرفين
-        for admin_id in ADMIN_IDS:
-            try:
-                await context.bot.send_message(
-                    chat_id=admin_id,
-                    text=f"📩 **رسالة من VIP:**\n\n"
-                         f"👤 **المستخدم:** {user.first_name} (ID: {user.id})\n"
-                         f"💬 **الرسالة:** {message}\n\n"
-                         f"📨 **للرد:** /reply {user.id} <الرسالة>"
-                )
-            except:
-                pass
-        
         await update.message.reply_text(
-            "✅ **تم إرسال رسالتك للمشرف بنجاح.**\n\n"
-            "👨‍💼 **سيتم الرد عليك في أقرب وقت.**",
-            reply_markup=vip_keyboard()
+            "✅ **تم تخطي التقييم.**", 
+            reply_markup=main_reply_keyboard(user.id in ADMIN_IDS)
         )
-        return
+
+async def handle_admin_message_state(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str):
+    """رسالة VIP للمشرفين"""
+    user = update.effective_user
+    USER_STATES.pop(user.id, None)
     
-    # معالجة اسم البلد المخصص
-    if user.id in USER_STATES and USER_STATES[user.id] == 'waiting_country_name':
-        db.update_user_profile(user.id, {'country': text})
-        await update.message.reply_text(
-            f"✅ **تم تحديث البلد إلى:** {text}",
-            reply_markup=settings_keyboard(user.id)
-        )
-        USER_STATES.pop(user.id, None)
-        return
+    for admin_id in ADMIN_IDS:
+        try:
+            await context.bot.send_message(
+                chat_id=admin_id,
+                text=f"📩 **رسالة من VIP:**\n\n"
+                     f"👤 **المستخدم:** {user.first_name} (ID: {user.id})\n"
+                     f"💬 **الرسالة:** {text}\n\n"
+                     f"📨 **للرد:** /reply {user.id} <الرسالة>"
+            )
+        except:
+            pass
+    
+    await update.message.reply_text(
+        "✅ **تم إرسال رسالتك للمشرف بنجاح.**\n\n"
+        "👨‍💼 **سيتم الرد عليك في أقرب وقت.**",
+        reply_markup=vip_keyboard()
+    )
 
-    # معالجة حالات المستخدم
-    if user.id in USER_STATES:
-        state = USER_STATES[user.id]
-        
-        if state == 'waiting_gender_choice':
-            await handle_gender_choice(update, context, text)
-            return
-            
-        elif state == 'waiting_gender_confirm':
-            await handle_gender_confirm(update, context, text)
-            return
-            
-        elif state == 'waiting_gender_update':
-            if text == '👦 ذكر':
-                await handle_gender_update(update, context, 'ذكر')
-            elif text == '👧 أنثى':
-                await handle_gender_update(update, context, 'أنثى')
-            elif text == '⬅️ رجوع':
-                USER_STATES.pop(user.id, None)
-                await update.message.reply_text("↩️ **تم الرجوع.**", reply_markup=settings_keyboard(user.id))
-            return
-            
-        elif state == 'waiting_age_update':
-            await handle_age_update(update, context, text)
-            return
-            
-        elif state == 'waiting_country_update':
-            if text != '⬅️ رجوع':
-                await handle_country_update(update, context, text)
-            else:
-                USER_STATES.pop(user.id, None)
-                await update.message.reply_text("↩️ **تم الرجوع.**", reply_markup=settings_keyboard(user.id))
-            return
-            
-        elif state.startswith('playing_guess_'):
-            await handle_guess_game(update, context, state, text)
-            return
+async def handle_country_name_state(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str):
+    user = update.effective_user
+    await db.update_user_profile(user.id, {'country': text})
+    await update.message.reply_text(
+        f"✅ **تم تحديث البلد إلى:** {text}",
+        reply_markup=await settings_keyboard(user.id)
+    )
+    USER_STATES.pop(user.id, None)
 
-    # معالجة الأزرار الرئيسية
-    if text == "🚀 بحث عشوائي":
-        await start_search(update, context)
-    elif text == "⚤ بحث بالجنس":
-        await gender_search_entry(update, context)
-    elif text == "🎩 حسابي":
-        await profile_menu(update, context)
-    elif text == "📄 ملفي الشخصي":
-        await show_profile(update, context)
-    elif text == "⚙️ إعدادات الملف":
-        await settings_menu(update, context)
-    elif text == "👫 الجنس" or text == "👫 الجنس (10 💰)":
-        await update_gender(update, context)
-    elif text == "🎂 العمر":
-        await update_age(update, context)
-    elif text == "📍 البلد":
-        await update_country(update, context)
-    elif text == "💰 كسب النقاط":
-        await earn_points_menu(update, context)
-    elif text == "📤 مشاركة الروابط":
-        await share_links(update, context)
-    elif text == "👥 إحالة أصدقاء":
-        await invite_friends(update, context)
-    elif text == "🎁 هدايا الأصدقاء":
-        await friends_gifts_menu(update, context)
-    elif text == "":
-        await reward_handler(update, context)
-    elif text == "🎮 الألعاب":
-        await games_menu(update, context)
-    elif text == "🎯 XO العشوائي":
-        await xo_game_random(update, context)
-    elif text == "  ":
-        await guess_number_game(update, context)
-    elif text == "🎰 لعبة الحظ":
-        await update.message.reply_text("🎰 **لعبة الحظ قريباً...**", reply_markup=games_keyboard())
-    elif text == "📊 إحصائيات":
-        await stats_menu(update, context)
-    elif text == "👥 المستخدمين":
-        await show_users_stats(update, context)
-    elif text == "🎯 النشاط":
-        await show_activity_stats(update, context)
-    elif text == "💰 النقاط":
-        await show_points_stats(update, context)
-    elif text == "⭐ النجوم":
-        await show_stars_stats(update, context)
-    elif text == "⭐ النجوم" and text != "⭐ النجوم":  # معالجة زر النجوم الرئيسي
-        await stars_menu_main(update, context)
-    elif text == "👑 VIP":
-        await vip_menu(update, context)
-    elif text == "🏆 المتصدرين":
-        await leaderboard(update, context)
-    elif text == "🛠️ لوحة المشرف":
-        await admin_opener_handler(update, context)
-    elif text == "⏹️ إيقاف البحث":
-        await stop_search(update, context)
-    elif text == "⬅️ الرئيسية":
-        await update.message.reply_text("🏠 **القائمة الرئيسية**", 
-                                      reply_markup=main_reply_keyboard(user.id in ADMIN_IDS))
-    elif text == "⬅️ رجوع":
-        await update.message.reply_text("↩️ **تم الرجوع.**", reply_markup=settings_keyboard(user.id))
-    elif text == "👑 اشتراك VIP":
-        await vip_purchase_menu(update, context)
-    elif text == "⭐ VIP بالنجوم":
-        await vip_stars_menu_main(update, context)
-    elif text == "📞 تواصل مع المشرف":
-        await vip_contact_admin(update, context)
-    elif text in ['👦 ذكر', '👧 أنثى']:
-        if USER_STATES.get(user.id) == 'waiting_gender_update':
-            await handle_gender_update(update, context, 'ذكر' if 'ذكر' in text else 'أنثى')
-    elif text in ['نعم ✅', 'لا ❌'] and USER_STATES.get(user.id) == 'waiting_gender_confirm':
-        pass  # تمت المعالجة أعلاه
-    elif text == "⏹️ إنهاء المحادثة":
-        await stop_chat(update, context)
-    elif text == "⭐ إضافة صديق":
-        await add_friend(update, context)
-    elif text == "📋 قائمة الأصدقاء":
-        await friends_list(update, context)
-    elif text == "💌 إرسال نقاط":
-        await send_points_to_friend(update, context)
-    elif text == "⭐ التقييم" and user.id in active_chats:
-        await update.message.reply_text(
-            "⭐ **كيف تقيم تجربة الدردشة مع الشريك؟**",
-            reply_markup=rating_keyboard()
-        )
-        USER_STATES[user.id] = 'waiting_for_rating'
-    elif text == "📊 الإحصائيات الكاملة":
-        await admin_stats_full(update, context)
-    elif text == "👥 المستخدمين المحظورين":
-        await admin_banned_users(update, context)
-    elif text == "💰 توزيع النقاط":
-        await admin_distribute_points(update, context)
-    elif text == "⭐ توزيع النجوم":
-        await admin_distribute_stars(update, context)
-    elif text == "📢 بث سريع":
-        await admin_broadcast(update, context)
-    elif text == "🔄 تحديث النظام":
-        await admin_update_system(update, context)
-    
-    # معالجة المحادثات النشطة
-    elif user.id in active_chats:
-        await handle_chat_message(update, context)
-    
+async def handle_gender_update_state(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str):
+    if text == '👦 ذكر':
+        await handle_gender_update(update, context, 'ذكر')
+    elif text == '👧 أنثى':
+        await handle_gender_update(update, context, 'أنثى')
+    elif text == '⬅️ رجوع':
+        await back_from_settings_state(update, context)
+
+async def handle_country_update_state(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str):
+    if text != '⬅️ رجوع':
+        await handle_country_update(update, context, text)
     else:
-        await update.message.reply_text(
-            "🤔 **لم أفهم طلبك.**\n"
-            "استخدم الأزرار للتفاعل مع البوت 🎮", 
-            reply_markup=main_reply_keyboard(user.id in ADMIN_IDS)
-        )
+        await back_from_settings_state(update, context)
+
+async def back_from_settings_state(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    USER_STATES.pop(update.effective_user.id, None)
+    await back_to_settings(update, context)
+
+async def handle_guess_state(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str):
+    await handle_guess_game(update, context, USER_STATES.get(update.effective_user.id), text)
+
+async def handle_admin_state(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str):
+    if text in ADMIN_BUTTONS:
+        # الضغط على زر آخر يلغي العملية الحالية بدل بثه أو توزيعه كنص
+        USER_STATES.pop(update.effective_user.id, None)
+        return False
+    return bool(await handle_admin_messages(update, context, text))  # أي قيمة خاطئة تكمل إلى الأزرار كما في السلسلة القديمة
+
+# --- معالجات الأزرار البسيطة ---
+async def back_to_main(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.message.reply_text("🏠 **القائمة الرئيسية**", 
+                                  reply_markup=main_reply_keyboard(update.effective_user.id in ADMIN_IDS))
+
+async def back_to_settings(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.message.reply_text("↩️ **تم الرجوع.**", reply_markup=await settings_keyboard(update.effective_user.id))
+
+async def luck_game_soon(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.message.reply_text("🎰 **لعبة الحظ قريباً...**", reply_markup=games_keyboard())
+
+async def ignore_button(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """أزرار اختيار الجنس خارج حالتها: لا تُعامل كرسالة محادثة"""
+
+async def request_rating(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user = update.effective_user
+    if user.id not in active_chats:
+        await reply_not_understood(update, context)
+        return
+    await update.message.reply_text(
+        "⭐ **كيف تقيم تجربة الدردشة مع الشريك؟**",
+        reply_markup=rating_keyboard()
+    )
+    set_user_state(user.id, 'waiting_for_rating', notify=False)  # التقييم اختياري: لا داعي للتنبيه
 
 # --- معالجات المساعدة ---
 async def handle_gender_choice(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str):
@@ -2037,7 +1990,7 @@ async def handle_gender_choice(update: Update, context: ContextTypes.DEFAULT_TYP
         return
     
     GENDER_CONFIRM[user.id] = choice
-    u = db.get_user(user.id)
+    u = await db.get_user(user.id)
     
     await update.message.reply_text(
         f"✅ **تم الاختيار:** {choice}\n"
@@ -2046,7 +1999,7 @@ async def handle_gender_choice(update: Update, context: ContextTypes.DEFAULT_TYP
         f"هل تريد المتابعة؟",
         reply_markup=ReplyKeyboardMarkup([['نعم ✅','لا ❌']], resize_keyboard=True)
     )
-    USER_STATES[user.id] = 'waiting_gender_confirm'
+    set_user_state(user.id, 'waiting_gender_confirm')
 
 async def handle_gender_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str):
     user = update.effective_user
@@ -2066,70 +2019,31 @@ async def handle_gender_confirm(update: Update, context: ContextTypes.DEFAULT_TY
         await update.message.reply_text("لم يتم اختيار الجنس.", reply_markup=main_reply_keyboard(user.id in ADMIN_IDS))
         return
         
-    u = db.get_user(user.id)
+    u = await db.get_user(user.id)
     if not u or u.get('points',0) < GENDER_SEARCH_COST:
         await update.message.reply_text("نقاطك غير كافية.", reply_markup=main_reply_keyboard(user.id in ADMIN_IDS))
         GENDER_CONFIRM.pop(user.id, None)
         USER_STATES.pop(user.id, None)
         return
         
-    ok = db.consume_points(user.id, GENDER_SEARCH_COST)
+    ok = await db.consume_points(user.id, GENDER_SEARCH_COST)
     if not ok:
         await update.message.reply_text("فشل في خصم النقاط.", reply_markup=main_reply_keyboard(user.id in ADMIN_IDS))
         GENDER_CONFIRM.pop(user.id, None)
         USER_STATES.pop(user.id, None)
         return
     
-    # البحث عن شريك بنفس الجنس
-    db.set_user_status(user.id, "searching")
-    await update.message.reply_text(
-        "🔍 **جاري البحث عن شريك حسب الجنس...**\n"
-        "⏳ **سيستمر البحث حتى تجد شريكاً**",
-        reply_markup=search_cancel_keyboard()
-    )
-    
-    # البحث في قاعدة البيانات
-    partner = db.find_available_partner_by_gender(user.id, choice)
-    if partner:
-        # ربط المستخدمين
-        active_chats[user.id] = partner['user_id']
-        active_chats[partner['user_id']] = user.id
-        
-        db.set_user_status(user.id, "chatting")
-        db.set_user_status(partner['user_id'], "chatting")
-        
-        conv_id = db.create_conversation(user.id, partner['user_id'])
-        
+    # البحث عن شريك بالجنس المطلوب
+    partner_id = matchmaker.search(user.id, gender=u.get('gender'), want_gender=choice, vip=is_vip_user(u))
+    if partner_id:
+        await connect_partners(update, context, user.id, partner_id, source="جنس")
+    else:
+        await db.set_user_status(user.id, "searching")
         await update.message.reply_text(
-            f"🎉 **تم العثور على شريك!**\n\n"
-            f"👤 **معلومات الشريك:**\n"
-            f"• **الاسم:** {partner.get('first_name', 'مستخدم')}\n"
-            f"• **الجنس:** {partner.get('gender', 'غير محدد')}\n"
-            f"• **العمر:** {partner.get('age', '—')}\n\n"
-            f"💬 **اكتب له الآن للبدء بالدردشة!**",
-            reply_markup=chat_control_keyboard()
+            "🔍 **جاري البحث عن شريك حسب الجنس...**\n"
+            f"⏳ **سيستمر البحث لمدة {MAX_SEARCH_TIME // 60} دقائق حتى تجد شريكاً**",
+            reply_markup=search_cancel_keyboard()
         )
-        
-        try:
-            user_info = db.get_user(user.id)
-            user_name = user_info.get('first_name', 'مستخدم') if user_info else 'مستخدم'
-            user_gender = user_info.get('gender', 'غير محدد') if user_info else 'غير محدد'
-            
-            await context.bot.send_message(
-                chat_id=partner['user_id'],
-                text=f"🎉 **تم العثور على شريك!**\n\n"
-                     f"👤 **معلومات الشريك:**\n"
-                     f"• **الاسم:** {user_name}\n"
-                     f"• **الجنس:** {user_gender}\n\n"
-                     f"💬 **اكتب له الآن للبدء بالدردشة!**",
-                reply_markup=chat_control_keyboard()
-            )
-        except:
-            pass
-        
-        await send_to_monitor(context, f"🟢 محادثة (جنس): {user.id} ↔ {partner['user_id']}")
-    else:
-        waiting_users.add(user.id)
     
     GENDER_CONFIRM.pop(user.id, None)
     USER_STATES.pop(user.id, None)
@@ -2151,15 +2065,15 @@ async def handle_guess_game(update: Update, context: ContextTypes.DEFAULT_TYPE,
         if finished:
             if points != 0:
                 if points > 0:
-                    db.add_points(user.id, points)
+                    await db.add_points(user.id, points)
                     result_type = "win"
                 else:
                     # التأكد من أن المستخدم لديه نقاط كافية قبل الخصم
-                    user_info = db.get_user(user.id)
+                    user_info = await db.get_user(user.id)
                     current_points = user_info.get('points', 0) if user_info else 0
                     
                     if current_points >= abs(points):
-                        db.consume_points(user.id, abs(points))
+                        await db.consume_points(user.id, abs(points))
                         result_type = "lose"
                     else:
                         # إذا لم يكن لديه نقاط كافية، لا نخصم
@@ -2177,13 +2091,8 @@ async def handle_guess_game(update: Update, context: ContextTypes.DEFAULT_TYPE,
                 )
             
             # تسجيل اللعبة في قاعدة البيانات
-            db.create_game('guess', user.id)
-            if points > 0:
-                db.update_game_result(game_id, 'win', points, 0)
-            elif points < 0:
-                db.update_game_result(game_id, 'lose', points, 0)
-            else:
-                db.update_game_result(game_id, 'lose', 0, 0)
+            await db.record_game('guess', user.id, None, 'win' if points > 0 else 'lose', points,
+                                 winner=user.id if points > 0 else None)
             
             game_manager.delete_guess_game(game_id)
             USER_STATES.pop(user.id, None)
@@ -2208,7 +2117,7 @@ async def add_friend(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "📝 **أدخل معرف صديقك:**\n"
         "مثال: 123456789"
     )
-    USER_STATES[user.id] = 'waiting_for_friend_id'
+    set_user_state(user.id, 'waiting_for_friend_id')
 
 async def friends_list(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """قائمة الأصدقاء"""
@@ -2218,7 +2127,7 @@ async def friends_list(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     user = update.effective_user
-    friends = db.get_user_friends(user.id)
+    friends = await db.get_user_friends(user.id)
     
     if not friends:
         await update.message.reply_text(
@@ -2232,7 +2141,7 @@ async def friends_list(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     for friend in friends:
         friend_id = friend.get('friend_id')
-        friend_info = db.get_user(friend_id)
+        friend_info = await db.get_user(friend_id)
         if friend_info:
             name = friend_info.get('first_name', 'مستخدم')
             friends_text += f"👤 **{name}** (ID: {friend_id})\n"
@@ -2252,7 +2161,7 @@ async def send_points_to_friend(update: Update, context: ContextTypes.DEFAULT_TY
         "📝 **أدخل معرف صديقك وعدد النقاط:**\n"
         "مثال: 123456789 50"
     )
-    USER_STATES[user.id] = 'waiting_for_friend_points'
+    set_user_state(user.id, 'waiting_for_friend_points')
 
 async def handle_friend_points(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str):
     """معالجة إرسال نقاط لصديق"""
@@ -2279,7 +2188,7 @@ async def handle_friend_points(update: Update, context: ContextTypes.DEFAULT_TYP
             return
         
         # التحقق من وجود الصديق
-        friend = db.get_user(friend_id)
+        friend = await db.get_user(friend_id)
         if not friend:
             await update.message.reply_text(
                 "❌ **المستخدم غير موجود.**",
@@ -2288,7 +2197,7 @@ async def handle_friend_points(update: Update, context: ContextTypes.DEFAULT_TYP
             return
         
         # التحقق من رصيد المستخدم
-        u = db.get_user(user.id)
+        u = await db.get_user(user.id)
         if u.get('points', 0) < points:
             await update.message.reply_text(
                 f"❌ **نقاطك غير كافية.**\n"
@@ -2298,8 +2207,9 @@ async def handle_friend_points(update: Update, context: ContextTypes.DEFAULT_TYP
             )
             return
         
-        # إرسال النقاط
-        if db.send_gift(user.id, friend_id, points, "هدية نقاط من صديق"):
+        # إرسال النقاط (الخصم والإضافة في تحويل واحد)
+        transfer = await db.transfer_points(user.id, friend_id, points, "gift")
+        if transfer.ok:
             await update.message.reply_text(
                 f"✅ **تم إرسال {points} نقطة لصديقك بنجاح.**",
                 reply_markup=friends_keyboard()
@@ -2340,9 +2250,12 @@ async def admin_distribute_points(update: Update, context: ContextTypes.DEFAULT_
         "📝 **أدخل معرف المستخدم وعدد النقاط:**\n"
         "مثال: 123456789 100\n\n"
         "💡 **للتوزيع الجماعي:**\n"
-        "all 50 - يعطي 50 نقطة للجميع"
+        "all 50 - يعطي 50 نقطة للجميع\n"
+        "vip 50 - لمستخدمي VIP فقط\n"
+        "active 7 50 - للنشطين آخر 7 أيام\n"
+        "111,222,333 50 - لقائمة مستخدمين"
     )
-    USER_STATES[user.id] = 'admin_distribute_points'
+    set_user_state(user.id, 'admin_distribute_points')
 
 async def admin_distribute_stars(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """توزيع نجوم للمشرف"""
@@ -2357,9 +2270,12 @@ async def admin_distribute_stars(update: Update, context: ContextTypes.DEFAULT_T
         "📝 **أدخل معرف المستخدم وعدد النجوم:**\n"
         "مثال: 123456789 10\n\n"
         "💡 **للتوزيع الجماعي:**\n"
-        "all 5 - يعطي 5 نجوم للجميع"
+        "all 5 - يعطي 5 نجوم للجميع\n"
+        "vip 5 - لمستخدمي VIP فقط\n"
+        "active 7 5 - للنشطين آخر 7 أيام\n"
+        "111,222,333 5 - لقائمة مستخدمين"
     )
-    USER_STATES[user.id] = 'admin_distribute_stars'
+    set_user_state(user.id, 'admin_distribute_stars')
 
 async def admin_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """بث رسالة للمشرف"""
@@ -2374,7 +2290,7 @@ async def admin_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "💬 **اكتب الرسالة التي تريد بثها:**\n\n"
         "⚠️ **ملاحظة:** سيتم إرسال الرسالة لجميع المستخدمين المسجلين."
     )
-    USER_STATES[user.id] = 'admin_broadcast'
+    set_user_state(user.id, 'admin_broadcast')
 
 async def admin_update_system(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """تحديث النظام للمشرف"""
@@ -2389,7 +2305,7 @@ async def admin_update_system(update: Update, context: ContextTypes.DEFAULT_TYPE
         await cleanup_resources()
         
         # تحسين قاعدة البيانات
-        db.optimize_database()
+        await db.optimize_database()
         
         await update.message.reply_text(
             "🔄 **تم تحديث النظام بنجاح!**\n\n"
@@ -2433,22 +2349,37 @@ async def handle_admin_messages(update: Update, context: ContextTypes.DEFAULT_TY
     
     return False
 
+def parse_distribution_target(text: str) -> Tuple[Dict[str, Any], int, str]:
+    """تحليل أمر التوزيع: (معايير المستخدمين, الكمية, وصف المستفيدين)
+
+    all 50 • vip 50 • active 7 50 (نشطون آخر 7 أيام) • 123456789 50 • 111,222,333 50
+    """
+    parts = text.split()
+    if len(parts) == 3 and parts[0].lower() == 'active':
+        days, amount = int(parts[1]), int(parts[2])
+        return {"active_since": now_ts() - days * 86400}, amount, f"النشطين آخر {days} يوم"
+    if len(parts) != 2:
+        raise ValueError("صيغة غير صحيحة")
+    
+    target, amount = parts[0].lower(), int(parts[1])
+    if target == 'all':
+        return {}, amount, "جميع المستخدمين"
+    if target == 'vip':
+        return {"vip_only": True}, amount, "مستخدمي VIP"
+    user_ids = [int(user_id) for user_id in target.split(',') if user_id]
+    return {"user_ids": user_ids}, amount, f"{len(user_ids)} مستخدم محدد"
+
+DISTRIBUTION_USAGE = (
+    "مثال: 123456789 {amount}\n"
+    "الجماعي: all {amount} • vip {amount} • active 7 {amount} • 111,222 {amount}"
+)
+
 async def handle_admin_distribute_points(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str):
-    """معالجة توزيع النقاط"""
+    """معالجة توزيع النقاط (تعديل واحد مهما كان عدد المستخدمين)"""
     user = update.effective_user
     
     try:
-        parts = text.split()
-        if len(parts) != 2:
-            await update.message.reply_text(
-                "❌ **صيغة غير صحيحة.**\n"
-                "مثال: 123456789 100",
-                reply_markup=admin_keyboard()
-            )
-            return
-        
-        target = parts[0]
-        points = int(parts[1])
+        selector, points, label = parse_distribution_target(text)
         
         if points <= 0:
             await update.message.reply_text(
@@ -2457,43 +2388,23 @@ async def handle_admin_distribute_points(update: Update, context: ContextTypes.D
             )
             return
         
-        if target.lower() == 'all':
-            # توزيع على جميع المستخدمين
-            all_users = db.list_all_users()
-            count = 0
-            
-            for u in all_users:
-                db.add_points(u['user_id'], points)
-                count += 1
-            
+        count = await db.bulk_add_points(points, **selector)
+        if count == 0:
             await update.message.reply_text(
-                f"✅ **تم توزيع {points} نقطة على {count} مستخدم.**",
-                reply_markup=admin_keyboard()
-            )
-        else:
-            # توزيع لمستخدم محدد
-            target_id = int(target)
-            target_user = db.get_user(target_id)
-            
-            if not target_user:
-                await update.message.reply_text(
-                    "❌ **المستخدم غير موجود.**",
-                    reply_markup=admin_keyboard()
-                )
-                return
-            
-            db.add_points(target_id, points)
-            await update.message.reply_text(
-                f"✅ **تم إضافة {points} نقطة للمستخدم {target_user.get('first_name', 'مجهول')}.**",
+                "❌ **لا يوجد مستخدمون مطابقون.**",
                 reply_markup=admin_keyboard()
             )
+            return
         
+        await update.message.reply_text(
+            f"✅ **تم توزيع {points} نقطة على {count} مستخدم ({label}).**",
+            reply_markup=admin_keyboard()
+        )
         USER_STATES.pop(user.id, None)
         
     except ValueError:
         await update.message.reply_text(
-            "❌ **يرجى إدخال أرقام صحيحة.**\n"
-            "مثال: 123456789 100",
+            "❌ **يرجى إدخال أرقام صحيحة.**\n" + DISTRIBUTION_USAGE.format(amount=100),
             reply_markup=admin_keyboard()
         )
     except Exception as e:
@@ -2505,21 +2416,11 @@ async def handle_admin_distribute_points(update: Update, context: ContextTypes.D
         USER_STATES.pop(user.id, None)
 
 async def handle_admin_distribute_stars(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str):
-    """معالجة توزيع النجوم"""
+    """معالجة توزيع النجوم (تعديل واحد مهما كان عدد المستخدمين)"""
     user = update.effective_user
     
     try:
-        parts = text.split()
-        if len(parts) != 2:
-            await update.message.reply_text(
-                "❌ **صيغة غير صحيحة.**\n"
-                "مثال: 123456789 10",
-                reply_markup=admin_keyboard()
-            )
-            return
-        
-        target = parts[0]
-        stars = int(parts[1])
+        selector, stars, label = parse_distribution_target(text)
         
         if stars <= 0:
             await update.message.reply_text(
@@ -2528,43 +2429,23 @@ async def handle_admin_distribute_stars(update: Update, context: ContextTypes.DE
             )
             return
         
-        if target.lower() == 'all':
-            # توزيع على جميع المستخدمين
-            all_users = db.list_all_users()
-            count = 0
-            
-            for u in all_users:
-                db.add_stars(u['user_id'], stars)
-                count += 1
-            
+        count = await db.bulk_add_stars(stars, **selector)
+        if count == 0:
             await update.message.reply_text(
-                f"✅ **تم توزيع {stars} نجمة على {count} مستخدم.**",
-                reply_markup=admin_keyboard()
-            )
-        else:
-            # توزيع لمستخدم محدد
-            target_id = int(target)
-            target_user = db.get_user(target_id)
-            
-            if not target_user:
-                await update.message.reply_text(
-                    "❌ **المستخدم غير موجود.**",
-                    reply_markup=admin_keyboard()
-                )
-                return
-            
-            db.add_stars(target_id, stars)
-            await update.message.reply_text(
-                f"✅ **تم إضافة {stars} نجمة للمستخدم {target_user.get('first_name', 'مجهول')}.**",
+                "❌ **لا يوجد مستخدمون مطابقون.**",
                 reply_markup=admin_keyboard()
             )
+            return
         
+        await update.message.reply_text(
+            f"✅ **تم توزيع {stars} نجمة على {count} مستخدم ({label}).**",
+            reply_markup=admin_keyboard()
+        )
         USER_STATES.pop(user.id, None)
         
     except ValueError:
         await update.message.reply_text(
-            "❌ **يرجى إدخال أرقام صحيحة.**\n"
-            "مثال: 123456789 10",
+            "❌ **يرجى إدخال أرقام صحيحة.**\n" + DISTRIBUTION_USAGE.format(amount=10),
             reply_markup=admin_keyboard()
         )
     except Exception as e:
@@ -2576,51 +2457,30 @@ async def handle_admin_distribute_stars(update: Update, context: ContextTypes.DE
         USER_STATES.pop(user.id, None)
 
 async def handle_admin_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str):
-    """معالجة بث الرسالة"""
+    """بدء بث الرسالة في الخلفية (التقدم يظهر في رسالة واحدة تُحدّث تلقائياً)"""
     user = update.effective_user
+    USER_STATES.pop(user.id, None)
     
     try:
-        # الحصول على جميع المستخدمين
-        all_users = db.list_all_users()
-        total = len(all_users)
-        success = 0
-        failed = 0
-        
-        await update.message.reply_text(
-            f"📤 **جاري إرسال الرسالة لـ {total} مستخدم...**\n\n"
-            f"💬 **الرسالة:** {text[:100]}..."
-        )
-        
-        for u in all_users:
-            try:
-                await context.bot.send_message(
-                    chat_id=u['user_id'],
-                    text=f"📢 **إعلان من الإدارة:**\n\n{text}"
-                )
-                success += 1
-                await asyncio.sleep(0.1)  # تجنب rate limit
-            except Exception as e:
-                failed += 1
-                logger.error(f"فشل إرسال للمستخدم {u['user_id']}: {e}")
+        if not await broadcaster.start(context.bot, text, update.effective_chat.id):
+            await update.message.reply_text(
+                "⏳ **يوجد بث قيد التنفيذ حالياً.** انتظر حتى ينتهي.",
+                reply_markup=admin_keyboard()
+            )
+            return
         
         await update.message.reply_text(
-            f"✅ **تم الانتهاء من البث!**\n\n"
-            f"📊 **النتائج:**\n"
-            f"• ✅ الناجحة: {success}\n"
-            f"• ❌ الفاشلة: {failed}\n"
-            f"• 📊 الإجمالي: {total}",
+            f"📤 **بدأ البث لـ {broadcaster.job.total} مستخدم.**\n\n"
+            f"💬 **الرسالة:** {text[:100]}...",
             reply_markup=admin_keyboard()
         )
         
-        USER_STATES.pop(user.id, None)
-        
     except Exception as e:
         logger.error(f"خطأ في البث: {e}")
         await update.message.reply_text(
             f"❌ **حدث خطأ في البث:** {e}",
             reply_markup=admin_keyboard()
         )
-        USER_STATES.pop(user.id, None)
 
 # --- معالجة الوسائط ---
 async def media_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -2659,6 +2519,8 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # معالجة الاشتراك الإجباري
     elif data == "check_subscription":
+        # المستخدم يقول إنه اشترك للتو: تجاهل النتيجة المحفوظة
+        subscription_cache.invalidate(user.id)
         if await check_channel_subscription(update, context):
             await query.edit_message_text(
                 "✅ **تم التحقق من الاشتراك بنجاح!**\n\n"
@@ -2702,6 +2564,36 @@ async def admin_broadcast_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE
     message = " ".join(context.args)
     await handle_admin_broadcast(update, context, message)
 
+async def admin_metrics_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """عرض مقاييس الأداء: توقف حلقة الأحداث وزمن استدعاءات قاعدة البيانات"""
+    user = update.effective_user
+    
+    if user.id not in ADMIN_IDS:
+        await update.message.reply_text("❌ **ليس لديك صلاحية لهذا الأمر.**")
+        return
+    
+    write_stats = await db.get_write_stats()
+    text = (
+        "📈 **مقاييس الأداء:**\n\n"
+        f"{registry.render()}\n\n"
+        f"💞 المطابقة: {matchmaker.get_stats()}\n"
+        f"📢 كاش الاشتراك: {subscription_cache.get_stats()}\n"
+        f"📤 الإرسال: {send_scheduler.get_stats()}\n"
+        f"🎮 الألعاب: {game_manager.get_stats()}\n"
+        f"⏱️ المؤقتات: {timers.get_stats()}\n"
+        f"💾 الجلسات: {session_store.get_stats()}\n"
+        f"🚫 التصفية: {content_filter.get_stats()}\n"
+        f"🛡️ الإشراف: {moderation.get_stats()}\n"
+        f"📋 المراقبة: {monitor_digest.get_stats()}\n"
+        f"🌐 الاستقبال: {BOT_MODE} • {get_webhook_stats() or 'polling'}\n"
+        f"🔐 التحديثات: {update_processor.get_stats()}\n"
+        f"🧭 التوجيه: {router.get_stats()}\n"
+        f"💾 commits: {write_stats['commits']} • "
+        f"تعديلات لكل commit: {write_stats['mutations_per_commit']} • "
+        f"معلقة: {write_stats['pending_mutations']}"
+    )
+    await update.message.reply_text(text)
+
 async def admin_ban_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """حظر مستخدم من الأمر"""
     user = update.effective_user
@@ -2726,14 +2618,14 @@ async def admin_ban_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text("❌ **المدة يجب أن تكون أكبر من صفر.**")
             return
         
-        target_user = db.get_user(target_id)
+        target_user = await db.get_user(target_id)
         if not target_user:
             await update.message.reply_text("❌ **المستخدم غير موجود.**")
             return
         
         # حساب وقت انتهاء الحظر
         until_ts = now_ts() + (days * 86400)
-        db.ban_user(target_id, until_ts)
+        await db.ban_user(target_id, until_ts)
         
         await update.message.reply_text(
             f"✅ **تم حظر المستخدم بنجاح.**\n\n"
@@ -2776,13 +2668,13 @@ async def admin_unban_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     try:
         target_id = int(context.args[0])
-        target_user = db.get_user(target_id)
+        target_user = await db.get_user(target_id)
         
         if not target_user:
             await update.message.reply_text("❌ **المستخدم غير موجود.**")
             return
         
-        db.unban_user(target_id)
+        await db.unban_user(target_id)
         
         await update.message.reply_text(
             f"✅ **تم إلغاء حظر المستخدم بنجاح.**\n\n"
@@ -2824,12 +2716,12 @@ async def admin_add_points_cmd(update: Update, context: ContextTypes.DEFAULT_TYP
             await update.message.reply_text("❌ **عدد النقاط يجب أن يكون أكبر من صفر.**")
             return
         
-        target_user = db.get_user(target_id)
+        target_user = await db.get_user(target_id)
         if not target_user:
             await update.message.reply_text("❌ **المستخدم غير موجود.**")
             return
         
-        db.add_points(target_id, points)
+        await db.add_points(target_id, points)
         
         await update.message.reply_text(
             f"✅ **تم إضافة {points} نقطة للمستخدم.**\n\n"
@@ -2863,7 +2755,7 @@ async def admin_remove_points_cmd(update: Update, context: ContextTypes.DEFAULT_
             await update.message.reply_text("❌ **عدد النقاط يجب أن يكون أكبر من صفر.**")
             return
         
-        target_user = db.get_user(target_id)
+        target_user = await db.get_user(target_id)
         if not target_user:
             await update.message.reply_text("❌ **المستخدم غير موجود.**")
             return
@@ -2875,7 +2767,7 @@ async def admin_remove_points_cmd(update: Update, context: ContextTypes.DEFAULT_
             )
             return
         
-        db.consume_points(target_id, points)
+        await db.consume_points(target_id, points)
         
         await update.message.reply_text(
             f"✅ **تم خصم {points} نقطة من المستخدم.**\n\n"
@@ -2915,7 +2807,7 @@ async def report_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
         reason = " ".join(args[1:])
         
         # الحصول على معلومات المستخدم المبلغ عنه
-        reported_user = db.get_user(reported_id)
+        reported_user = await db.get_user(reported_id)
         
         if not reported_user:
             await update.message.reply_text("❌ **المستخدم غير موجود.**")
@@ -2926,7 +2818,7 @@ async def report_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return
         
         # تسجيل البلاغ
-        db.add_report(
+        await db.add_report(
             reporter_id=user.id,
             target_id=reported_id,
             reason=reason
@@ -2978,15 +2870,114 @@ async def successful_payment_callback(update: Update, context: ContextTypes.DEFA
         await stars_system.successful_payment(update, context)
 
 # بناء التطبيق
-def build_app():
+# --- حفظ الجلسات عبر إعادة التشغيل ---
+def restore_active_chats(pairs: Dict[int, int]):
+    active_chats.update(pairs)
+
+def restore_user_states(data: Dict[str, Dict[int, str]]):
+    for uid, state in data.get("states", {}).items():
+        if state.startswith('playing_'):
+            USER_STATES[uid] = state  # حالات الألعاب تنتهي مع مؤقت اللعبة نفسها
+        else:
+            set_user_state(uid, state, notify=(state != 'waiting_for_rating'))
+    GENDER_CONFIRM.update(data.get("gender_confirm", {}))
+
+def register_session_sections():
+    session_store.register("chats", lambda: dict(active_chats), restore_active_chats)
+    session_store.register("states", lambda: {"states": dict(USER_STATES), "gender_confirm": dict(GENDER_CONFIRM)},
+                           restore_user_states)
+    session_store.register("matchmaker", matchmaker.snapshot, matchmaker.restore)
+    session_store.register("games", game_manager.snapshot, game_manager.restore)
+
+def register_routes():
+    if len(router):
+        return
+    # حالات انتظار الإدخال
+    router.add_state('waiting_for_rating', handle_rating_state)
+    router.add_state('waiting_admin_message', handle_admin_message_state)
+    router.add_state('waiting_country_name', handle_country_name_state)
+    router.add_state('waiting_gender_choice', handle_gender_choice)
+    router.add_state('waiting_gender_confirm', handle_gender_confirm)
+    router.add_state('waiting_gender_update', handle_gender_update_state)
+    router.add_state('waiting_age_update', handle_age_update)
+    router.add_state('waiting_country_update', handle_country_update_state)
+    router.add_state_prefix('playing_guess_', handle_guess_state)
+    router.add_state_prefix('admin_', handle_admin_state)
+    
+    # الأزرار الرئيسية
+    router.add_button("🚀 بحث عشوائي", start_search)
+    router.add_button("⚤ بحث بالجنس", gender_search_entry)
+    router.add_button("🎩 حسابي", profile_menu)
+    router.add_button("📄 ملفي الشخصي", show_profile)
+    router.add_button("⚙️ إعدادات الملف", settings_menu)
+    router.add_button(["👫 الجنس", "👫 الجنس (10 💰)"], update_gender)
+    router.add_button("🎂 العمر", update_age)
+    router.add_button("📍 البلد", update_country)
+    router.add_button("💰 كسب النقاط", earn_points_menu)
+    router.add_button("📤 مشاركة الروابط", share_links)
+    router.add_button("👥 إحالة أصدقاء", invite_friends)
+    router.add_button("🎁 هدايا الأصدقاء", friends_gifts_menu)
+    router.add_button("", reward_handler)
+    router.add_button("🎮 الألعاب", games_menu)
+    router.add_button("🎯 XO العشوائي", xo_game_random)
+    router.add_button("  ", guess_number_game)
+    router.add_button("🎰 لعبة الحظ", luck_game_soon)
+    router.add_button("📊 إحصائيات", stats_menu)
+    router.add_button("👥 المستخدمين", show_users_stats)
+    router.add_button("🎯 النشاط", show_activity_stats)
+    router.add_button("💰 النقاط", show_points_stats)
+    router.add_button("⭐ النجوم", show_stars_stats)
+    router.add_button("👑 VIP", vip_menu)
+    router.add_button("🏆 المتصدرين", leaderboard)
+    router.add_button("🛠️ لوحة المشرف", admin_opener_handler)
+    router.add_button("⏹️ إيقاف البحث", stop_search)
+    router.add_button("⬅️ الرئيسية", back_to_main)
+    router.add_button("⬅️ رجوع", back_to_settings)
+    router.add_button("👑 اشتراك VIP", vip_purchase_menu)
+    router.add_button("⭐ VIP بالنجوم", vip_stars_menu_main)
+    router.add_button("📞 تواصل مع المشرف", vip_contact_admin)
+    router.add_button(["👦 ذكر", "👧 أنثى"], ignore_button)
+    
+    # أزرار المحادثة
+    router.add_button("⏹️ إنهاء المحادثة", stop_chat)
+    router.add_button("⭐ إضافة صديق", add_friend)
+    router.add_button("📋 قائمة الأصدقاء", friends_list)
+    router.add_button("💌 إرسال نقاط", send_points_to_friend)
+    router.add_button("⭐ التقييم", request_rating)
+    
+    # أزرار المشرف
+    router.add_button("📊 الإحصائيات الكاملة", admin_stats_full)
+    router.add_button("👥 المستخدمين المحظورين", admin_banned_users)
+    router.add_button("💰 توزيع النقاط", admin_distribute_points)
+    router.add_button("⭐ توزيع النجوم", admin_distribute_stars)
+    router.add_button("📢 بث سريع", admin_broadcast)
+    router.add_button("🔄 تحديث النظام", admin_update_system)
+
+def build_app(updater: bool = True):
+    """updater=False لوضع webhook: التحديثات تصل من خادم webhook_front بدل polling"""
     global stars_system
     
-    app = ApplicationBuilder().token(TOKEN).build()
+    # استعادة المحادثات والألعاب وطوابير البحث من آخر لقطة قبل استقبال أي تحديث
+    register_session_sections()
+    session_store.load()
+    register_routes()
+    
+    builder = (
+        ApplicationBuilder()
+        .token(TOKEN)
+        .rate_limiter(send_scheduler)
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+        .concurrent_updates(update_processor)
+    )
+    if not updater:
+        builder = builder.updater(None)
+    app = builder.build()
     
     # تهيئة نظام النجوم
     
     try:
-        stars_system = TelegramStarsPaymentSystem(db)
+        stars_system = TelegramStarsPaymentSystem(db, monitor_digest)
     except Exception as e:
         logger.error(f"فشل في تهيئة نظام النجوم: {e}")
         stars_system = None
@@ -3007,6 +2998,7 @@ def build_app():
     app.add_handler(CommandHandler("unban", admin_unban_cmd))
     app.add_handler(CommandHandler("addpoints", admin_add_points_cmd))
     app.add_handler(CommandHandler("removepoints", admin_remove_points_cmd))
+    app.add_handler(CommandHandler("metrics", admin_metrics_cmd))
     
     # معالجات الرسائل النصية
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, relay_message))
@@ -3030,8 +3022,90 @@ def build_app():
     
     return app
 
+async def notify_search_expired(uid: int):
+    """انتهاء مهلة البحث عن شريك (يستدعيها مؤقت البحث في موعده)"""
+    try:
+        await db.set_user_status(uid, "idle")
+        await bot_app.bot.send_message(
+            chat_id=uid,
+            text="⌛ **انتهت مدة البحث دون العثور على شريك.**\nيمكنك البحث مرة أخرى في أي وقت.",
+            reply_markup=main_reply_keyboard(uid in ADMIN_IDS)
+        )
+    except Exception as e:
+        logger.error(f"خطأ في إنهاء بحث المستخدم {uid}: {e}")
+
+async def notify_game_expired(game_type: str, game):
+    """إبلاغ اللاعبين بانتهاء مدة لعبة لم تكتمل"""
+    if game_type == "xo":
+        players = [player for player in (game.player1, game.player2) if player]
+        text = "⌛ **انتهت مدة لعبة XO.**"
+    else:
+        players = [game.player_id]
+        if USER_STATES.get(game.player_id) == f'playing_guess_{game.game_id}':
+            USER_STATES.pop(game.player_id, None)
+        text = f"⌛ **انتهت مدة لعبة التخمين.**\nالرقم كان {game.number}"
+    for player in players:
+        try:
+            await bot_app.bot.send_message(chat_id=player, text=text, reply_markup=games_keyboard())
+        except Exception as e:
+            logger.debug(f"تعذر إبلاغ اللاعب {player} بانتهاء اللعبة: {e}")
+
+async def end_chat_after_ban(uid: int, until_ts: int):
+    """إنهاء محادثة مستخدم حُظر تلقائياً وإبلاغه هو وشريكه"""
+    partner = active_chats.pop(uid, None)
+    await db.set_user_status(uid, "idle")
+    try:
+        await bot_app.bot.send_message(
+            chat_id=uid,
+            text=f"⛔ **تم حظرك حتى {readable(until_ts)} بسبب تكرار استخدام كلمات محظورة.**"
+        )
+    except Exception as e:
+        logger.debug(f"تعذر إبلاغ المستخدم {uid} بالحظر: {e}")
+    if partner is None:
+        return
+    active_chats.pop(partner, None)
+    await db.set_user_status(partner, "idle")
+    try:
+        await bot_app.bot.send_message(
+            chat_id=partner,
+            text="🔴 **انتهت المحادثة.**",
+            reply_markup=main_reply_keyboard(partner in ADMIN_IDS)
+        )
+    except Exception as e:
+        logger.debug(f"تعذر إبلاغ الشريك {partner} بانتهاء المحادثة: {e}")
+
+async def on_startup(app):
+    """تشغيل مراقب توقف حلقة الأحداث وعجلة المؤقتات واستئناف البث غير المكتمل"""
+    global bot_app
+    bot_app = app
+    matchmaker.on_expire = notify_search_expired
+    game_manager.on_expire = notify_game_expired
+    loop_monitor.start()
+    timers.start()
+    session_store.start()
+    content_filter.start()
+    moderation.on_ban = end_chat_after_ban
+    moderation.start(app.bot)
+    monitor_digest.start(app.bot)
+    broadcaster.resume(app.bot)
+
+async def on_shutdown(app):
+    """حفظ التعديلات المعلقة في قاعدة البيانات عند إيقاف البوت"""
+    loop_monitor.stop()
+    timers.stop()
+    content_filter.stop()
+    await moderation.stop()  # إكمال العقوبات المعلقة
+    await monitor_digest.stop()  # آخر ملخص لقناة المراقبة
+    await session_store.stop()  # لقطة أخيرة: الجلسات تستمر بعد إعادة التشغيل
+    await broadcaster.stop()  # ملف الاستئناف يبقى ليكمل البث بعد إعادة التشغيل
+    try:
+        await db.flush()
+    except Exception as e:
+        logger.error(f"فشل حفظ البيانات عند الإيقاف: {e}")
+
 async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
     logger.error(msg="Exception while handling an update:", exc_info=context.error)
+    await send_to_monitor(context, f"⚠️ خطأ في البوت: {context.error}", "error", critical=True)
     try:
         if update and isinstance(update, Update) and update.effective_message:
             await update.effective_message.reply_text(
@@ -3044,46 +3118,16 @@ async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> N
         pass
 
 async def cleanup_resources():
-    """تنظيف الموارد القديمة"""
-    current_time = time.time()
-    
-    # تنظيف الألعاب القديمة
-    removed = game_manager.cleanup_old_games()
+    """تنظيف الموارد القديمة
+
+    الألعاب والبحث وحالات الانتظار تنتهي في موعدها عبر عجلة المؤقتات؛ المسح هنا
+    احتياطي فقط لما قد يفلت منها (مثل ألعاب أُنشئت قبل تشغيل العجلة).
+    """
+    removed = game_manager.cleanup_old_games(GAME_TIMEOUT)
     if removed > 0:
         logger.info(f"تم تنظيف {removed} لعبة قديمة")
     
-    # تنظيف حالات المستخدمين القديمة
-    states_to_remove = []
-    for user_id, state in USER_STATES.items():
-        if state.startswith('waiting_') and user_id not in waiting_users and user_id not in active_chats:
-            states_to_remove.append(user_id)
-    
-    for user_id in states_to_remove:
-        USER_STATES.pop(user_id, None)
-    
-    # تنظيف عمليات البحث القديمة
-    searches_to_remove = []
-    for user_id, task in ACTIVE_SEARCHES.items():
-        if task.done():
-            searches_to_remove.append(user_id)
-    
-    for user_id in searches_to_remove:
-        ACTIVE_SEARCHES.pop(user_id, None)
-    
-    # تنظيف المستخدمين المنتظرين الذين تجاوزوا الحد الزمني
-    users_to_remove = []
-    for uid in waiting_users:
-        user = db.get_user(uid)
-        if user and user.get('status') == 'searching':
-            # إذا كان ينتظر أكثر من 5 دقائق
-            if current_time - user.get('last_activity', current_time) > 300:
-                users_to_remove.append(uid)
-    
-    for uid in users_to_remove:
-        waiting_users.remove(uid)
-        db.set_user_status(uid, "idle")
-    
-    logger.info(f"✅ تم تنظيف {len(states_to_remove)} حالة و {len(searches_to_remove)} بحث و {len(users_to_remove)} مستخدم")
+    logger.info(f"✅ تم تنظيف {removed} لعبة • المؤقتات: {timers.get_stats()}")
 
 # تشغيل البوت
 if __name__ == "__main__":
@@ -3096,13 +3140,7 @@ if __name__ == "__main__":
         level=logging.INFO
     )
     
-    # تشغيل تنظيف الموارد بشكل دوري
-    async def periodic_cleanup():
-        while True:
-            await asyncio.sleep(300)  # كل 5 دقائق
-            await cleanup_resources()
-    
-    app = build_app()
+    app = build_app(updater=(BOT_MODE != 'webhook'))
     
     print("✅ **البوت المحدث جاهز للعمل!**")
     print("✨ **المميزات الجديدة:**")
@@ -3114,5 +3152,8 @@ if __name__ == "__main__":
     print("• **لعبة التخمين:** الفوز: +5 نقاط، الخسارة: -2 نقاط")
     print("• إصلاحات كاملة للأخطاء 🔧")
     
-    app.run_polling()
+    if BOT_MODE == 'webhook':
+        run_webhook(app, config)
+    else:
+        app.run_polling()
 #[file content end]
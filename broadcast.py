@@ -0,0 +1,204 @@
+"""
+📢 محرك البث الجماعي
+
+البث يعمل كمهمة في الخلفية تمر على جميع المستخدمين بمؤشر مرقّم (صفحة بعد
+صفحة) بدل تحميل قائمة محدودة بألف مستخدم. الرسائل داخل الصفحة تُرسل بالتوازي
+بحد أقصى BROADCAST_CONCURRENCY، والسرعة الفعلية يضبطها SendScheduler.
+التقدم يُحفظ في ملف بعد كل صفحة ومع كل تحديث لرسالة التقدم وعند الإيقاف، فإذا
+أُعيد تشغيل البوت يُستأنف البث من حيث توقف بدل الإرسال من البداية.
+"""
+
+import os
+import json
+import time
+import asyncio
+import logging
+from dataclasses import dataclass, asdict, field
+from typing import List, Optional
+
+from telegram.error import Forbidden, TelegramError
+
+from send_scheduler import PRIORITY_BROADCAST
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class BroadcastJob:
+    """حالة بث واحد (تُحفظ كما هي في ملف الاستئناف)"""
+    text: str
+    admin_chat_id: int
+    progress_message_id: Optional[int] = None
+    cursor: int = 0  # آخر رقم مستخدم في آخر صفحة مكتملة
+    page_done: List[int] = field(default_factory=list)  # من انتهى إرسالهم في الصفحة الحالية
+    total: int = 0
+    sent: int = 0
+    failed: int = 0
+    blocked: int = 0
+    started_at: float = 0.0
+    finished: bool = False
+
+    @property
+    def done(self) -> int:
+        return self.sent + self.failed + self.blocked
+
+    def progress_text(self) -> str:
+        percent = int(self.done * 100 / self.total) if self.total else 100
+        elapsed = max(time.time() - self.started_at, 1)
+        header = "✅ **تم الانتهاء من البث!**" if self.finished else "📤 **جاري البث...**"
+        return (
+            f"{header}\n\n"
+            f"📊 **التقدم:** {self.done}/{self.total} ({percent}%)\n"
+            f"• ✅ الناجحة: {self.sent}\n"
+            f"• 🚫 حظروا البوت: {self.blocked}\n"
+            f"• ❌ الفاشلة: {self.failed}\n"
+            f"⚡ **السرعة:** {self.done / elapsed:.1f} رسالة/ثانية"
+        )
+
+class BroadcastManager:
+    """تشغيل بث واحد في كل مرة مع حفظ التقدم واستئنافه"""
+
+    def __init__(self, db, checkpoint_file: str = "broadcast_checkpoint.json", concurrency: int = 30,
+                 page_size: int = 200, progress_interval: float = 5):
+        self.db = db  # AsyncDatabase
+        self.checkpoint_file = checkpoint_file
+        self.concurrency = concurrency
+        self.page_size = page_size
+        self.progress_interval = progress_interval
+        self.job: Optional[BroadcastJob] = None
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def is_running(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+    # --- ملف الاستئناف ---
+    def _save_checkpoint(self):
+        tmp_file = f"{self.checkpoint_file}.tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(asdict(self.job), f, ensure_ascii=False)
+        os.replace(tmp_file, self.checkpoint_file)
+
+    def _load_checkpoint(self) -> Optional[BroadcastJob]:
+        if not os.path.exists(self.checkpoint_file):
+            return None
+        try:
+            with open(self.checkpoint_file, encoding="utf-8") as f:
+                return BroadcastJob(**json.load(f))
+        except (OSError, ValueError, TypeError) as e:
+            logger.error(f"Ignoring unreadable broadcast checkpoint: {e}")
+            return None
+
+    def _clear_checkpoint(self):
+        try:
+            os.remove(self.checkpoint_file)
+        except FileNotFoundError:
+            pass
+
+    # --- التشغيل ---
+    async def start(self, bot, text: str, admin_chat_id: int) -> bool:
+        """بدء بث جديد (False إذا كان هناك بث قيد التنفيذ)"""
+        if self.is_running:
+            return False
+        self.job = BroadcastJob(text=text, admin_chat_id=admin_chat_id, started_at=time.time())
+        self.job.total = await self.db.count_users()
+        message = await bot.send_message(chat_id=admin_chat_id, text=self.job.progress_text())
+        self.job.progress_message_id = message.message_id
+        self._save_checkpoint()
+        self.task = asyncio.create_task(self._run(bot))
+        return True
+
+    def resume(self, bot) -> bool:
+        """استئناف بث لم يكتمل قبل إعادة التشغيل"""
+        job = self._load_checkpoint()
+        if job is None or job.finished or self.is_running:
+            return False
+        logger.info(f"Resuming broadcast after user {job.cursor} ({job.done}/{job.total})")
+        self.job = job
+        self.task = asyncio.create_task(self._run(bot))
+        return True
+
+    async def stop(self):
+        """إيقاف البث مع إبقاء ملف الاستئناف"""
+        if self.is_running:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+    async def _run(self, bot):
+        job = self.job
+        semaphore = asyncio.Semaphore(self.concurrency)
+        progress_task = asyncio.create_task(self._report_progress(bot))
+        try:
+            while True:
+                page = await self.db.get_user_ids_page(job.cursor, self.page_size)
+                if not page:
+                    break
+                already_done = set(job.page_done)
+                await asyncio.gather(*(self._send_one(bot, semaphore, user_id)
+                                       for user_id in page if user_id not in already_done))
+                job.cursor = page[-1]
+                job.page_done = []
+                self._save_checkpoint()
+
+            job.finished = True
+            self._clear_checkpoint()
+            logger.info(f"Broadcast finished: {job.sent} sent, {job.blocked} blocked, {job.failed} failed")
+        except asyncio.CancelledError:
+            self._save_checkpoint()
+            logger.info(f"Broadcast paused after user {job.cursor}")
+            raise
+        except Exception as e:
+            logger.error(f"Broadcast stopped after user {job.cursor}: {e}")
+        finally:
+            progress_task.cancel()
+        # عند الإيقاف (CancelledError) لا نلمس البوت: قد يكون أُغلق بالفعل
+        await self._edit_progress(bot)
+
+    async def _send_one(self, bot, semaphore: asyncio.Semaphore, user_id: int):
+        job = self.job
+        async with semaphore:
+            try:
+                await bot.send_message(
+                    chat_id=user_id,
+                    text=f"📢 **إعلان من الإدارة:**\n\n{job.text}",
+                    rate_limit_args=PRIORITY_BROADCAST
+                )
+                job.sent += 1
+            except Forbidden:
+                # المستخدم حظر البوت أو حذف حسابه: لا نرسل له في البث القادم
+                job.blocked += 1
+                try:
+                    await self.db.set_bot_blocked(user_id)
+                except Exception as e:
+                    logger.error(f"Could not mark {user_id} as blocked: {e}")
+            except TelegramError as e:
+                job.failed += 1
+                logger.debug(f"Broadcast to {user_id} failed: {e}")
+            except Exception as e:
+                # خطأ غير متوقع لمستخدم واحد لا يُفشل gather الصفحة ولا يوقف البث كله
+                job.failed += 1
+                logger.error(f"Broadcast to {user_id} failed: {e}")
+            job.page_done.append(user_id)
+
+    # --- رسالة التقدم ---
+    async def _report_progress(self, bot):
+        while True:
+            await asyncio.sleep(self.progress_interval)
+            self._save_checkpoint()
+            await self._edit_progress(bot)
+
+    async def _edit_progress(self, bot):
+        job = self.job
+        if job.progress_message_id is None:
+            return
+        try:
+            await bot.edit_message_text(
+                chat_id=job.admin_chat_id,
+                message_id=job.progress_message_id,
+                text=job.progress_text()
+            )
+        except TelegramError as e:
+            # "message is not modified" عندما لا يتغير التقدم بين تحديثين
+            logger.debug(f"Broadcast progress edit skipped: {e}")
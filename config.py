@@ -17,7 +17,12 @@ ADMIN_IDS = {OWNER_ID}
 
 # 📢 القنوات
 MANDATORY_CHANNEL = "@NN26S"  # قناة الاشتراك الإجباري
+SUBSCRIPTION_CACHE_TTL = 600  # ثوانٍ لحفظ نتيجة "مشترك"
+SUBSCRIPTION_NEGATIVE_TTL = 30  # ثوانٍ لحفظ نتيجة "غير مشترك" أو فشل الفحص
 MONITOR_CHANNEL = "@-1003463880550"
+MONITOR_DIGEST_INTERVAL = 5  # ثوانٍ بين كل ملخص لقناة المراقبة (الأخطاء والمدفوعات تُرسل فوراً)
+MONITOR_DIGEST_MAX_EVENTS = 200  # إرسال الملخص مبكراً عند بلوغ هذا العدد من الأحداث
+MONITOR_DIGEST_SAMPLES = 5  # عدد الأمثلة المعروضة من كل نوع حدث
 DATA_CHANNEL = "-1003378437796"
 
 # 🗄️ قاعدة البيانات
@@ -90,6 +95,13 @@ FILTERED_WORDS = {
     "سكس", "طيز", "خنزير", "فحش", "عارية", "شرموطة", 
     "زنا", "زاني", "دعارة", "قحبة", "عاهرة", "منيوك"
 }
+FILTERED_WORDS_FILE = "filtered_words.txt"  # كلمات إضافية (كلمة في كل سطر) تُحمّل تلقائياً عند تعديل الملف
+FILTER_RELOAD_INTERVAL = 30  # ثوانٍ بين كل فحص لتعديل الملف
+MODERATION_PENALTY = 5  # نقاط تُخصم لكل كلمة محظورة مختلفة في الرسالة
+MODERATION_BAN_STRIKES = 3  # عدد المخالفات التي تؤدي لحظر تلقائي
+MODERATION_STRIKE_WINDOW = 3600  # المدة (بالثواني) التي تُحسب فيها المخالفات
+MODERATION_BAN_DURATION = 86400  # مدة الحظر التلقائي بالثواني
+MODERATION_QUEUE_SIZE = 10000  # أقصى عدد مخالفات تنتظر المعالجة
 
 # 📊 إعدادات التسجيل
 LOG_LEVEL = "INFO"
@@ -100,6 +112,34 @@ LOG_FILE = "bot.log"
 MAX_SEARCH_TIME = 300  # 5 دقائق كحد أقصى للبحث
 MAX_CHAT_TIME = 3600  # ساعة كحد أقصى للمحادثة
 XO_SEARCH_TIMEOUT = 60  # 60 ثانية للبحث عن خصم XO
+MATCHMAKING_STRATEGY = "fifo"  # fifo: الأقدم انتظاراً أولاً، random: اختيار عشوائي بين المتوافقين
+
+# ⏱️ المهل (عجلة المؤقتات)
+TIMER_RESOLUTION = 1  # دقة المؤقتات بالثواني (كل نبضة في العجلة)
+USER_STATE_TIMEOUT = 600  # مهلة حالات انتظار إدخال المستخدم (تأكيد الجنس، تحويل النقاط...)
+GAME_TIMEOUT = 3600  # أقصى مدة للعبة XO أو التخمين قبل إنهائها
+
+# 💾 حفظ الجلسات عبر إعادة التشغيل
+SESSION_SNAPSHOT_FILE = "sessions.snapshot"  # لقطة المحادثات النشطة والألعاب وطوابير البحث
+SESSION_SNAPSHOT_INTERVAL = 5  # ثوانٍ بين كل لقطة (لا تُكتب إذا لم يتغير شيء)
+
+# 🌐 استقبال التحديثات
+BOT_MODE = "polling"  # polling أو webhook (خادم HTTP خلف وسيط TLS)
+CONCURRENT_UPDATES = 16  # عدد التحديثات التي تُعالج في نفس الوقت (تحديثات نفس المستخدم أو نفس لعبة XO تبقى بالترتيب)
+WEBHOOK_HOST = "0.0.0.0"
+WEBHOOK_PORT = 8443  # المنفذ الداخلي الذي يمرر إليه وسيط TLS
+WEBHOOK_PATH = "/telegram"  # مسار الطلبات كما يصل من الوسيط
+WEBHOOK_URL = ""  # العنوان العام الكامل الذي تُرسل إليه Telegram التحديثات (فارغ = لا يُسجل تلقائياً)
+WEBHOOK_SECRET = ""  # يُقارن بترويسة X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_MAX_CONNECTIONS = 40  # أقصى اتصالات متزامنة من Telegram
+WEBHOOK_QUEUE_SIZE = 1000  # أقصى تحديثات بانتظار المعالجة قبل الرد بـ 503
+WEBHOOK_QUEUE_TIMEOUT = 5  # ثوانٍ ينتظرها الطلب مكاناً في الطابور قبل 503
+
+# 📢 البث الجماعي
+BROADCAST_CONCURRENCY = 30  # أقصى عدد رسائل بث قيد الإرسال معاً (الحد العام لـ Telegram ~30/ثانية)
+BROADCAST_PAGE_SIZE = 200  # عدد المستخدمين في كل صفحة (يُحفظ التقدم بعد كل صفحة)
+BROADCAST_PROGRESS_INTERVAL = 5  # ثوانٍ بين تحديثات رسالة التقدم
+BROADCAST_CHECKPOINT_FILE = "broadcast_checkpoint.json"
 
 # 💰 أسعار VIP بالنقاط (المضاعفة)
 VIP_POINTS_PRICES = {
@@ -119,7 +159,12 @@ def get_config():
         'owner_id': OWNER_ID,
         'admin_ids': ADMIN_IDS,
         'mandatory_channel': MANDATORY_CHANNEL,
+        'subscription_cache_ttl': SUBSCRIPTION_CACHE_TTL,
+        'subscription_negative_ttl': SUBSCRIPTION_NEGATIVE_TTL,
         'monitor_channel': MONITOR_CHANNEL,
+        'monitor_digest_interval': MONITOR_DIGEST_INTERVAL,
+        'monitor_digest_max_events': MONITOR_DIGEST_MAX_EVENTS,
+        'monitor_digest_samples': MONITOR_DIGEST_SAMPLES,
         'data_channel': DATA_CHANNEL,
         'db_path': DB_PATH,
         'reward_points': REWARD_POINTS,
@@ -134,11 +179,38 @@ def get_config():
         'vip_packages': VIP_PACKAGES,
         'vip_points_prices': VIP_POINTS_PRICES,
         'filtered_words': FILTERED_WORDS,
+        'filtered_words_file': FILTERED_WORDS_FILE,
+        'filter_reload_interval': FILTER_RELOAD_INTERVAL,
+        'moderation_penalty': MODERATION_PENALTY,
+        'moderation_ban_strikes': MODERATION_BAN_STRIKES,
+        'moderation_strike_window': MODERATION_STRIKE_WINDOW,
+        'moderation_ban_duration': MODERATION_BAN_DURATION,
+        'moderation_queue_size': MODERATION_QUEUE_SIZE,
         'log_level': LOG_LEVEL,
         'log_format': LOG_FORMAT,
         'log_file': LOG_FILE,
         'max_search_time': MAX_SEARCH_TIME,
         'max_chat_time': MAX_CHAT_TIME,
-        'xo_search_timeout': XO_SEARCH_TIMEOUT
+        'xo_search_timeout': XO_SEARCH_TIMEOUT,
+        'matchmaking_strategy': MATCHMAKING_STRATEGY,
+        'timer_resolution': TIMER_RESOLUTION,
+        'user_state_timeout': USER_STATE_TIMEOUT,
+        'game_timeout': GAME_TIMEOUT,
+        'session_snapshot_file': SESSION_SNAPSHOT_FILE,
+        'session_snapshot_interval': SESSION_SNAPSHOT_INTERVAL,
+        'bot_mode': BOT_MODE,
+        'concurrent_updates': CONCURRENT_UPDATES,
+        'webhook_host': WEBHOOK_HOST,
+        'webhook_port': WEBHOOK_PORT,
+        'webhook_path': WEBHOOK_PATH,
+        'webhook_url': WEBHOOK_URL,
+        'webhook_secret': WEBHOOK_SECRET,
+        'webhook_max_connections': WEBHOOK_MAX_CONNECTIONS,
+        'webhook_queue_size': WEBHOOK_QUEUE_SIZE,
+        'webhook_queue_timeout': WEBHOOK_QUEUE_TIMEOUT,
+        'broadcast_concurrency': BROADCAST_CONCURRENCY,
+        'broadcast_page_size': BROADCAST_PAGE_SIZE,
+        'broadcast_progress_interval': BROADCAST_PROGRESS_INTERVAL,
+        'broadcast_checkpoint_file': BROADCAST_CHECKPOINT_FILE
     }
 #[file content end]
@@ -0,0 +1,192 @@
+"""
+🚫 تصفية الكلمات المحظورة
+
+بدل البحث عن كل كلمة محظورة في الرسالة على حدة (مرور كامل على النص لكل
+كلمة)، تُجمع الكلمات في آلة Aho-Corasick واحدة تجد كل الكلمات الموجودة في
+مرور واحد على النص، مهما كبرت القائمة.
+
+النص والكلمات يُوحّدان بنفس الطريقة قبل المقارنة: حذف التشكيل والتطويل
+والمحارف غير المرئية، توحيد أشكال الألف والياء والتاء المربوطة، وضغط
+الحروف العربية المكررة (سكككس -> سكس).
+
+القائمة = FILTERED_WORDS من config + ملف نصي اختياري (كلمة في كل سطر) يُعاد
+تحميله تلقائياً عند تعديله دون إعادة تشغيل البوت.
+"""
+
+import os
+import re
+import asyncio
+import logging
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# --- توحيد النص العربي ---
+_REMOVED = (
+    [chr(c) for c in range(0x064B, 0x0660)]  # الحركات والتنوين والشدة والسكون
+    + ["\u0670", "\u0640"]  # الألف الخنجرية والتطويل
+    + [chr(c) for c in range(0x06D6, 0x06EE)]  # علامات قرآنية
+    + ["\u200b", "\u200c", "\u200d", "\u200e", "\u200f", "\u2060", "\ufeff"]  # محارف غير مرئية
+)
+_REPLACED = {"أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا", "ى": "ي", "ئ": "ي", "ؤ": "و", "ة": "ه"}
+_SUBSTITUTIONS = {**{ch: "" for ch in _REMOVED}, **_REPLACED}
+# regex بدل str.translate: المسح في C والاستدعاء فقط للمحارف التي تتغير (أسرع 2-3 مرات للعربية)
+_SUBSTITUTE = re.compile("[" + "".join(_SUBSTITUTIONS) + "]")
+_ARABIC_LETTERS = frozenset(chr(c) for c in range(0x0621, 0x064B))
+_REPEATED_LETTER = re.compile(r"([ء-ي])\1+")  # العربية فقط: الحروف المكررة في الإنجليزية كلمات حقيقية
+
+def _replacement(match) -> str:
+    return _SUBSTITUTIONS[match.group()]
+
+def substitute(text: str) -> str:
+    """توحيد المحارف (دون ضغط التكرار، الذي تتولاه الآلة أثناء المسح)"""
+    return _SUBSTITUTE.sub(_replacement, text.lower())
+
+def normalize_text(text: str) -> str:
+    """الشكل الموحد الكامل الذي تُخزن به الكلمات المحظورة"""
+    return _REPEATED_LETTER.sub(r"\1", substitute(text))
+
+# --- آلة Aho-Corasick ---
+class Automaton:
+    """شجرة الكلمات مع روابط الفشل: كل حالة تعرف كل الكلمات المنتهية عندها"""
+
+    def __init__(self, terms: Iterable[str]):
+        self.terms: List[str] = []
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.out: List[Tuple[int, ...]] = [()]
+
+        for term in terms:
+            state = 0
+            for ch in term:
+                next_state = self.goto[state].get(ch)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto[state][ch] = next_state
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append(())
+                state = next_state
+            self.out[state] += (len(self.terms),)
+            self.terms.append(term)
+
+        # روابط الفشل بالعرض: أطول لاحقة للحالة هي أيضاً بادئة كلمة
+        pending = deque(self.goto[0].values())
+        while pending:
+            state = pending.popleft()
+            for ch, child in self.goto[state].items():
+                pending.append(child)
+                fallback = self.fail[state]
+                while fallback and ch not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(ch, 0)
+                # دمج مخرجات حالة الفشل: البحث لا يحتاج لتتبع الروابط لجمع النتائج
+                self.out[child] += self.out[self.fail[child]]
+
+    def __len__(self) -> int:
+        return len(self.terms)
+
+    def scan(self, text: str) -> List[int]:
+        """أرقام كل الكلمات الموجودة (مع التكرار) في مرور واحد على نص مرّ بـ substitute
+
+        الحرف العربي المكرر يُتخطى هنا، فالنتيجة كما لو ضُغط التكرار قبل المسح.
+        """
+        goto, fail, out = self.goto, self.fail, self.out
+        root = goto[0]
+        matches = []
+        state = 0
+        previous = ""
+        for ch in text:
+            if ch == previous and ch in _ARABIC_LETTERS:
+                continue
+            previous = ch
+            if state:
+                while state and ch not in goto[state]:
+                    state = fail[state]
+                state = goto[state].get(ch, 0)
+            else:
+                state = root.get(ch, 0)
+                if not state:
+                    continue
+            if out[state]:
+                matches.extend(out[state])
+        return matches
+
+class ContentFilter:
+    """قائمة الكلمات المحظورة المجمعة، مع إعادة تحميل ملف القائمة عند تعديله"""
+
+    def __init__(self, terms: Iterable[str] = (), path: Optional[str] = None, interval: float = 30):
+        self.base_terms = list(terms)
+        self.path = path
+        self.interval = interval
+        self.originals: Dict[str, str] = {}  # الشكل الموحد -> الكلمة كما كُتبت في القائمة
+        self._automaton = Automaton(())
+        self._mtime: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"reloads": 0, "checked": 0, "flagged": 0}
+        self.reload()
+
+    def __len__(self) -> int:
+        return len(self._automaton)
+
+    # --- القائمة ---
+    def _read_file(self) -> List[str]:
+        if not self.path or not os.path.exists(self.path):
+            self._mtime = None
+            return []
+        self._mtime = os.path.getmtime(self.path)
+        with open(self.path, encoding="utf-8") as f:
+            return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+    def reload(self, terms: Optional[Iterable[str]] = None) -> int:
+        """إعادة بناء الآلة من config والملف (أو من terms) واستبدالها دفعة واحدة"""
+        if terms is not None:
+            self.base_terms = list(terms)
+        originals = {}
+        for term in self.base_terms + self._read_file():
+            normalized = normalize_text(term.strip())
+            if normalized:
+                originals.setdefault(normalized, term.strip())
+        automaton = Automaton(originals)
+        # الاستبدال بإسناد واحد: أي فحص جارٍ يكمل على الآلة القديمة
+        self.originals, self._automaton = originals, automaton
+        self.stats["reloads"] += 1
+        return len(automaton)
+
+    # --- الفحص ---
+    def find(self, text: str) -> List[str]:
+        """الكلمات المحظورة الموجودة في النص (كل كلمة مرة واحدة، بترتيب ظهورها)"""
+        automaton = self._automaton
+        self.stats["checked"] += 1
+        found = dict.fromkeys(automaton.terms[term_id] for term_id in automaton.scan(substitute(text)))
+        if found:
+            self.stats["flagged"] += 1
+        return [self.originals[term] for term in found]
+
+    # --- مراقبة الملف ---
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                mtime = os.path.getmtime(self.path) if os.path.exists(self.path) else None
+                if mtime != self._mtime:
+                    count = await asyncio.to_thread(self.reload)
+                    logger.info(f"Reloaded content filter: {count} terms")
+            except Exception as e:
+                logger.error(f"Content filter reload failed: {e}")
+
+    def start(self):
+        if not self.path:
+            return None
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self.run())
+        return self._task
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def get_stats(self) -> Dict[str, int]:
+        return dict(self.stats, terms=len(self._automaton), states=len(self._automaton.goto))
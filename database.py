@@ -1,23 +1,54 @@
 import os
 import json
 import time
+import copy
+import atexit
 import base64
+import functools
 import requests
 import logging
 from typing import Optional, Dict, Any, List
 from datetime import datetime
+from dataclasses import dataclass
 import threading
 from collections import defaultdict
+from journal import Journal, apply_record
+from indexes import DatabaseIndexes
+from stats import StatsAggregator, recompute_stats
+from sharded_storage import ShardedGitHubStorage, shards_for_record, all_shards, build_shards, SYSTEM_SHARD, MANIFEST_SHARD
 
 logger = logging.getLogger(__name__)
 
 def now_ts():
     return int(time.time())
 
+@dataclass
+class TransferResult:
+    """نتيجة تحويل نقاط بين مستخدمين"""
+    ok: bool
+    amount: int = 0  # المبلغ المحول فعلياً (قد يقل عن المطلوب مع allow_partial)
+    transfer_id: Optional[int] = None
+    from_balance: int = 0
+    to_balance: int = 0
+    error: str = ""  # invalid_amount / same_user / unknown_user / insufficient_funds
+
+def _locked(method):
+    """تنفيذ التعديل تحت قفل قاعدة البيانات حتى لا يتزامن مع الحفظ في الخلفية"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        # تحديث الكاش (طلب شبكة) يتم قبل أخذ القفل
+        self._load_data()
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
 class GitHubDatabase:
     """نظام قاعدة بيانات يستخدم GitHub كمستودع للبيانات"""
     
-    def __init__(self, token: str, repo: str, db_file: str = "bot_data.json"):
+    def __init__(self, token: str, repo: str, db_file: str = "bot_data.json",
+                 flush_interval: int = 10, flush_max_mutations: int = 50,
+                 journal_path: Optional[str] = None, layout: str = "single",
+                 shard_prefix: Optional[str] = None):
         self.token = token
         self.repo = repo
         self.db_file = db_file
@@ -30,7 +61,45 @@ class GitHubDatabase:
         self.cache_sha = None
         self.last_sync = 0
         self.cache_duration = 300  # 5 دقائق بين كل مزامنة
-        self.lock = threading.Lock()
+        # فشل أول تحميل: الكاش هيكل فارغ مؤقت لا يُسجل ولا يُرفع حتى ينجح التحميل
+        self.placeholder = False
+        self.load_retry_interval = 30  # ثوانٍ بين محاولات التحميل أثناء ذلك
+        self.lock = threading.RLock()
+        
+        # الكتابة المؤجلة: التعديلات تبقى في الذاكرة ثم تُدمج في commit واحد
+        self.flush_interval = flush_interval  # ثوانٍ بين كل دفعة حفظ
+        self.flush_max_mutations = flush_max_mutations  # حفظ فوري عند بلوغ هذا العدد
+        self.flush_lock = threading.Lock()
+        self.refresh_lock = threading.Lock()
+        self._saves_started = 0
+        self.dirty = False
+        self.pending_mutations = 0
+        self.write_stats = {
+            "mutations": 0,
+            "commits": 0,
+            "failed_commits": 0,
+            "last_batch_size": 0,
+            "max_batch_size": 0
+        }
+        self._flush_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._flusher = None
+        
+        # السجل المحلي: كل تعديل يُحفظ على القرص فوراً ويُعاد تطبيقه بعد التوقف المفاجئ
+        self.journal = Journal(journal_path or os.path.splitext(db_file)[0] + ".journal")
+        self._journal_replayed = False
+        
+        # التخزين المقسم: ملف لكل مجموعة ودلاء للمستخدمين، وتُرفع الملفات المتغيرة فقط
+        self.layout = layout
+        self.storage = None
+        if layout == "sharded":
+            self.storage = ShardedGitHubStorage(token, repo, shard_prefix or os.path.splitext(db_file)[0])
+        self.dirty_shards = set()
+        
+        # فهارس المحادثات والرسائل والتقارير (تُبنى عند التحميل وتُحدّث مع كل تعديل)
+        self.indexes = DatabaseIndexes()
+        self.aggregates = StatsAggregator()
+        self._indexed_cache = None
         
         # تهيئة الهيكل الأساسي للبيانات
         self.default_structure = {
@@ -46,6 +115,7 @@ class GitHubDatabase:
             "game_requests": [],
             "stars_transactions": [],
             "vip_stars_purchases": [],
+            "transfers": [],
             "logs": [],
             "system": {
                 "last_backup": 0,
@@ -57,82 +127,311 @@ class GitHubDatabase:
         
         # محاولة تحميل البيانات الحالية
         self._load_data()
+        
+        # تشغيل خيط الحفظ المؤجل وضمان الحفظ عند إغلاق العملية
+        self._start_flusher()
+        atexit.register(self.close)
     
     def _load_data(self) -> Dict:
         """تحميل البيانات من مستودع GitHub"""
-        with self.lock:
-            current_time = now_ts()
-            
-            # استخدام الكاش إذا كان حديثاً
-            if self.cache and (current_time - self.last_sync) < self.cache_duration:
+        if self.is_cache_fresh():
+            return self.cache
+        
+        # طلب الشبكة يتم خارج قفل البيانات حتى لا تتوقف القراءات والتعديلات أثناءه.
+        # إذا كان تحديث آخر جارياً نخدم النسخة الحالية بدلاً من الانتظار
+        if not self.refresh_lock.acquire(blocking=self.cache is None):
+            return self.cache
+        try:
+            if self.is_cache_fresh():
                 return self.cache
             
+            with self.lock:
+                saves_before = self._saves_started
+                save_in_flight = self.flush_lock.locked()
+            
             try:
-                # الحصول على معلومات الملف
-                file_url = f"{self.base_url}/{self.db_file}"
-                response = requests.get(file_url, headers=self.headers, timeout=30)
-                
-                if response.status_code == 200:
-                    content = response.json()
-                    data_json = base64.b64decode(content['content']).decode('utf-8')
-                    self.cache = json.loads(data_json)
-                    self.cache_sha = content['sha']
-                else:
-                    # إذا لم يوجد الملف، إنشاء هيكل جديد
-                    self.cache = self.default_structure.copy()
-                    self.cache_sha = None
-                    
-                    # محاولة حفظ الهيكل الجديد
-                    self._save_data("Initializing database structure")
-                
+                remote = self._fetch_shards() if self.storage else self._fetch_single_file()
+                fetch_failed = False
             except Exception as e:
                 logger.error(f"Error loading data from GitHub: {e}")
-                # استخدام بيانات افتراضية في حالة الخطأ
-                if not self.cache:
-                    self.cache = self.default_structure.copy()
-                    self.cache_sha = None
+                remote, fetch_failed = None, True
             
-            self.last_sync = current_time
-            return self.cache
-    
-    def _save_data(self, commit_message: str = "Auto-save") -> bool:
-        """حفظ البيانات إلى مستودع GitHub"""
-        with self.lock:
-            try:
-                # تحويل البيانات إلى JSON
-                data_json = json.dumps(self.cache, indent=2, ensure_ascii=False)
-                data_bytes = data_json.encode('utf-8')
-                encoded_content = base64.b64encode(data_bytes).decode('utf-8')
-                
-                # إعداد بيانات الرفع
-                file_url = f"{self.base_url}/{self.db_file}"
-                payload = {
-                    "message": f"🤖 {commit_message}",
-                    "content": encoded_content
-                }
+            with self.lock:
+                if self.cache is None or (self.placeholder and not fetch_failed):
+                    if self.placeholder:
+                        logger.warning("GitHub data loaded, dropping the placeholder cache")
+                        self.placeholder = False
+                        self.dirty_shards = set()
+                    if remote is not None:
+                        self.cache, self.cache_sha = remote
+                    else:
+                        # إذا لم يوجد الملف (أو تعذر التحميل) إنشاء هيكل جديد
+                        self.cache = copy.deepcopy(self.default_structure)
+                        self.cache_sha = None
+                        if fetch_failed:
+                            # لا نعرف ما في المستودع: أي رفع الآن يمحو البيانات الحقيقية
+                            self.placeholder = True
+                        else:
+                            self._initialize_structure()
+                elif (remote is not None and not self.dirty and not save_in_flight
+                      and self._saves_started == saves_before):
+                    # لا نستبدل الكاش إذا تغير أو بدأ حفظ أثناء التحميل؛ نسختنا هي الأحدث
+                    self.cache, self.cache_sha = remote
                 
-                # إضافة SHA إذا كان موجوداً لتحديث الملف
-                if self.cache_sha:
-                    payload["sha"] = self.cache_sha
+                # إعادة تطبيق التعديلات المحفوظة محلياً ولم تصل إلى GitHub (فوق لقطة حقيقية فقط)
+                if not self._journal_replayed and not self.placeholder:
+                    self._replay_journal()
                 
-                # رفع/تحديث الملف
-                response = requests.put(file_url, headers=self.headers, json=payload, timeout=30)
+                if self.cache is not self._indexed_cache:
+                    self.indexes.rebuild(self.cache)
+                    self.aggregates.rebuild(self.cache)
+                    self._indexed_cache = self.cache
                 
-                if response.status_code in [200, 201]:
-                    result = response.json()
-                    self.cache_sha = result.get('sha')
-                    logger.info(f"Successfully saved data to GitHub: {commit_message}")
-                    
+                self.last_sync = now_ts()
+                return self.cache
+        finally:
+            self.refresh_lock.release()
+    
+    def is_cache_fresh(self) -> bool:
+        """هل يمكن خدمة القراءة من الذاكرة دون أي طلب إلى GitHub"""
+        if self.cache is not None and self.placeholder:
+            return (now_ts() - self.last_sync) < self.load_retry_interval
+        return self.cache is not None and (self.dirty or (now_ts() - self.last_sync) < self.cache_duration)
+    
+    def _initialize_structure(self):
+        """حفظ الهيكل الجديد مع الدفعة التالية"""
+        if self.storage:
+            # التخزين المقسم غير موجود بعد: رفع جميع الملفات
+            self.dirty_shards.update(all_shards(self.cache))
+            self.dirty_shards.add(MANIFEST_SHARD)
+        self._mark_dirty("Initializing database structure")
+    
+    def _fetch_single_file(self):
+        """تحميل الملف الواحد: (البيانات, sha) أو None إذا لم يوجد"""
+        # الحصول على معلومات الملف
+        file_url = f"{self.base_url}/{self.db_file}"
+        response = requests.get(file_url, headers=self.headers, timeout=30)
+        
+        if response.status_code != 200:
+            return None
+        content = response.json()
+        data_json = base64.b64decode(content['content']).decode('utf-8')
+        return self._with_defaults(json.loads(data_json)), content['sha']
+    
+    def _fetch_shards(self):
+        """تحميل الملفات المقسمة: (البيانات, None) أو None إذا لم توجد"""
+        data = self.storage.load()
+        if data is None:
+            return None
+        return self._with_defaults(data), None
+    
+    def _with_defaults(self, data: Dict) -> Dict:
+        """المجموعات الجديدة غير الموجودة في المستودع تأخذ القيم الافتراضية"""
+        for name, default in self.default_structure.items():
+            data.setdefault(name, copy.deepcopy(default))
+        return data
+    
+    def _replay_journal(self):
+        """إعادة تطبيق سجل التعديلات المحلي فوق اللقطة المحملة"""
+        self._journal_replayed = True
+        base_seq = self.cache.get("system", {}).get("journal_seq", 0)
+        replayed = 0
+        
+        for record in self.journal.replay(after_seq=base_seq):
+            value = record.get("delta", record.get("value"))
+            try:
+                apply_record(self.cache, record["op"], record["key"], value)
+                replayed += 1
+            except (KeyError, IndexError, TypeError) as e:
+                logger.error(f"Skipping journal record {record.get('seq')}: {e}")
+                continue
+            # الملفات المسترجعة يجب أن تُرفع قبل حذف السجل، وإلا تضيع التعديلات مع مقطعه
+            self.dirty_shards |= shards_for_record(record["op"], record["key"], value)
+        
+        self.journal.seq = max(self.journal.seq, base_seq)
+        if replayed:
+            logger.info(f"Replayed {replayed} journal records")
+            self.dirty = True
+            self.pending_mutations += replayed
+    
+    def _save_data(self, commit_message: str = "Auto-save") -> bool:
+        """حفظ البيانات إلى مستودع GitHub"""
+        with self.flush_lock:
+            # أخذ لقطة من البيانات تحت القفل ثم الرفع خارجه حتى لا تتوقف التعديلات
+            with self.lock:
+                if self.cache is None or self.placeholder:
+                    return False
+                # اللقطة تحمل آخر رقم تسلسلي مضمّن فيها، ويبدأ مقطع سجل جديد بعدها
+                self.cache["system"]["journal_seq"] = self.journal.seq
+                if self.storage:
+                    # تحويل الملفات المتغيرة فقط (ومعها system لرقم السجل)
+                    saved_shards = self.dirty_shards | {SYSTEM_SHARD}
+                    self.dirty_shards = set()
+                    payload = build_shards(self.cache, saved_shards)
+                else:
+                    payload = json.dumps(self.cache, indent=2, ensure_ascii=False)
+                sealed_segment = self.journal.rotate()
+                self._saves_started += 1
+                batch_size = self.pending_mutations
+                self.pending_mutations = 0
+                self.dirty = False
+            
+            if self.storage:
+                saved = self.storage.save(payload, commit_message)
+            else:
+                saved = self._upload_data(payload, commit_message)
+            
+            with self.lock:
+                if saved:
+                    # ضغط السجل: التعديلات أصبحت جزءاً من اللقطة المرفوعة
+                    self.journal.discard(sealed_segment)
+                    self.last_sync = now_ts()
+                    self.write_stats["commits"] += 1
+                    self.write_stats["last_batch_size"] = batch_size
+                    self.write_stats["max_batch_size"] = max(self.write_stats["max_batch_size"], batch_size)
                     # إنشاء سجل
                     self._add_log(f"SAVE: {commit_message}")
-                    return True
                 else:
-                    logger.error(f"Failed to save data: {response.status_code} - {response.text}")
-                    return False
-                    
-            except Exception as e:
-                logger.error(f"Error saving data to GitHub: {e}")
+                    # إعادة التعديلات للدفعة التالية
+                    self.write_stats["failed_commits"] += 1
+                    self.pending_mutations += batch_size
+                    self.dirty = True
+                    if self.storage:
+                        self.dirty_shards |= saved_shards
+            return saved
+    
+    def _upload_data(self, data_json: str, commit_message: str) -> bool:
+        """رفع ملف البيانات إلى GitHub"""
+        try:
+            data_bytes = data_json.encode('utf-8')
+            encoded_content = base64.b64encode(data_bytes).decode('utf-8')
+            
+            # إعداد بيانات الرفع
+            file_url = f"{self.base_url}/{self.db_file}"
+            payload = {
+                "message": f"🤖 {commit_message}",
+                "content": encoded_content
+            }
+            
+            # إضافة SHA إذا كان موجوداً لتحديث الملف
+            if self.cache_sha:
+                payload["sha"] = self.cache_sha
+            
+            # رفع/تحديث الملف
+            response = requests.put(file_url, headers=self.headers, json=payload, timeout=30)
+            
+            if response.status_code in [200, 201]:
+                result = response.json()
+                self.cache_sha = result.get('content', {}).get('sha', self.cache_sha)
+                logger.info(f"Successfully saved data to GitHub: {commit_message}")
+                return True
+            else:
+                logger.error(f"Failed to save data: {response.status_code} - {response.text}")
                 return False
+                
+        except Exception as e:
+            logger.error(f"Error saving data to GitHub: {e}")
+            return False
+    
+    # --- التعديلات المسجلة ---
+    def _apply(self, op: str, key: List, value: Any = None):
+        """تطبيق تعديل على الذاكرة وتسجيله في السجل المحلي"""
+        apply_record(self.cache, op, key, value)
+        self.indexes.on_apply(self.cache, op, key, value)
+        self.aggregates.on_apply(self.cache, op, key, value)
+        if not self.placeholder:
+            self.journal.append(op, key, value)
+        self.dirty_shards |= shards_for_record(op, key, value)
+    
+    def _apply_batch(self, records: List[tuple]):
+        """تطبيق عدة تعديلات كسطر واحد في السجل المحلي (لا تظهر حالة وسيطة بعد الاسترجاع)"""
+        for op, key, value in records:
+            apply_record(self.cache, op, key, value)
+            self.indexes.on_apply(self.cache, op, key, value)
+            self.aggregates.on_apply(self.cache, op, key, value)
+            self.dirty_shards |= shards_for_record(op, key, value)
+        if not self.placeholder:
+            self.journal.append("batch", [], [list(record) for record in records])
+    
+    def _next_id(self, collection: str) -> int:
+        """رقم السجل التالي (لا يتكرر بعد حذف السجلات القديمة)"""
+        records = self.cache[collection]
+        return records[-1].get("id", len(records)) + 1 if records else 1
+    
+    def _set(self, key: List, value: Any):
+        self._apply("set", key, value)
+    
+    def _incr(self, key: List, delta: int):
+        self._apply("incr", key, delta)
+    
+    def _append(self, key: List, record: Dict):
+        self._apply("append", key, record)
+    
+    def _delete(self, key: List):
+        self._apply("del", key)
+    
+    def _bulk_update(self, key: List, record_keys: List[str], incr: Dict[str, int],
+                     values: Optional[Dict[str, Dict]] = None):
+        """تعديل مجموعة سجلات كسطر واحد في السجل المحلي"""
+        self._apply("bulk_update", key, {"keys": record_keys, "incr": incr, "set": values or {}})
+    
+    # --- الكتابة المؤجلة ---
+    def _mark_dirty(self, reason: str):
+        """تسجيل تعديل في الذاكرة ليُحفظ مع الدفعة التالية"""
+        with self.lock:
+            if self.placeholder:
+                # تعديلات فوق هيكل فارغ (مستخدمون "جدد" مثلاً) تمحو البيانات الحقيقية إن رُفعت أو أعيد تطبيقها
+                logger.warning(f"Dropping change while GitHub data is unavailable: {reason}")
+                return
+            self.dirty = True
+            self.pending_mutations += 1
+            self.write_stats["mutations"] += 1
+            logger.debug(f"Pending change: {reason}")
+            if self.pending_mutations >= self.flush_max_mutations:
+                self._flush_event.set()
+    
+    def flush(self) -> bool:
+        """حفظ جميع التعديلات المعلقة فوراً في commit واحد (للإغلاق والمدفوعات)"""
+        with self.lock:
+            dirty = self.dirty
+            batch_size = self.pending_mutations
+        if not dirty:
+            # انتظار أي رفع جارٍ في الخلفية حتى تكون البيانات على GitHub عند العودة
+            with self.flush_lock:
+                return not self.dirty
+        return self._save_data(f"Batch save: {batch_size} changes")
+    
+    def _start_flusher(self):
+        """تشغيل خيط الحفظ الدوري في الخلفية"""
+        def flusher_worker():
+            while not self._stop_event.is_set():
+                self._flush_event.wait(self.flush_interval)
+                self._flush_event.clear()
+                try:
+                    self.flush()
+                except Exception as e:
+                    logger.error(f"Error in background flush: {e}")
+        
+        self._flusher = threading.Thread(target=flusher_worker, name="github-db-flusher", daemon=True)
+        self._flusher.start()
+    
+    def close(self):
+        """إيقاف خيط الحفظ وحفظ ما تبقى من تعديلات"""
+        if self._stop_event.is_set():
+            return
+        self._stop_event.set()
+        self._flush_event.set()
+        self.flush()
+        self.journal.close()
+    
+    def get_write_stats(self) -> Dict[str, Any]:
+        """إحصائيات الكتابة: عدد التعديلات لكل commit"""
+        with self.lock:
+            stats = dict(self.write_stats)
+            stats["pending_mutations"] = self.pending_mutations
+        committed = stats["mutations"] - stats["pending_mutations"]
+        stats["mutations_per_commit"] = round(committed / stats["commits"], 2) if stats["commits"] else 0.0
+        return stats
     
     def _add_log(self, action: str):
         """إضافة سجل للنظام"""
@@ -141,11 +440,13 @@ class GitHubDatabase:
             "action": action
         }
         self.cache.get("logs", []).insert(0, log_entry)
+        self.dirty_shards.add("logs.json")
         # حفظ آخر 1000 سجل فقط
         if len(self.cache.get("logs", [])) > 1000:
             self.cache["logs"] = self.cache["logs"][:1000]
     
     # --- المستخدمين ---
+    @_locked
     def create_user(self, info: Dict[str, Any]) -> Dict:
         """إنشاء مستخدم جديد"""
         data = self._load_data()
@@ -197,12 +498,11 @@ class GitHubDatabase:
                 "searching_since": 0
             }
             
-            data["users"][str(user_id)] = user_data
-            self.cache = data
-            self._save_data(f"Create user: {user_id}")
+            self._set(["users", str(user_id)], user_data)
             
             # تحديث إحصائيات النظام
-            data["system"]["total_users"] = len(data["users"])
+            self._set(["system", "total_users"], len(data["users"]))
+            self._mark_dirty(f"Create user: {user_id}")
             
             return user_data
         
@@ -213,6 +513,12 @@ class GitHubDatabase:
         data = self._load_data()
         return data["users"].get(str(user_id))
     
+    def peek_user(self, user_id: int) -> Optional[Dict]:
+        """بيانات المستخدم من الذاكرة كما هي، دون أي تحميل من GitHub (آمنة داخل حلقة الأحداث)"""
+        cache = self.cache
+        return cache["users"].get(str(user_id)) if cache is not None else None
+    
+    @_locked
     def update_user_profile(self, user_id: int, updates: Dict[str, Any]):
         """تحديث بيانات المستخدم"""
         data = self._load_data()
@@ -220,25 +526,24 @@ class GitHubDatabase:
         
         if user_key in data["users"]:
             for key, value in updates.items():
-                data["users"][user_key][key] = value
+                self._set(["users", user_key, key], value)
             
-            self.cache = data
-            self._save_data(f"Update user profile: {user_id}")
+            self._mark_dirty(f"Update user profile: {user_id}")
     
+    @_locked
     def set_user_status(self, user_id: int, status: str):
         """تحديث حالة المستخدم"""
         data = self._load_data()
         user_key = str(user_id)
         
         if user_key in data["users"]:
-            data["users"][user_key]["status"] = status
+            self._set(["users", user_key, "status"], status)
             if status == "searching":
-                data["users"][user_key]["searching_since"] = now_ts()
+                self._set(["users", user_key, "searching_since"], now_ts())
             elif status == "idle":
-                data["users"][user_key]["searching_since"] = 0
+                self._set(["users", user_key, "searching_since"], 0)
             
-            self.cache = data
-            self._save_data(f"User {user_id} status changed to {status}")
+            self._mark_dirty(f"User {user_id} status changed to {status}")
     
     def list_all_users(self, limit: int = 1000) -> List[Dict]:
         """قائمة بجميع المستخدمين"""
@@ -246,23 +551,93 @@ class GitHubDatabase:
         users = list(data["users"].values())
         return sorted(users, key=lambda x: x.get('join_ts', 0), reverse=True)[:limit]
     
+    def get_user_ids_page(self, after_id: int = 0, limit: int = 500, include_blocked: bool = False) -> List[int]:
+        """صفحة من أرقام المستخدمين بعد after_id (مؤشر ثابت لا يتأثر بإضافة أو حذف مستخدمين)"""
+        data = self._load_data()
+        with self.lock:
+            page = self.indexes.user_ids_after(after_id, limit)
+            if include_blocked:
+                return page
+            return [user_id for user_id in page if not data["users"][str(user_id)].get("blocked_bot")]
+    
+    def count_users(self, include_blocked: bool = False) -> int:
+        """عدد المستخدمين (بدون من حظروا البوت افتراضياً)"""
+        data = self._load_data()
+        with self.lock:
+            if include_blocked:
+                return len(data["users"])
+            return sum(1 for user in data["users"].values() if not user.get("blocked_bot"))
+    
+    @_locked
+    def set_bot_blocked(self, user_id: int, blocked: bool = True):
+        """تسجيل أن المستخدم حظر البوت (يُتخطى في البث) أو أنه عاد لاستخدامه"""
+        data = self._load_data()
+        user_key = str(user_id)
+        
+        if user_key in data["users"]:
+            self._set(["users", user_key, "blocked_bot"], now_ts() if blocked else 0)
+            self._mark_dirty(f"User {user_id} {'blocked' if blocked else 'unblocked'} the bot")
+    
     # --- النقاط ---
+    @_locked
     def add_points(self, user_id: int, points: int):
         """إضافة نقاط للمستخدم"""
         data = self._load_data()
         user_key = str(user_id)
         
         if user_key in data["users"]:
-            data["users"][user_key]["points"] = data["users"][user_key].get("points", 0) + points
+            self._incr(["users", user_key, "points"], points)
             
             # تحديث المستوى
             current_points = data["users"][user_key]["points"]
             new_level = (current_points // 100) + 1
-            data["users"][user_key]["level"] = new_level
+            self._set(["users", user_key, "level"], new_level)
             
-            self.cache = data
-            self._save_data(f"Add {points} points to user {user_id}")
+            self._mark_dirty(f"Add {points} points to user {user_id}")
+    
+    def _select_users(self, data: Dict, user_ids: Optional[List[int]] = None, vip_only: bool = False,
+                      active_since: Optional[int] = None) -> List[str]:
+        """مفاتيح المستخدمين المطابقين: الكل أو قائمة محددة، مع تصفية VIP أو النشاط منذ وقت معين"""
+        users = data["users"]
+        if user_ids is None:
+            user_keys = list(users)
+        else:
+            user_keys = [key for key in dict.fromkeys(str(user_id) for user_id in user_ids) if key in users]
+        
+        if vip_only:
+            current_time = now_ts()
+            user_keys = [key for key in user_keys if users[key].get("vip_until", 0) > current_time]
+        
+        if active_since is not None:
+            # النشاط: بدء محادثة أو استلام المكافأة منذ active_since
+            active = {
+                str(user_id)
+                for conv in data["conversations"] if conv.get("start_ts", 0) >= active_since
+                for user_id in (conv["user_a"], conv["user_b"])
+            }
+            user_keys = [key for key in user_keys
+                         if key in active or users[key].get("last_reward_ts", 0) >= active_since]
+        return user_keys
+    
+    @_locked
+    def bulk_add_points(self, points: int, user_ids: Optional[List[int]] = None, vip_only: bool = False,
+                        active_since: Optional[int] = None) -> int:
+        """إضافة نقاط لمجموعة مستخدمين كتعديل واحد، وإرجاع عدد المستفيدين"""
+        data = self._load_data()
+        user_keys = self._select_users(data, user_ids, vip_only, active_since)
+        if not user_keys:
+            return 0
+        
+        # المستويات الجديدة لمن تغير مستواه فقط
+        users = data["users"]
+        new_levels = {key: (users[key].get("points", 0) + points) // 100 + 1 for key in user_keys}
+        levels = {key: {"level": level} for key, level in new_levels.items() if users[key].get("level") != level}
+        
+        self._bulk_update(["users"], user_keys, {"points": points}, levels)
+        self._mark_dirty(f"Bulk add {points} points to {len(user_keys)} users")
+        return len(user_keys)
     
+    @_locked
     def consume_points(self, user_id: int, points: int) -> bool:
         """خصم نقاط من المستخدم"""
         data = self._load_data()
@@ -271,24 +646,101 @@ class GitHubDatabase:
         if user_key in data["users"]:
             current_points = data["users"][user_key].get("points", 0)
             if current_points >= points:
-                data["users"][user_key]["points"] = current_points - points
-                self.cache = data
-                self._save_data(f"Consume {points} points from user {user_id}")
+                self._incr(["users", user_key, "points"], -points)
+                self._mark_dirty(f"Consume {points} points from user {user_id}")
                 return True
         return False
     
+    @_locked
+    def transfer_points(self, from_id: int, to_id: int, amount: int, reason: str,
+                        allow_partial: bool = False) -> TransferResult:
+        """تحويل نقاط من مستخدم لآخر: الخصم والإضافة وسجل التحويل في خطوة واحدة
+        
+        allow_partial: إذا كان رصيد المرسل أقل من المبلغ يُحول ما لديه فقط (مثل خسارة لعبة)
+        """
+        data = self._load_data()
+        from_key, to_key = str(from_id), str(to_id)
+        
+        if amount <= 0:
+            return TransferResult(False, error="invalid_amount")
+        if from_key == to_key:
+            return TransferResult(False, error="same_user")
+        if from_key not in data["users"] or to_key not in data["users"]:
+            return TransferResult(False, error="unknown_user")
+        
+        balance = data["users"][from_key].get("points", 0)
+        if balance < amount:
+            if not allow_partial or balance <= 0:
+                return TransferResult(False, from_balance=balance,
+                                      to_balance=data["users"][to_key].get("points", 0),
+                                      error="insufficient_funds")
+            amount = balance
+        
+        to_balance = data["users"][to_key].get("points", 0) + amount
+        transfer = {
+            "id": self._next_id("transfers"),
+            "from_id": from_id,
+            "to_id": to_id,
+            "amount": amount,
+            "reason": reason,
+            "ts": now_ts()
+        }
+        self._apply_batch([
+            ("incr", ["users", from_key, "points"], -amount),
+            ("incr", ["users", to_key, "points"], amount),
+            ("set", ["users", to_key, "level"], to_balance // 100 + 1),
+            ("append", ["transfers"], transfer)
+        ])
+        self._mark_dirty(f"Transfer {amount} points {from_id} -> {to_id} ({reason})")
+        return TransferResult(True, amount, transfer["id"], balance - amount, to_balance)
+    
+    # --- الألعاب ---
+    @_locked
+    def record_game(self, game_type: str, player1: int, player2: Optional[int], result: str,
+                    points: int = 0, winner: Optional[int] = None) -> int:
+        """تسجيل نتيجة لعبة منتهية"""
+        self._load_data()
+        game = {
+            "id": self._next_id("games"),
+            "game_type": game_type,
+            "player1": player1,
+            "player2": player2,
+            "result": result,
+            "winner": winner,
+            "points": points,
+            "ts": now_ts()
+        }
+        self._append(["games"], game)
+        self._incr(["system", "total_games"], 1)
+        self._mark_dirty(f"Record {game_type} game {game['id']}: {result}")
+        return game["id"]
+    
     # --- النجوم ---
+    @_locked
     def add_stars(self, user_id: int, stars: int):
         """إضافة نجوم للمستخدم"""
         data = self._load_data()
         user_key = str(user_id)
         
         if user_key in data["users"]:
-            data["users"][user_key]["stars_balance"] = data["users"][user_key].get("stars_balance", 0) + stars
-            data["users"][user_key]["total_stars_earned"] = data["users"][user_key].get("total_stars_earned", 0) + stars
-            self.cache = data
-            self._save_data(f"Add {stars} stars to user {user_id}")
+            self._incr(["users", user_key, "stars_balance"], stars)
+            self._incr(["users", user_key, "total_stars_earned"], stars)
+            self._mark_dirty(f"Add {stars} stars to user {user_id}")
+    
+    @_locked
+    def bulk_add_stars(self, stars: int, user_ids: Optional[List[int]] = None, vip_only: bool = False,
+                       active_since: Optional[int] = None) -> int:
+        """إضافة نجوم لمجموعة مستخدمين كتعديل واحد، وإرجاع عدد المستفيدين"""
+        data = self._load_data()
+        user_keys = self._select_users(data, user_ids, vip_only, active_since)
+        if not user_keys:
+            return 0
+        
+        self._bulk_update(["users"], user_keys, {"stars_balance": stars, "total_stars_earned": stars})
+        self._mark_dirty(f"Bulk add {stars} stars to {len(user_keys)} users")
+        return len(user_keys)
     
+    @_locked
     def consume_stars(self, user_id: int, stars: int) -> bool:
         """خصم نجوم من المستخدم"""
         data = self._load_data()
@@ -297,10 +749,9 @@ class GitHubDatabase:
         if user_key in data["users"]:
             current_stars = data["users"][user_key].get("stars_balance", 0)
             if current_stars >= stars:
-                data["users"][user_key]["stars_balance"] = current_stars - stars
-                data["users"][user_key]["total_stars_spent"] = data["users"][user_key].get("total_stars_spent", 0) + stars
-                self.cache = data
-                self._save_data(f"Consume {stars} stars from user {user_id}")
+                self._incr(["users", user_key, "stars_balance"], -stars)
+                self._incr(["users", user_key, "total_stars_spent"], stars)
+                self._mark_dirty(f"Consume {stars} stars from user {user_id}")
                 return True
         return False
     
@@ -309,6 +760,7 @@ class GitHubDatabase:
         user = self.get_user(user_id)
         return user.get("stars_balance", 0) if user else 0
     
+    @_locked
     def add_stars_transaction(self, user_id: int, transaction_type: str, stars_amount: int, description: str):
         """إضافة معاملة نجوم"""
         data = self._load_data()
@@ -323,17 +775,17 @@ class GitHubDatabase:
             "created_at": now_ts()
         }
         
-        data["stars_transactions"].append(transaction)
-        self.cache = data
-        self._save_data(f"Add stars transaction for user {user_id}")
+        self._append(["stars_transactions"], transaction)
+        self._mark_dirty(f"Add stars transaction for user {user_id}")
     
     # --- التقارير ---
+    @_locked
     def add_report(self, reporter_id: int, target_id: int, reason: str):
         """إضافة تقرير"""
-        data = self._load_data()
+        self._load_data()
         
         report = {
-            "id": len(data["reports"]) + 1,
+            "id": self._next_id("reports"),
             "reporter_id": reporter_id,
             "target_id": target_id,
             "reason": reason,
@@ -341,9 +793,14 @@ class GitHubDatabase:
             "handled": 0
         }
         
-        data["reports"].append(report)
-        self.cache = data
-        self._save_data(f"Add report from {reporter_id} against {target_id}")
+        self._append(["reports"], report)
+        self._mark_dirty(f"Add report from {reporter_id} against {target_id}")
+    
+    def get_reports_against(self, target_id: int, limit: int = 100) -> List[Dict]:
+        """التقارير المقدمة ضد مستخدم معين (الأحدث أولاً)"""
+        self._load_data()
+        with self.lock:
+            return self.indexes.reports_for(target_id)[::-1][:limit]
     
     def get_reports(self, limit: int = 100) -> List[Dict]:
         """الحصول على التقارير"""
@@ -352,6 +809,7 @@ class GitHubDatabase:
         return sorted(reports, key=lambda x: x.get('ts', 0), reverse=True)[:limit]
     
     # --- الإحالات ---
+    @_locked
     def add_referral(self, referrer_id: int, new_user_id: int):
         """إضافة إحالة"""
         data = self._load_data()
@@ -363,27 +821,27 @@ class GitHubDatabase:
             "ts": now_ts()
         }
         
-        data["referrals"].append(referral)
+        self._append(["referrals"], referral)
         
         # تحديث إحصائيات المستخدم
         referrer_key = str(referrer_id)
         if referrer_key in data["users"]:
-            data["users"][referrer_key]["referrals"] = data["users"][referrer_key].get("referrals", 0) + 1
+            self._incr(["users", referrer_key, "referrals"], 1)
         
         new_user_key = str(new_user_id)
         if new_user_key in data["users"]:
-            data["users"][new_user_key]["invited_by"] = referrer_id
+            self._set(["users", new_user_key, "invited_by"], referrer_id)
         
-        self.cache = data
-        self._save_data(f"Add referral: {referrer_id} -> {new_user_id}")
+        self._mark_dirty(f"Add referral: {referrer_id} -> {new_user_id}")
     
     # --- المحادثات والرسائل ---
+    @_locked
     def create_conversation(self, user_a: int, user_b: int) -> int:
         """إنشاء محادثة جديدة"""
         data = self._load_data()
         
         conversation = {
-            "id": len(data["conversations"]) + 1,
+            "id": self._next_id("conversations"),
             "user_a": user_a,
             "user_b": user_b,
             "start_ts": now_ts(),
@@ -394,47 +852,50 @@ class GitHubDatabase:
             "messages_count": 0
         }
         
-        data["conversations"].append(conversation)
+        self._append(["conversations"], conversation)
         
         # تحديث إحصائيات المستخدمين
         for user_id in [user_a, user_b]:
             user_key = str(user_id)
             if user_key in data["users"]:
-                data["users"][user_key]["chats_count"] = data["users"][user_key].get("chats_count", 0) + 1
-                data["users"][user_key]["total_chats"] = data["users"][user_key].get("total_chats", 0) + 1
-                data["users"][user_key]["active_conversation"] = conversation["id"]
+                self._incr(["users", user_key, "chats_count"], 1)
+                self._incr(["users", user_key, "total_chats"], 1)
+                self._set(["users", user_key, "active_conversation"], conversation["id"])
         
-        self.cache = data
-        self._save_data(f"Create conversation between {user_a} and {user_b}")
+        self._mark_dirty(f"Create conversation between {user_a} and {user_b}")
         
         return conversation["id"]
     
+    @_locked
     def close_conversation(self, conv_id: int):
         """إغلاق محادثة"""
         data = self._load_data()
         
-        for conv in data["conversations"]:
-            if conv["id"] == conv_id and conv["active"] == 1:
-                conv["active"] = 0
-                conv["last_ts"] = now_ts()
-                
-                # إزالة المحادثة النشطة من المستخدمين
-                for user_id in [conv["user_a"], conv["user_b"]]:
-                    user_key = str(user_id)
-                    if user_key in data["users"]:
-                        data["users"][user_key]["active_conversation"] = None
-                        data["users"][user_key]["status"] = "idle"
-                
-                self.cache = data
-                self._save_data(f"Close conversation {conv_id}")
-                break
+        index = self.indexes.conversation_index(conv_id)
+        if index is None:
+            return
+        
+        conv = data["conversations"][index]
+        if conv["active"] == 1:
+            self._set(["conversations", index, "active"], 0)
+            self._set(["conversations", index, "last_ts"], now_ts())
+            
+            # إزالة المحادثة النشطة من المستخدمين
+            for user_id in [conv["user_a"], conv["user_b"]]:
+                user_key = str(user_id)
+                if user_key in data["users"]:
+                    self._set(["users", user_key, "active_conversation"], None)
+                    self._set(["users", user_key, "status"], "idle")
+            
+            self._mark_dirty(f"Close conversation {conv_id}")
     
+    @_locked
     def add_message(self, conv_id: int, sender_id: int, text: str, message_type: str = "text"):
         """إضافة رسالة"""
         data = self._load_data()
         
         message = {
-            "id": len(data["messages"]) + 1,
+            "id": self._next_id("messages"),
             "conv_id": conv_id,
             "sender_id": sender_id,
             "text": text,
@@ -442,129 +903,78 @@ class GitHubDatabase:
             "message_type": message_type
         }
         
-        data["messages"].append(message)
+        self._append(["messages"], message)
         
         # تحديث عدد الرسائل في المحادثة
-        for conv in data["conversations"]:
-            if conv["id"] == conv_id:
-                conv["messages_count"] = conv.get("messages_count", 0) + 1
-                conv["last_ts"] = now_ts()
-                break
+        index = self.indexes.conversation_index(conv_id)
+        if index is not None:
+            self._incr(["conversations", index, "messages_count"], 1)
+            self._set(["conversations", index, "last_ts"], now_ts())
         
         # تحديث إحصائيات النظام
-        data["system"]["total_messages"] = len(data["messages"])
+        self._set(["system", "total_messages"], len(data["messages"]))
         
-        self.cache = data
-        self._save_data(f"Add message to conversation {conv_id}")
+        self._mark_dirty(f"Add message to conversation {conv_id}")
     
     def get_messages(self, conv_id: int, limit: int = 50) -> List[Dict]:
         """الحصول على رسائل المحادثة"""
-        data = self._load_data()
-        messages = [msg for msg in data["messages"] if msg["conv_id"] == conv_id]
-        return sorted(messages, key=lambda x: x.get('ts', 0), reverse=True)[:limit][::-1]
+        self._load_data()
+        with self.lock:
+            # الرسائل مفهرسة بترتيب إضافتها، فآخر limit منها هي الأحدث
+            return list(self.indexes.messages_for(conv_id)[-limit:])
     
     def list_active_conversations(self) -> List[Dict]:
         """قائمة بالمحادثات النشطة"""
         data = self._load_data()
-        return [conv for conv in data["conversations"] if conv.get("active") == 1]
+        with self.lock:
+            return [data["conversations"][self.indexes.conversation_index(conv_id)]
+                    for conv_id in set(self.indexes.active_by_pair.values())]
     
     def get_conversation(self, conv_id: int) -> Optional[Dict]:
         """الحصول على محادثة"""
         data = self._load_data()
-        for conv in data["conversations"]:
-            if conv["id"] == conv_id:
-                return conv
-        return None
-    
-    # --- المطابقة المحسنة ---
-    def find_available_partner(self, exclude_user_id: int) -> Optional[Dict]:
-        """البحث عن شريك متاح"""
-        data = self._load_data()
-        current_time = now_ts()
-        
-        # فلترة المستخدمين المتاحين
-        available_users = []
-        for user_id, user in data["users"].items():
-            uid = int(user_id)
-            if (uid != exclude_user_id and
-                user.get("status") == "idle" and
-                user.get("banned_until", 0) < current_time and
-                not user.get("active_conversation") and
-                (user.get("searching_since", 0) == 0 or 
-                 (current_time - user.get("searching_since", 0)) < 300)):  # لا يبحث لأكثر من 5 دقائق
-                available_users.append(user)
-        
-        if available_users:
-            # ترتيب عشوائي للمستخدمين
-            import random
-            return random.choice(available_users)
-        
-        return None
+        with self.lock:
+            index = self.indexes.conversation_index(conv_id)
+            return data["conversations"][index] if index is not None else None
     
-    def find_available_partner_by_gender(self, exclude_user_id: int, gender_pref: str) -> Optional[Dict]:
-        """البحث عن شريك حسب الجنس"""
-        data = self._load_data()
-        current_time = now_ts()
-        
-        # فلترة المستخدمين المتاحين بنفس الجنس
-        available_users = []
-        for user_id, user in data["users"].items():
-            uid = int(user_id)
-            if (uid != exclude_user_id and
-                user.get("gender") == gender_pref and
-                user.get("status") == "idle" and
-                user.get("banned_until", 0) < current_time and
-                not user.get("active_conversation")):
-                available_users.append(user)
-        
-        if available_users:
-            import random
-            return random.choice(available_users)
-        
-        return None
+    def find_active_conversation(self, user_a: int, user_b: Optional[int] = None) -> Optional[Dict]:
+        """المحادثة النشطة بين مستخدمين (أو للمستخدم الأول مع أي شريك)"""
+        self._load_data()
+        with self.lock:
+            conv_id = self.indexes.active_conversation_id(user_a, user_b)
+        return self.get_conversation(conv_id) if conv_id is not None else None
     
     # --- لوحة المتصدرين ---
     def get_leaderboard(self, limit: int = 10) -> List[Dict]:
         """لوحة متصدرين النقاط"""
-        data = self._load_data()
-        users = list(data["users"].values())
-        return sorted(users, key=lambda x: x.get('points', 0), reverse=True)[:limit]
+        return self._top_users("points", limit)
     
     def get_stars_leaderboard(self, limit: int = 10) -> List[Dict]:
         """لوحة متصدرين النجوم"""
-        data = self._load_data()
-        users = list(data["users"].values())
-        return sorted(users, key=lambda x: x.get('stars_balance', 0), reverse=True)[:limit]
+        return self._top_users("stars_balance", limit)
     
     def get_user_rank(self, user_id: int) -> int:
         """الحصول على ترتيب المستخدم في النقاط"""
-        data = self._load_data()
-        user_points = self.get_user(user_id).get("points", 0) if self.get_user(user_id) else 0
-        
-        users = list(data["users"].values())
-        users.sort(key=lambda x: x.get('points', 0), reverse=True)
-        
-        for i, user in enumerate(users, 1):
-            if user.get("user_id") == user_id:
-                return i
-        
-        return len(users) + 1
+        return self._user_rank("points", user_id)
     
     def get_user_stars_rank(self, user_id: int) -> int:
         """الحصول على ترتيب المستخدم في النجوم"""
+        return self._user_rank("stars_balance", user_id)
+    
+    def _top_users(self, field: str, limit: int) -> List[Dict]:
         data = self._load_data()
-        user_stars = self.get_user(user_id).get("stars_balance", 0) if self.get_user(user_id) else 0
-        
-        users = list(data["users"].values())
-        users.sort(key=lambda x: x.get('stars_balance', 0), reverse=True)
-        
-        for i, user in enumerate(users, 1):
-            if user.get("user_id") == user_id:
-                return i
-        
-        return len(users) + 1
+        with self.lock:
+            return [data["users"][user_key] for user_key in self.indexes.rankings[field].top(limit)]
+    
+    def _user_rank(self, field: str, user_id: int) -> int:
+        self._load_data()
+        with self.lock:
+            ranking = self.indexes.rankings[field]
+            rank = ranking.rank(str(user_id))
+            return rank if rank is not None else len(ranking) + 1
     
     # --- VIP ---
+    @_locked
     def set_vip(self, user_id: int, days: int, use_stars: bool = False, stars_paid: int = 0):
         """تعيين VIP للمستخدم"""
         data = self._load_data()
@@ -574,9 +984,9 @@ class GitHubDatabase:
             until_ts = now_ts() + (days * 86400)
             
             # تحديث حالة VIP
-            data["users"][user_key]["vip_until"] = until_ts
-            data["users"][user_key]["vip_days"] = data["users"][user_key].get("vip_days", 0) + days
-            data["users"][user_key]["vip_purchases"] = data["users"][user_key].get("vip_purchases", 0) + 1
+            self._set(["users", user_key, "vip_until"], until_ts)
+            self._incr(["users", user_key, "vip_days"], days)
+            self._incr(["users", user_key, "vip_purchases"], 1)
             
             # تحديد مستوى VIP
             vip_level = 1
@@ -585,8 +995,8 @@ class GitHubDatabase:
             elif days >= 7:
                 vip_level = 2
             
-            data["users"][user_key]["vip_level"] = vip_level
-            data["users"][user_key]["vip_title"] = f'VIP {vip_level}'
+            self._set(["users", user_key, "vip_level"], vip_level)
+            self._set(["users", user_key, "vip_title"], f'VIP {vip_level}')
             
             # تسجيل عملية الشراء
             purchase = {
@@ -599,7 +1009,7 @@ class GitHubDatabase:
                 "purchase_type": "stars" if use_stars else "points"
             }
             
-            data["vip_purchases"].append(purchase)
+            self._append(["vip_purchases"], purchase)
             
             # إذا كانت بالنجوم، تسجيل في جدول النجوم
             if use_stars:
@@ -611,10 +1021,9 @@ class GitHubDatabase:
                     "purchase_date": now_ts(),
                     "expiration_date": until_ts
                 }
-                data["vip_stars_purchases"].append(stars_purchase)
+                self._append(["vip_stars_purchases"], stars_purchase)
             
-            self.cache = data
-            self._save_data(f"Set VIP for user {user_id} for {days} days")
+            self._mark_dirty(f"Set VIP for user {user_id} for {days} days")
     
     def get_vip_status(self, user_id: int) -> Dict[str, Any]:
         """الحصول على حالة VIP للمستخدم"""
@@ -642,6 +1051,7 @@ class GitHubDatabase:
                 "vip_title": ""
             }
     
+    @_locked
     def purchase_vip_with_stars(self, user_id: int, days: int, stars_cost: int) -> bool:
         """شراء VIP بالنجوم"""
         if self.consume_stars(user_id, stars_cost):
@@ -650,93 +1060,51 @@ class GitHubDatabase:
         return False
     
     # --- المشرفين ---
+    @_locked
     def ban_user(self, user_id: int, until_ts: int):
         """حظر مستخدم"""
         data = self._load_data()
         user_key = str(user_id)
         
         if user_key in data["users"]:
-            data["users"][user_key]["banned_until"] = until_ts
+            self._set(["users", user_key, "banned_until"], until_ts)
             
             # إذا كان في محادثة، إغلاقها
             active_conv = data["users"][user_key].get("active_conversation")
             if active_conv:
                 self.close_conversation(active_conv)
             
-            self.cache = data
-            self._save_data(f"Ban user {user_id} until {until_ts}")
+            self._mark_dirty(f"Ban user {user_id} until {until_ts}")
     
+    @_locked
     def unban_user(self, user_id: int):
         """إلغاء حظر مستخدم"""
         data = self._load_data()
         user_key = str(user_id)
         
         if user_key in data["users"]:
-            data["users"][user_key]["banned_until"] = 0
-            self.cache = data
-            self._save_data(f"Unban user {user_id}")
+            self._set(["users", user_key, "banned_until"], 0)
+            self._mark_dirty(f"Unban user {user_id}")
     
     # --- الإحصائيات المحسنة ---
     def get_stats(self) -> Dict[str, Any]:
-        """الحصول على إحصائيات النظام"""
+        """الحصول على إحصائيات النظام (من المجاميع المحدثة تدريجياً)"""
         data = self._load_data()
-        current_time = now_ts()
-        today_ts = current_time - 86400
-        
-        # إجمالي المستخدمين
-        total_users = len(data["users"])
-        
-        # المستخدمين النشطين
-        active_users = 0
-        searching_users = 0
-        
-        for user in data["users"].values():
-            if user.get("status") == "chatting":
-                active_users += 1
-            elif user.get("status") == "searching":
-                searching_users += 1
-        
-        # المحادثات النشطة
-        active_chats = len([conv for conv in data["conversations"] if conv.get("active") == 1])
-        
-        # إجمالي النقاط والنجوم
-        total_points = sum(user.get("points", 0) for user in data["users"].values())
-        total_stars = sum(user.get("stars_balance", 0) for user in data["users"].values())
-        
-        # التوزيع حسب الجنس
-        male_users = len([user for user in data["users"].values() if user.get("gender") == "ذكر"])
-        female_users = len([user for user in data["users"].values() if user.get("gender") == "أنثى"])
-        
-        # المحادثات اليوم
-        today_chats = len([conv for conv in data["conversations"] if conv.get("start_ts", 0) > today_ts])
-        
-        # المستخدمين الجدد اليوم
-        new_users_today = len([user for user in data["users"].values() if user.get("join_ts", 0) > today_ts])
-        
-        # عدد مستخدمين VIP
-        vip_users = len([user for user in data["users"].values() if user.get("vip_until", 0) > current_time])
-        
-        # الألعاب اليوم
-        today_games = len([game for game in data["games"] if game.get("ts", 0) > today_ts])
-        
-        # إجمالي الرسائل
-        total_messages = len(data["messages"])
-        
-        return {
-            "total_users": total_users,
-            "active_users": active_users,
-            "searching_users": searching_users,
-            "active_chats": active_chats,
-            "total_points": total_points,
-            "total_stars": total_stars,
-            "male_users": male_users,
-            "female_users": female_users,
-            "today_chats": today_chats,
-            "new_users_today": new_users_today,
-            "vip_users": vip_users,
-            "today_games": today_games,
-            "total_messages": total_messages
-        }
+        with self.lock:
+            return self.aggregates.snapshot(data, len(self.indexes.active_by_pair))
+    
+    def verify_stats(self) -> Dict[str, tuple]:
+        """مقارنة المجاميع التدريجية بإعادة الحساب من الصفر: {المفتاح: (التدريجي, الفعلي)}"""
+        data = self._load_data()
+        with self.lock:
+            current_time = time.time()
+            incremental = self.aggregates.snapshot(data, len(self.indexes.active_by_pair), current_time)
+            expected = recompute_stats(data, current_time)
+        mismatches = {key: (incremental[key], expected[key])
+                      for key in expected if incremental.get(key) != expected[key]}
+        if mismatches:
+            logger.error(f"Stats mismatch: {mismatches}")
+        return mismatches
     
     # --- النسخ الاحتياطي ---
     def backup_database(self) -> bool:
@@ -764,9 +1132,9 @@ class GitHubDatabase:
                 logger.info(f"Created backup: {backup_file}")
                 
                 # تحديث وقت آخر نسخة احتياطية
-                data["system"]["last_backup"] = now_ts()
-                self.cache = data
-                self._save_data("Update last backup timestamp")
+                with self.lock:
+                    self._set(["system", "last_backup"], now_ts())
+                    self._mark_dirty("Update last backup timestamp")
                 
                 # الحفاظ على آخر 5 نسخ احتياطية فقط
                 self._cleanup_old_backups(keep=5)
@@ -807,6 +1175,7 @@ class GitHubDatabase:
             logger.error(f"Error cleaning up old backups: {e}")
     
     # --- التحسين ---
+    @_locked
     def optimize_database(self) -> bool:
         """تحسين قاعدة البيانات"""
         try:
@@ -826,18 +1195,21 @@ class GitHubDatabase:
                     users_to_remove.append(user_id)
             
             for user_id in users_to_remove:
-                del data["users"][user_id]
+                self._delete(["users", user_id])
             
             # حذف المحادثات القديمة (أكثر من 7 أيام)
-            data["conversations"] = [conv for conv in data["conversations"] 
-                                   if conv.get("last_ts", 0) > (current_time - (7 * 86400))]
+            self._set(["conversations"], [conv for conv in data["conversations"] 
+                                          if conv.get("last_ts", 0) > (current_time - (7 * 86400))])
             
             # حذف الرسائل القديمة (أكثر من 7 أيام)
-            data["messages"] = [msg for msg in data["messages"] 
-                              if msg.get("ts", 0) > (current_time - (7 * 86400))]
+            self._set(["messages"], [msg for msg in data["messages"] 
+                                     if msg.get("ts", 0) > (current_time - (7 * 86400))])
             
-            self.cache = data
-            self._save_data("Optimize database")
+            # سجل التحويلات يُحفظ 30 يوماً
+            self._set(["transfers"], [transfer for transfer in data["transfers"]
+                                      if transfer.get("ts", 0) > thirty_days_ago])
+            
+            self._mark_dirty("Optimize database")
             
             logger.info(f"Optimized database - Removed {len(users_to_remove)} inactive users")
             return True
@@ -850,7 +1222,7 @@ class GitHubDatabase:
         """حفظ تلقائي للبيانات"""
         try:
             if self.cache:
-                self._save_data("Auto-save")
+                self.flush()
                 logger.debug("Auto-save completed")
         except Exception as e:
             logger.error(f"Error in auto-save: {e}")
@@ -867,7 +1239,7 @@ class GitHubDatabase:
         # محاولة حفظ البيانات
         try:
             if self.cache:
-                self._save_data("Emergency save after error")
+                self.flush()
         except:
             pass
 
@@ -884,11 +1256,17 @@ class DatabaseManager:
             token = os.getenv('GH_TOKEN')
             repo = os.getenv('DATA_REPO')
             db_file = os.getenv('DB_FILE', 'bot_data.json')
+            flush_interval = int(os.getenv('DB_FLUSH_INTERVAL', '10'))
+            flush_max_mutations = int(os.getenv('DB_FLUSH_MAX_MUTATIONS', '50'))
+            journal_path = os.getenv('DB_JOURNAL')
+            layout = os.getenv('DB_LAYOUT', 'single')
+            shard_prefix = os.getenv('DB_SHARD_PREFIX')
             
             if not token or not repo:
                 raise ValueError("GitHub token and repository must be configured")
             
-            self.db = GitHubDatabase(token, repo, db_file)
+            self.db = GitHubDatabase(token, repo, db_file, flush_interval, flush_max_mutations,
+                                     journal_path, layout, shard_prefix)
             logger.info("Using GitHub as database repository")
         else:
             # استخدام قاعدة البيانات المحلية (SQLite)
@@ -921,8 +1299,12 @@ class DatabaseManager:
     def switch_to_github(self, token: str, repo: str, db_file: str = "bot_data.json"):
         """التبديل إلى استخدام GitHub"""
         try:
+            old_db = self.db
             self.db = GitHubDatabase(token, repo, db_file)
             self.use_github = True
+            # حفظ التعديلات المعلقة في القاعدة السابقة
+            if hasattr(old_db, 'close'):
+                old_db.close()
             logger.info("Switched to GitHub database")
             return True
         except Exception as e:
@@ -971,4 +1353,9 @@ USE_GITHUB_DB=true
 GH_TOKEN=your_github_token_here
 DATA_REPO=your_username/your_repo_name
 DB_FILE=bot_data.json
+DB_FLUSH_INTERVAL=10
+DB_FLUSH_MAX_MUTATIONS=50
+DB_JOURNAL=bot_data.journal
+DB_LAYOUT=single  # أو sharded بعد تشغيل: python sharded_storage.py migrate
+DB_SHARD_PREFIX=bot_data
 """ 
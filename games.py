@@ -1,33 +1,80 @@
 import random
 import time
 import asyncio
-from typing import Dict, List, Optional, Tuple, Set
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple, Set
 from telegram import InlineKeyboardMarkup, InlineKeyboardButton
 
+from metrics import registry
+
+# --- لوحة XO كأرقام بتات: الخانة i تقابل البت (1 << i) ---
+EMPTY_CELL = '⬜'
+X_SYMBOL = '❌'
+O_SYMBOL = '⭕'
+FULL_BOARD = (1 << 9) - 1
+WIN_MASKS = tuple(sum(1 << i for i in pattern) for pattern in (
+    (0, 1, 2), (3, 4, 5), (6, 7, 8),  # صفوف
+    (0, 3, 6), (1, 4, 7), (2, 5, 8),  # أعمدة
+    (0, 4, 8), (2, 4, 6)              # قطري
+))
+# خطوط الفوز المارة بكل خانة: بعد أي حركة يكفي فحص 2-4 أقنعة فقط
+CELL_WIN_MASKS = tuple(tuple(mask for mask in WIN_MASKS if mask & (1 << i)) for i in range(9))
+
+def render_board(x_bits: int, o_bits: int) -> List[str]:
+    """تحويل البتات إلى رموز اللوحة (عند العرض فقط)"""
+    return [X_SYMBOL if x_bits >> i & 1 else O_SYMBOL if o_bits >> i & 1 else EMPTY_CELL for i in range(9)]
+
 class XOGame:
+    __slots__ = ("game_id", "player1", "player2", "x_bits", "o_bits", "current_player", "symbols", "status",
+                 "created_at", "winner", "move_history", "message_ids", "is_random", "rendered", "edits_saved")
+
     def __init__(self, game_id: int, player1: int, player2: Optional[int] = None, is_random: bool = False):
         self.game_id = game_id
         self.player1 = player1
         self.player2 = player2
-        self.board = ['⬜'] * 9
+        self.x_bits = 0  # خانات ❌ (اللاعب الأول)
+        self.o_bits = 0  # خانات ⭕ (اللاعب الثاني)
         self.current_player = player1
-        self.symbols = {player1: '❌'}
+        self.symbols = {player1: X_SYMBOL}
         self.status = 'waiting' if player2 is None else 'active'
         self.created_at = time.time()
         self.winner = None
         self.move_history = []
         self.message_ids = {}  # لتخزين معرفات الرسائل
         self.is_random = is_random
+        self.rendered = {}  # player_id -> (النص, لوحة المفاتيح) آخر ما عُرض في رسالته
+        self.edits_saved = 0
         
         if player2:
-            self.symbols[player2] = '⭕'
+            self.symbols[player2] = O_SYMBOL
+    
+    @property
+    def board(self) -> List[str]:
+        return render_board(self.x_bits, self.o_bits)
+    
+    def keyboard(self, player_id: int) -> InlineKeyboardMarkup:
+        """لوحة المفاتيح كما يراها اللاعب (من الكاش)"""
+        can_play = self.status == 'active' and self.current_player == player_id
+        return xo_keyboard(self.x_bits, self.o_bits, self.game_id, can_play)
+    
+    def needs_edit(self, player_id: int, text: str, markup: InlineKeyboardMarkup) -> bool:
+        """هل تختلف الرسالة عما يعرضه اللاعب حالياً؟ (يُسجل العرض الجديد إن اختلفت)"""
+        if self.rendered.get(player_id) == (text, markup):
+            self.edits_saved += 1
+            registry.inc("xo_edits_skipped")
+            return False
+        self.rendered[player_id] = (text, markup)
+        registry.inc("xo_edits_sent")
+        return True
     
     def join(self, player_id: int) -> bool:
         if self.status != 'waiting' or self.player2 is not None:
             return False
         
         self.player2 = player_id
-        self.symbols[player_id] = '⭕'
+        self.symbols[player_id] = O_SYMBOL
         self.status = 'active'
         return True
     
@@ -41,22 +88,28 @@ class XOGame:
         if position < 0 or position > 8:
             return False, "موقع غير صالح", None
         
-        if self.board[position] != '⬜':
+        cell = 1 << position
+        if (self.x_bits | self.o_bits) & cell:
             return False, "هذه الخانة محجوزة", None
         
         # تنفيذ الحركة
         symbol = self.symbols[player_id]
-        self.board[position] = symbol
+        if symbol == X_SYMBOL:
+            self.x_bits |= cell
+            bits = self.x_bits
+        else:
+            self.o_bits |= cell
+            bits = self.o_bits
         self.move_history.append((player_id, position, symbol))
         
-        # التحقق من الفوز
-        if self.check_win(symbol):
+        # التحقق من الفوز (الخطوط المارة بالخانة الجديدة فقط)
+        if any(bits & mask == mask for mask in CELL_WIN_MASKS[position]):
             self.status = 'finished'
             self.winner = player_id
             return True, "فوز", player_id
         
         # التحقق من التعادل
-        if '⬜' not in self.board:
+        if self.x_bits | self.o_bits == FULL_BOARD:
             self.status = 'finished'
             self.winner = None
             return True, "تعادل", None
@@ -66,26 +119,43 @@ class XOGame:
         return True, "استمرار", None
     
     def check_win(self, symbol: str) -> bool:
-        board = self.board
-        win_patterns = [
-            [0,1,2], [3,4,5], [6,7,8],  # صفوف
-            [0,3,6], [1,4,7], [2,5,8],  # أعمدة
-            [0,4,8], [2,4,6]            # قطري
-        ]
-        return any(all(board[i] == symbol for i in pattern) for pattern in win_patterns)
+        bits = self.x_bits if symbol == X_SYMBOL else self.o_bits
+        return any(bits & mask == mask for mask in WIN_MASKS)
     
     def get_board_display(self) -> str:
-        board = self.board
-        return f"""
-{board[0]}|{board[1]}|{board[2]}
------
-{board[3]}|{board[4]}|{board[5]}
------
-{board[6]}|{board[7]}|{board[8]}
-"""
+        return format_xo_board(self.board)
+    
+    def to_dict(self) -> Dict:
+        """حالة اللعبة للحفظ عبر إعادة التشغيل"""
+        return {
+            "game_id": self.game_id, "player1": self.player1, "player2": self.player2,
+            "x_bits": self.x_bits, "o_bits": self.o_bits, "current_player": self.current_player,
+            "status": self.status, "created_at": self.created_at, "winner": self.winner,
+            "move_history": list(self.move_history), "message_ids": dict(self.message_ids), "is_random": self.is_random,
+            # آخر ما عُرض لكل لاعب: بعد الاستعادة لا تُعاد تعديلات لم يتغير فيها شيء
+            "rendered": {player: [text, markup.to_dict()] for player, (text, markup) in self.rendered.items()},
+            "edits_saved": self.edits_saved
+        }
+    
+    @classmethod
+    def from_dict(cls, data: Dict) -> "XOGame":
+        game = cls(data["game_id"], data["player1"], data["player2"], data["is_random"])
+        game.x_bits = data["x_bits"]
+        game.o_bits = data["o_bits"]
+        game.current_player = data["current_player"]
+        game.status = data["status"]
+        game.created_at = data["created_at"]
+        game.winner = data["winner"]
+        game.move_history = list(data["move_history"])
+        game.message_ids = {int(player): message_id for player, message_id in data["message_ids"].items()}
+        game.rendered = {int(player): (text, InlineKeyboardMarkup.de_json(markup, None))
+                         for player, (text, markup) in data.get("rendered", {}).items()}
+        game.edits_saved = data.get("edits_saved", 0)
+        return game
     
     def restart(self):
-        self.board = ['⬜'] * 9
+        self.x_bits = 0
+        self.o_bits = 0
         self.current_player = self.player1
         self.status = 'active'
         self.winner = None
@@ -117,19 +187,41 @@ class GuessNumberGame:
         hint = "⬆️ أكبر من ذلك" if number < self.number else "⬇️ أصغر من ذلك"
         remaining = self.max_attempts - self.attempts
         return False, f"{hint}\nالمحاولات المتبقية: {remaining}", 0
+    
+    def to_dict(self) -> Dict:
+        return dict(self.__dict__)
+    
+    @classmethod
+    def from_dict(cls, data: Dict) -> "GuessNumberGame":
+        game = cls(data["game_id"], data["player_id"])
+        game.__dict__.update(data)
+        return game
+
+@dataclass
+class XOMatch:
+    """نتيجة البحث عن خصم XO"""
+    opponent_id: int
+    initiator: bool  # True للاعب الذي وصل ووجد منتظراً: هو من ينشئ اللعبة ويرسل اللوحتين
 
 class GameManager:
-    def __init__(self, db):
+    def __init__(self, db, timers=None, max_age: int = 3600):
         self.db = db
+        self.timers = timers  # TimerWheel: كل لعبة تنتهي في موعدها بدل cleanup_old_games الدوري
+        self.max_age = max_age
+        self.on_expire: Optional[Callable[[str, object], Any]] = None  # (نوع اللعبة, اللعبة) لإبلاغ اللاعبين
         self.xo_games: Dict[int, XOGame] = {}
         self.guess_games: Dict[int, GuessNumberGame] = {}
-        self.waiting_xo_players: Set[int] = set()  # لاعبين ينتظرون خصم XO
-        self.xo_search_tasks: Dict[int, asyncio.Task] = {}
+        self.waiting_xo_players: Set[int] = set()  # لاعبون أنشأوا لعبة XO تنتظر انضمام خصم
+        # الباحثون عن خصم عشوائي بالترتيب: كل منتظر متوقف على Future يحلّه الخصم القادم
+        self.xo_waiters: "OrderedDict[int, asyncio.Future]" = OrderedDict()
+        self.closed_xo_games = 0
+        self.xo_edits_saved = 0  # تعديلات رسائل لم تُرسل لأن اللوحة لم تتغير
     
     def create_xo_game(self, player1: int, player2: Optional[int] = None, is_random: bool = False) -> XOGame:
         game_id = int(time.time() * 1000) + random.randint(1, 999)
         game = XOGame(game_id, player1, player2, is_random)
         self.xo_games[game_id] = game
+        self._schedule_expiry("xo", game_id)
         
         if player2 is None:
             self.waiting_xo_players.add(player1)
@@ -142,56 +234,45 @@ class GameManager:
         
         game = self.xo_games[game_id]
         if game.join(player2):
-            if game_id in self.xo_games and game.player1 in self.waiting_xo_players:
+            if game.player1 in self.waiting_xo_players:
                 self.waiting_xo_players.remove(game.player1)
             return game
         
         return None
     
-    async def search_xo_opponent(self, player_id: int, context, max_wait: int = 60) -> Optional[int]:
-        """البحث عن خصم XO"""
-        # التحقق إذا كان هناك لاعب ينتظر
-        for waiting_player in list(self.waiting_xo_players):
-            if waiting_player != player_id:
-                # إزالة اللاعب من قائمة الانتظار
-                self.waiting_xo_players.remove(waiting_player)
-                return waiting_player
+    async def search_xo_opponent(self, player_id: int, context=None, max_wait: int = 60) -> Optional[XOMatch]:
+        """البحث عن خصم XO: مطابقة فورية مع أقدم منتظر، وإلا الانتظار حتى يصل خصم أو تنتهي المهلة"""
+        # بحث جديد من نفس اللاعب يلغي بحثه السابق
+        self.cancel_xo_search(player_id)
         
-        # إذا لم يوجد خصم، يضاف للانتظار
-        self.waiting_xo_players.add(player_id)
+        while self.xo_waiters:
+            waiting_player, waiter = self.xo_waiters.popitem(last=False)
+            if not waiter.done():
+                waiter.set_result(XOMatch(player_id, initiator=False))
+                return XOMatch(waiting_player, initiator=True)
         
-        # إنشاء مهمة بحث
-        task = asyncio.create_task(self._wait_for_opponent(player_id, max_wait))
-        self.xo_search_tasks[player_id] = task
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.xo_waiters[player_id] = future
+        # مؤقت واحد للمهلة بدل الاستيقاظ كل ثانية
+        timeout = loop.call_later(max_wait, self._expire_xo_waiter, player_id, future)
         
         try:
-            opponent = await task
-            return opponent
-        except asyncio.TimeoutError:
-            # إذا انتهى الوقت
-            if player_id in self.waiting_xo_players:
-                self.waiting_xo_players.remove(player_id)
-            return None
+            return await future
+        except asyncio.CancelledError:
+            if self.xo_waiters.get(player_id) is future:
+                # المهمة نفسها أُلغيت (وليس البحث): تنظيف ثم تمرير الإلغاء
+                del self.xo_waiters[player_id]
+                raise
+            return None  # أُلغي البحث عبر cancel_xo_search
         finally:
-            if player_id in self.xo_search_tasks:
-                del self.xo_search_tasks[player_id]
+            timeout.cancel()
     
-    async def _wait_for_opponent(self, player_id: int, max_wait: int) -> Optional[int]:
-        """الانتظار للعثور على خصم"""
-        start_time = time.time()
-        
-        while time.time() - start_time < max_wait:
-            # التحقق إذا كان هناك خصم متاح
-            for waiting_player in list(self.waiting_xo_players):
-                if waiting_player != player_id:
-                    self.waiting_xo_players.remove(waiting_player)
-                    if player_id in self.waiting_xo_players:
-                        self.waiting_xo_players.remove(player_id)
-                    return waiting_player
-            
-            await asyncio.sleep(1)
-        
-        raise asyncio.TimeoutError()
+    def _expire_xo_waiter(self, player_id: int, future: asyncio.Future):
+        if self.xo_waiters.get(player_id) is future:
+            del self.xo_waiters[player_id]
+        if not future.done():
+            future.set_result(None)
     
     def get_xo_game(self, game_id: int) -> Optional[XOGame]:
         return self.xo_games.get(game_id)
@@ -205,20 +286,33 @@ class GameManager:
             if game.player2 and game.player2 in self.waiting_xo_players:
                 self.waiting_xo_players.remove(game.player2)
             del self.xo_games[game_id]
+            self.closed_xo_games += 1
+            self.xo_edits_saved += game.edits_saved
+            self._cancel_expiry("xo", game_id)
     
+    def finish_xo_game(self, game_id: int, delay: float = 10):
+        """لعبة انتهت: تبقى delay ثانية (لإعادة اللعب من نفس اللوحة) ثم تُحذف من عجلة المؤقتات"""
+        if self.timers is None:
+            self.delete_xo_game(game_id)
+        elif game_id in self.xo_games:
+            self.timers.schedule(("xo", game_id), delay, self.delete_xo_game, game_id)
+
+    def restart_xo_game(self, game: XOGame):
+        """بدء جولة جديدة في نفس اللعبة (تلغي حذفها المؤجل بعد نهاية الجولة السابقة)"""
+        game.restart()
+        self._schedule_expiry("xo", game.game_id)
+
     def cancel_xo_search(self, player_id: int):
         """إلغاء بحث XO"""
-        if player_id in self.waiting_xo_players:
-            self.waiting_xo_players.remove(player_id)
-        
-        if player_id in self.xo_search_tasks:
-            self.xo_search_tasks[player_id].cancel()
-            del self.xo_search_tasks[player_id]
+        future = self.xo_waiters.pop(player_id, None)
+        if future is not None:
+            future.cancel()
     
     def create_guess_game(self, player_id: int) -> GuessNumberGame:
         game_id = int(time.time() * 1000) + random.randint(1, 999)
         game = GuessNumberGame(game_id, player_id)
         self.guess_games[game_id] = game
+        self._schedule_expiry("guess", game_id)
         return game
     
     def get_guess_game(self, game_id: int) -> Optional[GuessNumberGame]:
@@ -227,9 +321,54 @@ class GameManager:
     def delete_guess_game(self, game_id: int):
         if game_id in self.guess_games:
             del self.guess_games[game_id]
+            self._cancel_expiry("guess", game_id)
+    
+    # --- الحفظ عبر إعادة التشغيل ---
+    def snapshot(self) -> Dict:
+        return {
+            "xo": [game.to_dict() for game in self.xo_games.values()],
+            "guess": [game.to_dict() for game in self.guess_games.values()],
+            "waiting_xo": list(self.waiting_xo_players)
+        }
+    
+    def restore(self, data: Dict):
+        """إعادة الألعاب من لقطة مع مؤقتات انتهاء بالوقت المتبقي لكل لعبة"""
+        now = time.time()
+        for game_type, games, game_class in (("xo", self.xo_games, XOGame), ("guess", self.guess_games, GuessNumberGame)):
+            for record in data.get(game_type, []):
+                game = game_class.from_dict(record)
+                remaining = self.max_age - (now - game.created_at)
+                if remaining <= 0:
+                    continue
+                games[game.game_id] = game
+                self._schedule_expiry(game_type, game.game_id, remaining)
+        self.waiting_xo_players.update(data.get("waiting_xo", []))
+    
+    # --- انتهاء مدة الألعاب ---
+    def _schedule_expiry(self, game_type: str, game_id: int, delay: Optional[float] = None):
+        if self.timers is not None:
+            self.timers.schedule((game_type, game_id), self.max_age if delay is None else delay,
+                                 self._expire_game, game_type, game_id)
+    
+    def _cancel_expiry(self, game_type: str, game_id: int):
+        if self.timers is not None:
+            self.timers.cancel((game_type, game_id))
+    
+    def _expire_game(self, game_type: str, game_id: int):
+        games = self.xo_games if game_type == "xo" else self.guess_games
+        game = games.get(game_id)
+        if game is None:
+            return None
+        if game_type == "xo":
+            self.delete_xo_game(game_id)
+        else:
+            self.delete_guess_game(game_id)
+        if self.on_expire is not None:
+            return self.on_expire(game_type, game)
+        return None
     
     def cleanup_old_games(self, max_age: int = 3600):
-        """تنظيف الألعاب القديمة"""
+        """تنظيف الألعاب القديمة (مسح كامل؛ مع عجلة المؤقتات تنتهي الألعاب في موعدها دون الحاجة إليه)"""
         current_time = time.time()
         
         # تنظيف ألعاب XO القديمة
@@ -251,6 +390,16 @@ class GameManager:
             self.delete_guess_game(game_id)
         
         return len(xo_to_remove) + len(guess_to_remove)
+    
+    def get_stats(self) -> Dict[str, float]:
+        keyboard_cache = xo_keyboard.cache_info()
+        return {
+            "xo_games": len(self.xo_games),
+            "guess_games": len(self.guess_games),
+            "edits_saved_per_game": round(self.xo_edits_saved / self.closed_xo_games, 2) if self.closed_xo_games else 0.0,
+            "keyboard_cache_hits": keyboard_cache.hits,
+            "keyboard_cache_size": keyboard_cache.currsize
+        }
 
 # وظائف المساعدة
 def format_xo_board(board: List[str]) -> str:
@@ -272,8 +421,8 @@ def create_xo_keyboard(board: List[str], game_id: int, can_play: bool = True):
         row = []
         for j in range(3):
             idx = i + j
-            if board[idx] == '⬜' and can_play:
-                row.append(InlineKeyboardButton("⬜", callback_data=f"xo_move_{game_id}_{idx}"))
+            if board[idx] == EMPTY_CELL and can_play:
+                row.append(InlineKeyboardButton(EMPTY_CELL, callback_data=f"xo_move_{game_id}_{idx}"))
             else:
                 row.append(InlineKeyboardButton(board[idx], callback_data=f"xo_view_{game_id}"))
         buttons.append(row)
@@ -286,6 +435,11 @@ def create_xo_keyboard(board: List[str], game_id: int, can_play: bool = True):
     
     return InlineKeyboardMarkup(buttons)
 
+@lru_cache(maxsize=8192)
+def xo_keyboard(x_bits: int, o_bits: int, game_id: int, can_play: bool) -> InlineKeyboardMarkup:
+    """لوحة XO محفوظة حسب حالة اللوحة (كائنات PTB غير قابلة للتعديل فيمكن مشاركتها)"""
+    return create_xo_keyboard(render_board(x_bits, o_bits), game_id, can_play)
+
 def create_game_keyboard():
     """لوحة مفاتيح الألعاب"""
     keyboard = [
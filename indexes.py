@@ -0,0 +1,161 @@
+import bisect
+from collections import defaultdict
+from typing import Dict, Any, List, Optional
+from ranking import ScoreIndex
+
+INDEXED_COLLECTIONS = ("conversations", "messages", "reports")
+RANKED_FIELDS = ("points", "stars_balance")
+
+def pair_key(user_a: int, user_b: int) -> tuple:
+    """مفتاح ثابت لزوج المستخدمين بغض النظر عن الترتيب"""
+    return (user_a, user_b) if user_a <= user_b else (user_b, user_a)
+
+class DatabaseIndexes:
+    """فهارس في الذاكرة فوق قوائم المحادثات والرسائل والتقارير وترتيب المستخدمين
+
+    تُبنى بالكامل عند تحميل البيانات، ثم تُحدّث مع كل تعديل يمر عبر
+    GitHubDatabase._apply حتى تصبح عمليات البحث O(1) أو O(k) بدل مسح القائمة.
+    """
+
+    def __init__(self):
+        self.conversation_pos: Dict[int, int] = {}  # conv_id -> موقعها في القائمة
+        self.active_by_pair: Dict[tuple, int] = {}  # (user_a, user_b) -> conv_id
+        self.active_by_user: Dict[int, int] = {}  # user_id -> conv_id
+        self.messages_by_conv: Dict[int, List[Dict]] = defaultdict(list)
+        self.reports_by_target: Dict[int, List[Dict]] = defaultdict(list)
+        self.rankings: Dict[str, ScoreIndex] = {field: ScoreIndex() for field in RANKED_FIELDS}
+        self.user_ids: List[int] = []  # أرقام المستخدمين مرتبة (للتصفح بمؤشر)
+
+    # --- البناء الكامل ---
+    def rebuild(self, data: Dict[str, Any]):
+        for collection in INDEXED_COLLECTIONS:
+            self._rebuild_collection(collection, data.get(collection, []))
+        self._rebuild_rankings(data.get("users", {}))
+
+    def _rebuild_rankings(self, users: Dict[str, Dict]):
+        self.user_ids = sorted(int(user_key) for user_key in users)
+        self.rankings = {
+            field: ScoreIndex((user_key, user.get(field, 0)) for user_key, user in users.items())
+            for field in RANKED_FIELDS
+        }
+
+    def _rank_user(self, users: Dict[str, Dict], user_key: str):
+        user = users.get(user_key)
+        self._track_user_id(int(user_key), user is not None)
+        for field, ranking in self.rankings.items():
+            if user is None:
+                ranking.remove(user_key)
+            else:
+                ranking.update(user_key, user.get(field, 0))
+
+    def _track_user_id(self, user_id: int, exists: bool):
+        index = bisect.bisect_left(self.user_ids, user_id)
+        present = index < len(self.user_ids) and self.user_ids[index] == user_id
+        if exists and not present:
+            self.user_ids.insert(index, user_id)
+        elif present and not exists:
+            del self.user_ids[index]
+
+    def _rebuild_conversations(self, conversations: List[Dict]):
+        self.conversation_pos = {}
+        self.active_by_pair = {}
+        self.active_by_user = {}
+        for index, conv in enumerate(conversations):
+            self._index_conversation(index, conv)
+
+    def _rebuild_messages(self, messages: List[Dict]):
+        self.messages_by_conv = defaultdict(list)
+        for message in messages:
+            self.messages_by_conv[message["conv_id"]].append(message)
+
+    def _rebuild_reports(self, reports: List[Dict]):
+        self.reports_by_target = defaultdict(list)
+        for report in reports:
+            self.reports_by_target[report["target_id"]].append(report)
+
+    def _index_conversation(self, index: int, conv: Dict):
+        self.conversation_pos[conv["id"]] = index
+        if conv.get("active") == 1:
+            self._activate(conv)
+
+    def _activate(self, conv: Dict):
+        self.active_by_pair[pair_key(conv["user_a"], conv["user_b"])] = conv["id"]
+        self.active_by_user[conv["user_a"]] = conv["id"]
+        self.active_by_user[conv["user_b"]] = conv["id"]
+
+    def _deactivate(self, conv: Dict):
+        pair = pair_key(conv["user_a"], conv["user_b"])
+        if self.active_by_pair.get(pair) == conv["id"]:
+            del self.active_by_pair[pair]
+        for user_id in (conv["user_a"], conv["user_b"]):
+            if self.active_by_user.get(user_id) == conv["id"]:
+                del self.active_by_user[user_id]
+
+    # --- التحديث التدريجي ---
+    def on_apply(self, data: Dict[str, Any], op: str, key: List, value: Any = None):
+        """تحديث الفهارس بعد تطبيق تعديل واحد على البيانات"""
+        collection = key[0]
+        if op == "bulk_update":
+            for record_key in value["keys"]:
+                self._rank_user(data[collection], record_key)
+            return
+        if collection == "users":
+            if len(key) == 1:
+                self._rebuild_rankings(data["users"])
+            elif len(key) == 2 or key[2] in RANKED_FIELDS:
+                self._rank_user(data["users"], key[1])
+            return
+        if collection not in INDEXED_COLLECTIONS:
+            return
+
+        if len(key) == 1:
+            if op == "append":
+                self._index_record(collection, len(data[collection]) - 1, value)
+            else:
+                # استبدال المجموعة كاملة (مثل التحسين الدوري)
+                self._rebuild_collection(collection, data[collection])
+        elif len(key) == 2:
+            # حذف أو استبدال عنصر كامل يغيّر المواقع: إعادة البناء أبسط وأضمن
+            self._rebuild_collection(collection, data[collection])
+        elif collection == "conversations" and key[2] == "active" and op == "set":
+            conv = data["conversations"][key[1]]
+            if value == 1:
+                self._activate(conv)
+            else:
+                self._deactivate(conv)
+
+    def _rebuild_collection(self, collection: str, records: List[Dict]):
+        if collection == "conversations":
+            self._rebuild_conversations(records)
+        elif collection == "messages":
+            self._rebuild_messages(records)
+        else:
+            self._rebuild_reports(records)
+
+    def _index_record(self, collection: str, index: int, record: Dict):
+        """فهرسة سجل جديد أضيف إلى نهاية مجموعة"""
+        if collection == "conversations":
+            self._index_conversation(index, record)
+        elif collection == "messages":
+            self.messages_by_conv[record["conv_id"]].append(record)
+        else:
+            self.reports_by_target[record["target_id"]].append(record)
+
+    # --- الاستعلامات ---
+    def conversation_index(self, conv_id: int) -> Optional[int]:
+        return self.conversation_pos.get(conv_id)
+
+    def active_conversation_id(self, user_a: int, user_b: Optional[int] = None) -> Optional[int]:
+        if user_b is None:
+            return self.active_by_user.get(user_a)
+        return self.active_by_pair.get(pair_key(user_a, user_b))
+
+    def user_ids_after(self, after_id: int, limit: int) -> List[int]:
+        start = bisect.bisect_right(self.user_ids, after_id)
+        return self.user_ids[start:start + limit]
+
+    def messages_for(self, conv_id: int) -> List[Dict]:
+        return self.messages_by_conv.get(conv_id, [])
+
+    def reports_for(self, target_id: int) -> List[Dict]:
+        return self.reports_by_target.get(target_id, [])
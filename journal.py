@@ -0,0 +1,175 @@
+import os
+import json
+import glob
+import time
+import logging
+import threading
+from typing import Dict, Any, Iterator
+
+logger = logging.getLogger(__name__)
+
+class Journal:
+    """سجل محلي للإلحاق فقط يحفظ كل تعديل على القرص بين رفعات GitHub
+
+    كل تعديل يُكتب كسطر JSON مختصر (seq, op, key, delta/value, ts) في مقطع
+    من ملفات السجل، ويتم fsync على دفعات. عند رفع لقطة كاملة إلى GitHub يُغلق
+    المقطع الحالي ثم يُحذف بعد نجاح الرفع (الضغط داخل اللقطة).
+    """
+
+    def __init__(self, path: str, group_size: int = 32, group_interval: float = 0.01):
+        self.path = path
+        self.group_size = group_size  # fsync فوري عند بلوغ هذا العدد
+        self.group_interval = group_interval  # أقصى انتظار قبل fsync الدفعة
+        self.lock = threading.Lock()
+        self.seq = 0
+        self.segment = self._last_segment() + 1  # مقطع جديد لكل تشغيل
+        self._file = open(self._segment_path(self.segment), 'ab')
+        self._unsynced = 0
+        self._sync_event = threading.Event()
+        self._closed = False
+
+        self._syncer = threading.Thread(target=self._sync_worker, name="journal-syncer", daemon=True)
+        self._syncer.start()
+
+    def _segment_path(self, index: int) -> str:
+        return f"{self.path}.{index:06d}"
+
+    def _segments(self) -> Dict[int, str]:
+        """جميع مقاطع السجل الموجودة على القرص حسب الترتيب"""
+        segments = {}
+        for segment_path in glob.glob(f"{glob.escape(self.path)}.*"):
+            suffix = segment_path.rsplit('.', 1)[-1]
+            if suffix.isdigit():
+                segments[int(suffix)] = segment_path
+        return dict(sorted(segments.items()))
+
+    def _last_segment(self) -> int:
+        segments = self._segments()
+        return max(segments) if segments else 0
+
+    def append(self, op: str, key, value: Any = None) -> int:
+        """إلحاق تعديل واحد بالسجل وإرجاع رقمه التسلسلي"""
+        with self.lock:
+            self.seq += 1
+            record = {"seq": self.seq, "op": op, "key": key}
+            if op == "incr":
+                record["delta"] = value
+            elif value is not None:
+                record["value"] = value
+            record["ts"] = round(time.time(), 3)
+
+            line = json.dumps(record, ensure_ascii=False, separators=(',', ':')) + "\n"
+            self._file.write(line.encode('utf-8'))
+            self._unsynced += 1
+
+            if self._unsynced >= self.group_size:
+                self._sync_locked()
+            else:
+                self._sync_event.set()
+            return self.seq
+
+    def _sync_locked(self):
+        if self._unsynced == 0 or self._file.closed:
+            return
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+
+    def _sync_worker(self):
+        """fsync جماعي: ينتظر قليلاً لتجميع التعديلات ثم يكتبها على القرص مرة واحدة"""
+        while not self._closed:
+            self._sync_event.wait()
+            self._sync_event.clear()
+            time.sleep(self.group_interval)
+            try:
+                with self.lock:
+                    self._sync_locked()
+            except Exception as e:
+                logger.error(f"Error syncing journal: {e}")
+
+    def sync(self):
+        """كتابة جميع التعديلات المعلقة على القرص فوراً"""
+        with self.lock:
+            self._sync_locked()
+
+    def replay(self, after_seq: int = 0) -> Iterator[Dict[str, Any]]:
+        """قراءة التعديلات المسجلة بعد رقم تسلسلي معين بالترتيب"""
+        for index, segment_path in self._segments().items():
+            if index == self.segment:
+                continue
+            with open(segment_path, 'rb') as f:
+                for raw_line in f:
+                    try:
+                        record = json.loads(raw_line)
+                    except ValueError:
+                        # سطر غير مكتمل بسبب توقف مفاجئ أثناء الكتابة
+                        logger.warning(f"Skipping torn journal record in {segment_path}")
+                        break
+                    self.seq = max(self.seq, record["seq"])
+                    if record["seq"] > after_seq:
+                        yield record
+
+    def rotate(self) -> int:
+        """إغلاق المقطع الحالي وبدء مقطع جديد، وإرجاع رقم المقطع المغلق"""
+        with self.lock:
+            self._sync_locked()
+            self._file.close()
+            sealed = self.segment
+            self.segment += 1
+            self._file = open(self._segment_path(self.segment), 'ab')
+            return sealed
+
+    def discard(self, upto_segment: int):
+        """حذف المقاطع التي أصبحت محفوظة ضمن لقطة GitHub"""
+        for index, segment_path in self._segments().items():
+            if index <= upto_segment and index != self.segment:
+                try:
+                    os.remove(segment_path)
+                except OSError as e:
+                    logger.error(f"Error removing journal segment {segment_path}: {e}")
+
+    def close(self):
+        """كتابة ما تبقى وإغلاق الملف"""
+        with self.lock:
+            self._sync_locked()
+            self._closed = True
+            self._file.close()
+        self._sync_event.set()
+
+def apply_record(data: Dict[str, Any], op: str, key, value: Any = None):
+    """تطبيق تعديل واحد على هيكل البيانات حسب مساره"""
+    if op == "batch":
+        # عدة تعديلات في سطر واحد: تُطبق كلها أو لا شيء منها عند الاسترجاع
+        for sub_op, sub_key, sub_value in value:
+            apply_record(data, sub_op, sub_key, sub_value)
+        return
+
+    container = data
+    for part in key[:-1]:
+        container = container[part]
+    last = key[-1]
+
+    if op == "set":
+        container[last] = value
+    elif op == "incr":
+        container[last] = container.get(last, 0) + value
+    elif op == "append":
+        container[last].append(value)
+    elif op == "del":
+        if isinstance(container, list):
+            del container[last]
+        else:
+            container.pop(last, None)
+    elif op == "bulk_update":
+        # تعديل واحد على مجموعة سجلات: زيادة نفس الحقول للجميع ثم قيم خاصة بكل سجل
+        records = container[last]
+        for record_key in value["keys"]:
+            record = records.get(record_key)
+            if record is not None:
+                for field, delta in value.get("incr", {}).items():
+                    record[field] = record.get(field, 0) + delta
+        for record_key, fields in value.get("set", {}).items():
+            if record_key in records:
+                records[record_key].update(fields)
+    else:
+        raise ValueError(f"Unknown journal op: {op}")
@@ -0,0 +1,210 @@
+"""
+💞 محرك المطابقة
+
+الباحثون عن شريك محفوظون في طوابير حسب معايير البحث بدل مسح جميع
+المستخدمين في كل طلب. كل طابور OrderedDict مرتب حسب وقت الدخول، فالإضافة
+والإلغاء وأخذ أقدم باحث كلها O(1)، وعدد الطوابير التي تُفحص لكل بحث ثابت.
+إذا مُررت عجلة مؤقتات، ينتهي كل بحث في موعده عبر مؤقت خاص به بدل فحص
+الطوابير دورياً بـ expire().
+البطاقة تبقى في الطابور حتى يأخذها أحد، وقد يتغير صاحبها خلال ذلك (حُظر أو
+دخل محادثة)، لذلك يُسأل is_available عن الشريك قبل المطابقة وتُسقط البطاقة
+إن لم يعد متاحاً.
+"""
+
+import time
+import random
+import asyncio
+import inspect
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+ANY = "any"
+GENDERS = ("ذكر", "أنثى", "غير محدد")
+VIP_LANE = 0  # طابور VIP يُفحص أولاً (أولوية في البحث)
+NORMAL_LANE = 1
+
+@dataclass
+class SearchTicket:
+    """طلب بحث واحد في الطابور"""
+    user_id: int
+    gender: str  # جنس الباحث نفسه
+    want_gender: str = ANY  # الجنس المطلوب أو ANY
+    vip: bool = False
+    enqueued_at: float = field(default_factory=time.time)
+
+    @property
+    def queue_key(self) -> Tuple[int, str, str]:
+        return (VIP_LANE if self.vip else NORMAL_LANE, self.gender, self.want_gender)
+
+class MatchmakingEngine:
+    """طوابير المطابقة: المصدر الوحيد لمن يبحث عن شريك الآن
+
+    strategy:
+        "fifo"   - أقدم باحث متوافق أولاً (عدالة حسب وقت الانتظار)
+        "random" - اختيار عشوائي بين رؤوس الطوابير المتوافقة
+    """
+
+    def __init__(self, max_search_time: int = 300, strategy: str = "fifo", timers=None,
+                 on_expire: Optional[Callable[[int], Any]] = None,
+                 is_available: Optional[Callable[[int], bool]] = None):
+        self.max_search_time = max_search_time
+        self.strategy = strategy
+        self.timers = timers  # TimerWheel اختيارية
+        self.on_expire = on_expire  # يُستدعى برقم المستخدم عند انتهاء مهلة بحثه
+        self.is_available = is_available  # هل ما زال صاحب البطاقة يصلح شريكاً الآن؟
+        self.queues: Dict[Tuple[int, str, str], "OrderedDict[int, SearchTicket]"] = {}
+        self.tickets: Dict[int, SearchTicket] = {}
+        self.stats = {"matches": 0, "cancelled": 0, "expired": 0, "stale": 0, "total_wait": 0.0}
+        self._expired_pending: List[int] = []  # من انتهت مهلتهم ولم يُبلغوا بعد
+
+    def __len__(self) -> int:
+        return len(self.tickets)
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self.tickets
+
+    def is_searching(self, user_id: int) -> bool:
+        return user_id in self.tickets
+
+    # --- الطوابير ---
+    def _queue(self, key) -> "OrderedDict[int, SearchTicket]":
+        queue = self.queues.get(key)
+        if queue is None:
+            queue = self.queues[key] = OrderedDict()
+        return queue
+
+    def _enqueue(self, ticket: SearchTicket, timeout: Optional[float] = None):
+        self.tickets[ticket.user_id] = ticket
+        self._queue(ticket.queue_key)[ticket.user_id] = ticket
+        if self.timers is not None:
+            self.timers.schedule(("search", ticket.user_id), self.max_search_time if timeout is None else timeout,
+                                 self._on_timer, ticket)
+
+    def _remove(self, ticket: SearchTicket):
+        self.tickets.pop(ticket.user_id, None)
+        queue = self.queues.get(ticket.queue_key)
+        if queue is not None:
+            queue.pop(ticket.user_id, None)
+        if self.timers is not None:
+            self.timers.cancel(("search", ticket.user_id))
+
+    def _expire_ticket(self, ticket: SearchTicket):
+        self._remove(ticket)
+        self.stats["expired"] += 1
+        if self.on_expire is not None:
+            return self.on_expire(ticket.user_id)
+        self._expired_pending.append(ticket.user_id)
+
+    def _on_timer(self, ticket: SearchTicket):
+        if self.tickets.get(ticket.user_id) is ticket:
+            return self._expire_ticket(ticket)
+
+    def _candidate_keys(self, ticket: SearchTicket) -> List[Tuple[int, str, str]]:
+        """الطوابير التي يمكن أن يكون فيها شريك متوافق مع الباحث"""
+        genders = GENDERS if ticket.want_gender == ANY else (ticket.want_gender,)
+        keys = []
+        for lane in (VIP_LANE, NORMAL_LANE):
+            for gender in genders:
+                # الطرف الآخر يقبل أي جنس أو يطلب جنس الباحث تحديداً
+                keys.append((lane, gender, ANY))
+                keys.append((lane, gender, ticket.gender))
+        return keys
+
+    def _head(self, key, now: float) -> Optional[SearchTicket]:
+        """أقدم باحث في الطابور بعد إسقاط من تجاوز مهلة البحث"""
+        queue = self.queues.get(key)
+        while queue:
+            ticket = next(iter(queue.values()))
+            if now - ticket.enqueued_at < self.max_search_time:
+                return ticket
+            result = self._expire_ticket(ticket)
+            if inspect.isawaitable(result):
+                asyncio.ensure_future(result)
+        return None
+
+    # --- الواجهة ---
+    def search(self, user_id: int, gender: Optional[str] = None, want_gender: Optional[str] = None,
+               vip: bool = False) -> Optional[int]:
+        """البحث عن شريك: يُرجع رقم الشريك فوراً إن وُجد، وإلا يدخل المستخدم الطابور"""
+        if user_id in self.tickets:
+            self._remove(self.tickets[user_id])
+
+        ticket = SearchTicket(user_id, gender or "غير محدد", want_gender or ANY, vip)
+        now = ticket.enqueued_at
+
+        while True:
+            heads = []
+            for key in self._candidate_keys(ticket):
+                head = self._head(key, now)
+                if head is not None:
+                    heads.append(head)
+            if not heads:
+                break
+
+            # VIP أولاً ثم حسب الاستراتيجية
+            vip_heads = [head for head in heads if head.vip] or heads
+            if self.strategy == "random":
+                partner = random.choice(vip_heads)
+            else:
+                partner = min(vip_heads, key=lambda head: head.enqueued_at)
+            self._remove(partner)
+            # بطاقة قديمة: صاحبها حُظر أو دخل محادثة بعد أن بدأ البحث
+            if self.is_available is not None and not self.is_available(partner.user_id):
+                self.stats["stale"] += 1
+                logger.info(f"Dropped stale search ticket of {partner.user_id}")
+                continue
+            self.stats["matches"] += 1
+            self.stats["total_wait"] += now - partner.enqueued_at
+            return partner.user_id
+
+        self._enqueue(ticket)
+        return None
+
+    def cancel(self, user_id: int) -> bool:
+        """إلغاء بحث المستخدم (O(1))"""
+        ticket = self.tickets.get(user_id)
+        if ticket is None:
+            return False
+        self._remove(ticket)
+        self.stats["cancelled"] += 1
+        return True
+
+    def expire(self, now: Optional[float] = None) -> List[int]:
+        """إزالة من تجاوز MAX_SEARCH_TIME وإرجاع أرقامهم لإبلاغهم"""
+        now = now or time.time()
+        for key in list(self.queues):
+            self._head(key, now)
+        expired, self._expired_pending = self._expired_pending, []
+        if expired:
+            logger.info(f"Expired {len(expired)} searches after {self.max_search_time}s")
+        return expired
+
+    # --- الحفظ عبر إعادة التشغيل ---
+    def snapshot(self) -> List[List]:
+        """الباحثون بترتيب دخولهم الطوابير"""
+        tickets = sorted(self.tickets.values(), key=lambda ticket: ticket.enqueued_at)
+        return [[t.user_id, t.gender, t.want_gender, t.vip, t.enqueued_at] for t in tickets]
+
+    def restore(self, rows: List[List]):
+        """إعادة الباحثين مع الاحتفاظ بوقت دخولهم (ومهلة البحث المتبقية لكل منهم)"""
+        now = time.time()
+        for user_id, gender, want_gender, vip, enqueued_at in rows:
+            # من انتهت مهلته أثناء التوقف يُنهى بحثه (ويُبلغ) مع أول نبضة
+            remaining = max(0.0, self.max_search_time - (now - enqueued_at))
+            self._enqueue(SearchTicket(user_id, gender, want_gender, vip, enqueued_at), remaining)
+
+    def get_stats(self) -> Dict[str, float]:
+        matches = self.stats["matches"]
+        return {
+            "searching": len(self.tickets),
+            "vip_searching": sum(len(q) for key, q in self.queues.items() if key[0] == VIP_LANE),
+            "matches": matches,
+            "cancelled": self.stats["cancelled"],
+            "expired": self.stats["expired"],
+            "stale": self.stats["stale"],
+            "avg_wait": round(self.stats["total_wait"] / matches, 1) if matches else 0.0
+        }
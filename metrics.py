@@ -0,0 +1,148 @@
+"""
+📈 مقاييس أداء البوت
+
+عدادات ومدرجات تكرارية (histograms) بسيطة في الذاكرة، ومراقب لتوقف حلقة
+الأحداث يقيس التأخير بين موعد الاستيقاظ المتوقع والفعلي.
+"""
+
+import time
+import bisect
+import asyncio
+import logging
+import threading
+from typing import Dict, Any, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Histogram:
+    """مدرج تكراري بحدود ثابتة (بالثواني)"""
+
+    def __init__(self, name: str, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # الخانة الأخيرة لما يتجاوز آخر حد
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value: float):
+        with self.lock:
+            self.counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.count += 1
+            self.total += value
+            if value > self.max:
+                self.max = value
+
+    def quantile(self, q: float) -> float:
+        """تقدير النسبة المئوية من حدود الخانات"""
+        with self.lock:
+            if not self.count:
+                return 0.0
+            target = q * self.count
+            seen = 0
+            for index, bucket_count in enumerate(self.counts):
+                seen += bucket_count
+                if seen >= target:
+                    return self.buckets[index] if index < len(self.buckets) else self.max
+            return self.max
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self.lock:
+            snapshot = {
+                "count": self.count,
+                "sum": round(self.total, 6),
+                "max": round(self.max, 6),
+                "buckets": dict(zip([*map(str, self.buckets), "+Inf"], self.counts))
+            }
+        snapshot["p50"] = self.quantile(0.5)
+        snapshot["p99"] = self.quantile(0.99)
+        return snapshot
+
+    def render(self) -> str:
+        snapshot = self.snapshot()
+        avg = snapshot["sum"] / snapshot["count"] if snapshot["count"] else 0.0
+        return (f"{self.name}: n={snapshot['count']} avg={avg * 1000:.1f}ms "
+                f"p50≤{snapshot['p50'] * 1000:.0f}ms p99≤{snapshot['p99'] * 1000:.0f}ms "
+                f"max={snapshot['max'] * 1000:.1f}ms")
+
+class MetricsRegistry:
+    """سجل مركزي للعدادات والمدرجات"""
+
+    def __init__(self):
+        self.counters: Dict[str, int] = {}
+        self.histograms: Dict[str, Histogram] = {}
+        self.lock = threading.Lock()
+
+    def histogram(self, name: str, buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        with self.lock:
+            if name not in self.histograms:
+                self.histograms[name] = Histogram(name, buckets)
+            return self.histograms[name]
+
+    def inc(self, name: str, amount: int = 1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self.lock:
+            counters = dict(self.counters)
+            histograms = list(self.histograms.values())
+        return {
+            "counters": counters,
+            "histograms": {h.name: h.snapshot() for h in histograms}
+        }
+
+    def render(self) -> str:
+        """نص مختصر للعرض في رسالة تليجرام"""
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(self.histograms.values(), key=lambda h: h.name)
+        lines = [h.render() for h in histograms]
+        lines += [f"{name}: {value}" for name, value in counters]
+        return "\n".join(lines) or "لا توجد مقاييس بعد"
+
+registry = MetricsRegistry()
+
+class LoopStallMonitor:
+    """قياس توقف حلقة الأحداث: ينام لفترة ثابتة ويسجل التأخير الزائد عند الاستيقاظ"""
+
+    def __init__(self, interval: float = 0.05, histogram: Optional[Histogram] = None):
+        self.interval = interval
+        self.histogram = histogram or registry.histogram("event_loop_stall_seconds")
+        self._task = None
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            stall = loop.time() - started - self.interval
+            self.histogram.observe(max(stall, 0.0))
+            if stall > 1.0:
+                logger.warning(f"Event loop stalled for {stall:.2f}s")
+
+    def start(self):
+        """تشغيل المراقب كمهمة في الحلقة الحالية"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self.run())
+        return self._task
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+def timed(histogram: Histogram):
+    """قياس زمن كتلة كود: with timed(h): ..."""
+    class _Timer:
+        def __enter__(self):
+            self.started = time.perf_counter()
+            return self
+
+        def __exit__(self, *exc):
+            histogram.observe(time.perf_counter() - self.started)
+            return False
+    return _Timer()
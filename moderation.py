@@ -0,0 +1,166 @@
+"""
+🛡️ الإشراف على المحادثات في الخلفية
+
+فحص الرسالة (ContentFilter) سريع ويتم في مسار الإرسال، أما العواقب فكانت
+تؤخر وصول الرسالة للشريك: خصم النقاط من قاعدة البيانات، تنبيه المرسل،
+وإشعار قناة المراقبة. ModerationPipeline يأخذ المخالفة في طابور ويعالجها
+عامل في الخلفية، فتُرسل الرسالة فوراً:
+
+- خصم النقاط وتنبيه المرسل.
+- إشعار قناة المراقبة يدخل في ملخص MonitorDigest الدوري.
+- من يكرر المخالفة ban_strikes مرات خلال strike_window يُحظر تلقائياً
+  (db.ban_user) ويُستدعى on_ban لإنهاء محادثته.
+"""
+
+import time
+import asyncio
+import logging
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+from metrics import registry
+from send_scheduler import PRIORITY_MONITOR
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class Violation:
+    """رسالة مخالفة بانتظار المعالجة"""
+    user_id: int
+    partner_id: Optional[int]
+    terms: List[str]
+    text: str
+    message_id: Optional[int] = None
+    queued_at: float = field(default_factory=time.monotonic)
+
+class ModerationPipeline:
+    """طابور المخالفات وعامل الخلفية الذي يطبق العقوبات"""
+
+    def __init__(self, db, content_filter, monitor=None, penalty_per_term: int = 5, ban_strikes: int = 3,
+                 strike_window: float = 3600, ban_duration: int = 86400, queue_size: int = 10000):
+        self.db = db
+        self.content_filter = content_filter
+        self.monitor = monitor  # MonitorDigest
+        self.penalty_per_term = penalty_per_term
+        self.ban_strikes = ban_strikes
+        self.strike_window = strike_window
+        self.ban_duration = ban_duration
+        self.queue_size = queue_size
+        self.on_ban: Optional[Callable[[int, int], Awaitable[Any]]] = None  # (المستخدم, نهاية الحظر)
+        self.bot = None
+        self.queue: Optional[asyncio.Queue] = None
+        self.strikes: Dict[int, Deque[float]] = {}  # أوقات المخالفات الأخيرة لكل مستخدم
+        self._tasks: List[asyncio.Task] = []
+        self.latency = registry.histogram("moderation_seconds")  # من دخول الطابور حتى انتهاء العقوبة
+        self.stats = {"violations": 0, "processed": 0, "dropped": 0, "penalized": 0, "bans": 0}
+
+    # --- مسار الإرسال ---
+    def check(self, user_id: int, partner_id: Optional[int], text: str, message_id: Optional[int] = None) -> List[str]:
+        """الحكم السريع على الرسالة: الكلمات المحظورة فيها، والعقوبة تُطبق لاحقاً في الخلفية"""
+        terms = self.content_filter.find(text)
+        if terms:
+            self.submit(Violation(user_id, partner_id, terms, text, message_id))
+        return terms
+
+    def submit(self, violation: Violation):
+        self.stats["violations"] += 1
+        if self.queue is None:
+            logger.warning(f"Moderation pipeline not started, dropping violation by {violation.user_id}")
+            self.stats["dropped"] += 1
+            return
+        try:
+            self.queue.put_nowait(violation)
+        except asyncio.QueueFull:
+            self.stats["dropped"] += 1
+            registry.inc("moderation_dropped")
+
+    # --- العامل ---
+    async def _worker(self):
+        while True:
+            violation = await self.queue.get()
+            try:
+                await self._handle(violation)
+            except Exception as e:
+                logger.error(f"Moderation of {violation.user_id} failed: {e}")
+            finally:
+                self.stats["processed"] += 1
+                self.latency.observe(time.monotonic() - violation.queued_at)
+                self.queue.task_done()
+
+    async def _handle(self, violation: Violation):
+        uid = violation.user_id
+        penalty = self.penalty_per_term * len(violation.terms)
+        if await self.db.consume_points(uid, penalty):
+            self.stats["penalized"] += 1
+            warning = f"⚠️ **تم خصم {penalty} نقاط لاستخدام كلمات محظورة.**"
+        else:
+            warning = "⚠️ **استخدام كلمات محظورة مخالف للقواعد.** تكرار ذلك يؤدي إلى الحظر."
+        await self._send(uid, warning, reply_to_message_id=violation.message_id)
+        self._notify("filtered", f"{uid}: {violation.text}")
+
+        if self._add_strike(uid):
+            until_ts = int(time.time()) + self.ban_duration
+            await self.db.ban_user(uid, until_ts)
+            self.stats["bans"] += 1
+            registry.inc("moderation_bans")
+            self._notify("ban", f"{uid} بعد {self.ban_strikes} مخالفات")
+            if self.on_ban is not None:
+                await self.on_ban(uid, until_ts)
+
+    def _add_strike(self, user_id: int) -> bool:
+        """تسجيل مخالفة وإرجاع True إذا بلغ المستخدم حد الحظر"""
+        now = time.monotonic()
+        strikes = self.strikes.get(user_id)
+        if strikes is None:
+            strikes = self.strikes[user_id] = deque()
+        strikes.append(now)
+        while strikes and now - strikes[0] > self.strike_window:
+            strikes.popleft()
+        if len(strikes) >= self.ban_strikes:
+            del self.strikes[user_id]
+            return True
+        if len(self.strikes) > 10000:
+            self._prune_strikes(now)
+        return False
+
+    def _prune_strikes(self, now: float):
+        self.strikes = {uid: strikes for uid, strikes in self.strikes.items()
+                        if strikes and now - strikes[-1] <= self.strike_window}
+
+    async def _send(self, chat_id, text: str, **kwargs):
+        try:
+            await self.bot.send_message(chat_id=chat_id, text=text, rate_limit_args=PRIORITY_MONITOR, **kwargs)
+        except Exception as e:
+            logger.debug(f"Moderation message to {chat_id} failed: {e}")
+
+    def _notify(self, kind: str, text: str):
+        if self.monitor is not None:
+            self.monitor.add(kind, text)
+
+    # --- التشغيل ---
+    def start(self, bot, workers: int = 1):
+        self.bot = bot
+        if self.queue is None:
+            self.queue = asyncio.Queue(self.queue_size)
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._worker()) for _ in range(workers)]
+
+    async def stop(self, drain_timeout: float = 5.0):
+        """إكمال المخالفات المعلقة ثم الإيقاف"""
+        if self.queue is not None and self._tasks:
+            try:
+                await asyncio.wait_for(self.queue.join(), drain_timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Stopping moderation with {self.queue.qsize()} violations pending")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def get_stats(self) -> Dict[str, Any]:
+        return dict(
+            self.stats,
+            queued=self.queue.qsize() if self.queue is not None else 0,
+            latency_p95=round(self.latency.quantile(0.95), 3)
+        )
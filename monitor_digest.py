@@ -0,0 +1,143 @@
+"""
+📋 ملخصات قناة المراقبة
+
+كل محادثة جديدة ومنتهية وكل رسالة مخالفة كانت رسالة مستقلة لقناة المراقبة،
+أي أن القناة تستهلك من الحد العام للإرسال أكثر ما يكون عندما تشتد الحركة.
+MonitorDigest يجمع الأحداث ويرسلها كملخص واحد كل interval ثانية (أو فور
+بلوغ max_events حدثاً): عدد الأحداث من كل نوع مع عينة محدودة منها.
+
+الأحداث الحرجة (الأخطاء والمدفوعات) لا تنتظر الملخص: تُرسل فوراً وبأولوية
+أعلى من بقية رسائل المراقبة.
+"""
+
+import time
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Set
+
+from metrics import registry
+from send_scheduler import PRIORITY_GAME, PRIORITY_MONITOR
+
+logger = logging.getLogger(__name__)
+
+MAX_MESSAGE_LENGTH = 4000  # أقل من حد Telegram (4096)
+MAX_SAMPLE_LENGTH = 200  # طول أقصى لكل سطر في العينة
+
+# عناوين أنواع الأحداث في الملخص (الأنواع غير المعروفة تظهر باسمها)
+EVENT_TITLES = {
+    "chat_start": "🟢 محادثات جديدة",
+    "chat_end": "🔴 محادثات منتهية",
+    "filtered": "🚫 كلمات محظورة",
+    "ban": "⛔ حظر تلقائي",
+}
+
+class MonitorDigest:
+    """تجميع أحداث قناة المراقبة وإرسالها كملخصات دورية"""
+
+    def __init__(self, chat_id=None, interval: float = 5, max_events: int = 200, sample_size: int = 5):
+        self.chat_id = chat_id
+        self.interval = interval
+        self.max_events = max_events
+        self.sample_size = sample_size
+        self.bot = None
+        self.counts: Dict[str, int] = {}
+        self.samples: Dict[str, List[str]] = {}
+        self.pending = 0  # أحداث بانتظار الملخص التالي
+        self.window_start = time.monotonic()
+        self._full: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._sending: Set[asyncio.Task] = set()  # إرسال الأحداث الحرجة الجاري
+        self.stats = {"events": 0, "digests": 0, "critical": 0, "failed": 0}
+
+    # --- الأحداث ---
+    def add(self, kind: str, text: str, critical: bool = False):
+        """تسجيل حدث؛ الحدث الحرج يُرسل فوراً دون انتظار الملخص"""
+        self.stats["events"] += 1
+        if critical:
+            self.stats["critical"] += 1
+            if self.bot is not None:
+                task = asyncio.get_running_loop().create_task(self._send(text, PRIORITY_GAME))
+                self._sending.add(task)
+                task.add_done_callback(self._sending.discard)
+                return
+        self.counts[kind] = self.counts.get(kind, 0) + 1
+        samples = self.samples.setdefault(kind, [])
+        if len(samples) < self.sample_size:
+            samples.append(text[:MAX_SAMPLE_LENGTH])
+        self.pending += 1
+        if self.pending >= self.max_events and self._full is not None:
+            self._full.set()
+
+    def render(self) -> List[str]:
+        """نص الملخص الحالي مقسماً على رسائل لا تتجاوز حد Telegram"""
+        elapsed = int(time.monotonic() - self.window_start)
+        lines = [f"📋 ملخص المراقبة (آخر {elapsed} ثانية):"]
+        for kind, count in self.counts.items():
+            lines.append(f"\n{EVENT_TITLES.get(kind, kind)}: {count}")
+            samples = self.samples.get(kind, [])
+            lines.extend(f"• {sample}" for sample in samples)
+            if count > len(samples):
+                lines.append(f"… و{count - len(samples)} أخرى")
+        messages, chunk = [], ""
+        for line in lines:
+            if chunk and len(chunk) + len(line) + 1 > MAX_MESSAGE_LENGTH:
+                messages.append(chunk)
+                chunk = ""
+            chunk = f"{chunk}\n{line}" if chunk else line
+        messages.append(chunk)
+        return messages
+
+    async def flush(self):
+        """إرسال الملخص المتراكم وبدء نافذة جديدة"""
+        if not self.pending:
+            return
+        messages = self.render()
+        self.counts, self.samples, self.pending = {}, {}, 0
+        self.window_start = time.monotonic()
+        if self._full is not None:
+            self._full.clear()
+        self.stats["digests"] += 1
+        for text in messages:
+            await self._send(text, PRIORITY_MONITOR)
+
+    async def _send(self, text: str, priority: int):
+        if not self.chat_id or self.bot is None:
+            return
+        try:
+            await self.bot.send_message(chat_id=self.chat_id, text=text, rate_limit_args=priority)
+            registry.inc("monitor_messages")
+        except Exception as e:
+            self.stats["failed"] += 1
+            logger.debug(f"Monitor send failed: {e}")
+
+    # --- التشغيل ---
+    async def run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._full.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Monitor digest flush failed: {e}")
+
+    def start(self, bot):
+        self.bot = bot
+        if self._task is None or self._task.done():
+            self._full = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self.run())
+        return self._task
+
+    async def stop(self):
+        """إيقاف الدورة وإرسال آخر ملخص"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._sending:
+            await asyncio.gather(*self._sending, return_exceptions=True)
+        await self.flush()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return dict(self.stats, pending=self.pending)
@@ -0,0 +1,125 @@
+"""
+🏆 فهرس الترتيب للنقاط والنجوم
+
+شجرة Fenwick فوق دلاء الدرجات تعطي عدد المستخدمين فوق أي درجة في
+O(log B)، وقائمة مرتبة للدرجات المختلفة داخل كل دلو تجعل الترتيب دقيقاً.
+الدرجات الصغيرة (أقل من EXACT_LIMIT) لكل منها دلو مستقل، وما فوقها يُقسم
+كل ضعف إلى SUB_BUCKETS دلواً، فيبقى عدد الدلاء ثابتاً مهما كبرت الدرجات.
+"""
+
+import bisect
+from typing import Dict, List, Optional, Iterable, Tuple
+
+EXACT_LIMIT = 1024
+SUB_BUCKETS = 64
+MAX_BITS = 64
+BUCKETS = EXACT_LIMIT + (MAX_BITS - EXACT_LIMIT.bit_length() + 1) * SUB_BUCKETS
+
+def score_bucket(score: int) -> int:
+    """رقم الدلو لدرجة معينة (الدرجات السالبة في الدلو الأول)"""
+    if score < EXACT_LIMIT:
+        return max(score, 0)
+    bits = min(score.bit_length(), MAX_BITS)
+    octave_start = 1 << (bits - 1)
+    sub = min(((score - octave_start) * SUB_BUCKETS) >> (bits - 1), SUB_BUCKETS - 1)
+    return EXACT_LIMIT + (bits - EXACT_LIMIT.bit_length()) * SUB_BUCKETS + sub
+
+class ScoreIndex:
+    """ترتيب المستخدمين حسب درجة واحدة (النقاط أو النجوم)"""
+
+    def __init__(self, items: Iterable[Tuple[str, int]] = ()):
+        self.tree = [0] * (BUCKETS + 1)  # شجرة Fenwick: عدد المستخدمين في كل دلو
+        self.scores: Dict[str, int] = {}  # user_key -> الدرجة
+        self.members: Dict[int, Dict[str, None]] = {}  # الدرجة -> المستخدمون بها
+        self.distinct: Dict[int, List[int]] = {}  # الدلو -> الدرجات المختلفة فيه مرتبة
+        self.buckets: List[int] = []  # الدلاء غير الفارغة مرتبة
+        for user_key, score in items:
+            self.update(user_key, score)
+
+    def __len__(self) -> int:
+        return len(self.scores)
+
+    # --- شجرة Fenwick ---
+    def _tree_add(self, bucket: int, delta: int):
+        index = bucket + 1
+        while index <= BUCKETS:
+            self.tree[index] += delta
+            index += index & -index
+
+    def _tree_prefix(self, bucket: int) -> int:
+        """عدد المستخدمين في الدلاء 0..bucket"""
+        total = 0
+        index = bucket + 1
+        while index > 0:
+            total += self.tree[index]
+            index -= index & -index
+        return total
+
+    # --- التحديث ---
+    def update(self, user_key: str, score: int):
+        score = int(score or 0)
+        old = self.scores.get(user_key)
+        if old == score:
+            return
+        if old is not None:
+            self._discard(user_key, old)
+
+        self.scores[user_key] = score
+        members = self.members.get(score)
+        if members is None:
+            members = self.members[score] = {}
+            bucket = score_bucket(score)
+            if bucket not in self.distinct:
+                self.distinct[bucket] = []
+                bisect.insort(self.buckets, bucket)
+            bisect.insort(self.distinct[bucket], score)
+        members[user_key] = None
+        self._tree_add(score_bucket(score), 1)
+
+    def remove(self, user_key: str):
+        old = self.scores.pop(user_key, None)
+        if old is not None:
+            self._discard(user_key, old)
+
+    def _discard(self, user_key: str, score: int):
+        members = self.members[score]
+        del members[user_key]
+        bucket = score_bucket(score)
+        if not members:
+            del self.members[score]
+            scores = self.distinct[bucket]
+            del scores[bisect.bisect_left(scores, score)]
+            if not scores:
+                del self.distinct[bucket]
+                del self.buckets[bisect.bisect_left(self.buckets, bucket)]
+        self._tree_add(bucket, -1)
+
+    # --- الاستعلامات ---
+    def count_above(self, score: int) -> int:
+        """عدد المستخدمين بدرجة أعلى تماماً"""
+        bucket = score_bucket(score)
+        above = len(self.scores) - self._tree_prefix(bucket)
+        scores = self.distinct.get(bucket, [])
+        for higher in scores[bisect.bisect_right(scores, score):]:
+            above += len(self.members[higher])
+        return above
+
+    def rank(self, user_key: str) -> Optional[int]:
+        """ترتيب المستخدم (المتساوون في الدرجة يتشاركون الترتيب)"""
+        score = self.scores.get(user_key)
+        if score is None:
+            return None
+        return self.count_above(score) + 1
+
+    def top(self, limit: int) -> List[str]:
+        """أعلى limit مستخدمين حسب الدرجة"""
+        result = []
+        if limit <= 0:
+            return result
+        for bucket in reversed(self.buckets):
+            for score in reversed(self.distinct[bucket]):
+                for user_key in self.members[score]:
+                    result.append(user_key)
+                    if len(result) >= limit:
+                        return result
+        return result
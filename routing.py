@@ -0,0 +1,61 @@
+"""
+🧭 توجيه الرسائل النصية
+
+بدل سلسلة طويلة من if/elif تقارن النص بكل زر وحالة المستخدم بكل حالة
+انتظار (عشرات المقارنات لكل رسالة، حتى رسائل المحادثة العادية)، يحمل
+Router جدولين:
+- الأزرار: نص الزر -> المعالج، بحث واحد في dict.
+- الحالات: قيمة USER_STATES -> المعالج، مع حالات بالبادئة (playing_guess_123)
+  تُجرب بعد البحث المباشر.
+
+معالج الحالة يأخذ (update, context, text)؛ إرجاع False يعني "لم تُعالج"
+فتكمل الرسالة إلى الأزرار، وأي قيمة أخرى تنهي التوجيه.
+"""
+
+import logging
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+ButtonHandler = Callable[[Any, Any], Awaitable[Any]]
+StateHandler = Callable[[Any, Any, str], Awaitable[Any]]
+
+class Router:
+    """جداول توجيه الأزرار وحالات المستخدم"""
+
+    def __init__(self):
+        self.buttons: Dict[str, ButtonHandler] = {}
+        self.states: Dict[str, StateHandler] = {}
+        self.state_prefixes: List[Tuple[str, StateHandler]] = []
+
+    def __len__(self) -> int:
+        return len(self.buttons) + len(self.states) + len(self.state_prefixes)
+
+    # --- التسجيل ---
+    def add_button(self, texts: Iterable[str], handler: ButtonHandler):
+        for text in ([texts] if isinstance(texts, str) else texts):
+            if text in self.buttons:
+                logger.warning(f"Button {text!r} is already routed, keeping the first handler")
+                continue
+            self.buttons[text] = handler
+
+    def add_state(self, state: str, handler: StateHandler):
+        self.states[state] = handler
+
+    def add_state_prefix(self, prefix: str, handler: StateHandler):
+        self.state_prefixes.append((prefix, handler))
+
+    # --- البحث ---
+    def button(self, text: str) -> Optional[ButtonHandler]:
+        return self.buttons.get(text)
+
+    def state(self, state: str) -> Optional[StateHandler]:
+        handler = self.states.get(state)
+        if handler is None:
+            for prefix, prefix_handler in self.state_prefixes:
+                if state.startswith(prefix):
+                    return prefix_handler
+        return handler
+
+    def get_stats(self) -> Dict[str, int]:
+        return {"buttons": len(self.buttons), "states": len(self.states), "state_prefixes": len(self.state_prefixes)}
@@ -5,7 +5,8 @@
 
 import asyncio
 import logging
-from bot_main import build_app
+from bot_main import build_app, config, BOT_MODE
+from webhook_front import serve_webhook
 
 # إعداد التسجيل
 logging.basicConfig(
@@ -28,7 +29,7 @@ async def main():
         print("\n🚀 **جاري بدء التشغيل...**")
         
         # بناء التطبيق
-        app = build_app()
+        app = build_app(updater=(BOT_MODE != 'webhook'))
         
         print("✅ **تم تهيئة النظام بنجاح!**")
         print("\n📱 **الأوامر المتاحة:**")
@@ -52,6 +53,9 @@ async def main():
         print("\n🤖 **البوت يعمل الآن!**")
         
         # تشغيل البوت
+        if BOT_MODE == 'webhook':
+            await serve_webhook(app, config)
+            return
         await app.initialize()
         await app.start()
         await app.updater.start_polling()
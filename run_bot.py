@@ -1,7 +1,8 @@
 import asyncio
 import logging
 import sys
-from bot_main import build_app
+from bot_main import build_app, config, BOT_MODE
+from webhook_front import serve_webhook
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -9,7 +10,10 @@ logger = logging.getLogger(__name__)
 async def start_logic():
     while True: # حيلة التكرار اللانهائي داخل الكود
         try:
-            app = build_app()
+            app = build_app(updater=(BOT_MODE != 'webhook'))
+            if BOT_MODE == 'webhook':
+                await serve_webhook(app, config)
+                return
             await app.initialize()
             await app.start()
             # drop_pending_updates=True ضرورية جداً عند إعادة التشغيل المتكرر
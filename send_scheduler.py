@@ -0,0 +1,215 @@
+"""
+📤 جدولة الرسائل الصادرة
+
+كل طلبات الإرسال والتعديل تمر عبر SendScheduler (محدد معدل PTB) قبل أن تصل
+إلى Telegram:
+- حد لكل محادثة: رسالة في الثانية للمحادثات الخاصة و20 في الدقيقة للمجموعات والقنوات.
+- حد عام (~30 رسالة في الثانية) يُوزع حسب الأولوية: محادثات المستخدمين أولاً،
+  ثم تحديثات الألعاب، ثم قناة المراقبة، وأخيراً البث الجماعي.
+- عند استلام RetryAfter يتوقف الإرسال كله للمدة المطلوبة ثم يُعاد الطلب.
+
+الأولوية تُمرر عبر rate_limit_args=PRIORITY_... في استدعاءات البوت، أو
+لكتلة كاملة من الكود عبر: with send_priority(PRIORITY_GAME): ...
+"""
+
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Callable, Coroutine, Dict, Optional, Union
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from metrics import registry, timed
+
+logger = logging.getLogger(__name__)
+
+# فئات الأولوية (الأصغر يُرسل أولاً)
+PRIORITY_CHAT = 0
+PRIORITY_GAME = 1
+PRIORITY_MONITOR = 2
+PRIORITY_BROADCAST = 3
+PRIORITY_NAMES = {
+    PRIORITY_CHAT: "chat",
+    PRIORITY_GAME: "game",
+    PRIORITY_MONITOR: "monitor",
+    PRIORITY_BROADCAST: "broadcast",
+}
+
+_current_priority = contextvars.ContextVar("send_priority", default=PRIORITY_CHAT)
+
+@contextmanager
+def send_priority(priority: int):
+    """تحديد أولوية كل الرسائل المرسلة داخل الكتلة"""
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+def is_group_chat(chat_id: Union[int, str]) -> bool:
+    """المجموعات والقنوات أرقامها سالبة أو تُكتب باسم المستخدم @channel"""
+    if isinstance(chat_id, int):
+        return chat_id < 0
+    return str(chat_id).startswith(("-", "@"))
+
+def is_send_endpoint(endpoint: str) -> bool:
+    """الطلبات التي تحسبها Telegram ضمن حدود الإرسال"""
+    return endpoint.startswith(("send", "edit", "copyMessage", "forwardMessage"))
+
+class RateLimit:
+    """محدد معدل GCRA (دلو رموز بمتغير واحد): rate طلب كل period ثانية مع سماح بدفعة burst"""
+
+    def __init__(self, rate: float, period: float = 1.0, burst: int = 1):
+        self.interval = period / rate
+        self.tolerance = self.interval * (burst - 1)
+        self.tat = 0.0  # الوقت النظري للطلب التالي
+
+    def delay(self, now: float) -> float:
+        """كم يجب الانتظار قبل الطلب التالي (دون حجز)"""
+        return max(0.0, self.tat - self.tolerance - now)
+
+    def reserve(self, now: float) -> float:
+        """حجز مكان للطلب التالي وإرجاع مدة الانتظار حتى موعده"""
+        wait = self.delay(now)
+        self.tat = max(self.tat, now) + self.interval
+        return wait
+
+class SendScheduler(BaseRateLimiter[int]):
+    """محدد معدل مركزي لكل ما يرسله البوت، مع أولويات وحدود لكل محادثة"""
+
+    def __init__(self, global_rate: float = 30, chat_rate: float = 1, group_rate_per_minute: float = 20,
+                 max_retries: int = 3):
+        self.global_limit = RateLimit(global_rate, 1.0)
+        self.chat_rate = chat_rate
+        self.group_rate_per_minute = group_rate_per_minute
+        self.max_retries = max_retries
+        self.chat_limits: Dict[Union[int, str], RateLimit] = {}
+        self.queue = []  # (الأولوية, الترتيب, future) بانتظار مكان في الحد العام
+        self._sequence = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self.paused_until = 0.0
+        self.latency = {
+            priority: registry.histogram(f"send_{name}_seconds")
+            for priority, name in PRIORITY_NAMES.items()
+        }
+
+    # --- دورة الحياة (يستدعيها PTB مع تهيئة البوت وإيقافه) ---
+    async def initialize(self) -> None:
+        self._wakeup = asyncio.Event()
+        self._dispatcher = asyncio.get_running_loop().create_task(self._dispatch())
+
+    async def shutdown(self) -> None:
+        if self._dispatcher:
+            self._dispatcher.cancel()
+            try:
+                await self._dispatcher
+            except asyncio.CancelledError:
+                pass
+            self._dispatcher = None
+        for _, _, future in self.queue:
+            if not future.done():
+                future.cancel()
+        self.queue.clear()
+
+    # --- الحد العام حسب الأولوية ---
+    async def _dispatch(self):
+        """إعطاء مكان في الحد العام للطلب الأعلى أولوية كلما توفر"""
+        while True:
+            if not self.queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            now = time.monotonic()
+            wait = max(self.paused_until - now, self.global_limit.delay(now))
+            if wait > 0:
+                # إعادة التقييم بعد الانتظار: ربما وصل طلب بأولوية أعلى
+                await asyncio.sleep(wait)
+                continue
+
+            _, _, future = heapq.heappop(self.queue)
+            if not future.done():
+                self.global_limit.reserve(now)
+                future.set_result(None)
+
+    async def _global_slot(self, priority: int):
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.queue, (priority, next(self._sequence), future))
+        self._wakeup.set()
+        await future
+
+    # --- الحد لكل محادثة ---
+    def _chat_limit(self, chat_id: Union[int, str]) -> RateLimit:
+        limit = self.chat_limits.get(chat_id)
+        if limit is None:
+            if len(self.chat_limits) > 10000:
+                self._prune_chat_limits()
+            if is_group_chat(chat_id):
+                limit = RateLimit(self.group_rate_per_minute, 60.0)
+            else:
+                limit = RateLimit(self.chat_rate, 1.0)
+            self.chat_limits[chat_id] = limit
+        return limit
+
+    def _prune_chat_limits(self):
+        """حذف حدود المحادثات التي لم تُستخدم مؤخراً (لا تؤثر على أي طلب قادم)"""
+        now = time.monotonic()
+        self.chat_limits = {chat_id: limit for chat_id, limit in self.chat_limits.items() if limit.tat > now}
+
+    # --- معالجة الطلب ---
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, Any]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        endpoint: str,
+        data: Dict[str, Any],
+        rate_limit_args: Optional[int],
+    ) -> Any:
+        if not is_send_endpoint(endpoint):
+            return await callback(*args, **kwargs)
+
+        priority = _current_priority.get() if rate_limit_args is None else rate_limit_args
+        chat_id = data.get("chat_id")
+
+        with timed(self.latency.get(priority, self.latency[PRIORITY_CHAT])):
+            if chat_id is not None:
+                wait = self._chat_limit(chat_id).reserve(time.monotonic())
+                if wait > 0:
+                    await asyncio.sleep(wait)
+
+            for attempt in range(self.max_retries + 1):
+                await self._global_slot(priority)
+                try:
+                    result = await callback(*args, **kwargs)
+                    registry.inc(f"sent_{PRIORITY_NAMES.get(priority, priority)}")
+                    return result
+                except RetryAfter as e:
+                    registry.inc("send_retry_after")
+                    if attempt == self.max_retries:
+                        raise
+                    retry_after = float(e.retry_after if not hasattr(e.retry_after, "total_seconds")
+                                        else e.retry_after.total_seconds())
+                    logger.warning(f"Flood control on {endpoint} ({chat_id}): pausing sends for {retry_after}s")
+                    self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+
+    def get_stats(self) -> Dict[str, Any]:
+        depth = {name: 0 for name in PRIORITY_NAMES.values()}
+        for priority, _, future in self.queue:
+            if not future.done():
+                depth[PRIORITY_NAMES.get(priority, str(priority))] += 1
+        return {
+            "queue_depth": depth,
+            "tracked_chats": len(self.chat_limits),
+            "paused_for": round(max(0.0, self.paused_until - time.monotonic()), 1),
+            "latency_p95": {
+                PRIORITY_NAMES[priority]: round(histogram.quantile(0.95), 3)
+                for priority, histogram in self.latency.items()
+            }
+        }
@@ -0,0 +1,211 @@
+"""
+🗂️ تخزين مقسّم لقاعدة بيانات GitHub
+
+كل مجموعة (collection) في ملف مستقل، والمستخدمون موزعون على دلاء حسب
+user_id % USER_BUCKETS. عند الحفظ تُرفع الملفات المتغيرة فقط في commit واحد
+ذري عبر git data API (blobs / trees / commits / refs).
+"""
+
+import os
+import sys
+import json
+import base64
+import logging
+import requests
+from typing import Optional, Dict, Any, Iterable
+
+logger = logging.getLogger(__name__)
+
+USER_BUCKETS = 256
+LAYOUT_VERSION = 1
+SYSTEM_SHARD = "system.json"
+MANIFEST_SHARD = "manifest.json"
+
+def user_bucket(user_key) -> int:
+    return int(user_key) % USER_BUCKETS
+
+def user_shard(bucket: int) -> str:
+    return f"users/{bucket:03d}.json"
+
+def shard_for_key(key) -> str:
+    """اسم الملف الذي يحتوي المسار المعدّل"""
+    if key[0] == "users" and len(key) > 1:
+        return user_shard(user_bucket(key[1]))
+    return f"{key[0]}.json"
+
+def shards_for_record(op: str, key, value: Any = None) -> set:
+    """الملفات التي يغيرها تعديل واحد من السجل (بما فيها تعديلات batch وbulk_update)"""
+    if op == "batch":
+        shards = set()
+        for sub_op, sub_key, sub_value in value:
+            shards |= shards_for_record(sub_op, sub_key, sub_value)
+        return shards
+    if op == "bulk_update":
+        record_keys = set(value["keys"]) | set(value.get("set", {}))
+        return {shard_for_key(list(key) + [record_key]) for record_key in record_keys}
+    return {shard_for_key(key)}
+
+def all_shards(data: Dict[str, Any]) -> set:
+    """جميع ملفات البيانات (للهجرة أو التهيئة الأولى)"""
+    shards = {f"{name}.json" for name in data if name != "users"}
+    shards.update(user_shard(bucket) for bucket in range(USER_BUCKETS))
+    return shards
+
+def build_shards(data: Dict[str, Any], shard_names: Iterable[str]) -> Dict[str, str]:
+    """تحويل الملفات المطلوبة فقط إلى JSON"""
+    shard_names = set(shard_names)
+    buckets = {}
+    wanted_buckets = {int(name[6:9]) for name in shard_names if name.startswith("users/")}
+    if wanted_buckets:
+        buckets = {bucket: {} for bucket in wanted_buckets}
+        for user_key, user in data.get("users", {}).items():
+            bucket = user_bucket(user_key)
+            if bucket in buckets:
+                buckets[bucket][user_key] = user
+
+    payloads = {}
+    for name in shard_names:
+        if name.startswith("users/"):
+            content = buckets[int(name[6:9])]
+        elif name == MANIFEST_SHARD:
+            content = {"layout_version": LAYOUT_VERSION, "user_buckets": USER_BUCKETS}
+        else:
+            content = data.get(name[:-len(".json")], [])
+        payloads[name] = json.dumps(content, ensure_ascii=False, separators=(',', ':'))
+    return payloads
+
+class ShardedGitHubStorage:
+    """رفع وتحميل ملفات البيانات المقسمة عبر git data API"""
+
+    def __init__(self, token: str, repo: str, prefix: str = "bot_data", branch: Optional[str] = None):
+        self.repo = repo
+        self.prefix = prefix.strip("/")
+        self.branch = branch
+        self.api_url = f"https://api.github.com/repos/{repo}"
+        self._blobs = {}  # path -> (sha, raw) لتجنب إعادة تحميل الملفات غير المتغيرة
+        self.session = requests.Session()
+        self.session.headers.update({
+            "Authorization": f"token {token}",
+            "Accept": "application/vnd.github.v3+json"
+        })
+
+    def _request(self, method: str, path: str, **kwargs):
+        response = self.session.request(method, f"{self.api_url}{path}", timeout=30, **kwargs)
+        if response.status_code >= 400:
+            raise RuntimeError(f"{method} {path} failed: {response.status_code} - {response.text[:200]}")
+        return response.json()
+
+    def _get_branch(self) -> str:
+        if not self.branch:
+            self.branch = self._request("GET", "")["default_branch"]
+        return self.branch
+
+    def _get_head(self):
+        """آخر commit في الفرع وشجرة ملفاته"""
+        ref = self._request("GET", f"/git/ref/heads/{self._get_branch()}")
+        commit_sha = ref["object"]["sha"]
+        commit = self._request("GET", f"/git/commits/{commit_sha}")
+        return commit_sha, commit["tree"]["sha"]
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        """تحميل جميع الملفات ودمجها في هيكل واحد (None إذا لم يتم إنشاؤها بعد)"""
+        _, tree_sha = self._get_head()
+        tree = self._request("GET", f"/git/trees/{tree_sha}", params={"recursive": "1"})
+
+        base = f"{self.prefix}/"
+        entries = {item["path"][len(base):]: item["sha"] for item in tree["tree"]
+                   if item["type"] == "blob" and item["path"].startswith(base)}
+        if MANIFEST_SHARD not in entries:
+            return None
+
+        data = {"users": {}}
+        for name, blob_sha in entries.items():
+            if name == MANIFEST_SHARD or not name.endswith(".json"):
+                continue
+            cached = self._blobs.get(name)
+            if cached and cached[0] == blob_sha:
+                raw = cached[1]
+            else:
+                blob = self._request("GET", f"/git/blobs/{blob_sha}")
+                raw = base64.b64decode(blob["content"]).decode("utf-8")
+                self._blobs[name] = (blob_sha, raw)
+            content = json.loads(raw)
+            if name.startswith("users/"):
+                data["users"].update(content)
+            else:
+                data[name[:-len(".json")]] = content
+        return data
+
+    def save(self, payloads: Dict[str, str], commit_message: str) -> bool:
+        """رفع الملفات المتغيرة في commit واحد"""
+        for attempt in range(2):
+            try:
+                head_sha, tree_sha = self._get_head()
+
+                tree_entries = []
+                for name, content in payloads.items():
+                    blob = self._request("POST", "/git/blobs", json={
+                        "content": base64.b64encode(content.encode("utf-8")).decode("utf-8"),
+                        "encoding": "base64"
+                    })
+                    tree_entries.append({
+                        "path": f"{self.prefix}/{name}",
+                        "mode": "100644",
+                        "type": "blob",
+                        "sha": blob["sha"]
+                    })
+
+                new_tree = self._request("POST", "/git/trees", json={"base_tree": tree_sha, "tree": tree_entries})
+                commit = self._request("POST", "/git/commits", json={
+                    "message": f"🤖 {commit_message}",
+                    "tree": new_tree["sha"],
+                    "parents": [head_sha]
+                })
+                self._request("PATCH", f"/git/refs/heads/{self._get_branch()}", json={"sha": commit["sha"]})
+
+                logger.info(f"Saved {len(payloads)} shards to GitHub: {commit_message}")
+                return True
+
+            except Exception as e:
+                # فشل تحديث المرجع غالباً يعني commit جديد في الفرع؛ نعيد المحاولة مرة واحدة
+                logger.error(f"Error saving shards to GitHub (attempt {attempt + 1}): {e}")
+        return False
+
+def migrate_single_file(token: str, repo: str, db_file: str = "bot_data.json",
+                        prefix: Optional[str] = None) -> bool:
+    """تحويل ملف البيانات الواحد إلى التخزين المقسم (الملف القديم يبقى كما هو)"""
+    prefix = prefix or os.path.splitext(db_file)[0]
+    response = requests.get(
+        f"https://api.github.com/repos/{repo}/contents/{db_file}",
+        headers={"Authorization": f"token {token}", "Accept": "application/vnd.github.raw"},
+        timeout=60
+    )
+    if response.status_code != 200:
+        logger.error(f"Cannot read {db_file}: {response.status_code}")
+        return False
+
+    data = json.loads(response.content.decode("utf-8"))
+    data.setdefault("users", {})
+    shard_names = all_shards(data) | {MANIFEST_SHARD}
+
+    storage = ShardedGitHubStorage(token, repo, prefix)
+    saved = storage.save(build_shards(data, shard_names), f"Migrate {db_file} to sharded layout")
+    if saved:
+        logger.info(f"Migrated {len(data['users'])} users into {len(shard_names)} shards under {prefix}/")
+    return saved
+
+if __name__ == "__main__":
+    # python sharded_storage.py migrate
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) < 2 or sys.argv[1] != "migrate":
+        print("الاستخدام: python sharded_storage.py migrate")
+        sys.exit(1)
+
+    ok = migrate_single_file(
+        os.getenv('GH_TOKEN'),
+        os.getenv('DATA_REPO'),
+        os.getenv('DB_FILE', 'bot_data.json'),
+        os.getenv('DB_SHARD_PREFIX')
+    )
+    print("✅ تمت الهجرة بنجاح" if ok else "❌ فشلت الهجرة")
+    sys.exit(0 if ok else 1)
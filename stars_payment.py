@@ -495,10 +495,11 @@ class StarsKeyboards:
 
 # 🤖 نظام الدفع بالنجوم الرئيسي
 class TelegramStarsPaymentSystem:
-    def __init__(self, main_db):
+    def __init__(self, main_db, monitor=None):
         self.config = StarsConfig()
         self.stars_db = StarsDatabase(self.config.DB_NAME)
-        self.main_db = main_db  # قاعدة البيانات الرئيسية للبوت
+        self.main_db = main_db  # قاعدة البيانات الرئيسية للبوت (AsyncDatabase)
+        self.monitor = monitor  # MonitorDigest: المدفوعات تُبلغ لقناة المراقبة فوراً
         
         logger.info("✅ تم تهيئة نظام النجوم")
     
@@ -605,7 +606,7 @@ class TelegramStarsPaymentSystem:
             stars_user = {'stars_balance': 0, 'total_stars_earned': 0, 'total_stars_spent': 0}
         
         # الحصول من قاعدة البيانات الرئيسية
-        main_user = self.main_db.get_user(user.id)
+        main_user = await self.main_db.get_user(user.id)
         main_stars = main_user.get('stars_balance', 0) if main_user else 0
         
         # استخدام القيمة الأكبر
@@ -810,8 +811,9 @@ class TelegramStarsPaymentSystem:
             # تفعيل VIP
             self.stars_db.add_vip_purchase(user.id, days, package['price'])
             
-            # تحديث قاعدة البيانات الرئيسية
-            self.main_db.purchase_vip_with_stars(user.id, days, package['price'])
+            # تحديث قاعدة البيانات الرئيسية وحفظ عملية الدفع فوراً
+            await self.main_db.purchase_vip_with_stars(user.id, days, package['price'])
+            await self.main_db.flush()
             
             # تسجيل المعاملة
             transaction_data = {
@@ -893,8 +895,9 @@ class TelegramStarsPaymentSystem:
                     # إضافة النجوم للمستخدم
                     self.stars_db.update_stars_balance(user.id, package['stars'])
                     
-                    # تحديث قاعدة البيانات الرئيسية
-                    self.main_db.add_stars(user.id, package['stars'])
+                    # تحديث قاعدة البيانات الرئيسية وحفظ عملية الدفع فوراً
+                    await self.main_db.add_stars(user.id, package['stars'])
+                    await self.main_db.flush()
                     
                     success_text = f"""
 🎉 **تم الدفع بنجاح!** ⭐
@@ -918,6 +921,13 @@ class TelegramStarsPaymentSystem:
                     )
                     
                     logger.info(f"✅ تم إضافة {package['stars']} نجمة للمستخدم {user.id}")
+                    if self.monitor is not None:
+                        self.monitor.add(
+                            "payment",
+                            f"💳 دفعة ناجحة: {user.id} • {package['name']} • {package['stars']} نجمة • "
+                            f"{payment.telegram_payment_charge_id}",
+                            critical=True
+                        )
                 else:
                     await update.message.reply_text(
                         "❌ حدث خطأ في تفعيل الباقة. يرجى التواصل مع الدعم.\n\n"
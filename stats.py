@@ -0,0 +1,181 @@
+"""
+📊 إحصائيات تُحدّث تدريجياً
+
+بدلاً من المرور على جميع المستخدمين والمحادثات في كل طلب إحصائيات، تُحفظ
+المجاميع في الذاكرة وتُعدّل مع كل تعديل يمر عبر GitHubDatabase._apply.
+أرقام "اليوم" تُحسب من حلقات ساعية (آخر 24 ساعة بدقة الساعة).
+"""
+
+import heapq
+import time
+from collections import Counter
+from typing import Dict, Any, Optional, Tuple
+
+HOUR = 3600
+DAY_HOURS = 24
+
+class HourlyRing:
+    """عداد لآخر 24 ساعة: خانة لكل ساعة تُعاد تهيئتها عند دورانها"""
+
+    def __init__(self, hours: int = DAY_HOURS):
+        self.hours = hours
+        self.slots = [0] * hours
+        self.tags = [-1] * hours  # رقم الساعة المخزنة في كل خانة
+
+    def add(self, ts: int, amount: int = 1, now: Optional[float] = None):
+        hour = int(ts) // HOUR
+        current = int(now or time.time()) // HOUR
+        if hour <= current - self.hours or hour > current:
+            return  # خارج النافذة
+        slot = hour % self.hours
+        if self.tags[slot] != hour:
+            self.tags[slot] = hour
+            self.slots[slot] = 0
+        self.slots[slot] += amount
+
+    def total(self, now: Optional[float] = None) -> int:
+        current = int(now or time.time()) // HOUR
+        oldest = current - self.hours
+        return sum(count for count, hour in zip(self.slots, self.tags) if oldest < hour <= current)
+
+def in_today_window(ts: int, now: float) -> bool:
+    """نفس نافذة HourlyRing: آخر 24 ساعة كاملة بما فيها الساعة الحالية"""
+    current = int(now) // HOUR
+    return current - DAY_HOURS < int(ts) // HOUR <= current
+
+class StatsAggregator:
+    """مجاميع الإحصائيات: O(1) لكل تعديل ولكل قراءة"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.user_rows: Dict[str, Tuple] = {}  # user_key -> مساهمة المستخدم الحالية في المجاميع
+        self.status_counts = Counter()
+        self.gender_counts = Counter()
+        self.total_points = 0
+        self.total_stars = 0
+        self.vip_users = set()
+        self.vip_heap = []  # (vip_until, user_key) لإنهاء VIP عند انتهاء مدته
+        self.new_users = HourlyRing()
+        self.new_chats = HourlyRing()
+        self.new_games = HourlyRing()
+
+    # --- البناء الكامل ---
+    def rebuild(self, data: Dict[str, Any], now: Optional[float] = None):
+        now = now or time.time()
+        self.reset()
+        for user_key in data.get("users", {}):
+            self._refresh_user(data["users"], user_key, now)
+        self._rebuild_ring(self.new_chats, data.get("conversations", []), "start_ts", now)
+        self._rebuild_ring(self.new_games, data.get("games", []), "ts", now)
+
+    def _rebuild_ring(self, ring: HourlyRing, records, ts_field: str, now: float):
+        ring.__init__(ring.hours)
+        for record in records:
+            ring.add(record.get(ts_field, 0), 1, now)
+
+    # --- مساهمة مستخدم واحد ---
+    def _refresh_user(self, users: Dict[str, Dict], user_key: str, now: float):
+        old = self.user_rows.pop(user_key, None)
+        if old is not None:
+            self._apply_row(old, -1, now)
+
+        user = users.get(user_key)
+        if user is None:
+            self.vip_users.discard(user_key)
+            return
+        row = (
+            user.get("status"),
+            user.get("gender"),
+            user.get("points", 0) or 0,
+            user.get("stars_balance", 0) or 0,
+            user.get("vip_until", 0) or 0,
+            user.get("join_ts", 0) or 0
+        )
+        self.user_rows[user_key] = row
+        self._apply_row(row, 1, now)
+
+        vip_until = row[4]
+        if vip_until > now:
+            self.vip_users.add(user_key)
+            if old is None or old[4] != vip_until:
+                heapq.heappush(self.vip_heap, (vip_until, user_key))
+        else:
+            self.vip_users.discard(user_key)
+
+    def _apply_row(self, row: Tuple, sign: int, now: float):
+        status, gender, points, stars, _, join_ts = row
+        self.status_counts[status] += sign
+        self.gender_counts[gender] += sign
+        self.total_points += sign * points
+        self.total_stars += sign * stars
+        self.new_users.add(join_ts, sign, now)
+
+    def _expire_vip(self, now: float):
+        """إخراج من انتهى VIP لديهم (الإدخالات القديمة في الكومة تُتجاهل)"""
+        while self.vip_heap and self.vip_heap[0][0] <= now:
+            vip_until, user_key = heapq.heappop(self.vip_heap)
+            row = self.user_rows.get(user_key)
+            if row is None or row[4] <= now:
+                self.vip_users.discard(user_key)
+
+    # --- التحديث التدريجي ---
+    def on_apply(self, data: Dict[str, Any], op: str, key, value: Any = None):
+        """تحديث المجاميع بعد تطبيق تعديل واحد على البيانات"""
+        collection = key[0]
+        now = time.time()
+        if op == "bulk_update":
+            for user_key in value["keys"]:
+                self._refresh_user(data["users"], user_key, now)
+        elif collection == "users":
+            if len(key) == 1:
+                self.rebuild(data, now)
+            else:
+                self._refresh_user(data["users"], key[1], now)
+        elif collection in ("conversations", "games"):
+            ring, ts_field = (self.new_chats, "start_ts") if collection == "conversations" else (self.new_games, "ts")
+            if len(key) == 1 and op == "append":
+                ring.add(value.get(ts_field, 0), 1, now)
+            elif len(key) <= 2:
+                self._rebuild_ring(ring, data[collection], ts_field, now)
+
+    # --- القراءة ---
+    def snapshot(self, data: Dict[str, Any], active_chats: int, now: Optional[float] = None) -> Dict[str, Any]:
+        now = now or time.time()
+        self._expire_vip(now)
+        return {
+            "total_users": len(data["users"]),
+            "active_users": self.status_counts["chatting"],
+            "searching_users": self.status_counts["searching"],
+            "active_chats": active_chats,
+            "total_points": self.total_points,
+            "total_stars": self.total_stars,
+            "male_users": self.gender_counts["ذكر"],
+            "female_users": self.gender_counts["أنثى"],
+            "today_chats": self.new_chats.total(now),
+            "new_users_today": self.new_users.total(now),
+            "vip_users": len(self.vip_users),
+            "today_games": self.new_games.total(now),
+            "total_messages": len(data["messages"])
+        }
+
+def recompute_stats(data: Dict[str, Any], now: Optional[float] = None) -> Dict[str, Any]:
+    """حساب الإحصائيات من الصفر (للتحقق من صحة المجاميع التدريجية)"""
+    now = now or time.time()
+    users = list(data["users"].values())
+    return {
+        "total_users": len(users),
+        "active_users": sum(1 for user in users if user.get("status") == "chatting"),
+        "searching_users": sum(1 for user in users if user.get("status") == "searching"),
+        "active_chats": sum(1 for conv in data["conversations"] if conv.get("active") == 1),
+        "total_points": sum(user.get("points", 0) or 0 for user in users),
+        "total_stars": sum(user.get("stars_balance", 0) or 0 for user in users),
+        "male_users": sum(1 for user in users if user.get("gender") == "ذكر"),
+        "female_users": sum(1 for user in users if user.get("gender") == "أنثى"),
+        "today_chats": sum(1 for conv in data["conversations"] if in_today_window(conv.get("start_ts", 0), now)),
+        "new_users_today": sum(1 for user in users if in_today_window(user.get("join_ts", 0) or 0, now)),
+        "vip_users": sum(1 for user in users if (user.get("vip_until", 0) or 0) > now),
+        "today_games": sum(1 for game in data["games"] if in_today_window(game.get("ts", 0), now)),
+        "total_messages": len(data["messages"])
+    }
@@ -0,0 +1,94 @@
+"""
+📢 كاش فحص الاشتراك الإجباري
+
+فحص الاشتراك في القناة كان يرسل طلب get_chat_member مع كل رسالة وكل زر.
+النتيجة الإيجابية تُحفظ لمدة أطول، والسلبية لمدة قصيرة حتى يُلاحظ الاشتراك
+الجديد بسرعة، والطلبات المتزامنة لنفس المستخدم تنتظر طلباً واحداً فقط.
+"""
+
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Tuple, Any
+
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+class SubscriptionCache:
+    """كاش نتائج الاشتراك حسب رقم المستخدم"""
+
+    def __init__(self, ttl: float = 600, negative_ttl: float = 30, max_entries: int = 100000,
+                 fail_open: bool = True):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.fail_open = fail_open  # النتيجة عند فشل الطلب (لا نمنع المستخدمين بسبب خطأ في Telegram)
+        self.entries: "OrderedDict[int, Tuple[bool, float]]" = OrderedDict()  # user_id -> (مشترك, وقت الانتهاء)
+        self.pending: Dict[int, asyncio.Task] = {}
+        self._stale = set()  # طلبات جارية أُبطلت نتائجها قبل وصولها
+        self.stats = {"hits": 0, "misses": 0, "shared": 0, "errors": 0, "invalidations": 0}
+
+    def _count(self, name: str):
+        self.stats[name] += 1
+        registry.inc(f"subscription_cache_{name}")
+
+    async def is_subscribed(self, user_id: int, fetch: Callable[[], Awaitable[bool]]) -> bool:
+        """نتيجة الكاش إن كانت صالحة، وإلا طلب واحد مشترك لكل المنتظرين"""
+        entry = self.entries.get(user_id)
+        if entry is not None and entry[1] > time.monotonic():
+            self.entries.move_to_end(user_id)
+            self._count("hits")
+            return entry[0]
+
+        task = self.pending.get(user_id)
+        if task is not None:
+            self._count("shared")
+        else:
+            self._count("misses")
+            task = asyncio.ensure_future(self._lookup(user_id, fetch))
+            self.pending[user_id] = task
+        # shield: إلغاء أحد المنتظرين لا يلغي الطلب على الباقين
+        return await asyncio.shield(task)
+
+    async def _lookup(self, user_id: int, fetch: Callable[[], Awaitable[bool]]) -> bool:
+        task = asyncio.current_task()
+        try:
+            subscribed = bool(await fetch())
+            ttl = self.ttl if subscribed else self.negative_ttl
+        except Exception as e:
+            logger.error(f"Error checking channel subscription: {e}")
+            self._count("errors")
+            subscribed, ttl = self.fail_open, self.negative_ttl
+        finally:
+            if self.pending.get(user_id) is task:
+                del self.pending[user_id]
+
+        # لا نحفظ نتيجة طلب أُبطل أثناء تنفيذه (ضغط المستخدم على "تحقق من الاشتراك")
+        if task in self._stale:
+            self._stale.discard(task)
+        else:
+            self._store(user_id, subscribed, ttl)
+        return subscribed
+
+    def _store(self, user_id: int, subscribed: bool, ttl: float):
+        self.entries[user_id] = (subscribed, time.monotonic() + ttl)
+        self.entries.move_to_end(user_id)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, user_id: int):
+        """حذف نتيجة المستخدم حتى يُعاد الفحص من Telegram في الطلب التالي"""
+        self.entries.pop(user_id, None)
+        task = self.pending.pop(user_id, None)
+        if task is not None:
+            self._stale.add(task)
+        self._count("invalidations")
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.stats["hits"] + self.stats["misses"] + self.stats["shared"]
+        stats = dict(self.stats)
+        stats["entries"] = len(self.entries)
+        stats["hit_rate"] = round(self.stats["hits"] / lookups, 3) if lookups else 0.0
+        return stats
@@ -0,0 +1,43 @@
+import os
+import sys
+import glob
+
+import pytest
+
+# الوحدات في جذر المستودع (بدون حزمة)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+from tests.fakes import FakeShardedStorage
+
+@pytest.fixture
+def storage(monkeypatch):
+    fake = FakeShardedStorage()
+    monkeypatch.setattr(database, "ShardedGitHubStorage", lambda *args, **kwargs: fake)
+    return fake
+
+@pytest.fixture
+def open_db(tmp_path, storage):
+    opened = []
+
+    def factory():
+        db = database.GitHubDatabase(
+            "token", "owner/repo", db_file=str(tmp_path / "bot_data.json"),
+            flush_interval=3600, flush_max_mutations=10 ** 6,
+            journal_path=str(tmp_path / "bot_data.journal"), layout="sharded"
+        )
+        opened.append(db)
+        return db
+
+    yield factory
+    for db in opened:
+        db.close()
+
+def crash(db):
+    """توقف مفاجئ: السجل على القرص والتعديلات لم تُرفع"""
+    db.journal.sync()
+    db._stop_event.set()  # close() لن يحفظ شيئاً
+    db.journal.close()
+
+def journal_segments(tmp_path):
+    return glob.glob(str(tmp_path / "bot_data.journal.*"))
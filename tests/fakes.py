@@ -0,0 +1,228 @@
+"""بدائل في الذاكرة للخدمات الخارجية (GitHub) وللساعة ولتوجيه bot_main في الاختبارات والقياسات"""
+
+import os
+import ast
+import json
+import base64
+import asyncio
+import itertools
+import selectors
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from routing import Router
+from sharded_storage import MANIFEST_SHARD
+from tests.legacy_relay import LEGACY_RELAY
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class FakeShardedStorage:
+    """نفس واجهة ShardedGitHubStorage لكن الملفات في dict"""
+
+    def __init__(self):
+        self.files: Dict[str, str] = {}
+        self.saves = []
+        self.fail_saves = False
+        self.fail_loads = 0  # عدد التحميلات القادمة التي تفشل (انقطاع GitHub)
+
+    def load(self) -> Optional[Dict]:
+        if self.fail_loads:
+            self.fail_loads -= 1
+            raise ConnectionError("GitHub unavailable")
+        if MANIFEST_SHARD not in self.files:
+            return None
+        data = {"users": {}}
+        for name, raw in self.files.items():
+            if name == MANIFEST_SHARD:
+                continue
+            content = json.loads(raw)
+            if name.startswith("users/"):
+                data["users"].update(content)
+            else:
+                data[name[:-len(".json")]] = content
+        return data
+
+    def save(self, payloads: Dict[str, str], commit_message: str) -> bool:
+        if self.fail_saves:
+            return False
+        self.files.update(payloads)
+        self.saves.append(sorted(payloads))
+        return True
+
+    def shard(self, name: str):
+        return json.loads(self.files[name])
+
+class FakeResponse:
+    def __init__(self, status_code: int, body: Any = None, content: bytes = b""):
+        self.status_code = status_code
+        self._body = body
+        self.content = content or json.dumps(body).encode("utf-8")
+        self.text = self.content.decode("utf-8")
+
+    def json(self):
+        return self._body
+
+class FakeGitHub:
+    """مستودع git في الذاكرة خلف نفس طلبات REST التي يرسلها ShardedGitHubStorage
+
+    session() بديل requests.Session، وget بديل requests.get لملف contents.
+    تحديث المرجع يفشل بـ 422 إذا لم يكن الـ commit الجديد ابناً للرأس الحالي،
+    كما يفعل GitHub دون force. before_ref_update يُستدعى قبل كل تحديث مرجع
+    (لمحاكاة كاتب آخر يسبقنا).
+    """
+
+    def __init__(self, branch: str = "main"):
+        self.branch = branch
+        self.blobs: Dict[str, bytes] = {}
+        self.trees: Dict[str, Dict[str, str]] = {"tree0": {}}  # tree sha -> {path: blob sha}
+        self.commits: Dict[str, Dict[str, Any]] = {"commit0": {"tree": "tree0", "parents": [], "message": "init"}}
+        self.head = "commit0"
+        self.contents: Dict[str, bytes] = {}  # ملفات contents API (الملف الواحد القديم)
+        self.requests: List[Tuple[str, str]] = []
+        self.before_ref_update: Optional[Callable[[], Any]] = None
+        self._ids = itertools.count(1)
+
+    # --- عرض المستودع ---
+    def files(self, commit: Optional[str] = None) -> Dict[str, str]:
+        tree = self.trees[self.commits[commit or self.head]["tree"]]
+        return {path: self.blobs[sha].decode("utf-8") for path, sha in tree.items()}
+
+    def commit_files(self, files: Dict[str, str], message: str = "other writer"):
+        """commit مباشر على الفرع (كاتب آخر)"""
+        tree = dict(self.trees[self.commits[self.head]["tree"]])
+        for path, content in files.items():
+            tree[path] = self._store_blob(content.encode("utf-8"))
+        tree_sha = f"tree{next(self._ids)}"
+        self.trees[tree_sha] = tree
+        commit_sha = f"commit{next(self._ids)}"
+        self.commits[commit_sha] = {"tree": tree_sha, "parents": [self.head], "message": message}
+        self.head = commit_sha
+
+    def _store_blob(self, raw: bytes) -> str:
+        sha = f"blob{next(self._ids)}"
+        self.blobs[sha] = raw
+        return sha
+
+    # --- requests ---
+    def session(self):
+        fake = self
+
+        class Session:
+            def __init__(self):
+                self.headers = {}
+
+            def request(self, method, url, timeout=None, params=None, json=None):
+                return fake.handle(method, url, json)
+        return Session()
+
+    def get(self, url, headers=None, timeout=None):
+        self.requests.append(("GET", url))
+        path = url.split("/contents/", 1)[1]
+        if path not in self.contents:
+            return FakeResponse(404, {"message": "Not Found"})
+        return FakeResponse(200, content=self.contents[path])
+
+    def handle(self, method: str, url: str, body: Any = None) -> FakeResponse:
+        owner_repo_path = url.split("/repos/", 1)[1].split("/", 2)
+        path = owner_repo_path[2] if len(owner_repo_path) > 2 else ""
+        self.requests.append((method, path))
+        parts = path.split("/")
+        if method == "GET" and path == "":
+            return FakeResponse(200, {"default_branch": self.branch})
+        if method == "GET" and parts[:3] == ["git", "ref", "heads"]:
+            return FakeResponse(200, {"object": {"sha": self.head}})
+        if method == "GET" and parts[:2] == ["git", "commits"]:
+            return FakeResponse(200, {"tree": {"sha": self.commits[parts[2]]["tree"]}})
+        if method == "GET" and parts[:2] == ["git", "trees"]:
+            return FakeResponse(200, {"tree": [{"path": item_path, "type": "blob", "sha": sha}
+                                               for item_path, sha in self.trees[parts[2]].items()]})
+        if method == "GET" and parts[:2] == ["git", "blobs"]:
+            return FakeResponse(200, {"content": base64.b64encode(self.blobs[parts[2]]).decode("utf-8")})
+        if method == "POST" and path == "git/blobs":
+            return FakeResponse(201, {"sha": self._store_blob(base64.b64decode(body["content"]))})
+        if method == "POST" and path == "git/trees":
+            tree = dict(self.trees[body["base_tree"]])
+            tree.update({entry["path"]: entry["sha"] for entry in body["tree"]})
+            tree_sha = f"tree{next(self._ids)}"
+            self.trees[tree_sha] = tree
+            return FakeResponse(201, {"sha": tree_sha})
+        if method == "POST" and path == "git/commits":
+            commit_sha = f"commit{next(self._ids)}"
+            self.commits[commit_sha] = dict(body)
+            return FakeResponse(201, {"sha": commit_sha})
+        if method == "PATCH" and parts[:3] == ["git", "refs", "heads"]:
+            if self.before_ref_update is not None:
+                self.before_ref_update()
+            if self.head not in self.commits[body["sha"]]["parents"]:
+                return FakeResponse(422, {"message": "Update is not a fast forward"})
+            self.head = body["sha"]
+            return FakeResponse(200, {"object": {"sha": self.head}})
+        return FakeResponse(404, {"message": f"Not Found: {method} {path}"})
+
+class _VirtualSelector(selectors.DefaultSelector):
+    """لا ينتظر فعلاً: إذا لم يكن هناك ما يُقرأ يقفز بالساعة إلى موعد المؤقت التالي"""
+
+    def __init__(self, loop: "VirtualClockLoop"):
+        super().__init__()
+        self.loop = loop
+
+    def select(self, timeout=None):
+        events = super().select(0)
+        if not events:
+            if timeout is None:
+                raise RuntimeError("every task is waiting and no timer is pending")
+            self.loop.now += timeout
+        return events
+
+class VirtualClockLoop(asyncio.SelectorEventLoop):
+    """حلقة أحداث بساعة افتراضية: asyncio.sleep وcall_later تنتهي فوراً بتقديم الساعة"""
+
+    def __init__(self, start: float = 1000.0):
+        self.now = start
+        super().__init__(_VirtualSelector(self))
+
+    def time(self) -> float:
+        return self.now
+
+    def run(self, coroutine):
+        try:
+            return self.run_until_complete(coroutine)
+        finally:
+            self.close()
+
+# --- توجيه الرسائل النصية خارج bot_main ---
+# دوال التوجيه في bot_main التي تُنفذ فعلاً؛ كل ما عداها (start_search، db...) يأتي من namespace
+ROUTING_FUNCTIONS = {
+    "_relay_message_internal", "register_routes", "reply_not_understood",
+    "handle_rating_state", "handle_admin_message_state", "handle_country_name_state",
+    "handle_gender_update_state", "handle_country_update_state", "back_from_settings_state",
+    "handle_guess_state", "handle_admin_state", "back_to_main", "back_to_settings",
+    "luck_game_soon", "ignore_button", "request_rating",
+}
+SHARED_NAMES = {"ADMIN_KEYBOARD_ROWS", "ADMIN_BUTTONS"}
+
+def extract(source: str, names) -> str:
+    """مصدر الدوال والتعريفات المطلوبة من أعلى مستوى الملف"""
+    parts = []
+    for node in ast.parse(source).body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and node.name in names:
+            parts.append(ast.get_source_segment(source, node))
+        elif isinstance(node, ast.Assign) and any(getattr(t, "id", None) in names for t in node.targets):
+            parts.append(ast.get_source_segment(source, node))
+    return "\n\n".join(parts)
+
+def routing_sources() -> Tuple[str, str]:
+    """(التوجيه الحالي من bot_main, سلسلة if/elif القديمة مع نفس الأزرار)"""
+    with open(os.path.join(ROOT, "bot_main.py"), encoding="utf-8") as f:
+        bot_main = f.read()
+    return (extract(bot_main, ROUTING_FUNCTIONS | SHARED_NAMES),
+            extract(bot_main, SHARED_NAMES) + "\n\n" + LEGACY_RELAY)
+
+def load_routing(code, namespace: dict) -> dict:
+    """تنفيذ التوجيه في namespace (يحدد ما تصبح عليه الأسماء غير المعرفة) وتسجيل الأزرار"""
+    namespace.update(USER_STATES={}, active_chats={}, ADMIN_IDS=[1], router=Router(), Update=object,
+                     ContextTypes=SimpleNamespace(DEFAULT_TYPE=object))
+    exec(code, namespace)
+    if "register_routes" in namespace:
+        namespace["register_routes"]()
+    return namespace
@@ -0,0 +1,244 @@
+"""
+سلسلة if/elif التي كانت توجه الرسائل النصية قبل Router (bot_main قبل user-025)
+
+مرجع لاختبار test_routing وقياس benchmarks/bench_routing: المصدر محفوظ كنص
+ويُنفذ في نفس البيئة الوهمية التي يُنفذ فيها التوجيه الحالي، ويجب أن
+يستدعي الاثنان نفس المعالجات. لا يُعدّل.
+"""
+
+LEGACY_RELAY = r'''
+async def _relay_message_internal(update: Update, context: ContextTypes.DEFAULT_TYPE, user, text: str):
+    # معالجة التقييمات
+    if user.id in USER_STATES and USER_STATES[user.id] == 'waiting_for_rating':
+        if '⭐ 1' in text:
+            rating = 1
+            USER_STATES.pop(user.id, None)
+            await update.message.reply_text(
+                f"⭐ **شكراً لتقييمك!** تم تسجيل {rating} نجوم.", 
+                reply_markup=main_reply_keyboard(user.id in ADMIN_IDS)
+            )
+        elif '⭐⭐ 2' in text:
+            rating = 2
+            USER_STATES.pop(user.id, None)
+            await update.message.reply_text(
+                f"⭐⭐ **شكراً لتقييمك!** تم تسجيل {rating} نجوم.", 
+                reply_markup=main_reply_keyboard(user.id in ADMIN_IDS)
+            )
+        elif '⭐⭐⭐ 3' in text:
+            rating = 3
+            USER_STATES.pop(user.id, None)
+            await update.message.reply_text(
+                f"⭐⭐⭐ **شكراً لتقييمك!** تم تسجيل {rating} نجوم.", 
+                reply_markup=main_reply_keyboard(user.id in ADMIN_IDS)
+            )
+        elif '⭐⭐⭐⭐ 4' in text:
+            rating = 4
+            USER_STATES.pop(user.id, None)
+            await update.message.reply_text(
+                f"⭐⭐⭐⭐ **شكراً لتقييمك!** تم تسجيل {rating} نجوم.", 
+                reply_markup=main_reply_keyboard(user.id in ADMIN_IDS)
+            )
+        elif '⭐⭐⭐⭐⭐ 5' in text:
+            rating = 5
+            USER_STATES.pop(user.id, None)
+            await update.message.reply_text(
+                f"⭐⭐⭐⭐⭐ **شكراً لتقييمك!** تم تسجيل {rating} نجوم.", 
+                reply_markup=main_reply_keyboard(user.id in ADMIN_IDS)
+            )
+        elif 'تخطي' in text:
+            USER_STATES.pop(user.id, None)
+            await update.message.reply_text(
+                "✅ **تم تخطي التقييم.**", 
+                reply_markup=main_reply_keyboard(user.id in ADMIN_IDS)
+            )
+        return
+    
+    # معالجة رسائل المشرف من VIP
+    if user.id in USER_STATES and USER_STATES[user.id] == 'waiting_admin_message':
+        message = text
+        USER_STATES.pop(user.id, None)
+        
+        # إرسال الرسالة للمشرفين
+        for admin_id in ADMIN_IDS:
+            try:
+                await context.bot.send_message(
+                    chat_id=admin_id,
+                    text=f"📩 **رسالة من VIP:**\n\n"
+                         f"👤 **المستخدم:** {user.first_name} (ID: {user.id})\n"
+                         f"💬 **الرسالة:** {message}\n\n"
+                         f"📨 **للرد:** /reply {user.id} <الرسالة>"
+                )
+            except:
+                pass
+        
+        await update.message.reply_text(
+            "✅ **تم إرسال رسالتك للمشرف بنجاح.**\n\n"
+            "👨‍💼 **سيتم الرد عليك في أقرب وقت.**",
+            reply_markup=vip_keyboard()
+        )
+        return
+    
+    # معالجة اسم البلد المخصص
+    if user.id in USER_STATES and USER_STATES[user.id] == 'waiting_country_name':
+        await db.update_user_profile(user.id, {'country': text})
+        await update.message.reply_text(
+            f"✅ **تم تحديث البلد إلى:** {text}",
+            reply_markup=await settings_keyboard(user.id)
+        )
+        USER_STATES.pop(user.id, None)
+        return
+
+    # معالجة حالات المستخدم
+    if user.id in USER_STATES:
+        state = USER_STATES[user.id]
+        
+        if state == 'waiting_gender_choice':
+            await handle_gender_choice(update, context, text)
+            return
+            
+        elif state == 'waiting_gender_confirm':
+            await handle_gender_confirm(update, context, text)
+            return
+            
+        elif state == 'waiting_gender_update':
+            if text == '👦 ذكر':
+                await handle_gender_update(update, context, 'ذكر')
+            elif text == '👧 أنثى':
+                await handle_gender_update(update, context, 'أنثى')
+            elif text == '⬅️ رجوع':
+                USER_STATES.pop(user.id, None)
+                await update.message.reply_text("↩️ **تم الرجوع.**", reply_markup=await settings_keyboard(user.id))
+            return
+            
+        elif state == 'waiting_age_update':
+            await handle_age_update(update, context, text)
+            return
+            
+        elif state == 'waiting_country_update':
+            if text != '⬅️ رجوع':
+                await handle_country_update(update, context, text)
+            else:
+                USER_STATES.pop(user.id, None)
+                await update.message.reply_text("↩️ **تم الرجوع.**", reply_markup=await settings_keyboard(user.id))
+            return
+            
+        elif state.startswith('playing_guess_'):
+            await handle_guess_game(update, context, state, text)
+            return
+            
+        elif state.startswith('admin_'):
+            if text in ADMIN_BUTTONS:
+                # الضغط على زر آخر يلغي العملية الحالية بدل بثه أو توزيعه كنص
+                USER_STATES.pop(user.id, None)
+            elif await handle_admin_messages(update, context, text):
+                return
+
+    # معالجة الأزرار الرئيسية
+    if text == "🚀 بحث عشوائي":
+        await start_search(update, context)
+    elif text == "⚤ بحث بالجنس":
+        await gender_search_entry(update, context)
+    elif text == "🎩 حسابي":
+        await profile_menu(update, context)
+    elif text == "📄 ملفي الشخصي":
+        await show_profile(update, context)
+    elif text == "⚙️ إعدادات الملف":
+        await settings_menu(update, context)
+    elif text == "👫 الجنس" or text == "👫 الجنس (10 💰)":
+        await update_gender(update, context)
+    elif text == "🎂 العمر":
+        await update_age(update, context)
+    elif text == "📍 البلد":
+        await update_country(update, context)
+    elif text == "💰 كسب النقاط":
+        await earn_points_menu(update, context)
+    elif text == "📤 مشاركة الروابط":
+        await share_links(update, context)
+    elif text == "👥 إحالة أصدقاء":
+        await invite_friends(update, context)
+    elif text == "🎁 هدايا الأصدقاء":
+        await friends_gifts_menu(update, context)
+    elif text == "":
+        await reward_handler(update, context)
+    elif text == "🎮 الألعاب":
+        await games_menu(update, context)
+    elif text == "🎯 XO العشوائي":
+        await xo_game_random(update, context)
+    elif text == "  ":
+        await guess_number_game(update, context)
+    elif text == "🎰 لعبة الحظ":
+        await update.message.reply_text("🎰 **لعبة الحظ قريباً...**", reply_markup=games_keyboard())
+    elif text == "📊 إحصائيات":
+        await stats_menu(update, context)
+    elif text == "👥 المستخدمين":
+        await show_users_stats(update, context)
+    elif text == "🎯 النشاط":
+        await show_activity_stats(update, context)
+    elif text == "💰 النقاط":
+        await show_points_stats(update, context)
+    elif text == "⭐ النجوم":
+        await show_stars_stats(update, context)
+    elif text == "⭐ النجوم" and text != "⭐ النجوم":  # معالجة زر النجوم الرئيسي
+        await stars_menu_main(update, context)
+    elif text == "👑 VIP":
+        await vip_menu(update, context)
+    elif text == "🏆 المتصدرين":
+        await leaderboard(update, context)
+    elif text == "🛠️ لوحة المشرف":
+        await admin_opener_handler(update, context)
+    elif text == "⏹️ إيقاف البحث":
+        await stop_search(update, context)
+    elif text == "⬅️ الرئيسية":
+        await update.message.reply_text("🏠 **القائمة الرئيسية**", 
+                                      reply_markup=main_reply_keyboard(user.id in ADMIN_IDS))
+    elif text == "⬅️ رجوع":
+        await update.message.reply_text("↩️ **تم الرجوع.**", reply_markup=await settings_keyboard(user.id))
+    elif text == "👑 اشتراك VIP":
+        await vip_purchase_menu(update, context)
+    elif text == "⭐ VIP بالنجوم":
+        await vip_stars_menu_main(update, context)
+    elif text == "📞 تواصل مع المشرف":
+        await vip_contact_admin(update, context)
+    elif text in ['👦 ذكر', '👧 أنثى']:
+        if USER_STATES.get(user.id) == 'waiting_gender_update':
+            await handle_gender_update(update, context, 'ذكر' if 'ذكر' in text else 'أنثى')
+    elif text in ['نعم ✅', 'لا ❌'] and USER_STATES.get(user.id) == 'waiting_gender_confirm':
+        pass  # تمت المعالجة أعلاه
+    elif text == "⏹️ إنهاء المحادثة":
+        await stop_chat(update, context)
+    elif text == "⭐ إضافة صديق":
+        await add_friend(update, context)
+    elif text == "📋 قائمة الأصدقاء":
+        await friends_list(update, context)
+    elif text == "💌 إرسال نقاط":
+        await send_points_to_friend(update, context)
+    elif text == "⭐ التقييم" and user.id in active_chats:
+        await update.message.reply_text(
+            "⭐ **كيف تقيم تجربة الدردشة مع الشريك؟**",
+            reply_markup=rating_keyboard()
+        )
+        set_user_state(user.id, 'waiting_for_rating', notify=False)  # التقييم اختياري: لا داعي للتنبيه
+    elif text == "📊 الإحصائيات الكاملة":
+        await admin_stats_full(update, context)
+    elif text == "👥 المستخدمين المحظورين":
+        await admin_banned_users(update, context)
+    elif text == "💰 توزيع النقاط":
+        await admin_distribute_points(update, context)
+    elif text == "⭐ توزيع النجوم":
+        await admin_distribute_stars(update, context)
+    elif text == "📢 بث سريع":
+        await admin_broadcast(update, context)
+    elif text == "🔄 تحديث النظام":
+        await admin_update_system(update, context)
+    
+    # معالجة المحادثات النشطة
+    elif user.id in active_chats:
+        await handle_chat_message(update, context)
+    
+    else:
+        await update.message.reply_text(
+            "🤔 **لم أفهم طلبك.**\n"
+            "استخدم الأزرار للتفاعل مع البوت 🎮", 
+            reply_markup=main_reply_keyboard(user.id in ADMIN_IDS)
+        )
+'''
@@ -0,0 +1,69 @@
+import asyncio
+import threading
+
+import pytest
+
+import database
+from async_database import AsyncDatabase, LOCKED_READS, MEMORY_READS
+from metrics import registry
+
+@pytest.fixture
+def adb(open_db):
+    db = open_db()
+    db.create_user({"user_id": 1})
+    db.create_user({"user_id": 2})
+    db.create_conversation(1, 2)
+    wrapper = AsyncDatabase(db)
+    yield wrapper
+    wrapper.executor.shutdown(wait=True)
+
+def counter(name: str) -> int:
+    return registry.counters.get(name, 0)
+
+def test_locked_reads_are_memory_reads():
+    assert LOCKED_READS <= MEMORY_READS
+
+def test_free_lock_reads_stay_on_the_loop(adb):
+    async def read():
+        return await adb.get_stats(), await adb.get_conversation(1), await adb.get_user(1)
+
+    inline, deferred = counter("db_inline_reads"), counter("db_inline_reads_deferred")
+    stats, conv, user = asyncio.run(read())
+    assert stats["total_users"] == 2 and conv["user_a"] == 1 and user["user_id"] == 1
+    assert counter("db_inline_reads") - inline == 3
+    assert counter("db_inline_reads_deferred") == deferred
+
+def test_reads_do_not_block_the_loop_while_a_flush_serializes(adb, monkeypatch):
+    """_save_data يحجز القفل أثناء build_shards: القراءة تنتقل للمنفذ والحلقة تستمر"""
+    serializing, release = threading.Event(), threading.Event()
+    build_shards = database.build_shards
+
+    def slow_build_shards(*args, **kwargs):
+        serializing.set()
+        release.wait(5)
+        return build_shards(*args, **kwargs)
+
+    monkeypatch.setattr(database, "build_shards", slow_build_shards)
+    flush = threading.Thread(target=adb.sync.flush)
+    flush.start()
+    assert serializing.wait(5)
+
+    async def run():
+        ticks = 0
+        stats = asyncio.ensure_future(adb.get_stats())
+        conv = asyncio.ensure_future(adb.get_conversation(1))
+        user = await adb.get_user(2)  # لا تأخذ القفل: تبقى في الحلقة
+        for _ in range(20):
+            await asyncio.sleep(0.005)
+            ticks += 1
+        assert not stats.done() and not conv.done()
+        release.set()
+        return ticks, user, await stats, await conv
+
+    deferred = counter("db_inline_reads_deferred")
+    ticks, user, stats, conv = asyncio.run(run())
+    flush.join(5)
+    assert ticks == 20
+    assert user["user_id"] == 2
+    assert stats["total_users"] == 2 and conv["id"] == 1
+    assert counter("db_inline_reads_deferred") - deferred == 2
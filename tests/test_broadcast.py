@@ -0,0 +1,123 @@
+import asyncio
+import json
+import types
+
+import pytest
+from telegram.error import BadRequest, Forbidden
+
+from async_database import AsyncDatabase
+from broadcast import BroadcastJob, BroadcastManager
+
+class FakeBot:
+    """يسجل المستلمين، ويرفع لكل مستخدم الخطأ المحدد له في errors"""
+
+    def __init__(self, errors=None, pause_at=None):
+        self.errors = errors or {}
+        self.received = []
+        self.edits = []
+        self.pause_at = pause_at  # يتوقف الإرسال عند هذا المستخدم حتى يُلغى البث
+        self.paused = asyncio.Event()
+
+    async def send_message(self, chat_id, text, rate_limit_args=None):
+        if chat_id == self.pause_at:
+            self.paused.set()
+            await asyncio.Event().wait()
+        if chat_id in self.errors:
+            raise self.errors[chat_id]
+        self.received.append(chat_id)
+        return types.SimpleNamespace(message_id=len(self.received))
+
+    async def edit_message_text(self, chat_id, message_id, text):
+        self.edits.append(text)
+
+@pytest.fixture
+def adb(open_db):
+    db = open_db()
+    for user_id in range(1, 11):
+        db.create_user({"user_id": user_id})
+    wrapper = AsyncDatabase(db)
+    yield wrapper
+    wrapper.executor.shutdown(wait=True)
+
+@pytest.fixture
+def checkpoint(tmp_path):
+    return str(tmp_path / "broadcast_checkpoint.json")
+
+def manager_for(adb, checkpoint):
+    return BroadcastManager(adb, checkpoint, concurrency=3, page_size=4, progress_interval=3600)
+
+def test_broadcast_reaches_everyone_and_counts_failures(adb, checkpoint):
+    manager = manager_for(adb, checkpoint)
+    bot = FakeBot({3: Forbidden("blocked"), 4: BadRequest("chat not found"), 5: RuntimeError("bug")})
+
+    async def run():
+        assert await manager.start(bot, "hello", admin_chat_id=99)
+        await manager.task
+
+    asyncio.run(run())
+    job = manager.job
+    # 99 هو رسالة التقدم للمشرف
+    assert sorted(bot.received) == [1, 2, 6, 7, 8, 9, 10, 99]
+    assert (job.total, job.sent, job.blocked, job.failed, job.finished) == (10, 7, 1, 2, True)
+    assert adb.sync.get_user(3)["blocked_bot"] > 0
+    assert adb.sync.get_user(5).get("blocked_bot", 0) == 0
+    assert job.cursor == 10 and job.page_done == []
+    assert not manager.is_running
+    assert bot.edits and "تم الانتهاء" in bot.edits[-1]
+
+def test_finished_broadcast_clears_the_checkpoint(adb, checkpoint, tmp_path):
+    manager = manager_for(adb, checkpoint)
+
+    async def run():
+        await manager.start(FakeBot(), "hello", admin_chat_id=99)
+        await manager.task
+
+    asyncio.run(run())
+    assert not tmp_path.joinpath("broadcast_checkpoint.json").exists()
+    assert not manager.resume(FakeBot())
+
+def test_stopped_broadcast_resumes_where_it_left_off(adb, checkpoint):
+    first_bot = FakeBot(pause_at=7)
+    manager = manager_for(adb, checkpoint)
+
+    async def stop_midway():
+        await manager.start(first_bot, "hello", admin_chat_id=99)
+        await first_bot.paused.wait()
+        await asyncio.sleep(0)
+        await manager.stop()
+
+    asyncio.run(stop_midway())
+    with open(checkpoint, encoding="utf-8") as f:
+        saved = BroadcastJob(**json.load(f))
+    # الصفحة الأولى [1..4] اكتملت، ومن الثانية [5..8] وصل الكل إلا 7 الذي توقف عنده الإرسال
+    assert saved.cursor == 4
+    assert sorted(saved.page_done) == [5, 6, 8]
+    assert not saved.finished
+
+    second_bot = FakeBot()
+    resumed = manager_for(adb, checkpoint)
+
+    async def resume():
+        assert resumed.resume(second_bot)
+        await resumed.task
+
+    asyncio.run(resume())
+    delivered = [user_id for user_id in first_bot.received if user_id != 99] + second_bot.received
+    assert sorted(delivered) == list(range(1, 11))  # كل مستخدم مرة واحدة
+    assert second_bot.received[0] == 7
+    assert (resumed.job.sent, resumed.job.finished) == (10, True)
+
+def test_resume_skips_users_already_done_in_the_page(adb, checkpoint):
+    job = BroadcastJob(text="hello", admin_chat_id=99, cursor=4, page_done=[5, 7], total=10, sent=6)
+    with open(checkpoint, "w", encoding="utf-8") as f:
+        json.dump(job.__dict__, f)
+    bot = FakeBot()
+    manager = manager_for(adb, checkpoint)
+
+    async def run():
+        assert manager.resume(bot)
+        await manager.task
+
+    asyncio.run(run())
+    assert sorted(bot.received) == [6, 8, 9, 10]
+    assert manager.job.sent == 10
@@ -0,0 +1,90 @@
+import os
+import random
+import asyncio
+
+import pytest
+
+from content_filter import Automaton, ContentFilter, normalize_text, substitute
+
+LETTERS = "ابتثجحخدذرزسشصضطظعغفقكلمنهوي"
+
+def naive(terms, text):
+    """المرجع: الحلقة القديمة (bad in text) على النص والكلمات بعد التوحيد"""
+    normalized = normalize_text(text)
+    return {term for term in terms if term in normalized}
+
+@pytest.mark.parametrize("seed", range(5))
+def test_scan_matches_the_naive_loop(seed):
+    rng = random.Random(seed)
+    terms = sorted({normalize_text("".join(rng.choice(LETTERS[:8]) for _ in range(rng.randint(1, 5))))
+                    for _ in range(300)})
+    automaton = Automaton(terms)
+    for _ in range(200):
+        text = "".join(rng.choice(LETTERS[:8] + " ") for _ in range(rng.randint(0, 40)))
+        found = {automaton.terms[term_id] for term_id in automaton.scan(substitute(text))}
+        assert found == naive(terms, text), text
+
+def test_scan_reports_overlapping_and_nested_terms():
+    automaton = Automaton(["he", "she", "his", "hers"])
+    found = [automaton.terms[term_id] for term_id in automaton.scan("ushers")]
+    assert sorted(found) == ["he", "hers", "she"]
+
+@pytest.mark.parametrize("text", [
+    "زَانِي",  # تشكيل
+    "زانـــي",  # تطويل
+    "ز\u200bاني",  # محرف غير مرئي
+    "زاااااني",  # حروف مكررة
+    "زاني!!",
+])
+def test_normalized_variants_are_caught(text):
+    assert ContentFilter(["زاني"]).find(text) == ["زاني"]
+
+@pytest.mark.parametrize("term, text", [
+    ("أحمق", "احمق"),  # أشكال الألف
+    ("احمق", "إحمق"),
+    ("احمق", "آحمق"),
+    ("عاهرة", "عاهره"),  # التاء المربوطة
+    ("زاني", "زانى"),  # الألف المقصورة
+    ("سكس", "سكككس"),
+    ("SEX", "sex"),
+])
+def test_term_and_text_are_normalized_the_same_way(term, text):
+    assert ContentFilter([term]).find(f"يا {text} اليوم") == [term]
+
+def test_repeated_latin_letters_are_not_collapsed():
+    assert ContentFilter(["bok"]).find("book") == []
+
+def test_each_term_is_reported_once_in_order():
+    content_filter = ContentFilter(["قحبة", "زاني"])
+    assert content_filter.find("زاني قحبه زاني") == ["زاني", "قحبة"]
+
+def test_reload_from_file(tmp_path):
+    path = tmp_path / "words.txt"
+    path.write_text("# تعليق\nخنزير\n", encoding="utf-8")
+    content_filter = ContentFilter(["زاني"], path=str(path))
+    assert content_filter.find("خنزير زاني") == ["خنزير", "زاني"]
+
+    path.write_text("فحش\n", encoding="utf-8")
+    content_filter.reload()
+    assert content_filter.find("خنزير فحش") == ["فحش"]
+    assert len(content_filter) == 2
+
+def test_file_changes_are_picked_up_while_running(tmp_path):
+    path = tmp_path / "words.txt"
+    path.write_text("خنزير\n", encoding="utf-8")
+    content_filter = ContentFilter(path=str(path), interval=0.01)
+
+    async def main():
+        content_filter.start()
+        path.write_text("فحش\n", encoding="utf-8")
+        mtime = os.path.getmtime(path) + 5
+        os.utime(path, (mtime, mtime))
+        for _ in range(200):
+            if content_filter.find("فحش"):
+                break
+            await asyncio.sleep(0.01)
+        content_filter.stop()
+
+    asyncio.run(main())
+    assert content_filter.find("خنزير فحش") == ["فحش"]
+    assert content_filter.get_stats()["reloads"] == 2
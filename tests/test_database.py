@@ -0,0 +1,194 @@
+import os
+import random
+import threading
+
+import pytest
+
+from sharded_storage import user_shard, user_bucket
+from tests.conftest import crash, journal_segments
+
+def test_replayed_writes_reach_their_shards(tmp_path, storage, open_db):
+    db = open_db()
+    db.create_user({"user_id": 42})
+    assert db.flush()
+    shard = user_shard(user_bucket(42))
+    assert storage.shard(shard)["42"]["points"] == 50
+
+    db.add_points(42, 100)
+    crash(db)
+
+    recovered = open_db()
+    assert recovered.get_user(42)["points"] == 150
+    assert shard in recovered.dirty_shards
+    assert recovered.flush()
+    assert storage.shard(shard)["42"]["points"] == 150
+    # السجل حُذف فقط بعد أن أصبحت التعديلات في GitHub
+    remaining = [path for path in journal_segments(tmp_path) if not path.endswith(f"{recovered.journal.segment:06d}")]
+    assert remaining == []
+
+def test_replayed_batch_and_bulk_records_mark_every_shard(storage, open_db):
+    db = open_db()
+    for user_id in (1, 2, 3):
+        db.create_user({"user_id": user_id})
+    assert db.flush()
+
+    assert db.transfer_points(1, 2, 10, "gift").ok  # سطر batch
+    assert db.bulk_add_points(7, [1, 3]) == 2  # سطر bulk_update
+    crash(db)
+
+    recovered = open_db()
+    assert recovered.flush()
+    points = {user_id: storage.shard(user_shard(user_bucket(user_id)))[str(user_id)]["points"]
+              for user_id in (1, 2, 3)}
+    assert points == {1: 47, 2: 60, 3: 57}
+    assert storage.shard("transfers.json")[-1]["amount"] == 10
+
+def test_failed_first_load_never_overwrites_github(tmp_path, storage, open_db):
+    db = open_db()
+    db.create_user({"user_id": 42})
+    assert db.flush()
+    db.add_points(42, 100)
+    crash(db)
+    saves = len(storage.saves)
+
+    storage.fail_loads = 1
+    recovered = open_db()
+    assert recovered.placeholder
+    # المستخدم يبدو جديداً فوق الهيكل المؤقت: لا يُسجل ولا يُرفع ولا يُحذف السجل
+    assert recovered.create_user({"user_id": 42})["points"] == 50
+    assert not recovered.dirty
+    assert recovered.flush()
+    assert len(storage.saves) == saves
+    assert storage.shard(user_shard(user_bucket(42)))["42"]["points"] == 50
+    assert len(journal_segments(tmp_path)) > 1
+
+    recovered.last_sync = 0  # انتهت مهلة إعادة المحاولة
+    assert recovered.get_user(42)["points"] == 150
+    assert not recovered.placeholder
+    assert recovered.flush()
+    assert storage.shard(user_shard(user_bucket(42)))["42"]["points"] == 150
+
+def test_placeholder_waits_before_retrying(storage, open_db):
+    storage.fail_loads = 2
+    db = open_db()
+    assert db.placeholder and db.get_user(1) is None
+    assert storage.fail_loads == 1  # القراءة خُدمت من الهيكل المؤقت دون طلب جديد
+    db.last_sync = 0
+    assert db.get_user(1) is None and db.placeholder
+    db.last_sync = 0
+    db.get_user(1)
+    assert not db.placeholder
+
+def test_transfer_moves_points_and_logs_the_transfer(open_db):
+    db = open_db()
+    for user_id in (1, 2):
+        db.create_user({"user_id": user_id})
+
+    result = db.transfer_points(1, 2, 30, "gift")
+    assert result.ok and result.amount == 30
+    assert (result.from_balance, result.to_balance) == (20, 80)
+    assert db.get_user(1)["points"] == 20
+    assert db.get_user(2)["points"] == 80
+    assert db.get_user(2)["level"] == 1
+    transfer = db.cache["transfers"][-1]
+    assert transfer["id"] == result.transfer_id
+    assert (transfer["from_id"], transfer["to_id"], transfer["amount"], transfer["reason"]) == (1, 2, 30, "gift")
+
+    assert db.transfer_points(2, 1, 50, "gift").ok
+    assert db.get_user(2)["level"] == 1 and db.get_user(1)["points"] == 70
+
+@pytest.mark.parametrize("from_id,to_id,amount,error", [
+    (1, 2, 0, "invalid_amount"),
+    (1, 2, -5, "invalid_amount"),
+    (1, 1, 10, "same_user"),
+    (1, 99, 10, "unknown_user"),
+    (1, 2, 51, "insufficient_funds")
+])
+def test_rejected_transfers_change_nothing(open_db, from_id, to_id, amount, error):
+    db = open_db()
+    for user_id in (1, 2):
+        db.create_user({"user_id": user_id})
+    seq = db.journal.seq
+
+    result = db.transfer_points(from_id, to_id, amount, "gift")
+    assert not result.ok and result.error == error
+    assert [db.get_user(user_id)["points"] for user_id in (1, 2)] == [50, 50]
+    assert db.cache["transfers"] == []
+    assert db.journal.seq == seq
+
+def test_partial_transfer_takes_what_is_left(open_db):
+    db = open_db()
+    for user_id in (1, 2):
+        db.create_user({"user_id": user_id})
+
+    result = db.transfer_points(1, 2, 80, "xo_win:1", allow_partial=True)
+    assert result.ok and result.amount == 50
+    assert (db.get_user(1)["points"], db.get_user(2)["points"]) == (0, 100)
+    assert db.get_user(2)["level"] == 2
+
+    empty = db.transfer_points(1, 2, 10, "xo_win:2", allow_partial=True)
+    assert not empty.ok and empty.error == "insufficient_funds"
+
+def test_transfer_is_one_journal_record(open_db):
+    """الخصم والإضافة والسجل تُسترجع معاً أو لا يُسترجع أي منها"""
+    db = open_db()
+    for user_id in (1, 2):
+        db.create_user({"user_id": user_id})
+    assert db.flush()
+
+    seq = db.journal.seq
+    assert db.transfer_points(1, 2, 20, "gift").ok
+    assert db.journal.seq == seq + 1
+    crash(db)
+    recovered = open_db()
+    assert (recovered.get_user(1)["points"], recovered.get_user(2)["points"]) == (30, 70)
+    assert len(recovered.cache["transfers"]) == 1
+    assert recovered.flush()
+    recovered.close()
+
+    # السطر الأخير مقطوع (توقف أثناء الكتابة): لا خصم بلا إضافة
+    db = open_db()
+    assert db.transfer_points(1, 2, 20, "gift").ok
+    crash(db)
+    path = db.journal._segment_path(db.journal.segment)
+    with open(path, "rb+") as f:
+        f.truncate(os.path.getsize(path) - 10)
+    recovered = open_db()
+    assert (recovered.get_user(1)["points"], recovered.get_user(2)["points"]) == (30, 70)
+    assert len(recovered.cache["transfers"]) == 1
+
+def test_concurrent_transfers_keep_the_total(open_db):
+    db = open_db()
+    user_ids = list(range(1, 9))
+    for user_id in user_ids:
+        db.create_user({"user_id": user_id})
+
+    def worker(seed):
+        rng = random.Random(seed)
+        for _ in range(300):
+            from_id, to_id = rng.sample(user_ids, 2)
+            db.transfer_points(from_id, to_id, rng.randrange(1, 40), "gift", allow_partial=rng.random() < 0.3)
+
+    threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    balances = [db.get_user(user_id)["points"] for user_id in user_ids]
+    assert sum(balances) == 50 * len(user_ids)
+    assert min(balances) >= 0
+    sent = {user_id: 0 for user_id in user_ids}
+    for transfer in db.cache["transfers"]:
+        sent[transfer["from_id"]] -= transfer["amount"]
+        sent[transfer["to_id"]] += transfer["amount"]
+    assert balances == [50 + sent[user_id] for user_id in user_ids]
+
+def test_peek_user_never_loads(open_db, monkeypatch):
+    db = open_db()
+    db.create_user({"user_id": 5})
+    db.last_sync = 0  # الكاش قديم: get_user كانت ستحمل من GitHub
+    db.dirty = False
+    monkeypatch.setattr(db, "_load_data", lambda: pytest.fail("peek_user must not load"))
+    assert db.peek_user(5)["user_id"] == 5
+    assert db.peek_user(6) is None
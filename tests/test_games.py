@@ -0,0 +1,188 @@
+import json
+import asyncio
+
+import pytest
+
+from games import GameManager, XOMatch, XOGame, WIN_MASKS, CELL_WIN_MASKS, EMPTY_CELL, X_SYMBOL, O_SYMBOL
+from timer_wheel import TimerWheel
+
+def test_finished_xo_game_is_deleted_by_the_timer_wheel():
+    timers = TimerWheel(resolution=1.0)
+    manager = GameManager(None, timers)
+    game = manager.create_xo_game(1, 2)
+    manager.finish_xo_game(game.game_id, delay=10)
+    assert manager.get_xo_game(game.game_id) is game  # تبقى لإعادة اللعب
+
+    timers.advance(timers.current_tick * timers.resolution + 11)
+    assert manager.get_xo_game(game.game_id) is None
+
+def test_restart_cancels_the_pending_delete():
+    timers = TimerWheel(resolution=1.0)
+    manager = GameManager(None, timers, max_age=3600)
+    game = manager.create_xo_game(1, 2)
+    manager.finish_xo_game(game.game_id, delay=10)
+    manager.restart_xo_game(game)
+
+    timers.advance(timers.current_tick * timers.resolution + 11)
+    assert manager.get_xo_game(game.game_id) is game
+
+async def started(coroutine):
+    """بدء البحث كمهمة والانتظار حتى يدخل قائمة المنتظرين"""
+    task = asyncio.ensure_future(coroutine)
+    await asyncio.sleep(0)
+    return task
+
+def test_xo_search_pairs_the_next_player_with_the_waiter():
+    manager = GameManager(None)
+
+    async def run():
+        first = await started(manager.search_xo_opponent(1))
+        assert list(manager.xo_waiters) == [1]
+        assert await manager.search_xo_opponent(2) == XOMatch(1, initiator=True)
+        assert await first == XOMatch(2, initiator=False)
+        assert not manager.xo_waiters
+
+        third = await started(manager.search_xo_opponent(3))
+        manager.cancel_xo_search(3)
+        return await third
+
+    assert asyncio.run(run()) is None
+    assert not manager.xo_waiters
+
+def test_xo_search_times_out_with_the_call_later_timer():
+    manager = GameManager(None)
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        began = loop.time()
+        result = await manager.search_xo_opponent(1, max_wait=0.05)
+        return result, loop.time() - began
+
+    result, waited = asyncio.run(run())
+    assert result is None and 0.04 <= waited < 1
+    assert not manager.xo_waiters
+
+def test_searching_again_cancels_the_previous_search():
+    manager = GameManager(None)
+
+    async def run():
+        old = await started(manager.search_xo_opponent(1))
+        new = await started(manager.search_xo_opponent(1))
+        assert await old is None
+        assert list(manager.xo_waiters) == [1]
+        assert await manager.search_xo_opponent(2) == XOMatch(1, initiator=True)
+        return await new
+
+    assert asyncio.run(run()) == XOMatch(2, initiator=False)
+
+def test_cancelled_search_task_leaves_no_waiter():
+    manager = GameManager(None)
+
+    async def run():
+        task = await started(manager.search_xo_opponent(1))
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert not manager.xo_waiters
+        # اللاعب التالي ينتظر بدل مطابقته مع بحث ميت
+        return await manager.search_xo_opponent(2, max_wait=0.01)
+
+    assert asyncio.run(run()) is None
+    assert not manager.xo_waiters
+
+def naive_winner(board):
+    """فحص الفوز القديم على قائمة الرموز"""
+    lines = [(0, 1, 2), (3, 4, 5), (6, 7, 8), (0, 3, 6), (1, 4, 7), (2, 5, 8), (0, 4, 8), (2, 4, 6)]
+    for a, b, c in lines:
+        if board[a] != EMPTY_CELL and board[a] == board[b] == board[c]:
+            return board[a]
+    return None
+
+def test_every_xo_game_matches_the_naive_referee():
+    """كل الأوضاع الممكنة: الفوز والتعادل والدور كما في فحص القائمة"""
+    game = XOGame(1, 10, 20)
+    seen = set()
+    endings = {"فوز": 0, "تعادل": 0}
+
+    def explore():
+        for position in range(9):
+            saved = (game.x_bits, game.o_bits, game.current_player)
+            board = game.board
+            if board[position] != EMPTY_CELL:
+                assert game.make_move(game.current_player, position)[0] is False
+                continue
+            player = game.current_player
+            ok, result, winner = game.make_move(player, position)
+            assert ok
+            board[position] = game.symbols[player]
+            assert game.board == board
+            expected = naive_winner(board)
+            if expected is not None:
+                assert (result, winner, game.status) == ("فوز", player, "finished")
+                assert game.check_win(expected) and expected == game.symbols[player]
+            elif EMPTY_CELL not in board:
+                assert (result, winner, game.status) == ("تعادل", None, "finished")
+            else:
+                assert result == "استمرار" and game.current_player != player
+            position_key = (game.x_bits, game.o_bits)
+            if position_key not in seen:
+                seen.add(position_key)
+                if result == "استمرار":
+                    explore()
+                else:
+                    endings[result] += 1
+            game.x_bits, game.o_bits, game.current_player = saved
+            game.status, game.winner = "active", None
+            game.move_history.pop()
+
+    explore()
+    # 5478 وضعاً قانونياً بما فيها اللوحة الفارغة، منها 958 نهاية فوز أو تعادل
+    assert len(seen) == 5477
+    assert endings == {"فوز": 942, "تعادل": 16}
+
+def test_win_masks():
+    assert len(WIN_MASKS) == 8 and all(bin(mask).count("1") == 3 for mask in WIN_MASKS)
+    for position in range(9):
+        assert set(CELL_WIN_MASKS[position]) == {mask for mask in WIN_MASKS if mask >> position & 1}
+    assert [len(masks) for masks in CELL_WIN_MASKS] == [3, 2, 3, 2, 4, 2, 3, 2, 3]
+
+def test_rejected_moves_leave_the_board_alone():
+    game = XOGame(1, 10, 20)
+    assert game.make_move(20, 0)[1] == "ليس دورك للعب"
+    assert game.make_move(10, 9)[1] == "موقع غير صالح"
+    assert game.make_move(10, 4)[0]
+    assert game.make_move(20, 4)[1] == "هذه الخانة محجوزة"
+    assert (game.x_bits, game.o_bits, game.current_player) == (1 << 4, 0, 20)
+
+    waiting = XOGame(2, 10)
+    assert waiting.make_move(10, 0)[1] == "اللعبة غير نشطة"
+    assert waiting.join(20) and not waiting.join(30)
+    assert waiting.make_move(10, 0)[0]
+
+def test_xo_game_survives_a_json_round_trip():
+    game = XOGame(7, 10, 20, is_random=True)
+    for player, position in ((10, 0), (20, 4), (10, 8)):
+        game.make_move(player, position)
+    game.message_ids = {10: 111, 20: 222}
+    text = game.get_board_display()
+    assert game.needs_edit(10, text, game.keyboard(10)) and not game.needs_edit(10, text, game.keyboard(10))
+
+    restored = XOGame.from_dict(json.loads(json.dumps(game.to_dict())))
+    assert json.dumps(restored.to_dict()) == json.dumps(game.to_dict())
+    assert restored.edits_saved == 1
+    # اللوحة المعروضة محفوظة: نفس العرض لا يُعدل بعد الاستعادة، والتغيير يُعدل
+    assert not restored.needs_edit(10, text, restored.keyboard(10))
+    assert restored.needs_edit(20, text, restored.keyboard(20))
+    assert restored.board == game.board
+    assert restored.symbols == {10: X_SYMBOL, 20: O_SYMBOL}
+    assert restored.make_move(20, 2) == (True, "استمرار", None)
+    assert restored.make_move(10, 1)[0] and restored.make_move(20, 6) == (True, "فوز", 20)
+
+def test_restart_clears_the_board():
+    game = XOGame(1, 10, 20)
+    for player, position in ((10, 0), (20, 3), (10, 1), (20, 4), (10, 2)):
+        game.make_move(player, position)
+    assert game.status == "finished" and game.winner == 10
+    game.restart()
+    assert (game.x_bits, game.o_bits, game.status, game.winner, game.current_player) == (0, 0, "active", None, 10)
+    assert game.board == [EMPTY_CELL] * 9
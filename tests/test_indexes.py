@@ -0,0 +1,99 @@
+import random
+
+from indexes import DatabaseIndexes, RANKED_FIELDS
+
+def index_state(indexes: DatabaseIndexes) -> dict:
+    """محتوى الفهارس بصيغة قابلة للمقارنة (ترتيب المتساوين في الدرجة لا يهم)"""
+    return {
+        "conversation_pos": dict(indexes.conversation_pos),
+        "active_by_pair": dict(indexes.active_by_pair),
+        "active_by_user": dict(indexes.active_by_user),
+        "messages": {conv_id: [message["id"] for message in messages]
+                     for conv_id, messages in indexes.messages_by_conv.items() if messages},
+        "reports": {target_id: [report["id"] for report in reports]
+                    for target_id, reports in indexes.reports_by_target.items() if reports},
+        "user_ids": list(indexes.user_ids),
+        "rankings": {
+            field: (
+                dict(ranking.scores),
+                {user_key: ranking.rank(user_key) for user_key in ranking.scores},
+                [ranking.scores[user_key] for user_key in ranking.top(len(ranking))],
+                list(ranking.tree)
+            )
+            for field, ranking in indexes.rankings.items()
+        }
+    }
+
+def assert_matches_rebuild(db):
+    rebuilt = DatabaseIndexes()
+    rebuilt.rebuild(db.cache)
+    assert index_state(db.indexes) == index_state(rebuilt)
+
+def run_workload(db, rng: random.Random, steps: int):
+    """عمليات عشوائية على قاعدة البيانات كما يستدعيها البوت"""
+    user_ids = []
+    active = {}  # conv_id -> (user_a, user_b)
+    chatting = set()
+    for step in range(steps):
+        action = rng.random()
+        if action < 0.15 or len(user_ids) < 4:
+            user_id = rng.randrange(1, 10 ** 6)
+            # بعض المستخدمين قدامى بنقاط قليلة ليحذفهم optimize_database
+            join_ts = 1 if rng.random() < 0.2 else None
+            db.create_user({"user_id": user_id, **({"join_ts": join_ts} if join_ts else {})})
+            user_ids.append(user_id)
+        elif action < 0.3:
+            db.add_points(rng.choice(user_ids), rng.choice([-60, 5, 50, 2000, 10 ** 7]))
+        elif action < 0.35:
+            db.consume_points(rng.choice(user_ids), rng.randrange(1, 100))
+        elif action < 0.42:
+            db.transfer_points(rng.choice(user_ids), rng.choice(user_ids), rng.randrange(1, 80), "gift",
+                               allow_partial=rng.random() < 0.5)
+        elif action < 0.46:
+            db.bulk_add_points(rng.randrange(1, 30), rng.sample(user_ids, min(len(user_ids), 5)))
+        elif action < 0.5:
+            db.add_stars(rng.choice(user_ids), rng.randrange(1, 500))
+        elif action < 0.62:
+            # البوت لا يفتح محادثة لمستخدم لديه محادثة نشطة
+            idle = [user_id for user_id in user_ids if user_id not in chatting]
+            if len(idle) >= 2:
+                user_a, user_b = rng.sample(idle, 2)
+                active[db.create_conversation(user_a, user_b)] = (user_a, user_b)
+                chatting.update((user_a, user_b))
+        elif action < 0.72 and active:
+            conv_id = rng.choice(list(active))
+            chatting.difference_update(active.pop(conv_id))
+            db.close_conversation(conv_id)
+        elif action < 0.88:
+            conv_id = rng.randrange(1, len(db.cache["conversations"]) + 2)
+            db.add_message(conv_id, rng.choice(user_ids), f"msg {step}")
+        elif action < 0.96:
+            db.add_report(rng.choice(user_ids), rng.choice(user_ids), "spam")
+        elif action < 0.98:
+            db.ban_user(rng.choice(user_ids), 2 * 10 ** 9)
+        else:
+            db.optimize_database()
+            user_ids = [user_id for user_id in user_ids if str(user_id) in db.cache["users"]]
+            for user_id in list(chatting):
+                if str(user_id) not in db.cache["users"]:
+                    chatting.discard(user_id)
+
+def test_incremental_indexes_match_a_full_rebuild(open_db):
+    db = open_db()
+    rng = random.Random(5)
+    for _ in range(20):
+        run_workload(db, rng, 50)
+        assert_matches_rebuild(db)
+
+def test_indexes_after_reload_match_the_live_ones(open_db):
+    db = open_db()
+    run_workload(db, random.Random(7), 300)
+    live = index_state(db.indexes)
+    db.close()
+    assert index_state(open_db().indexes) == live
+
+def test_rankings_cover_every_user(open_db):
+    db = open_db()
+    run_workload(db, random.Random(11), 300)
+    for field in RANKED_FIELDS:
+        assert set(db.indexes.rankings[field].scores) == set(db.cache["users"])
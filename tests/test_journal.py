@@ -0,0 +1,127 @@
+import glob
+
+import pytest
+
+from journal import Journal, apply_record
+from sharded_storage import user_shard, user_bucket
+from tests.conftest import crash, journal_segments
+
+@pytest.fixture
+def journal_path(tmp_path):
+    return str(tmp_path / "test.journal")
+
+def journal_segments_at(path):
+    return sorted(glob.glob(f"{path}.*"))
+
+def reopen(journal: Journal, path: str) -> Journal:
+    journal.close()
+    return Journal(path)
+
+def test_records_replay_in_order_after_restart(journal_path):
+    journal = Journal(journal_path)
+    journal.append("set", ["users", "1", "name"], "a")
+    journal.append("incr", ["users", "1", "points"], 5)
+    journal.append("del", ["users", "2"])
+    journal = reopen(journal, journal_path)
+
+    records = list(journal.replay())
+    assert [(r["seq"], r["op"]) for r in records] == [(1, "set"), (2, "incr"), (3, "del")]
+    assert records[0]["value"] == "a" and records[1]["delta"] == 5 and "value" not in records[2]
+    assert journal.append("set", ["x"], 1) == 4  # الترقيم يكمل بعد الاسترجاع
+    journal.close()
+
+def test_replay_filters_by_sequence_and_skips_the_open_segment(journal_path):
+    journal = Journal(journal_path)
+    for value in range(5):
+        journal.append("set", ["k"], value)
+    journal = reopen(journal, journal_path)
+    journal.append("set", ["k"], 99)  # في المقطع المفتوح: ليس جزءاً مما يُسترجع
+
+    assert [r["value"] for r in journal.replay(after_seq=3)] == [3, 4]
+    journal.close()
+
+def test_torn_last_line_is_skipped(journal_path):
+    journal = Journal(journal_path)
+    journal.append("set", ["k"], 1)
+    journal.sync()
+    with open(journal._segment_path(journal.segment), "ab") as f:
+        f.write(b'{"seq":2,"op":"set","ke')
+    journal = reopen(journal, journal_path)
+
+    assert [r["seq"] for r in journal.replay()] == [1]
+    journal.close()
+
+def test_discard_removes_only_sealed_segments(journal_path):
+    journal = Journal(journal_path)
+    journal.append("set", ["k"], 1)
+    sealed = journal.rotate()
+    journal.append("set", ["k"], 2)
+    assert len(journal_segments_at(journal_path)) == 2
+
+    journal.discard(sealed)
+    assert journal_segments_at(journal_path) == [journal._segment_path(journal.segment)]
+    journal.close()
+
+@pytest.mark.parametrize("op, key, value, expected", [
+    ("set", ["users", "1", "name"], "b", {"users": {"1": {"name": "b", "points": 5, "tags": ["x"]}}}),
+    ("incr", ["users", "1", "points"], 3, {"users": {"1": {"name": "a", "points": 8, "tags": ["x"]}}}),
+    ("incr", ["users", "1", "stars"], 2, {"users": {"1": {"name": "a", "points": 5, "tags": ["x"], "stars": 2}}}),
+    ("append", ["users", "1", "tags"], "y", {"users": {"1": {"name": "a", "points": 5, "tags": ["x", "y"]}}}),
+    ("del", ["users", "1", "tags", 0], None, {"users": {"1": {"name": "a", "points": 5, "tags": []}}}),
+    ("del", ["users", "1"], None, {"users": {}}),
+    ("batch", [], [["incr", ["users", "1", "points"], -5], ["set", ["users", "1", "name"], "c"]],
+     {"users": {"1": {"name": "c", "points": 0, "tags": ["x"]}}}),
+    ("bulk_update", ["users"], {"keys": ["1", "9"], "incr": {"points": 10}, "set": {"1": {"vip": True}}},
+     {"users": {"1": {"name": "a", "points": 15, "tags": ["x"], "vip": True}}}),
+])
+def test_apply_record(op, key, value, expected):
+    data = {"users": {"1": {"name": "a", "points": 5, "tags": ["x"]}}}
+    apply_record(data, op, key, value)
+    assert data == expected
+
+def test_apply_record_rejects_unknown_ops():
+    with pytest.raises(ValueError):
+        apply_record({"k": {}}, "rename", ["k", "a"], "b")
+
+# --- الضغط داخل اللقطة (GitHubDatabase) ---
+def test_flush_compacts_the_journal(tmp_path, storage, open_db):
+    db = open_db()
+    db.create_user({"user_id": 7})
+    db.add_points(7, 10)
+    assert db.flush()
+
+    assert journal_segments(tmp_path) == [db.journal._segment_path(db.journal.segment)]
+    assert storage.shard("system.json")["journal_seq"] == db.journal.seq
+    crash(db)
+
+    recovered = open_db()
+    assert recovered.get_user(7)["points"] == 60
+    assert recovered.pending_mutations == 0
+
+def test_failed_upload_keeps_the_journal(storage, open_db):
+    db = open_db()
+    db.create_user({"user_id": 7})
+    assert db.flush()
+
+    storage.fail_saves = True
+    db.add_points(7, 10)
+    assert not db.flush()
+    crash(db)
+
+    storage.fail_saves = False
+    recovered = open_db()
+    assert recovered.get_user(7)["points"] == 60
+    assert recovered.flush()
+    assert storage.shard(user_shard(user_bucket(7)))["7"]["points"] == 60
+
+def test_records_already_in_the_snapshot_are_not_applied_twice(monkeypatch, storage, open_db):
+    db = open_db()
+    db.create_user({"user_id": 7})
+    db.add_points(7, 10)
+    # الرفع ينجح لكن حذف المقطع لا يحدث (توقف بين الخطوتين)
+    monkeypatch.setattr(db.journal, "discard", lambda upto_segment: None)
+    assert db.flush()
+    crash(db)
+
+    recovered = open_db()
+    assert recovered.get_user(7)["points"] == 60
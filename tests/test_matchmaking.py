@@ -0,0 +1,106 @@
+import random
+
+import pytest
+
+from matchmaking import ANY, GENDERS, MatchmakingEngine
+
+@pytest.fixture
+def make_engine():
+    return lambda **kwargs: MatchmakingEngine(**kwargs)
+
+def compatible(a, b) -> bool:
+    return (a.want_gender in (ANY, b.gender)) and (b.want_gender in (ANY, a.gender))
+
+def expected_partners(engine, ticket):
+    """كل من يصح أن يختاره fifo: VIP أولاً ثم الأقدم (المتساوون في الوقت كلهم صحيحون)"""
+    candidates = [other for other in engine.tickets.values() if compatible(ticket, other)]
+    if not candidates:
+        return set()
+    best = min((not other.vip, other.enqueued_at) for other in candidates)
+    return {other.user_id for other in candidates if (not other.vip, other.enqueued_at) == best}
+
+def test_fifo_matches_the_brute_force_choice(make_engine):
+    engine = make_engine()
+    rng = random.Random(6)
+    matched = set()
+    for user_id in range(1, 600):
+        gender = rng.choice(GENDERS)
+        want = rng.choice((ANY,) + GENDERS)
+        vip = rng.random() < 0.1
+        probe = type("Probe", (), {"gender": gender, "want_gender": want})
+        expected = expected_partners(engine, probe)
+
+        partner = engine.search(user_id, gender, want, vip)
+        if expected:
+            assert partner in expected
+            assert partner not in matched
+            matched.update((user_id, partner))
+            assert partner not in engine and user_id not in engine
+        else:
+            assert partner is None and user_id in engine
+    assert engine.get_stats()["matches"] == len(matched) // 2
+
+def test_vip_waiters_go_first(make_engine):
+    engine = make_engine()
+    assert engine.search(1, "ذكر", "أنثى") is None
+    assert engine.search(2, "ذكر", "أنثى", vip=True) is None
+    assert engine.search(3, "أنثى") == 2
+    assert engine.search(4, "أنثى") == 1
+
+def test_gender_filters_apply_both_ways(make_engine):
+    engine = make_engine()
+    assert engine.search(1, "ذكر", "أنثى") is None
+    assert engine.search(2, "ذكر") is None  # يقبل الجميع، لكن 1 لا يريد ذكراً
+    assert engine.search(3, "أنثى", "أنثى") is None
+    assert engine.search(4, "أنثى") == 1
+    assert engine.search(5, "ذكر", "أنثى") is None  # 3 تريد أنثى
+    assert engine.search(6, "أنثى", "ذكر") == 2
+
+def test_searching_again_replaces_the_old_ticket(make_engine):
+    engine = make_engine()
+    assert engine.search(1, "ذكر", "أنثى") is None
+    assert engine.search(1, "ذكر", ANY) is None
+    assert len(engine) == 1
+    assert engine.search(2, "ذكر") == 1
+
+def test_cancelled_searchers_are_not_matched(make_engine):
+    engine = make_engine()
+    engine.search(1, "ذكر", "أنثى")
+    engine.search(2, "ذكر", "أنثى")
+    assert engine.cancel(1) and not engine.cancel(1)
+    assert engine.search(3, "أنثى") == 2
+    assert engine.search(4, "أنثى") is None
+
+def test_stale_tickets_are_dropped_instead_of_matched(make_engine):
+    unavailable = set()
+    engine = make_engine(is_available=lambda user_id: user_id not in unavailable)
+    for user_id in (1, 2, 3):
+        assert engine.search(user_id, "ذكر", "أنثى") is None
+    unavailable.update((1, 2))  # 1 حُظر و2 دخل محادثة أثناء انتظارهما
+
+    assert engine.search(4, "أنثى") == 3
+    assert 1 not in engine and 2 not in engine
+    assert engine.get_stats()["stale"] == 2
+    # لم يبق أحد متاح: الباحث يدخل الطابور بدل مطابقته مع بطاقة قديمة
+    assert engine.search(5, "أنثى") is None
+    assert engine.search(6, "ذكر") == 5
+
+def test_stale_check_only_runs_for_the_chosen_partner(make_engine):
+    asked = []
+    engine = make_engine(is_available=lambda user_id: asked.append(user_id) or True)
+    for user_id in range(1, 50):
+        engine.search(user_id, "ذكر", "أنثى")
+    assert asked == []
+    assert engine.search(100, "أنثى") == 1
+    assert asked == [1]
+
+def test_expired_searches_are_reported_once(make_engine):
+    expired = []
+    engine = make_engine(max_search_time=300, on_expire=expired.append)
+    engine.search(1, "ذكر")
+    ticket = engine.tickets[1]
+    assert engine.expire(ticket.enqueued_at + 299) == [] and expired == []
+    engine.expire(ticket.enqueued_at + 301)
+    assert expired == [1] and 1 not in engine
+    engine.expire(ticket.enqueued_at + 900)
+    assert expired == [1]
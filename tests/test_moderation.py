@@ -0,0 +1,115 @@
+import asyncio
+import types
+
+import pytest
+
+import moderation
+from async_database import AsyncDatabase
+from content_filter import ContentFilter
+from moderation import ModerationPipeline
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, rate_limit_args=None, **kwargs):
+        self.sent.append((chat_id, text, kwargs.get("reply_to_message_id")))
+
+class FakeMonitor:
+    def __init__(self):
+        self.events = []
+
+    def add(self, kind, text):
+        self.events.append((kind, text))
+
+@pytest.fixture
+def clock(monkeypatch):
+    """ساعة يدوية لنافذة المخالفات (time.monotonic) فقط"""
+    current = [1000.0]
+    monkeypatch.setattr(moderation, "time", types.SimpleNamespace(monotonic=lambda: current[0], time=moderation.time.time))
+    return current
+
+@pytest.fixture
+def adb(open_db):
+    db = open_db()
+    db.create_user({"user_id": 1})  # 50 نقطة
+    db.create_user({"user_id": 2})
+    wrapper = AsyncDatabase(db)
+    yield wrapper
+    wrapper.executor.shutdown(wait=True)
+
+def make_pipeline(adb, **kwargs):
+    pipeline = ModerationPipeline(adb, ContentFilter(["خنزير", "زاني"]), FakeMonitor(), **kwargs)
+    bans = []
+
+    async def on_ban(user_id, until_ts):
+        bans.append((user_id, until_ts))
+
+    pipeline.on_ban = on_ban
+    return pipeline, bans
+
+def run(pipeline, bot, *messages, between=None):
+    """تشغيل العامل، تمرير الرسائل عبر check، ثم انتظار انتهاء العقوبات"""
+    async def main():
+        pipeline.start(bot)
+        verdicts = []
+        for message in messages:
+            verdicts.append(pipeline.check(*message))
+            await pipeline.queue.join()
+            if between:
+                between()
+        await pipeline.stop()
+        return verdicts
+    return asyncio.run(main())
+
+def test_clean_messages_are_not_queued(adb, clock):
+    pipeline, _ = make_pipeline(adb)
+    bot = FakeBot()
+    assert run(pipeline, bot, (1, 2, "مرحبا كيف حالك", 10)) == [[]]
+    assert bot.sent == [] and pipeline.get_stats()["violations"] == 0
+    assert adb.sync.get_user(1)["points"] == 50
+
+def test_violation_costs_points_warns_and_notifies(adb, clock):
+    pipeline, bans = make_pipeline(adb, penalty_per_term=5)
+    bot = FakeBot()
+    verdicts = run(pipeline, bot, (1, 2, "يا خنزير يا زاني", 10))
+    assert sorted(verdicts[0]) == ["خنزير", "زاني"]
+    assert adb.sync.get_user(1)["points"] == 40
+    assert bot.sent == [(1, "⚠️ **تم خصم 10 نقاط لاستخدام كلمات محظورة.**", 10)]
+    assert pipeline.monitor.events == [("filtered", "1: يا خنزير يا زاني")]
+    assert bans == [] and pipeline.get_stats()["penalized"] == 1
+
+def test_no_points_left_still_warns(adb, clock):
+    pipeline, _ = make_pipeline(adb, penalty_per_term=100)
+    bot = FakeBot()
+    run(pipeline, bot, (1, 2, "خنزير", 11))
+    assert adb.sync.get_user(1)["points"] == 50
+    assert "تكرار ذلك يؤدي إلى الحظر" in bot.sent[0][1]
+    assert pipeline.get_stats()["penalized"] == 0
+
+def test_repeated_violations_escalate_to_a_ban(adb, clock):
+    pipeline, bans = make_pipeline(adb, penalty_per_term=5, ban_strikes=3, ban_duration=86400)
+    bot = FakeBot()
+    run(pipeline, bot, *[(1, 2, "خنزير", message_id) for message_id in range(3)])
+    assert adb.sync.get_user(1)["points"] == 35
+    assert len(bans) == 1 and bans[0][0] == 1
+    assert adb.sync.get_user(1)["banned_until"] == bans[0][1]
+    assert ("ban", "1 بعد 3 مخالفات") in pipeline.monitor.events
+    assert 1 not in pipeline.strikes  # العد يبدأ من جديد بعد الحظر
+    assert pipeline.get_stats()["bans"] == 1
+
+def test_strikes_outside_the_window_do_not_count(adb, clock):
+    pipeline, bans = make_pipeline(adb, ban_strikes=3, strike_window=3600)
+    bot = FakeBot()
+
+    def an_hour_later():
+        clock[0] += 3601
+
+    run(pipeline, bot, *[(1, 2, "خنزير", message_id) for message_id in range(4)], between=an_hour_later)
+    assert bans == [] and len(pipeline.strikes[1]) == 1
+    assert adb.sync.get_user(1).get("banned_until", 0) == 0
+
+def test_violations_before_start_are_dropped(adb):
+    pipeline, _ = make_pipeline(adb)
+    assert pipeline.check(1, 2, "خنزير") == ["خنزير"]
+    assert pipeline.get_stats()["dropped"] == 1
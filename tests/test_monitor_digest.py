@@ -0,0 +1,112 @@
+import asyncio
+import types
+
+import pytest
+
+import monitor_digest
+from monitor_digest import MonitorDigest, MAX_MESSAGE_LENGTH, MAX_SAMPLE_LENGTH
+from send_scheduler import PRIORITY_GAME, PRIORITY_MONITOR
+from tests.fakes import VirtualClockLoop
+
+class FakeBot:
+    def __init__(self, loop=None):
+        self.loop = loop
+        self.sent = []
+
+    async def send_message(self, chat_id, text, rate_limit_args=None):
+        at = self.loop.time() if self.loop is not None else None
+        self.sent.append((chat_id, text, rate_limit_args, at))
+
+@pytest.fixture
+def loop(monkeypatch):
+    loop = VirtualClockLoop()
+    monkeypatch.setattr(monitor_digest, "time", types.SimpleNamespace(monotonic=loop.time))
+    return loop
+
+def test_render_counts_every_kind_with_a_bounded_sample():
+    digest = MonitorDigest(chat_id=-100, sample_size=2)
+    for user_id in range(5):
+        digest.add("chat_start", f"{user_id} ↔ {user_id + 10}")
+    digest.add("filtered", "x" * 500)
+    digest.add("custom", "something")
+
+    [text] = digest.render()
+    lines = text.split("\n")
+    assert "🟢 محادثات جديدة: 5" in lines
+    assert lines[lines.index("🟢 محادثات جديدة: 5") + 1:][:3] == ["• 0 ↔ 10", "• 1 ↔ 11", "… و3 أخرى"]
+    assert "🚫 كلمات محظورة: 1" in lines and f"• {'x' * MAX_SAMPLE_LENGTH}" in lines
+    assert "custom: 1" in lines
+    assert digest.get_stats() == {"events": 7, "digests": 0, "critical": 0, "failed": 0, "pending": 7}
+
+def test_long_digests_are_split_under_the_telegram_limit():
+    digest = MonitorDigest(chat_id=-100, sample_size=5)
+    for kind in range(40):
+        for _ in range(5):
+            digest.add(f"kind{kind}", "y" * MAX_SAMPLE_LENGTH)
+    messages = digest.render()
+    assert len(messages) > 1
+    assert all(len(message) <= MAX_MESSAGE_LENGTH for message in messages)
+    assert sum(message.count("• ") for message in messages) == 200
+
+def test_flush_sends_the_window_and_starts_a_new_one(loop):
+    digest = MonitorDigest(chat_id=-100)
+    bot = FakeBot(loop)
+
+    async def run():
+        digest.bot = bot
+        digest.add("chat_end", "1 ✕ 2")
+        await digest.flush()
+        await digest.flush()  # لا جديد: لا رسالة
+
+    loop.run(run())
+    assert [(chat, priority) for chat, _, priority, _ in bot.sent] == [(-100, PRIORITY_MONITOR)]
+    assert "🔴 محادثات منتهية: 1" in bot.sent[0][1]
+    assert digest.pending == 0 and digest.counts == {}
+    assert digest.get_stats()["digests"] == 1
+
+def test_digests_go_out_every_interval(loop):
+    digest = MonitorDigest(chat_id=-100, interval=5)
+    bot = FakeBot(loop)
+
+    async def run():
+        digest.start(bot)
+        digest.add("chat_start", "a")
+        await asyncio.sleep(7)
+        digest.add("chat_start", "b")
+        await asyncio.sleep(1)
+        await digest.stop()  # آخر ملخص عند الإيقاف
+
+    loop.run(run())
+    assert [round(at - 1000) for *_, at in bot.sent] == [5, 8]
+    assert ["• a" in text for _, text, _, _ in bot.sent] == [True, False]
+
+def test_a_full_window_is_sent_early(loop):
+    digest = MonitorDigest(chat_id=-100, interval=60, max_events=3)
+    bot = FakeBot(loop)
+
+    async def run():
+        digest.start(bot)
+        for user_id in range(3):
+            digest.add("filtered", str(user_id))
+        await asyncio.sleep(1)
+        sent_early = len(bot.sent)
+        await digest.stop()
+        return sent_early
+
+    assert loop.run(run()) == 1
+    assert round(bot.sent[0][3] - 1000) == 0
+    assert len(bot.sent) == 1
+
+def test_critical_events_skip_the_digest(loop):
+    digest = MonitorDigest(chat_id=-100, interval=60)
+    bot = FakeBot(loop)
+
+    async def run():
+        digest.start(bot)
+        digest.add("payment", "⭐ دفع 100", critical=True)
+        await asyncio.sleep(0)
+        await digest.stop()
+
+    loop.run(run())
+    assert [(text, priority) for _, text, priority, _ in bot.sent] == [("⭐ دفع 100", PRIORITY_GAME)]
+    assert digest.get_stats()["critical"] == 1 and digest.get_stats()["digests"] == 0
@@ -0,0 +1,62 @@
+import random
+
+import pytest
+
+from ranking import ScoreIndex, score_bucket, EXACT_LIMIT, BUCKETS
+
+def brute_rank(scores: dict, user_key: str) -> int:
+    return sum(1 for score in scores.values() if score > scores[user_key]) + 1
+
+def assert_matches_brute_force(index: ScoreIndex, scores: dict):
+    assert len(index) == len(scores)
+    for user_key in scores:
+        assert index.rank(user_key) == brute_rank(scores, user_key)
+    expected = sorted(scores.values(), reverse=True)
+    for limit in (0, 1, 10, len(scores), len(scores) + 5):
+        assert [scores[user_key] for user_key in index.top(limit)] == expected[:max(limit, 0)]
+    for probe in list(scores.values())[:20] + [-5, 0, EXACT_LIMIT, 10 ** 30]:
+        assert index.count_above(probe) == sum(1 for score in scores.values() if score > probe)
+
+@pytest.mark.parametrize("seed", range(5))
+def test_rank_and_top_match_brute_force(seed):
+    rng = random.Random(seed)
+    index, scores = ScoreIndex(), {}
+    for step in range(3000):
+        user_key = str(rng.randrange(400))
+        if rng.random() < 0.1:
+            index.remove(user_key)
+            scores.pop(user_key, None)
+            continue
+        # درجات صغيرة دقيقة، ودرجات كبيرة تتشارك الدلاء، وسالبة
+        score = rng.choice([
+            rng.randrange(-50, 50),
+            rng.randrange(EXACT_LIMIT),
+            rng.randrange(EXACT_LIMIT, 10 ** 6),
+            rng.randrange(10 ** 6, 2 ** 70)
+        ])
+        index.update(user_key, score)
+        scores[user_key] = score
+        if step % 500 == 0:
+            assert_matches_brute_force(index, scores)
+    assert_matches_brute_force(index, scores)
+
+def test_ties_share_a_rank():
+    index = ScoreIndex([("a", 10), ("b", 10), ("c", 5), ("d", 20)])
+    assert [index.rank(key) for key in "abcd"] == [2, 2, 4, 1]
+    assert index.rank("missing") is None
+
+def test_removing_the_last_member_clears_its_bucket():
+    index = ScoreIndex([("a", 5000), ("b", 5001)])
+    index.remove("a")
+    index.update("b", 3)
+    assert index.buckets == [3]
+    assert index.distinct == {3: [3]}
+    assert index.members == {3: {"b": None}}
+    assert index._tree_prefix(BUCKETS - 1) == 1
+    assert index.count_above(2) == 1 and index.count_above(3) == 0
+
+def test_buckets_are_monotonic():
+    scores = [-3, 0, 1, EXACT_LIMIT - 1, EXACT_LIMIT, EXACT_LIMIT + 1, 10 ** 6, 2 ** 63, 2 ** 64, 2 ** 80]
+    buckets = [score_bucket(score) for score in scores]
+    assert buckets == sorted(buckets)
+    assert all(0 <= bucket < BUCKETS for bucket in buckets)
@@ -0,0 +1,108 @@
+import ast
+import asyncio
+import builtins
+import itertools
+from types import SimpleNamespace
+
+import pytest
+
+from routing import Router
+from tests.fakes import load_routing, routing_sources
+
+class Result:
+    """نتيجة استدعاء مسجَّل: تصلح قيمةً وتصلح للانتظار"""
+
+    def __init__(self, value=None):
+        self.value = value
+
+    def __await__(self):
+        return self.value
+        yield
+
+class Recorder:
+    def __init__(self, log, name, returns):
+        self.log = log
+        self.name = name
+        self.returns = returns
+
+    def __getattr__(self, attr):
+        return Recorder(self.log, f"{self.name}.{attr}", self.returns)
+
+    def __call__(self, *args, **kwargs):
+        plain = tuple(arg for arg in args if isinstance(arg, (str, int, dict)))
+        plain += tuple(sorted((key, value) for key, value in kwargs.items() if isinstance(value, (str, int))))
+        self.log.append((self.name,) + plain)
+        return Result(self.returns.get(self.name))
+
+class Namespace(dict):
+    """globals للدوال المنفذة: أي اسم غير معرّف يصبح Recorder باسمه"""
+
+    def __init__(self, log, returns):
+        super().__init__()
+        self.log = log
+        self.returns = returns
+
+    def __missing__(self, name):
+        if hasattr(builtins, name):
+            raise KeyError(name)
+        recorder = self[name] = Recorder(self.log, name, self.returns)
+        return recorder
+
+def make_namespace(code, log, returns):
+    return load_routing(code, Namespace(log, returns))
+
+NEW_SOURCE, OLD_SOURCE = routing_sources()
+NEW_CODE = compile(NEW_SOURCE, "bot_main.py", "exec")
+OLD_CODE = compile(OLD_SOURCE, "legacy_relay.py", "exec")
+
+def route(code, text, state, in_chat, returns):
+    log = []
+    namespace = make_namespace(code, log, returns)
+    user = SimpleNamespace(id=5, first_name="Test")
+    if state is not None:
+        namespace["USER_STATES"][user.id] = state
+    if in_chat:
+        namespace["active_chats"][user.id] = 6
+    update = SimpleNamespace(effective_user=user, message=Recorder(log, "message", returns))
+    context = Recorder(log, "context", returns)
+    asyncio.run(namespace["_relay_message_internal"](update, context, user, text))
+    return log, dict(namespace["USER_STATES"])
+
+def all_buttons():
+    return sorted(make_namespace(NEW_CODE, [], {})["router"].buttons)
+
+STATES = [None, "waiting_for_rating", "waiting_admin_message", "waiting_country_name", "waiting_gender_choice",
+          "waiting_gender_confirm", "waiting_gender_update", "waiting_age_update", "waiting_country_update",
+          "playing_guess_7", "admin_broadcast", "waiting_something_else"]
+TEXTS = all_buttons() + ["⭐⭐ 2", "⭐⭐⭐⭐⭐ 5", "تخطي", "نعم ✅", "لا ❌", "مرحبا", "42", "مصر"]
+
+@pytest.mark.parametrize("state", STATES)
+def test_routing_matches_the_old_chain(state):
+    admin_results = [False, None, True] if state == "admin_broadcast" else [None]
+    for text, in_chat, admin_result in itertools.product(TEXTS, (False, True), admin_results):
+        returns = {"handle_admin_messages": admin_result}
+        expected = route(OLD_CODE, text, state, in_chat, returns)
+        assert route(NEW_CODE, text, state, in_chat, returns) == expected, (text, in_chat, admin_result)
+
+def test_every_old_button_is_routed():
+    old_buttons = {node.comparators[0].value
+                   for node in ast.walk(ast.parse(OLD_SOURCE))
+                   if isinstance(node, ast.Compare) and isinstance(node.left, ast.Name) and node.left.id == "text"
+                   and isinstance(node.ops[0], ast.Eq) and isinstance(node.comparators[0], ast.Constant)}
+    assert old_buttons <= set(all_buttons())
+
+def test_exact_state_wins_over_prefix():
+    router = Router()
+    exact, prefixed = object(), object()
+    router.add_state_prefix("admin_", prefixed)
+    router.add_state("admin_special", exact)
+    assert router.state("admin_special") is exact
+    assert router.state("admin_other") is prefixed
+    assert router.state("other") is None
+
+def test_first_button_registration_wins():
+    router = Router()
+    first, second = object(), object()
+    router.add_button(["a", "b"], first)
+    router.add_button("a", second)
+    assert router.button("a") is first and router.button("b") is first
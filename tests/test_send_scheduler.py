@@ -0,0 +1,117 @@
+import asyncio
+import types
+
+import pytest
+from telegram.error import RetryAfter
+
+import send_scheduler
+from send_scheduler import (SendScheduler, send_priority, PRIORITY_CHAT, PRIORITY_GAME, PRIORITY_MONITOR,
+                            PRIORITY_BROADCAST)
+from tests.fakes import VirtualClockLoop
+
+@pytest.fixture
+def loop(monkeypatch):
+    """كل الوقت في الجدولة (time.monotonic وasyncio.sleep) من الساعة الافتراضية"""
+    loop = VirtualClockLoop()
+    monkeypatch.setattr(send_scheduler, "time", types.SimpleNamespace(monotonic=loop.time))
+    return loop
+
+def sender(loop, sent: list, failures: int = 0):
+    """callback مزيف يسجل (الوسم, الوقت)، ويرفع RetryAfter أول failures مرة"""
+    remaining = [failures]
+
+    def make(tag):
+        async def callback():
+            if remaining[0]:
+                remaining[0] -= 1
+                raise RetryAfter(5)
+            sent.append((tag, loop.time()))
+            return tag
+        return callback
+    return make
+
+async def send(scheduler, callback, chat_id, priority=None, endpoint="sendMessage"):
+    return await scheduler.process_request(callback, (), {}, endpoint, {"chat_id": chat_id}, priority)
+
+def run(loop, scheduler, *coroutines):
+    async def main():
+        await scheduler.initialize()
+        try:
+            return await asyncio.gather(*coroutines)
+        finally:
+            await scheduler.shutdown()
+    return loop.run(main())
+
+def test_global_slots_go_to_the_highest_priority_first(loop):
+    scheduler = SendScheduler(global_rate=1)
+    sent = []
+    make = sender(loop, sent)
+    priorities = [PRIORITY_BROADCAST, PRIORITY_MONITOR, PRIORITY_GAME, PRIORITY_CHAT, PRIORITY_BROADCAST]
+    run(loop, scheduler, *(send(scheduler, make(f"{priority}-{chat_id}"), chat_id, priority)
+                           for chat_id, priority in enumerate(priorities, 1)))
+    # نفس الأولوية بترتيب الوصول
+    assert [tag for tag, _ in sent] == ["0-4", "1-3", "2-2", "3-1", "3-5"]
+    assert [at - 1000 for _, at in sent] == [0, 1, 2, 3, 4]
+
+def test_send_priority_context_sets_the_default(loop):
+    scheduler = SendScheduler(global_rate=1)
+    sent = []
+    make = sender(loop, sent)
+
+    async def game_send(chat_id):
+        with send_priority(PRIORITY_GAME):
+            return await send(scheduler, make(f"game-{chat_id}"), chat_id)
+
+    run(loop, scheduler, send(scheduler, make("broadcast"), 1, PRIORITY_BROADCAST),
+        game_send(2), send(scheduler, make("chat"), 3))
+    assert [tag for tag, _ in sent] == ["chat", "game-2", "broadcast"]
+
+def test_per_chat_limits(loop):
+    scheduler = SendScheduler(global_rate=1000, chat_rate=1, group_rate_per_minute=20)
+    sent = []
+    make = sender(loop, sent)
+    run(loop, scheduler, *(send(scheduler, make("private"), 7) for _ in range(3)),
+        *(send(scheduler, make("group"), -100) for _ in range(3)))
+    times = {tag: [round(at - 1000, 1) for t, at in sent if t == tag] for tag in ("private", "group")}
+    assert times["private"] == [0, 1, 2]
+    assert times["group"] == [0, 3, 6]
+
+def test_global_limit_spaces_every_send(loop):
+    scheduler = SendScheduler(global_rate=30)
+    sent = []
+    make = sender(loop, sent)
+    run(loop, scheduler, *(send(scheduler, make(chat_id), chat_id) for chat_id in range(1, 91)))
+    times = [at for _, at in sent]
+    assert len(times) == 90
+    assert all(later - earlier >= 1 / 30 - 1e-9 for earlier, later in zip(times, times[1:]))
+    assert times[-1] - times[0] == pytest.approx(89 / 30)
+
+def test_other_endpoints_are_not_limited(loop):
+    scheduler = SendScheduler(global_rate=1)
+    sent = []
+    make = sender(loop, sent)
+    run(loop, scheduler, *(send(scheduler, make("answer"), 1, endpoint="answerCallbackQuery") for _ in range(5)))
+    assert [at for _, at in sent] == [1000] * 5
+
+def test_retry_after_pauses_all_sends_then_retries(loop):
+    scheduler = SendScheduler(global_rate=1000)
+    sent = []
+    flaky = sender(loop, sent, failures=1)
+    make = sender(loop, sent)
+
+    async def later():
+        await asyncio.sleep(1)  # يصل أثناء التوقف
+        return await send(scheduler, make("other"), 2)
+
+    results = run(loop, scheduler, send(scheduler, flaky("retried"), 1), later())
+    assert results == ["retried", "other"]
+    assert [(tag, round(at - 1000, 3)) for tag, at in sent] == [("retried", 5), ("other", 5.001)]
+    assert scheduler.get_stats()["paused_for"] == 0
+
+def test_retry_after_gives_up_after_max_retries(loop):
+    scheduler = SendScheduler(global_rate=1000, max_retries=2)
+    sent = []
+    flaky = sender(loop, sent, failures=3)
+    with pytest.raises(RetryAfter):
+        run(loop, scheduler, send(scheduler, flaky("never"), 1))
+    assert sent == []
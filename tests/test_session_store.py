@@ -0,0 +1,77 @@
+import os
+import pickle
+import time
+
+import pytest
+
+from session_store import SessionStore, HEADER, SNAPSHOT_MAGIC, SNAPSHOT_VERSION
+
+class Exploit:
+    """يستدعي os.system عند فك pickle لو سُمح باستيراد الدوال"""
+
+    def __reduce__(self):
+        return (os.system, ("echo pwned",))
+
+def store_with(path, sections: dict, restored: dict) -> SessionStore:
+    store = SessionStore(str(path))
+    for name, value in sections.items():
+        store.register(name, lambda value=value: value, lambda data, name=name: restored.__setitem__(name, data))
+    return store
+
+def test_round_trip(tmp_path):
+    sections = {
+        "chats": {1: 2, 2: 1, -100: 7},
+        "states": {"states": {5: "waiting_gift"}, "gender_confirm": {6: "أنثى"}},
+        "games": [{"board": ["⬜"] * 9, "move_history": [(0, 4)], "scores": {"1": 2}, "ts": 1.5, "done": None}],
+        "search": {"tickets": [(3, "ذكر", "أنثى", True)], "seen": {1, 2}}
+    }
+    store_with(tmp_path / "s.snapshot", sections, {}).save()
+
+    restored = {}
+    assert store_with(tmp_path / "s.snapshot", {name: None for name in sections}, restored).load()
+    assert restored == sections
+
+def test_unchanged_snapshot_is_not_rewritten(tmp_path):
+    store = store_with(tmp_path / "s.snapshot", {"chats": {1: 2}}, {})
+    assert store.save() and not store.save()
+    assert store.get_stats()["saves"] == 1 and store.get_stats()["skipped"] == 1
+
+@pytest.mark.parametrize("payload", [
+    {"chats": Exploit()},
+    {"chats": os.system},
+    {"chats": time.struct_time((2024, 1, 1, 0, 0, 0, 0, 1, 0))},
+])
+def test_restricted_unpickler_rejects_globals(tmp_path, payload, monkeypatch):
+    store = SessionStore(str(tmp_path / "s.snapshot"))
+    store._write(pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL))
+    monkeypatch.setattr(os, "system", lambda command: pytest.fail(f"ran {command}"))
+
+    restored = {}
+    store = store_with(tmp_path / "s.snapshot", {"chats": None}, restored)
+    assert not store.load()
+    assert restored == {}
+
+def test_stale_or_foreign_snapshots_are_ignored(tmp_path):
+    path = tmp_path / "s.snapshot"
+    store_with(path, {"chats": {1: 2}}, {}).save()
+    restored = {}
+    old = SessionStore(str(path), max_age=-1)
+    old.register("chats", lambda: {}, lambda data: restored.update(data))
+    assert not old.load()
+
+    body = path.read_bytes()[HEADER.size:]
+    path.write_bytes(HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION + 1, time.time()) + body)
+    assert not store_with(path, {"chats": None}, restored).load()
+    path.write_bytes(b"garbage")
+    assert not store_with(path, {"chats": None}, restored).load()
+    assert restored == {}
+
+def test_a_broken_section_does_not_block_the_rest(tmp_path):
+    path = tmp_path / "s.snapshot"
+    store_with(path, {"chats": {1: 2}, "states": {"states": {}}}, {}).save()
+    restored = {}
+    store = SessionStore(str(path))
+    store.register("chats", lambda: {}, lambda data: 1 / 0)
+    store.register("states", lambda: {}, lambda data: restored.update(data))
+    assert store.load()
+    assert restored == {"states": {}}
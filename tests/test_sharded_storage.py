@@ -0,0 +1,93 @@
+import json
+
+import pytest
+
+import sharded_storage
+from sharded_storage import (ShardedGitHubStorage, migrate_single_file, build_shards, user_shard, user_bucket,
+                             MANIFEST_SHARD, USER_BUCKETS)
+from tests.fakes import FakeGitHub
+
+@pytest.fixture
+def github(monkeypatch):
+    fake = FakeGitHub()
+    monkeypatch.setattr(sharded_storage.requests, "Session", fake.session)
+    monkeypatch.setattr(sharded_storage.requests, "get", fake.get)
+    return fake
+
+def sample_data():
+    return {
+        "users": {"1": {"user_id": 1, "points": 50}, "257": {"user_id": 257, "points": 7},
+                  "2": {"user_id": 2, "points": 9}},
+        "conversations": [{"id": 1, "user_a": 1, "user_b": 2}],
+        "system": {"journal_seq": 3}
+    }
+
+def test_save_is_one_commit_under_the_prefix(github):
+    storage = ShardedGitHubStorage("token", "owner/repo", "bot_data")
+    data = sample_data()
+    names = {user_shard(1), user_shard(2), "conversations.json", "system.json", MANIFEST_SHARD}
+    assert storage.save(build_shards(data, names), "Batch save")
+
+    commit = github.commits[github.head]
+    assert commit["message"] == "🤖 Batch save" and commit["parents"] == ["commit0"]
+    files = github.files()
+    assert set(files) == {f"bot_data/{name}" for name in names}
+    assert json.loads(files["bot_data/users/001.json"]) == {"1": data["users"]["1"], "257": data["users"]["257"]}
+    assert [method for method, path in github.requests].count("PATCH") == 1
+    assert [path for method, path in github.requests if method == "POST"].count("git/blobs") == len(names)
+
+def test_load_merges_shards_and_reuses_unchanged_blobs(github):
+    storage = ShardedGitHubStorage("token", "owner/repo", "bot_data", branch="main")
+    assert storage.load() is None  # لا manifest بعد
+
+    data = sample_data()
+    names = {user_shard(1), user_shard(2), "conversations.json", "system.json", MANIFEST_SHARD}
+    assert storage.save(build_shards(data, names), "init")
+    github.commit_files({"unrelated/readme.md": "hi"})
+
+    reader = ShardedGitHubStorage("token", "owner/repo", "bot_data", branch="main")
+    assert reader.load() == data
+    github.requests.clear()
+    assert reader.save({"conversations.json": "[]"}, "close") and reader.load()["conversations"] == []
+    fetched = [path for method, path in github.requests if method == "GET" and path.startswith("git/blobs")]
+    assert len(fetched) == 1  # الملف الذي تغير فقط
+
+def test_ref_conflict_retries_on_the_new_head(github):
+    storage = ShardedGitHubStorage("token", "owner/repo", "bot_data", branch="main")
+    assert storage.save({"system.json": "{}", MANIFEST_SHARD: "{}"}, "init")
+
+    def other_writer():
+        github.before_ref_update = None
+        github.commit_files({"bot_data/logs.json": "[1]"})
+
+    github.before_ref_update = other_writer
+    assert storage.save({"system.json": '{"journal_seq": 9}'}, "save")
+    files = github.files()
+    # المحاولة الثانية بُنيت فوق commit الكاتب الآخر فلم تمحُ ملفه
+    assert files["bot_data/logs.json"] == "[1]" and files["bot_data/system.json"] == '{"journal_seq": 9}'
+    assert [method for method, _ in github.requests].count("PATCH") == 3
+
+def test_save_gives_up_after_two_conflicts(github):
+    storage = ShardedGitHubStorage("token", "owner/repo", "bot_data", branch="main")
+    assert storage.save({"system.json": "{}"}, "init")
+    github.before_ref_update = lambda: github.commit_files({"bot_data/logs.json": "[]"})
+    head_files = github.files()
+
+    assert not storage.save({"system.json": '{"journal_seq": 1}'}, "save")
+    assert github.files()["bot_data/system.json"] == head_files["bot_data/system.json"]
+
+def test_migrate_single_file(github):
+    data = sample_data()
+    github.contents["bot_data.json"] = json.dumps(data, ensure_ascii=False).encode("utf-8")
+    assert migrate_single_file("token", "owner/repo", "bot_data.json")
+
+    files = github.files()
+    assert len([path for path in files if path.startswith("bot_data/users/")]) == USER_BUCKETS
+    assert json.loads(files[f"bot_data/{user_shard(user_bucket(2))}"]) == {"2": data["users"]["2"]}
+    assert json.loads(files["bot_data/manifest.json"])["user_buckets"] == USER_BUCKETS
+    assert len(github.commits) == 2  # commit واحد
+    assert ShardedGitHubStorage("token", "owner/repo", "bot_data").load() == data
+
+def test_migrate_missing_file(github):
+    assert not migrate_single_file("token", "owner/repo", "bot_data.json")
+    assert github.head == "commit0"
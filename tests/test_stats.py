@@ -0,0 +1,102 @@
+import random
+import time
+
+import pytest
+
+from stats import HourlyRing, StatsAggregator, recompute_stats, HOUR
+from tests.test_indexes import run_workload
+
+@pytest.fixture
+def clock(monkeypatch):
+    """ساعة يدوية لـ time.time في كل الوحدات"""
+    current = [1_700_000_000.0]
+    monkeypatch.setattr(time, "time", lambda: current[0])
+    return current
+
+def stats_workload(db, rng: random.Random, steps: int):
+    """تعديلات تمس كل مجموع: الحالة والجنس وVIP والألعاب والمستخدمون الجدد"""
+    user_ids = [int(user_key) for user_key in db.cache["users"]]
+    now = int(time.time())
+    for _ in range(steps):
+        action = rng.random()
+        if action < 0.2 or not user_ids:
+            user_id = rng.randrange(1, 10 ** 6)
+            db.create_user({"user_id": user_id, "join_ts": now - rng.randrange(0, 3 * 86400)})
+            user_ids.append(user_id)
+        elif action < 0.4:
+            db.set_user_status(rng.choice(user_ids), rng.choice(["idle", "searching", "chatting"]))
+        elif action < 0.5:
+            db.update_user_profile(rng.choice(user_ids), {"gender": rng.choice(["ذكر", "أنثى", "غير محدد"])})
+        elif action < 0.6:
+            db.set_vip(rng.choice(user_ids), rng.randrange(1, 3))
+        elif action < 0.7:
+            db.update_user_profile(rng.choice(user_ids), {"vip_until": now + rng.randrange(-HOUR, HOUR)})
+        elif action < 0.85:
+            db.record_game("xo", rng.choice(user_ids), rng.choice(user_ids), "win")
+        else:
+            db.add_stars(rng.choice(user_ids), rng.randrange(1, 100))
+
+def test_incremental_stats_match_a_recompute(clock, open_db):
+    db = open_db()
+    rng = random.Random(8)
+    for _ in range(10):
+        run_workload(db, rng, 40)
+        stats_workload(db, rng, 40)
+        assert db.verify_stats() == {}
+
+def test_stats_stay_correct_as_time_passes(clock, open_db):
+    """مستخدمو اليوم والألعاب وVIP تخرج من المجاميع عند انتهاء نافذتها"""
+    db = open_db()
+    rng = random.Random(9)
+    stats_workload(db, rng, 300)
+    assert db.verify_stats() == {}
+    for _ in range(30):
+        clock[0] += rng.choice([60, 15 * 60, HOUR, 5 * HOUR])
+        assert db.verify_stats() == {}
+        stats_workload(db, rng, 10)
+        assert db.verify_stats() == {}
+
+def test_stats_after_reload(clock, open_db):
+    db = open_db()
+    stats_workload(db, random.Random(10), 200)
+    expected = db.get_stats()
+    db.close()
+    reopened = open_db()
+    assert reopened.get_stats() == expected
+    assert reopened.verify_stats() == {}
+
+def test_verify_stats_reports_drift(clock, open_db):
+    db = open_db()
+    stats_workload(db, random.Random(12), 50)
+    db.aggregates.total_points += 7
+    mismatches = db.verify_stats()
+    assert list(mismatches) == ["total_points"]
+    incremental, expected = mismatches["total_points"]
+    assert incremental == expected + 7
+
+def test_hourly_ring_window():
+    ring = HourlyRing()
+    now = 100 * HOUR + 30
+    ring.add(now, now=now)
+    ring.add(now - 23 * HOUR, now=now)
+    ring.add(now - 24 * HOUR, now=now)  # خارج النافذة
+    ring.add(now + HOUR, now=now)  # في المستقبل
+    assert ring.total(now) == 2
+    assert ring.total(now + HOUR) == 1
+    assert ring.total(now + 24 * HOUR) == 0
+
+def test_aggregator_rebuild_matches_recompute():
+    now = 1_700_000_000
+    data = {
+        "users": {
+            "1": {"status": "chatting", "gender": "ذكر", "points": 10, "stars_balance": 3,
+                  "vip_until": now + 5, "join_ts": now - 10},
+            "2": {"status": "searching", "gender": "أنثى", "points": None, "join_ts": now - 2 * 86400}
+        },
+        "conversations": [{"start_ts": now - 60, "active": 1}],
+        "games": [{"ts": now - 25 * HOUR}],
+        "messages": [{}, {}]
+    }
+    aggregator = StatsAggregator()
+    aggregator.rebuild(data, now)
+    assert aggregator.snapshot(data, 1, now) == recompute_stats(data, now)
@@ -0,0 +1,130 @@
+import asyncio
+import types
+
+import pytest
+from telegram.error import NetworkError
+
+import subscription_cache
+from subscription_cache import SubscriptionCache
+
+class FakeChatMembers:
+    """get_chat_member مزيف: حالة كل مستخدم، وعدد الطلبات، وبوابة لإبقاء الطلب جارياً"""
+
+    def __init__(self):
+        self.statuses = {}
+        self.calls = 0
+        self.gate = asyncio.Event()
+        self.gate.set()
+        self.fail = False
+
+    async def get_chat_member(self, chat_id, user_id):
+        # الحالة كما كانت لحظة الطلب، والرد يصل بعد فتح البوابة
+        self.calls += 1
+        status = self.statuses.get(user_id, "left")
+        await self.gate.wait()
+        if self.fail:
+            raise NetworkError("timed out")
+        return types.SimpleNamespace(status=status)
+
+def fetcher(bot, user_id):
+    """نفس فحص bot_main.fetch_channel_subscription"""
+    async def fetch():
+        member = await bot.get_chat_member("channel", user_id)
+        return member.status not in ['left', 'kicked']
+    return fetch
+
+@pytest.fixture
+def clock(monkeypatch):
+    current = [1000.0]
+    monkeypatch.setattr(subscription_cache, "time", types.SimpleNamespace(monotonic=lambda: current[0]))
+    return current
+
+def test_concurrent_checks_share_one_lookup(clock):
+    cache = SubscriptionCache(ttl=600, negative_ttl=30)
+
+    async def run():
+        bot = FakeChatMembers()
+        bot.statuses[1] = "member"
+        bot.gate.clear()
+        checks = [asyncio.ensure_future(cache.is_subscribed(1, fetcher(bot, 1))) for _ in range(50)]
+        await asyncio.sleep(0)
+        bot.gate.set()
+        return await asyncio.gather(*checks), bot.calls
+
+    results, calls = asyncio.run(run())
+    assert results == [True] * 50 and calls == 1
+    assert cache.get_stats()["misses"] == 1 and cache.get_stats()["shared"] == 49
+
+def test_cancelling_one_waiter_keeps_the_shared_lookup(clock):
+    cache = SubscriptionCache()
+
+    async def run():
+        bot = FakeChatMembers()
+        bot.statuses[1] = "member"
+        bot.gate.clear()
+        first = asyncio.ensure_future(cache.is_subscribed(1, fetcher(bot, 1)))
+        second = asyncio.ensure_future(cache.is_subscribed(1, fetcher(bot, 1)))
+        await asyncio.sleep(0)
+        first.cancel()
+        bot.gate.set()
+        return await second, first.cancelled(), bot.calls
+
+    assert asyncio.run(run()) == (True, True, 1)
+
+def test_positive_and_negative_ttls(clock):
+    cache = SubscriptionCache(ttl=600, negative_ttl=30)
+
+    async def run():
+        bot = FakeChatMembers()
+        bot.statuses[1] = "member"
+        results = [await cache.is_subscribed(1, fetcher(bot, 1)), await cache.is_subscribed(2, fetcher(bot, 2))]
+        bot.statuses[2] = "member"  # اشترك للتو
+        clock[0] += 29
+        results += [await cache.is_subscribed(1, fetcher(bot, 1)), await cache.is_subscribed(2, fetcher(bot, 2))]
+        clock[0] += 2  # السلبية انتهت والإيجابية باقية
+        results += [await cache.is_subscribed(1, fetcher(bot, 1)), await cache.is_subscribed(2, fetcher(bot, 2))]
+        return results, bot.calls
+
+    results, calls = asyncio.run(run())
+    assert results == [True, False, True, False, True, True]
+    assert calls == 3
+
+@pytest.mark.parametrize("fail_open", [True, False])
+def test_failed_lookup_returns_fail_open_briefly(clock, fail_open):
+    cache = SubscriptionCache(ttl=600, negative_ttl=30, fail_open=fail_open)
+
+    async def run():
+        bot = FakeChatMembers()
+        bot.statuses[1] = "member" if not fail_open else "left"
+        bot.fail = True
+        failed = await cache.is_subscribed(1, fetcher(bot, 1))
+        bot.fail = False
+        cached = await cache.is_subscribed(1, fetcher(bot, 1))
+        clock[0] += 31
+        return failed, cached, await cache.is_subscribed(1, fetcher(bot, 1)), bot.calls
+
+    failed, cached, fresh, calls = asyncio.run(run())
+    assert failed is fail_open and cached is fail_open
+    assert fresh is not fail_open and calls == 2
+    assert cache.get_stats()["errors"] == 1
+
+def test_invalidate_during_lookup_drops_the_stale_result(clock):
+    cache = SubscriptionCache(ttl=600, negative_ttl=30)
+
+    async def run():
+        slow, fast = FakeChatMembers(), FakeChatMembers()
+        slow.gate.clear()
+        stale = asyncio.ensure_future(cache.is_subscribed(1, fetcher(slow, 1)))
+        await asyncio.sleep(0)
+        # المستخدم اشترك وضغط "تحقق من الاشتراك" والطلب القديم ما زال جارياً
+        fast.statuses[1] = "member"
+        cache.invalidate(1)
+        fresh = await cache.is_subscribed(1, fetcher(fast, 1))
+        slow.gate.set()  # الرد القديم يصل بعد الجديد
+        old = await stale
+        return old, fresh, await cache.is_subscribed(1, fetcher(fast, 1)), fast.calls
+
+    old, fresh, cached, calls = asyncio.run(run())
+    assert old is False and fresh is True
+    assert cached is True and calls == 1  # النتيجة القديمة لم تُحفظ فوق الجديدة
+    assert cache.get_stats()["invalidations"] == 1
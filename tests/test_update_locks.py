@@ -0,0 +1,60 @@
+import asyncio
+
+from telegram.ext import BaseUpdateProcessor
+
+from update_locks import KeyedUpdateProcessor
+
+def test_process_update_stays_ptbs():
+    # process_update في PTB معلَّمة final: القفل كله في do_process_update
+    assert KeyedUpdateProcessor.process_update is BaseUpdateProcessor.process_update
+
+def run_updates(processor, updates, duration=0.01):
+    log = []
+
+    async def handle(name):
+        log.append(("start", name))
+        await asyncio.sleep(duration)
+        log.append(("end", name))
+
+    async def main():
+        await asyncio.gather(*(processor.process_update(update, handle(update[1])) for update in updates))
+
+    asyncio.run(main())
+    return log
+
+def test_updates_sharing_a_key_run_in_order():
+    processor = KeyedUpdateProcessor(8, lambda update: [update[0]])
+    log = run_updates(processor, [("user:1", "a"), ("user:1", "b"), ("user:1", "c")])
+    assert log == [("start", "a"), ("end", "a"), ("start", "b"), ("end", "b"), ("start", "c"), ("end", "c")]
+    assert len(processor.locks) == 0 and processor.waiting == 0 and processor.running == 0
+
+def test_waiting_on_a_key_does_not_take_a_slot():
+    # مستخدم يرسل بكثرة لا يشغل مكانَي التوازي: تحديث المستخدم الآخر يبدأ فوراً
+    processor = KeyedUpdateProcessor(2, lambda update: [update[0]])
+    spam = [("user:1", f"spam{i}") for i in range(5)]
+    log = run_updates(processor, spam + [("user:2", "other")])
+    assert log.index(("start", "other")) < log.index(("end", "spam0"))
+
+def test_concurrency_limit_holds():
+    processor = KeyedUpdateProcessor(2, lambda update: [update[0]])
+    log = run_updates(processor, [(f"user:{i}", i) for i in range(6)])
+    running = peak = 0
+    for event, _ in log:
+        running += 1 if event == "start" else -1
+        peak = max(peak, running)
+    assert peak == 2
+    assert processor.get_stats()["concurrency"] == 2
+
+def test_cancelled_update_releases_its_keys():
+    processor = KeyedUpdateProcessor(1, lambda update: ["user:1"])
+
+    async def main():
+        first = asyncio.ensure_future(processor.process_update(1, asyncio.sleep(0.05)))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(processor.process_update(2, asyncio.sleep(0)))
+        await asyncio.sleep(0)
+        second.cancel()
+        await asyncio.gather(first, second, return_exceptions=True)
+
+    asyncio.run(main())
+    assert len(processor.locks) == 0 and processor.waiting == 0
@@ -0,0 +1,159 @@
+import asyncio
+import json
+
+from webhook_front import UpdateFeeder, WebhookServer, SECRET_HEADER, MAX_BODY
+
+def message_update(update_id: int, user_id: int = 5) -> dict:
+    return {"update_id": update_id, "message": {
+        "message_id": update_id, "date": 0, "text": "hi",
+        "chat": {"id": user_id, "type": "private"},
+        "from": {"id": user_id, "is_bot": False, "first_name": "u"}}}
+
+class FakeProcessor:
+    """app.update_processor: يمرر التحديث كما هو (التوازي ليس موضوع هذه الاختبارات)"""
+    max_concurrent_updates = 4
+
+    async def process_update(self, update, coroutine):
+        await coroutine
+
+class FakeApp:
+    def __init__(self, gate: asyncio.Event = None):
+        self.bot = None
+        self.update_processor = FakeProcessor()
+        self.handled = []
+        self.gate = gate
+
+    async def process_update(self, update):
+        if self.gate is not None:
+            await self.gate.wait()
+        self.handled.append(update.update_id)
+
+async def request(port: int, method: str = "POST", path: str = "/telegram", body: bytes = b"",
+                  headers: dict = None) -> int:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    lines = [f"{method} {path} HTTP/1.1", "Host: bot", "Connection: close"]
+    if method == "POST" and body is not None:
+        lines.append(f"Content-Length: {len(body)}")
+    lines += [f"{name}: {value}" for name, value in (headers or {}).items()]
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode() + (body or b""))
+    await writer.drain()
+    status_line = await reader.readline()
+    writer.close()
+    return int(status_line.split()[1])
+
+def serve(sink, secret: str = "s3cret"):
+    """تشغيل WebhookServer على منفذ عشوائي وإرجاع (الخادم, المنفذ)"""
+    async def start():
+        server = await asyncio.start_server(WebhookServer(sink, secret).handle, "127.0.0.1", 0)
+        return server, server.sockets[0].getsockname()[1]
+    return start()
+
+def test_http_status_codes():
+    received = []
+
+    async def sink(update):
+        received.append(update)
+        return 200
+
+    async def run():
+        server, port = await serve(sink)
+        body = json.dumps(message_update(1)).encode()
+        good = {SECRET_HEADER: "s3cret"}
+        statuses = [
+            await request(port, body=body, headers=good),
+            await request(port, body=body),  # بلا رمز
+            await request(port, body=body, headers={SECRET_HEADER: "wrong"}),
+            await request(port, body=b"{not json", headers=good),
+            await request(port, path="/other", body=body, headers=good),
+            await request(port, method="GET"),
+            await request(port, method="GET", path="/healthz"),
+            await request(port, body=None, headers=good),
+            await request(port, headers={**good, "Content-Length": str(MAX_BODY + 1)}, body=None),
+        ]
+        server.close()
+        await server.wait_closed()
+        return statuses
+
+    assert asyncio.run(run()) == [200, 403, 403, 400, 404, 405, 200, 411, 413]
+    assert received == [message_update(1)]
+
+def test_dispatch_counts_rejections():
+    async def sink(update):
+        return 200
+
+    server = WebhookServer(sink, "s3cret")
+
+    async def run():
+        return [
+            await server.dispatch({SECRET_HEADER: "s3cret"}, b'{"update_id": 1}'),
+            await server.dispatch({}, b'{"update_id": 2}'),
+            await server.dispatch({SECRET_HEADER: "s3cret"}, b"]"),
+        ]
+
+    assert asyncio.run(run()) == [200, 403, 400]
+    assert server.stats == {"received": 1, "rejected": 2}
+
+def test_no_secret_accepts_every_request():
+    async def sink(update):
+        return 200
+
+    assert asyncio.run(WebhookServer(sink).dispatch({}, b"{}")) == 200
+
+def test_keep_alive_connection_serves_several_updates():
+    received = []
+
+    async def sink(update):
+        received.append(update["update_id"])
+        return 200
+
+    async def run():
+        server, port = await serve(sink, secret="")
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        statuses = []
+        for update_id in (1, 2, 3):
+            body = json.dumps(message_update(update_id)).encode()
+            writer.write(f"POST /telegram HTTP/1.1\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body)
+            await writer.drain()
+            statuses.append(int((await reader.readline()).split()[1]))
+            await reader.readuntil(b"\r\n\r\n")
+        writer.close()
+        server.close()
+        await server.wait_closed()
+        return statuses
+
+    assert asyncio.run(run()) == [200, 200, 200]
+    assert received == [1, 2, 3]
+
+def test_feeder_hands_updates_to_the_application():
+    async def run():
+        app = FakeApp()
+        feeder = UpdateFeeder(app, maxsize=10)
+        feeder.start()
+        server, port = await serve(feeder.offer)
+        for update_id in (1, 2, 3):
+            body = json.dumps(message_update(update_id)).encode()
+            assert await request(port, body=body, headers={SECRET_HEADER: "s3cret"}) == 200
+        await feeder.stop()
+        server.close()
+        await server.wait_closed()
+        return app.handled, feeder.get_stats()
+
+    handled, stats = asyncio.run(run())
+    assert sorted(handled) == [1, 2, 3]
+    assert stats["depth"] == 0 and stats["in_flight"] == 0 and stats["concurrency"] == 4
+
+def test_full_feeder_answers_503():
+    async def run():
+        gate = asyncio.Event()
+        app = FakeApp(gate)
+        feeder = UpdateFeeder(app, maxsize=2, put_timeout=0.05)
+        feeder.start()
+        # سعة 2 في الطابور و2 قيد المعالجة (متوقفة عند البوابة)، فالخامس لا يجد مكاناً
+        statuses = [await feeder.offer(message_update(update_id)) for update_id in range(1, 6)]
+        gate.set()
+        await feeder.stop()
+        return statuses, app.handled
+
+    statuses, handled = asyncio.run(run())
+    assert statuses == [200, 200, 200, 200, 503]
+    assert sorted(handled) == [1, 2, 3, 4]
@@ -0,0 +1,143 @@
+"""
+⏱️ عجلة المؤقتات
+
+بدل مسح كل الألعاب والحالات والباحثين كل بضع دقائق بحثاً عما انتهت مهلته،
+يسجل كل عنصر موعد انتهائه عند إنشائه في عجلة مؤقتات (hashed timing wheel):
+خانة لكل نبضة، والمؤقت يوضع في خانة موعده. كل نبضة تمر على خانة واحدة
+فقط، فالتسجيل والإلغاء O(1) والانتهاء يحدث في موعده بدقة نبضة واحدة.
+
+المؤقتات مفهرسة بمفتاح (مثل ("xo", game_id)): تسجيل نفس المفتاح يستبدل
+المؤقت السابق، والإلغاء بالمفتاح فقط.
+"""
+
+import time
+import asyncio
+import inspect
+import logging
+from typing import Any, Callable, Dict, Hashable, Optional, Set
+
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+class Timer:
+    """مؤقت واحد في العجلة"""
+    __slots__ = ("key", "tick", "callback", "args")
+
+    def __init__(self, key: Hashable, tick: int, callback: Callable[..., Any], args: tuple):
+        self.key = key
+        self.tick = tick  # رقم النبضة التي ينتهي عندها
+        self.callback = callback
+        self.args = args
+
+class TimerWheel:
+    """عجلة مؤقتات: resolution ثانية لكل نبضة و slots خانة (دورة كاملة = resolution * slots)"""
+
+    def __init__(self, resolution: float = 1.0, slots: int = 512):
+        self.resolution = resolution
+        self.slots = slots
+        self.wheel = [{} for _ in range(slots)]  # كل خانة: key -> Timer
+        self.timers: Dict[Hashable, Timer] = {}
+        self.current_tick = self._tick_at(time.monotonic())
+        self._task: Optional[asyncio.Task] = None
+        self._callbacks: Set[asyncio.Task] = set()  # مهام الاستدعاءات غير المتزامنة الجارية
+        self.stats = {"scheduled": 0, "cancelled": 0, "fired": 0, "errors": 0}
+
+    def __len__(self) -> int:
+        return len(self.timers)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.timers
+
+    def _tick_at(self, now: float) -> int:
+        return int(now / self.resolution)
+
+    # --- التسجيل والإلغاء ---
+    def schedule(self, key: Hashable, delay: float, callback: Callable[..., Any], *args) -> Timer:
+        """تسجيل مؤقت ينتهي بعد delay ثانية (يستبدل أي مؤقت سابق بنفس المفتاح)"""
+        self.cancel(key)
+        deadline = time.monotonic() + delay
+        tick = -int(-deadline // self.resolution)  # تقريب للأعلى: لا ينتهي قبل موعده
+        timer = Timer(key, max(tick, self.current_tick + 1), callback, args)
+        self.wheel[timer.tick % self.slots][key] = timer
+        self.timers[key] = timer
+        self.stats["scheduled"] += 1
+        return timer
+
+    def cancel(self, key: Hashable) -> bool:
+        timer = self.timers.pop(key, None)
+        if timer is None:
+            return False
+        self.wheel[timer.tick % self.slots].pop(key, None)
+        self.stats["cancelled"] += 1
+        return True
+
+    def remaining(self, key: Hashable) -> Optional[float]:
+        """الوقت المتبقي حتى انتهاء المؤقت (None إذا لم يكن مسجلاً)"""
+        timer = self.timers.get(key)
+        if timer is None:
+            return None
+        return max(0.0, timer.tick * self.resolution - time.monotonic())
+
+    # --- التقدم ---
+    def advance(self, now: Optional[float] = None) -> int:
+        """تنفيذ كل المؤقتات التي حان موعدها حتى now وإرجاع عددها"""
+        target = self._tick_at(time.monotonic() if now is None else now)
+        fired = 0
+        while self.current_tick < target:
+            self.current_tick += 1
+            bucket = self.wheel[self.current_tick % self.slots]
+            if not bucket:
+                continue
+            # المؤقتات البعيدة (أكثر من دورة) تبقى في الخانة حتى دورتها
+            due = [timer for timer in bucket.values() if timer.tick <= self.current_tick]
+            for timer in due:
+                del bucket[timer.key]
+                del self.timers[timer.key]
+                self._fire(timer)
+                fired += 1
+        return fired
+
+    def _fire(self, timer: Timer):
+        self.stats["fired"] += 1
+        registry.inc("timers_fired")
+        try:
+            result = timer.callback(*timer.args)
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.error(f"Timer {timer.key!r} failed: {e}")
+            return
+        if inspect.isawaitable(result):
+            task = asyncio.ensure_future(result)
+            self._callbacks.add(task)
+            task.add_done_callback(self._callback_done)
+
+    def _callback_done(self, task: asyncio.Task):
+        self._callbacks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            self.stats["errors"] += 1
+            logger.error(f"Timer callback failed: {task.exception()}")
+
+    # --- التشغيل ---
+    async def run(self):
+        while True:
+            # الاستيقاظ عند بداية النبضة التالية بالضبط
+            next_tick = (self.current_tick + 1) * self.resolution
+            await asyncio.sleep(max(0.0, next_tick - time.monotonic()))
+            self.advance()
+
+    def start(self):
+        """تشغيل العجلة كمهمة في الحلقة الحالية"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self.run())
+        return self._task
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def get_stats(self) -> Dict[str, int]:
+        stats = dict(self.stats)
+        stats["pending"] = len(self.timers)
+        return stats
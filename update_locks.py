@@ -0,0 +1,124 @@
+"""
+🔐 تنفيذ التحديثات بالتوازي مع الحفاظ على ترتيب كل مستخدم
+
+مع concurrent_updates > 1 يشغل PTB كل تحديث في مهمة مستقلة، فقد تتداخل
+رسالتان من نفس المستخدم (أو حركتان في نفس لعبة XO) وتتسابقان على
+active_chats وUSER_STATES وGameManager. KeyedUpdateProcessor يعطي كل
+تحديث مفاتيح (المستخدم، اللعبة...) ولا يبدأ التحديث حتى ينتهي كل تحديث
+سابق يشاركه مفتاحاً؛ التحديثات بلا مفاتيح مشتركة تعمل بالتوازي حتى
+max_concurrent_updates.
+
+المفاتيح تُقفل قبل أخذ مكان في حد التوازي: تحديثات مستخدم يرسل بكثرة
+تنتظر دورها دون أن تشغل أماكن بقية المستخدمين. لذلك حد PTB نفسه (الذي
+يأخذه process_update قبل do_process_update) يصبح حداً للتحديثات المقبولة
+max_pending، والتوازي الفعلي حد خاص يؤخذ بعد المفاتيح.
+"""
+
+import time
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, List, Tuple
+
+from telegram.ext import BaseUpdateProcessor
+
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+class KeyedLock:
+    """أقفال asyncio حسب المفتاح، تُنشأ عند الحاجة وتُحذف عندما لا ينتظرها أحد"""
+
+    def __init__(self):
+        self._locks: Dict[Hashable, List[Any]] = {}  # المفتاح -> [القفل، عدد المستخدمين والمنتظرين]
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+    async def acquire(self, keys: Iterable[Hashable]) -> Tuple[Hashable, ...]:
+        """قفل كل المفاتيح بترتيب ثابت (يمنع الجمود بين تحديثين يتشاركان مفتاحين)"""
+        keys = tuple(sorted(set(keys), key=str))
+        held = 0
+        try:
+            for key in keys:
+                entry = self._locks.get(key)
+                if entry is None:
+                    entry = self._locks[key] = [asyncio.Lock(), 0]
+                entry[1] += 1
+                try:
+                    await entry[0].acquire()
+                except BaseException:
+                    self._unref(key, entry)
+                    raise
+                held += 1
+        except BaseException:
+            self.release(keys[:held])
+            raise
+        return keys
+
+    def release(self, keys: Tuple[Hashable, ...]):
+        for key in reversed(keys):
+            entry = self._locks[key]
+            entry[0].release()
+            self._unref(key, entry)
+
+    def _unref(self, key: Hashable, entry: List[Any]):
+        entry[1] -= 1
+        if not entry[1]:
+            del self._locks[key]
+
+class KeyedUpdateProcessor(BaseUpdateProcessor):
+    """معالج تحديثات PTB: توازي عام مع تسلسل التحديثات التي تتشارك مفتاحاً"""
+
+    def __init__(self, max_concurrent_updates: int, keys_for: Callable[[object], Iterable[Hashable]],
+                 max_pending: int = 4096):
+        super().__init__(max(max_pending, max_concurrent_updates))  # تحديثات تنتظر مفاتيحها أو تعمل
+        self.concurrency = max_concurrent_updates
+        self.keys_for = keys_for
+        self.locks = KeyedLock()
+        self._slots = asyncio.Semaphore(max_concurrent_updates)
+        self.waiting = 0
+        self.running = 0
+        self.lock_wait = registry.histogram("update_lock_wait_seconds")  # انتظار تحديث سابق لنفس المفتاح
+        self.queue_wait = registry.histogram("update_queue_wait_seconds")  # من الوصول حتى بدء المعالجة
+        self.handle_latency = registry.histogram("update_handle_seconds")
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        arrived = time.monotonic()
+        self.waiting += 1
+        keys = ()
+        try:
+            keys = await self.locks.acquire(self.keys_for(update))
+            self.lock_wait.observe(time.monotonic() - arrived)
+            await self._slots.acquire()
+        except BaseException:
+            self.waiting -= 1
+            self.locks.release(keys)
+            coroutine.close()
+            raise
+        started = time.monotonic()
+        self.queue_wait.observe(started - arrived)
+        self.waiting -= 1
+        self.running += 1
+        try:
+            await coroutine
+        finally:
+            self.running -= 1
+            self._slots.release()
+            self.locks.release(keys)
+            self.handle_latency.observe(time.monotonic() - started)
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "concurrency": self.concurrency,
+            "running": self.running,
+            "waiting": self.waiting,
+            "locked_keys": len(self.locks),
+            "lock_wait_p95": round(self.lock_wait.quantile(0.95), 3),
+            "queue_wait_p95": round(self.queue_wait.quantile(0.95), 3)
+        }
@@ -0,0 +1,265 @@
+"""
+🌐 استقبال التحديثات عبر webhook
+
+بدل سحب التحديثات بـ long polling (اتصال واحد ودفعات متتالية)، ترسل
+Telegram كل تحديث إلى خادم HTTP صغير (asyncio من المكتبة القياسية) يعمل
+خلف وسيط TLS (nginx، Caddy، موازن السحابة...) يمرر الطلبات إلى WEBHOOK_PORT.
+
+التشغيل: BOT_MODE = "webhook" في config ثم python bot_main.py.
+التحديثات تدخل طابوراً محدوداً (UpdateFeeder) وتُنفذ عبر معالج تحديثات
+التطبيق (CONCURRENT_UPDATES بالتوازي، بترتيب ثابت لكل مستخدم)؛ إذا امتلأ
+الطابور يُرد 503 فتعيد Telegram الإرسال لاحقاً.
+عملية واحدة فقط: GitHubDatabase تحمل نسخة كاملة من البيانات وترفعها، فلا
+يصح وجود كاتب ثانٍ عليها.
+"""
+
+import os
+import json
+import hmac
+import time
+import signal
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+from telegram import Update
+
+from config import get_config
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+MAX_BODY = 1 << 20  # تحديثات Telegram أصغر من هذا بكثير
+SECRET_HEADER = "x-telegram-bot-api-secret-token"
+REASONS = {200: "OK", 400: "Bad Request", 403: "Forbidden", 404: "Not Found", 405: "Method Not Allowed",
+           411: "Length Required", 413: "Payload Too Large", 503: "Service Unavailable"}
+
+active_feeder: Optional["UpdateFeeder"] = None  # طابور هذه العملية (لعرضه في /metrics)
+
+# --- طابور التحديثات ---
+class UpdateFeeder:
+    """طابور محدود بين خادم HTTP ومعالجات PTB
+
+    كل تحديث يُسحب من الطابور يُسلم لمعالج تحديثات التطبيق (app.update_processor)
+    كما يفعل PTB مع polling: هو من يحدد التوازي وترتيب تحديثات كل مستخدم.
+    التحديثات المسحوبة التي لم تنته محدودة بحجم الطابور أيضاً، فالذاكرة محدودة
+    بضعفه. put ينتظر مكاناً حتى timeout ثانية؛ إذا بقي الطابور ممتلئاً يفشل،
+    فيرد الخادم 503 وتعيد Telegram الإرسال لاحقاً بدل تراكم التحديثات.
+    """
+
+    def __init__(self, app, maxsize: int = 1000, put_timeout: float = 5.0):
+        self.app = app
+        self.maxsize = maxsize
+        self.put_timeout = put_timeout
+        self.queue: Optional[asyncio.Queue] = None
+        self.in_flight = 0
+        self.max_depth = 0
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._consumer: Optional[asyncio.Task] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self.wait_latency = registry.histogram("webhook_queue_wait_seconds")
+        self.handle_latency = registry.histogram("webhook_update_seconds")
+
+    async def put(self, data: Dict[str, Any], timeout: Optional[float] = None) -> bool:
+        """إضافة تحديث (timeout=None: الانتظار حتى يتوفر مكان)"""
+        item = (time.monotonic(), data)
+        try:
+            if timeout is None:
+                await self.queue.put(item)
+            else:
+                await asyncio.wait_for(self.queue.put(item), timeout)
+        except asyncio.TimeoutError:
+            registry.inc("webhook_rejected_full")
+            return False
+        registry.inc("webhook_accepted")
+        depth = self.queue.qsize()
+        if depth > self.max_depth:
+            self.max_depth = depth
+        return True
+
+    async def offer(self, data: Dict[str, Any]) -> int:
+        """واجهة الخادم: حالة HTTP للرد على Telegram"""
+        return 200 if await self.put(data, self.put_timeout) else 503
+
+    async def _consume(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._slots.acquire()
+            received_at, data = await self.queue.get()
+            self.wait_latency.observe(time.monotonic() - received_at)
+            task = loop.create_task(self._process(data))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _process(self, data: Dict[str, Any]):
+        started = time.monotonic()
+        self.in_flight += 1
+        try:
+            update = Update.de_json(data, self.app.bot)
+            await self.app.update_processor.process_update(update, self.app.process_update(update))
+        except Exception as e:
+            # أخطاء المعالجات تصل إلى error_handler داخل process_update؛ هنا ما يفلت منه فقط
+            logger.error(f"Failed to process webhook update: {e}")
+        finally:
+            self.in_flight -= 1
+            self.handle_latency.observe(time.monotonic() - started)
+            self._slots.release()
+            self.queue.task_done()
+
+    def start(self):
+        global active_feeder
+        self.queue = asyncio.Queue(self.maxsize)
+        self._slots = asyncio.Semaphore(self.maxsize)
+        self._consumer = asyncio.get_running_loop().create_task(self._consume())
+        active_feeder = self
+
+    async def stop(self, drain_timeout: float = 10.0):
+        """إكمال ما في الطابور (حتى drain_timeout) ثم إيقاف المعالجات"""
+        if self.queue is not None:
+            try:
+                await asyncio.wait_for(self.queue.join(), drain_timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Stopping with {self.queue.qsize()} webhook updates unprocessed")
+        if self._consumer is not None:
+            self._consumer.cancel()
+            self._consumer = None
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "depth": self.queue.qsize() if self.queue is not None else 0,
+            "capacity": self.maxsize,
+            "max_depth": self.max_depth,
+            "in_flight": self.in_flight,
+            "concurrency": self.app.update_processor.max_concurrent_updates,
+            "wait_p95": round(self.wait_latency.quantile(0.95), 3)
+        }
+
+def get_webhook_stats() -> Optional[Dict[str, Any]]:
+    return active_feeder.get_stats() if active_feeder is not None else None
+
+# --- خادم HTTP ---
+class WebhookServer:
+    """خادم HTTP بسيط: يتحقق من الرمز السري ويسلم كل تحديث إلى sink
+
+    sink دالة غير متزامنة تأخذ التحديث (dict) وتُرجع حالة HTTP للرد.
+    GET على health_path يرد 200 لفحوص الوسيط وموازن الأحمال.
+    """
+
+    def __init__(self, sink: Callable[[Dict[str, Any]], Awaitable[int]], secret: str = "",
+                 path: str = "/telegram", health_path: str = "/healthz"):
+        self.sink = sink
+        self.secret = secret.encode()
+        self.path = path
+        self.health_path = health_path
+        self.stats = {"received": 0, "rejected": 0}
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:  # Telegram والوسيط يعيدان استخدام الاتصال لعدة طلبات
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                    return
+                request_line, *header_lines = head.decode("latin-1").split("\r\n")
+                headers = {}
+                for line in header_lines:
+                    name, _, value = line.partition(":")
+                    if name:
+                        headers[name.strip().lower()] = value.strip()
+                method, _, target = request_line.partition(" ")
+                path = target.split(" ", 1)[0].split("?", 1)[0]
+
+                if method == "GET" and path == self.health_path:
+                    await self._respond(writer, 200)
+                elif path != self.path:
+                    await self._respond(writer, 404)
+                    return
+                elif method != "POST":
+                    await self._respond(writer, 405)
+                    return
+                elif "content-length" not in headers:
+                    await self._respond(writer, 411)
+                    return
+                else:
+                    length = int(headers["content-length"])
+                    if length > MAX_BODY:
+                        await self._respond(writer, 413)
+                        return
+                    body = await reader.readexactly(length)
+                    await self._respond(writer, await self.dispatch(headers, body))
+                if headers.get("connection", "").lower() == "close":
+                    return
+        except (ConnectionError, ValueError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def dispatch(self, headers: Dict[str, str], body: bytes) -> int:
+        if self.secret and not hmac.compare_digest(headers.get(SECRET_HEADER, "").encode(), self.secret):
+            self.stats["rejected"] += 1
+            registry.inc("webhook_rejected_auth")
+            return 403
+        try:
+            update = json.loads(body)
+        except ValueError:
+            self.stats["rejected"] += 1
+            return 400
+        self.stats["received"] += 1
+        return await self.sink(update)
+
+    @staticmethod
+    async def _respond(writer: asyncio.StreamWriter, status: int):
+        writer.write(f"HTTP/1.1 {status} {REASONS.get(status, 'Error')}\r\nContent-Length: 0\r\n\r\n".encode())
+        await writer.drain()
+
+def _stop_event() -> asyncio.Event:
+    """حدث يُضبط عند SIGINT/SIGTERM"""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass  # ليست في الخيط الرئيسي أو نظام لا يدعمها
+    return stop
+
+# --- التشغيل (BOT_MODE = "webhook") ---
+async def serve_webhook(app, config: Optional[Dict[str, Any]] = None):
+    """تشغيل التطبيق على webhook حتى SIGINT/SIGTERM (مقابل run_polling)"""
+    config = config or get_config()
+    secret = os.getenv('WEBHOOK_SECRET') or config.get('webhook_secret', '')
+    path = config.get('webhook_path', '/telegram')
+    feeder = UpdateFeeder(app, config.get('webhook_queue_size', 1000), config.get('webhook_queue_timeout', 5))
+
+    await app.initialize()
+    if app.post_init:
+        await app.post_init(app)
+    await app.start()
+    feeder.start()
+    server = await asyncio.start_server(WebhookServer(feeder.offer, secret, path).handle,
+                                        config.get('webhook_host', '0.0.0.0'), config.get('webhook_port', 8443))
+    try:
+        url = config.get('webhook_url', '')
+        if url:
+            await app.bot.set_webhook(
+                url=url,
+                secret_token=secret or None,
+                max_connections=config.get('webhook_max_connections', 40),
+                allowed_updates=Update.ALL_TYPES
+            )
+        logger.info(f"Webhook listening on {config.get('webhook_host', '0.0.0.0')}:{config.get('webhook_port', 8443)}{path}")
+        await _stop_event().wait()
+    finally:
+        server.close()
+        await server.wait_closed()
+        await feeder.stop()
+        await app.stop()
+        if app.post_shutdown:
+            await app.post_shutdown(app)
+        await app.shutdown()
+
+def run_webhook(app, config: Optional[Dict[str, Any]] = None):
+    asyncio.run(serve_webhook(app, config))